@@ -1,4 +1,7 @@
 #!/bin/sh -e
 # This script periodically cleans the dirty_objects table removing objects 
-# already indexed.
+# already indexed.  touchObjects only appends rows, so an object touched by
+# several requests has several rows waiting to be indexed; all but the newest
+# one are removed too.
 echo 'DELETE FROM dirty_objects WHERE id <= (SELECT MIN(last_indexed) FROM last_indexed_objects);' | psql -q fluidinfo
+echo 'DELETE FROM dirty_objects USING dirty_objects AS newer WHERE dirty_objects.object_id = newer.object_id AND dirty_objects.id < newer.id;' | psql -q fluidinfo
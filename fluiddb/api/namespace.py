@@ -60,7 +60,7 @@ class FacadeNamespaceMixin(object):
                     namespace.tags = result[path]['tagNames']
                 return namespace
 
-        return session.transact.run(run)
+        return session.transact.runReadOnly(run)
 
     def createNamespace(self, session, parentNamespace, name, description):
         """Create a new L{Namespace}.
@@ -64,4 +64,4 @@ class FacadeObjectMixin(object):
             result.tagPaths = tagPaths
             return result
 
-        return session.transact.run(run)
+        return session.transact.runReadOnly(run)
@@ -68,7 +68,7 @@ class FacadePermissionMixin(object):
             policy = str(policy).lower()
             return TPolicyAndExceptions(policy=policy, exceptions=exceptions)
 
-        return session.transact.run(run)
+        return session.transact.runReadOnly(run)
 
     def updatePermission(self, session, category, action, path,
                          policyAndExceptions):
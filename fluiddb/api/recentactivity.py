@@ -40,7 +40,7 @@ class FacadeRecentActivityMixin(object):
             result = recentActivity.getForObjects([objectID])
             return self._formatResult(result)
 
-        return session.transact.run(run)
+        return session.transact.runReadOnly(run)
 
     def getRecentActivityForQuery(self, session, query):
         """
@@ -71,7 +71,8 @@ class FacadeRecentActivityMixin(object):
             objects = SecureObjectAPI(session.auth.user)
 
             # _resolveQuery is implemented in FacadeTagValueMixin
-            objectIDs = self._resolveQuery(session, objects, parsedQuery)
+            objectIDs = self._resolveQuery(session, objects, parsedQuery,
+                                           implicitCreate=False)
 
             # FIXME: This sucks, but right now if the query returns too many
             # objects, RecentActivityAPI will blow up. While we fix this, it's
@@ -83,7 +84,7 @@ class FacadeRecentActivityMixin(object):
             result = recentActivity.getForObjects(objectIDs)
             return self._formatResult(result)
 
-        return session.transact.run(run)
+        return session.transact.runReadOnly(run)
 
     def getRecentAboutActivity(self, session, about):
         """Get information about recent tag values on the given object.
@@ -111,7 +112,7 @@ class FacadeRecentActivityMixin(object):
             result = recentActivity.getForObjects([objectID])
             return self._formatResult(result)
 
-        return session.transact.run(run)
+        return session.transact.runReadOnly(run)
 
     def getRecentUserActivity(self, session, username):
         """Get information about recent tag values on the given user.
@@ -140,7 +141,7 @@ class FacadeRecentActivityMixin(object):
                 raise TNoSuchUser(username.encode('utf-8'))
             return self._formatResult(result)
 
-        return session.transact.run(run)
+        return session.transact.runReadOnly(run)
 
     def getRecentUserActivityForQuery(self, session, query):
         """
@@ -173,7 +174,8 @@ class FacadeRecentActivityMixin(object):
             objects = SecureObjectAPI(session.auth.user)
 
             # _resolveQuery is implemented in FacadeTagValueMixin
-            objectIDs = self._resolveQuery(session, objects, parsedQuery)
+            objectIDs = self._resolveQuery(session, objects, parsedQuery,
+                                           implicitCreate=False)
 
             if not objectIDs:
                 return []
@@ -193,7 +195,7 @@ class FacadeRecentActivityMixin(object):
             result = recentActivity.getForUsers(usernames)
             return self._formatResult(result)
 
-        return session.transact.run(run)
+        return session.transact.runReadOnly(run)
 
     def _formatResult(self, result):
         """
@@ -39,7 +39,7 @@ class FacadeTagMixin(object):
                     tag.description = result[path]['description']
                 return tag
 
-        return session.transact.run(run)
+        return session.transact.runReadOnly(run)
 
     def createTag(self, session, parentNamespace, name, description, indexed,
                   rangeType):
@@ -3,19 +3,26 @@
 from json import loads
 from uuid import uuid4, UUID
 
+from storm.zope.interfaces import IZStorm
+from twisted.internet import reactor
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import deferLater
+from zope.component import getUtility
 
+from fluiddb.api import value as valueModule
 from fluiddb.api.facade import Facade
 from fluiddb.application import FluidinfoSessionFactory
 from fluiddb.common.types_thrift.ttypes import (
     TNonexistentTag, TPathPermissionDenied, TNoInstanceOnObject, TBadRequest,
     TParseError, TInvalidPath)
-from fluiddb.api.value import TagPathAndValue
+from fluiddb.api.value import TagPathAndValue, TagValueOperation
 from fluiddb.data.permission import Operation, Policy
+from fluiddb.data.store import ReplicaRouter
 from fluiddb.data.system import createSystemData
 from fluiddb.data.tag import getTags
 from fluiddb.data.value import createTagValue, getTagValues
 from fluiddb.cache.permission import CachingPermissionAPI
+from fluiddb.model.object import ObjectAPI
 from fluiddb.model.tag import TagAPI
 from fluiddb.model.user import UserAPI, getUser
 from fluiddb.model.value import TagValueAPI, FluidinfoTagValue
@@ -219,9 +226,29 @@ class FacadeTagValueMixinTest(FluidinfoTestCase):
                                              str(objectID), thriftValue)
             value, tagValue = yield self.facade.getTagInstance(
                 session, u'username/tag', str(objectID))
-            self.assertEqual('Hello, world!', value.binaryKey)
+            self.assertEqual('Hello, world!', value.binaryKey.read())
             self.assertEqual('text/plain', value.binaryKeyMimeType)
 
+    @inlineCallbacks
+    def testGetTagInstanceWithBinaryValueWithoutContents(self):
+        """
+        L{FacadeTagValueMixin.getTagInstance} returns a Thrift value without
+        a key if contents for binary values aren't requested.  The metadata
+        is available from the L{TagValue}.
+        """
+        TagAPI(self.user).create([(u'username/tag', u'description')])
+        objectID = uuid4()
+        thriftValue = createBinaryThriftValue('Hello, world!', 'text/plain')
+        self.store.commit()
+        with login(u'username', uuid4(), self.transact) as session:
+            yield self.facade.setTagInstance(session, u'username/tag',
+                                             str(objectID), thriftValue)
+            value, tagValue = yield self.facade.getTagInstance(
+                session, u'username/tag', str(objectID), withContents=False)
+            self.assertIdentical(None, value.binaryKey)
+            self.assertEqual('text/plain', value.binaryKeyMimeType)
+            self.assertEqual(13, tagValue.value['size'])
+
     @inlineCallbacks
     def testGetTagInstanceWithFluidDBID(self):
         """
@@ -439,7 +466,7 @@ class FacadeTagValueMixinTest(FluidinfoTestCase):
             value, tagValue = yield self.facade.getTagInstance(
                 session, u'username/bar', str(objectID))
             self.assertEqual('text/plain', value.binaryKeyMimeType)
-            self.assertEqual('Hello, world!', value.binaryKey)
+            self.assertEqual('Hello, world!', value.binaryKey.read())
 
     @inlineCallbacks
     def testHasTagInstanceUnknownTag(self):
@@ -571,6 +598,167 @@ class FacadeTagValueMixinTest(FluidinfoTestCase):
         result = getTagValues([(objectID, tag.id)])
         self.assertTrue(result.is_empty())
 
+    @inlineCallbacks
+    def testRunBatch(self):
+        """
+        L{FacadeTagValueMixin.runBatch} gets, sets and deletes L{TagValue}s
+        and returns a result for each operation, in order.  Values are read
+        before any changes are made.
+        """
+        TagAPI(self.user).create([(u'username/bar', u'description')])
+        tag = getTags(paths=[u'username/bar']).one()
+        objectID1 = uuid4()
+        objectID2 = uuid4()
+        createTagValue(self.user.id, tag.id, objectID1, 42)
+        createTagValue(self.user.id, tag.id, objectID2, 17)
+        self.store.commit()
+        operations = [
+            TagValueOperation('PUT', 'username/bar', str(objectID1), value=43),
+            TagValueOperation('GET', 'username/bar', str(objectID1)),
+            TagValueOperation('DELETE', 'username/bar', str(objectID2))]
+        with login(u'username', uuid4(), self.transact) as session:
+            results = yield self.facade.runBatch(session, operations)
+
+        self.assertIdentical(None, results[0])
+        self.assertEqual(42, results[1]['value'])
+        self.assertEqual(u'username', results[1]['username'])
+        self.assertIdentical(None, results[2])
+        self.store.rollback()
+        self.assertEqual(43, getTagValues([(objectID1, tag.id)]).one().value)
+        self.assertTrue(getTagValues([(objectID2, tag.id)]).is_empty())
+
+    @inlineCallbacks
+    def testRunBatchWithAbout(self):
+        """
+        L{FacadeTagValueMixin.runBatch} creates objects for unknown about
+        values in C{PUT} operations.  Other operations on unknown about
+        values fail with L{TNoInstanceOnObject}.
+        """
+        operations = [
+            TagValueOperation('PUT', 'username/bar', about='about', value=1),
+            TagValueOperation('GET', 'username/bar', about='unknown')]
+        with login(u'username', uuid4(), self.transact) as session:
+            results = yield self.facade.runBatch(session, operations)
+
+        self.assertIdentical(None, results[0])
+        self.assertIsInstance(results[1], TNoInstanceOnObject)
+        self.store.rollback()
+        objectID = ObjectAPI(self.user).get([u'about'])[u'about']
+        result = TagValueAPI(self.user).get([objectID], [u'username/bar'])
+        self.assertEqual(1, result[objectID][u'username/bar'].value)
+
+    @inlineCallbacks
+    def testRunBatchWithManyAboutValues(self):
+        """
+        L{FacadeTagValueMixin.runBatch} creates the objects for all the
+        unknown about values in C{PUT} operations together.  Operations on
+        the same about value use the same new object.
+        """
+        operations = [
+            TagValueOperation('PUT', 'username/bar', about='about1', value=1),
+            TagValueOperation('PUT', 'username/foo', about='about1', value=2),
+            TagValueOperation('PUT', 'username/bar', about='about2', value=3)]
+        with login(u'username', uuid4(), self.transact) as session:
+            results = yield self.facade.runBatch(session, operations)
+
+        self.assertEqual([None, None, None], results)
+        self.store.rollback()
+        objectIDs = ObjectAPI(self.user).get([u'about1', u'about2'])
+        result = TagValueAPI(self.user).get(objectIDs.values(),
+                                            [u'username/bar', u'username/foo'])
+        values1 = result[objectIDs[u'about1']]
+        values2 = result[objectIDs[u'about2']]
+        self.assertEqual(1, values1[u'username/bar'].value)
+        self.assertEqual(2, values1[u'username/foo'].value)
+        self.assertEqual(3, values2[u'username/bar'].value)
+
+    @inlineCallbacks
+    def testRunBatchWithAboutDoesNotCreateObjectsForFailingOperations(self):
+        """
+        L{FacadeTagValueMixin.runBatch} only creates objects for unknown
+        about values if their C{PUT} operations are allowed, so operations
+        that fail don't leave new objects behind.
+        """
+        TagAPI(self.user).create([(u'username/bar', u'description'),
+                                  (u'username/closed', u'description')])
+        self.permissions.set([(u'username/closed', Operation.WRITE_TAG_VALUE,
+                               Policy.CLOSED, []),
+                              (u'username', Operation.CREATE_NAMESPACE,
+                               Policy.CLOSED, [])])
+        self.store.commit()
+        operations = [
+            TagValueOperation('PUT', 'username/closed', about='closed',
+                              value=1),
+            TagValueOperation('PUT', 'unknown/bar', about='unknown', value=2),
+            TagValueOperation('PUT', 'username/new', about='new', value=3),
+            TagValueOperation('PUT', 'username/bar', about='allowed',
+                              value=4)]
+        with login(u'username', uuid4(), self.transact) as session:
+            results = yield self.facade.runBatch(session, operations)
+
+        self.assertIsInstance(results[0], TPathPermissionDenied)
+        self.assertEqual('username/closed', results[0].path)
+        self.assertIsInstance(results[1], TNonexistentTag)
+        self.assertIsInstance(results[2], TPathPermissionDenied)
+        self.assertEqual('username/new', results[2].path)
+        self.assertIdentical(None, results[3])
+        self.store.rollback()
+        self.assertEqual(
+            [u'allowed'],
+            ObjectAPI(self.user).get([u'closed', u'unknown', u'new',
+                                      u'allowed']).keys())
+
+    @inlineCallbacks
+    def testRunBatchWithFailingOperations(self):
+        """
+        L{FacadeTagValueMixin.runBatch} returns an error for each operation
+        that fails, without stopping the other operations.
+        """
+        TagAPI(self.user).create([(u'username/bar', u'description'),
+                                  (u'username/closed', u'description')])
+        self.permissions.set([(u'username/closed', Operation.WRITE_TAG_VALUE,
+                               Policy.CLOSED, [])])
+        objectID = uuid4()
+        self.store.commit()
+        operations = [
+            TagValueOperation('PUT', 'username/closed', str(objectID),
+                              value=1),
+            TagValueOperation('GET', 'username/unknown', str(objectID)),
+            TagValueOperation('PUT', 'username/bar', str(objectID), value=2),
+            TagValueOperation('GET', 'username/bar', str(uuid4())),
+            TagValueOperation('PUT', 'username/$bad', str(objectID),
+                              value=3)]
+        with login(u'username', uuid4(), self.transact) as session:
+            results = yield self.facade.runBatch(session, operations)
+
+        self.assertIsInstance(results[0], TPathPermissionDenied)
+        self.assertEqual('username/closed', results[0].path)
+        self.assertIsInstance(results[1], TNonexistentTag)
+        self.assertIdentical(None, results[2])
+        self.assertIsInstance(results[3], TNoInstanceOnObject)
+        self.assertIsInstance(results[4], TInvalidPath)
+        self.store.rollback()
+        result = TagValueAPI(self.user).get([objectID])
+        self.assertEqual([u'username/bar'], result[objectID].keys())
+
+    @inlineCallbacks
+    def testRunBatchLastWriteWins(self):
+        """
+        L{FacadeTagValueMixin.runBatch} applies the last operation when more
+        than one changes the same tag instance.
+        """
+        objectID = uuid4()
+        operations = [
+            TagValueOperation('PUT', 'username/bar', str(objectID), value=1),
+            TagValueOperation('DELETE', 'username/bar', str(objectID)),
+            TagValueOperation('PUT', 'username/bar', str(objectID), value=3)]
+        with login(u'username', uuid4(), self.transact) as session:
+            yield self.facade.runBatch(session, operations)
+
+        self.store.rollback()
+        result = TagValueAPI(self.user).get([objectID], [u'username/bar'])
+        self.assertEqual(3, result[objectID][u'username/bar'].value)
+
 
 class FacadeTagValueMixinQueriesTest(FluidinfoTestCase):
 
@@ -1755,3 +1943,165 @@ class FacadeTagValueMixinQueriesTest(FluidinfoTestCase):
                                 u'updated-at': updatedAt,
                                 u'username': u'username'}}}}}
             self.assertEquals(expected, results)
+
+    @inlineCallbacks
+    def testGetValuesForQueryWithWrite(self):
+        """
+        L{FacadeTagValueMixin.getValuesForQuery} passes the JSON response to
+        the C{write} callable, a batch of objects at a time, and fires with
+        C{None}.
+        """
+        self.patch(valueModule, 'VALUES_BATCH_SIZE', 1)
+        SecureTagAPI(self.user).create([(u'username/bar', u'description')])
+        objectID1 = uuid4()
+        objectID2 = uuid4()
+        values = {objectID1: {u'username/bar': 42},
+                  objectID2: {u'username/bar': 42}}
+        SecureTagValueAPI(self.user).set(values)
+        runDataImportHandler(self.client.url)
+        self.store.commit()
+        chunks = []
+        with login(u'username', uuid4(), self.transact) as session:
+            result = yield self.facade.getValuesForQuery(
+                session, u'username/bar = 42', [u'username/bar'],
+                write=chunks.append)
+            self.assertIdentical(None, result)
+            self.assertEqual(3, len(chunks))
+            results = loads(''.join(chunks))
+            self.assertEqual(sorted([str(objectID1), str(objectID2)]),
+                             sorted(results[u'results'][u'id'].keys()))
+            value = results[u'results'][u'id'][str(objectID1)]
+            self.assertEqual(42, value[u'username/bar'][u'value'])
+
+    @inlineCallbacks
+    def testGetValuesForQueryWithWriteDoesNotHoldTransaction(self):
+        """
+        L{FacadeTagValueMixin.getValuesForQuery} fetches each batch in its
+        own transaction, and doesn't keep a transaction open while it waits
+        for a C{Deferred} returned by C{write}.
+        """
+        self.patch(valueModule, 'VALUES_BATCH_SIZE', 1)
+        SecureTagAPI(self.user).create([(u'username/bar', u'description')])
+        SecureTagValueAPI(self.user).set({uuid4(): {u'username/bar': 42},
+                                          uuid4(): {u'username/bar': 42}})
+        runDataImportHandler(self.client.url)
+        self.store.commit()
+        chunks = []
+        with login(u'username', uuid4(), self.transact) as session:
+
+            def write(chunk):
+                # The query and the first batch have been fetched, and their
+                # transactions have finished.
+                chunks.append(len(session.transact.transactions))
+                return deferLater(reactor, 0, lambda: None)
+
+            yield self.facade.getValuesForQuery(
+                session, u'username/bar = 42', [u'username/bar'],
+                write=write)
+            self.assertEqual([2, 3, 3], chunks)
+
+    @inlineCallbacks
+    def testGetValuesForQueryWithWriteAndEmptyQueryResults(self):
+        """
+        L{FacadeTagValueMixin.getValuesForQuery} writes an empty result if a
+        L{Query} doesn't match any objects.
+        """
+        TagAPI(self.user).create([(u'username/bar', u'description')])
+        self.store.commit()
+        chunks = []
+        with login(u'username', uuid4(), self.transact) as session:
+            yield self.facade.getValuesForQuery(
+                session, u'username/bar = 2600', [u'username/bar'],
+                write=chunks.append)
+            self.assertEqual({u'results': {u'id': {}}},
+                             loads(''.join(chunks)))
+
+    @inlineCallbacks
+    def testGetValuesForQueryWithWriteAndPermissionDenied(self):
+        """
+        L{FacadeTagValueMixin.getValuesForQuery} raises a L{TNonexistentTag}
+        exception before anything is written if the user doesn't have
+        C{Operation.READ_TAG_VALUE} permission on a requested L{Tag}.
+        """
+        UserAPI().create([(u'fred', u'password', u'Fred',
+                           u'fred@example.com')])
+        user = getUser(u'fred')
+        TagAPI(user).create([(u'fred/bar', u'description'),
+                             (u'fred/foo', u'description')])
+        SecureTagValueAPI(user).set({uuid4(): {u'fred/bar': 42}})
+        runDataImportHandler(self.client.url)
+        values = [(u'fred/foo', Operation.READ_TAG_VALUE,
+                   Policy.CLOSED, [u'fred'])]
+        CachingPermissionAPI(user).set(values)
+        self.store.commit()
+        chunks = []
+        with login(u'username', uuid4(), self.transact) as session:
+            deferred = self.facade.getValuesForQuery(
+                session, u'fred/bar = 42', [u'fred/foo'], write=chunks.append)
+            yield self.assertFailure(deferred, TNonexistentTag)
+            self.assertEqual([], chunks)
+
+
+class ReadOnlyReplicaRouter(ReplicaRouter):
+    """
+    A L{ReplicaRouter} that sends read-only transactions to a store that
+    rejects writes, like a hot standby does.
+    """
+
+    def __init__(self):
+        super(ReadOnlyReplicaRouter, self).__init__(['read-only'], 5, 10)
+
+    def getStoreName(self, key=None):
+        """Start a read-only transaction on the C{read-only} store."""
+        zstorm = getUtility(IZStorm)
+        uri = zstorm.get_default_uris()['main']
+        store = zstorm.get('read-only', uri)
+        store.execute('SET TRANSACTION READ ONLY')
+        return 'read-only'
+
+
+class FacadeTagValueMixinWithReplicaTest(FluidinfoTestCase):
+
+    resources = [('cache', CacheResource()),
+                 ('client', IndexResource()),
+                 ('config', ConfigResource()),
+                 ('log', LoggingResource()),
+                 ('store', DatabaseResource()),
+                 ('threadPool', ThreadPoolResource())]
+
+    def setUp(self):
+        super(FacadeTagValueMixinWithReplicaTest, self).setUp()
+        createSystemData()
+        self.transact = Transact(self.threadPool,
+                                 router=ReadOnlyReplicaRouter())
+        factory = FluidinfoSessionFactory('API-9000')
+        self.facade = Facade(self.transact, factory)
+        UserAPI().create([(u'username', u'password', u'User',
+                           u'user@example.com')])
+        self.store.commit()
+
+    @inlineCallbacks
+    def testResolveQueryCreatesObject(self):
+        """
+        L{FacadeTagValueMixin.resolveQuery} runs against the C{main} store,
+        so it can create an object for an unknown about value.
+        """
+        with login(u'username', uuid4(), self.transact) as session:
+            [objectID] = yield self.facade.resolveQuery(
+                session, 'fluiddb/about = "new object"')
+        result = ObjectAPI(getUser(u'username')).get([u'new object'])
+        self.assertEqual({u'new object': UUID(objectID)}, result)
+
+    @inlineCallbacks
+    def testGetValuesForQueryWithUnknownAboutValue(self):
+        """
+        L{FacadeTagValueMixin.getValuesForQuery} doesn't create objects for
+        unknown about values, so it works against a store that rejects
+        writes.
+        """
+        with login(u'username', uuid4(), self.transact) as session:
+            result = yield self.facade.getValuesForQuery(
+                session, 'fluiddb/about = "new object"', ['fluiddb/about'])
+        self.assertEqual({u'results': {u'id': {}}}, loads(result))
+        result = ObjectAPI(getUser(u'username')).get([u'new object'])
+        self.assertEqual({}, result)
@@ -34,7 +34,7 @@ class FacadeUserMixin(object):
                              role=str(result[username]['role']),
                              objectId=str(result[username]['id']))
 
-        return session.transact.run(run)
+        return session.transact.runReadOnly(run)
 
     def updateUser(self, session, info):
         """Update information about a L{User}.
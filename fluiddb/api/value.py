@@ -1,7 +1,7 @@
 from json import dumps
 from uuid import UUID
 
-from twisted.internet.defer import fail
+from twisted.internet.defer import fail, inlineCallbacks, maybeDeferred
 from twisted.internet import reactor
 from twisted.internet.threads import blockingCallFromThread
 
@@ -12,17 +12,24 @@ from fluiddb.common.types_thrift.ttypes import (
     TUnauthorized, ThriftValue)
 from fluiddb.data.exceptions import MalformedPathError
 from fluiddb.data.object import SearchError
+from fluiddb.data.path import isValidPath
 from fluiddb.data.permission import Operation
 from fluiddb.model.exceptions import UnknownPathError
 from fluiddb.query.parser import IllegalQueryError, parseQuery
 from fluiddb.query.grammar import QueryParseError
 from fluiddb.security.exceptions import PermissionDeniedError
+from fluiddb.security.permission import checkBatchPermissions
 from fluiddb.security.object import SecureObjectAPI
 from fluiddb.security.value import SecureTagValueAPI
 from fluiddb.web.query import (
     createBinaryThriftValue, createThriftValue, guessValue)
 
 
+# The number of objects to fetch values for at a time, when streaming the
+# results of a /values query.
+VALUES_BATCH_SIZE = 1000
+
+
 class TagPathAndValue(object):
     """Represents a pair of tag path and value.
 
@@ -37,20 +44,56 @@ class TagPathAndValue(object):
         self.value = value
 
 
+class TagValueOperation(object):
+    """Represents an operation on a single tag instance, in a batch.
+
+    @param method: The HTTP method of the operation: C{'GET'}, C{'PUT'} or
+        C{'DELETE'}.
+    @param path: A UTF-8 C{str} with the tag path.
+    @param objectId: Optionally, a C{str} with the ID of the object.
+    @param about: Optionally, a UTF-8 C{str} with the C{fluiddb/about} value
+        of the object, used if C{objectId} isn't given.
+    @param value: Optionally, the value to set for a C{PUT} operation.
+        Default is C{None}.
+    """
+
+    def __init__(self, method, path, objectId=None, about=None, value=None):
+        if not isinstance(value, ThriftValue):
+            value = createThriftValue(value)
+        self.method = method
+        self.path = path
+        self.objectId = objectId
+        self.about = about
+        self.value = value
+
+
+# The permission checked for each kind of operation in a batch.
+BATCH_OPERATIONS = {'GET': Operation.READ_TAG_VALUE,
+                    'PUT': Operation.WRITE_TAG_VALUE,
+                    'DELETE': Operation.DELETE_TAG_VALUE}
+
+
 class FacadeTagValueMixin(object):
 
-    def getTagInstance(self, session, path, objectId):
+    def getTagInstance(self, session, path, objectId, withContents=True):
         """Get the L{TagValue} stored for an object.
 
         @param session: The L{FluidinfoSession} for the request.
         @param path: The L{Tag.path} of the value to retrieve.
         @param objectId: The object ID to retrieve the value for.
+        @param withContents: Optionally, a flag indicating whether the
+            contents of a binary value should be opened.  If C{False}, the
+            key of a binary Thrift value is C{None} and only the metadata of
+            the value is loaded.  Default is C{True}.
         @raise TNonexistentTag: Raised if the L{User} doesn't have
             permission to read the value.
         @raise TNoInstanceOnObject: Raised if specified L{Tag.path} doesn't
             exist or if no value is available for the specified object ID.
         @return: A C{Deferred} that will fire with a tuple of the Thrift value
             for the specified path and object ID, and the L{TagValue} itself.
+            The key of a binary Thrift value is an open file-like object,
+            which the caller must read or close, unless C{withContents} is
+            C{False}.
         """
         path = path.decode('utf-8')
         objectID = UUID(objectId)
@@ -58,7 +101,8 @@ class FacadeTagValueMixin(object):
         def run():
             tagValues = SecureTagValueAPI(session.auth.user)
             try:
-                result = tagValues.get([objectID], [path])
+                result = tagValues.get([objectID], [path], openContents=True,
+                                       withContents=withContents)
             except PermissionDeniedError as error:
                 session.log.exception(error)
                 path_, operation = error.pathsAndOperations[0]
@@ -75,7 +119,7 @@ class FacadeTagValueMixin(object):
                 # Thrift-related logic.
                 if isinstance(value, dict):
                     mimeType = value['mime-type'].encode('utf-8')
-                    value = createBinaryThriftValue(value['contents'],
+                    value = createBinaryThriftValue(value.get('contents'),
                                                     mimeType)
                 elif isinstance(value, UUID):
                     value = createThriftValue(str(value))
@@ -83,7 +127,7 @@ class FacadeTagValueMixin(object):
                     value = createThriftValue(value)
                 return (value, tagValue)
 
-        return session.transact.run(run)
+        return session.transact.runReadOnly(run)
 
     def setTagInstance(self, session, path, objectId, thriftValue):
         """Set a L{TagValue} for an object.
@@ -99,14 +143,7 @@ class FacadeTagValueMixin(object):
         """
         path = path.decode('utf-8')
         objectID = UUID(objectId)
-        if thriftValue.valueType == ThriftValueType.BINARY_TYPE:
-            value = {'mime-type': thriftValue.binaryKeyMimeType,
-                     'contents': thriftValue.binaryKey}
-        else:
-            value = guessValue(thriftValue)
-            if isinstance(value, list):
-                value = [item.decode('utf-8') for item in value]
-        values = {objectID: {path: value}}
+        values = {objectID: {path: _getValue(thriftValue)}}
 
         def run():
             try:
@@ -139,7 +176,8 @@ class FacadeTagValueMixin(object):
         def run():
             tagValues = SecureTagValueAPI(session.auth.user)
             try:
-                values = tagValues.get([objectID], [path])
+                values = tagValues.get([objectID], [path],
+                                       withContents=False)
                 return createThriftValue(len(values.keys()) > 0)
             except UnknownPathError as error:
                 session.log.exception(error)
@@ -149,7 +187,7 @@ class FacadeTagValueMixin(object):
                 path_, operation = error.pathsAndOperations[0]
                 raise TNonexistentTag(path_)
 
-        return session.transact.run(run)
+        return session.transact.runReadOnly(run)
 
     def deleteTagInstance(self, session, path, objectId):
         """Delete a C{TagValue} stored for an object.
@@ -178,6 +216,130 @@ class FacadeTagValueMixin(object):
 
         return session.transact.run(run)
 
+    def runBatch(self, session, operations):
+        """Get, set and delete L{TagValue}s in a single transaction.
+
+        Permissions for all the operations are checked together and the
+        objects that are changed are marked as dirty once, instead of once
+        per operation.  An operation that fails doesn't stop the others from
+        running.  Values are read before any changes are made and, if more
+        than one operation changes the same tag instance, the last one wins.
+
+        @param session: The L{FluidinfoSession} for the request.
+        @param operations: A sequence of L{TagValueOperation}s.
+        @return: A C{Deferred} that will fire with a C{list} with a result
+            for each operation, in the same order.  The result of a
+            successful C{GET} is a C{dict} with the C{value} that was read,
+            without the contents of binary values, its C{updated-at} time
+            and the C{username} of its creator, and the result of a
+            successful C{PUT} or C{DELETE} is C{None}.  The result of a
+            failed operation is a L{TInvalidPath}, L{TNonexistentTag},
+            L{TNoInstanceOnObject}, L{TPathPermissionDenied} or
+            L{TUnauthorized} exception describing the error.
+        """
+        errors = {}
+        parsedOperations = []
+        for index, operation in enumerate(operations):
+            path = operation.path.decode('utf-8')
+            if operation.method == 'PUT' and not isValidPath(path):
+                errors[index] = TInvalidPath(operation.path)
+                continue
+            objectID = (UUID(operation.objectId) if operation.objectId
+                        else None)
+            about = (operation.about.decode('utf-8')
+                     if operation.about is not None else None)
+            value = (_getValue(operation.value)
+                     if operation.method == 'PUT' else None)
+            parsedOperations.append(
+                (index, operation.method, path, objectID, about, value))
+
+        def run():
+            user = session.auth.user
+            objects = SecureObjectAPI(user)
+            tagValues = SecureTagValueAPI(user)
+            results = [errors.get(index) for index in range(len(operations))]
+
+            # Resolve about values to object IDs.  Objects that don't exist
+            # yet are created for PUT operations, once the values are known
+            # to be allowed, so denied operations don't leave new objects
+            # behind.
+            abouts = set(about for _, _, _, _, about, _ in parsedOperations
+                         if about is not None)
+            objectIDs = objects.get(list(abouts)) if abouts else {}
+            pending = []
+            for (index, method, path, objectID, about,
+                 value) in parsedOperations:
+                if about is not None:
+                    objectID = objectIDs.get(about)
+                if objectID is None and method != 'PUT':
+                    results[index] = TNoInstanceOnObject(path.encode('utf-8'))
+                else:
+                    pending.append(
+                        (index, method, path, objectID, about, value))
+
+            # Permissions for all the operations are checked together, once.
+            # Operations on unknown paths or that are denied are skipped and
+            # the rest still run.
+            pathsAndOperations = set((path, BATCH_OPERATIONS[method])
+                                     for _, method, path, _, _, _ in pending)
+            deniedOperations, unknownPaths = checkBatchPermissions(
+                user, pathsAndOperations)
+            allowed = []
+            for operation in pending:
+                index, method, path = operation[:3]
+                permission = BATCH_OPERATIONS[method]
+                if path in unknownPaths:
+                    results[index] = TNonexistentTag(path.encode('utf-8'))
+                elif not _isDenied(path, permission, deniedOperations):
+                    allowed.append(operation)
+                elif method == 'GET':
+                    results[index] = TNonexistentTag(path.encode('utf-8'))
+                else:
+                    category, action = getCategoryAndAction(permission)
+                    results[index] = TPathPermissionDenied(
+                        category, action, path.encode('utf-8'))
+
+            # The objects for all the new about values are created together.
+            newAbouts = set(about for _, _, _, objectID, about, _ in allowed
+                            if objectID is None)
+            if newAbouts:
+                try:
+                    objectIDs.update(objects.createMany(newAbouts))
+                except PermissionDeniedError as error:
+                    session.log.exception(error)
+                    for index, _, _, objectID, _, _ in allowed:
+                        if objectID is None:
+                            results[index] = TUnauthorized()
+                    allowed = [operation for operation in allowed
+                               if operation[3] is not None]
+            if not allowed:
+                return results
+
+            # The last change to a tag instance wins, so operations stay in
+            # the order they were requested.
+            pending = []
+            for index, method, path, objectID, about, value in allowed:
+                if objectID is None:
+                    objectID = objectIDs[about]
+                pending.append((index, method, path, objectID, value))
+            found = tagValues.batch(*_groupBatchOperations(pending))
+            for index, method, path, objectID, value in pending:
+                if method != 'GET':
+                    continue
+                tagValue = found.get(objectID, {}).get(path)
+                if tagValue is None:
+                    results[index] = TNoInstanceOnObject(
+                        path.encode('utf-8'), str(objectID))
+                    continue
+                # The creator can only be loaded in the transaction.
+                results[index] = {
+                    'value': tagValue.value,
+                    'updated-at': tagValue.creationTime,
+                    'username': tagValue.creator.username}
+            return results
+
+        return session.transact.run(run)
+
     def resolveQuery(self, session, query):
         """Get the object IDs that match a query.
 
@@ -209,18 +371,23 @@ class FacadeTagValueMixin(object):
             objectIDs = self._resolveQuery(session, objects, parsedQuery)
             return [str(objectID) for objectID in objectIDs]
 
+        # Objects are created for unknown about values, so this can't run
+        # against a replica.
         return session.transact.run(run)
 
-    def _resolveQuery(self, session, objects, query):
+    def _resolveQuery(self, session, objects, query, implicitCreate=True):
         """Resolve a L{Query}.
 
         @param session: The L{FluidinfoSession} for the request.
         @param objects: The L{SecureObjectAPI} to use to fetch object IDs.
         @param query: The L{Query} to resolve.
+        @param implicitCreate: Optionally, C{False} to not create objects for
+            unknown C{fluiddb/about} values, so the query can be resolved in
+            a read-only transaction.  Default is C{True}.
         @return: A C{list} of object ID C{str}s that match the query.
         """
         try:
-            result = objects.search([query])
+            result = objects.search([query], implicitCreate)
         except UnknownPathError as error:
             session.log.exception(error)
             unknownPath = error.paths[0]
@@ -239,24 +406,37 @@ class FacadeTagValueMixin(object):
 
         return result[query]
 
-    def getValuesForQuery(self, session, query, tags=None):
+    def getValuesForQuery(self, session, query, tags=None, write=None):
         """Get L{TagValue}s that match a query.
 
         Existence checks are performed for L{Tag.path}s specified in the
         L{Query}, but not in the return list.  If requested tags don't exist
         we treat them as having no matches.
 
+        Values are fetched and serialized in batches of
+        L{VALUES_BATCH_SIZE} objects, so a response can be streamed with
+        C{write} without building all of it in memory first.  When
+        streaming, the query is resolved and each batch is fetched in its
+        own short transaction, and no database thread is held while a chunk
+        is written to the client.
+
         @param session: The L{FluidinfoSession} for the request.
         @param query: The query to resolve.
         @param tags: Optionally, the sequence of L{Tag.path}s to retrieve
             values for.
+        @param write: Optionally, a callable to stream the response to.  It's
+            called in the reactor thread with each C{str} chunk of the JSON
+            response, as soon as it's ready.  If it returns a C{Deferred},
+            the next batch isn't fetched until it fires.  Errors caused by
+            the query or the requested L{Tag.path}s are raised before the
+            first chunk is written.
         @raise TNonexistentTag: Raised if L{Tag}s in the L{Query} don't exist,
             or if the L{User} doesn't have L{Operation.READ_TAG_VALUE}
             permission on all L{Tag}s in the query.
         @raise TParseError: Raised if the L{Query} can't be parsed.
-        @return: A L{Deferred} that will fire with a C{dict} that maps object
-            IDs to L{Tag.path}s with L{TagValue}s, matching the following
-            format::
+        @return: A L{Deferred} that will fire with C{None}, if C{write} is
+            given, or with the JSON response otherwise.  It maps object IDs to
+            L{Tag.path}s with L{TagValue}s, matching the following format::
 
               {'results': {
                   'id': {<object-id>: {<path>: {'value': <contents>},
@@ -275,49 +455,102 @@ class FacadeTagValueMixin(object):
             return fail(TBadRequest(str(error)))
         if tags is not None:
             tags = [tag.decode('utf-8') for tag in tags]
+        if write is not None:
+            return self._streamValuesForQuery(session, parsedQuery, tags,
+                                              write)
 
         def run():
             tagValues = SecureTagValueAPI(session.auth.user)
             objects = SecureObjectAPI(session.auth.user)
-            objectIDs = self._resolveQuery(session, objects, parsedQuery)
-            if not objectIDs:
-                return dumps({'results': {'id': {}}})
-            try:
-                values = tagValues.get(objectIDs, tags)
-            except UnknownPathError as error:
-                # One or more of the requested return Tag's doesn't exist.
-                # We'll filter them out and try again because we don't want to
-                # fail the request just because of a missing tag.
-                filteredTags = set(tags) - set(error.paths)
-                if not filteredTags:
-                    return dumps({'results': {'id': {}}})
-                values = tagValues.get(objectIDs, filteredTags)
-            except PermissionDeniedError as error:
-                session.log.exception(error)
-                path_, operation = error.pathsAndOperations[0]
-                raise TNonexistentTag(path_)
+            objectIDs = list(self._resolveQuery(session, objects, parsedQuery,
+                                                implicitCreate=False))
+            paths = tags
+            items = []
+            for i in xrange(0, len(objectIDs), VALUES_BATCH_SIZE):
+                batch = objectIDs[i:i + VALUES_BATCH_SIZE]
+                values, paths = self._getValuesBatch(session, tagValues,
+                                                     batch, paths)
+                if values:
+                    items.append(_serializeValues(values))
+            return '{"results": {"id": {%s}}}' % ', '.join(items)
+
+        return session.transact.runReadOnly(run)
+
+    @inlineCallbacks
+    def _streamValuesForQuery(self, session, query, paths, write):
+        """Stream the L{TagValue}s that match a query.
+
+        See L{getValuesForQuery}.  Batches are fetched in separate read-only
+        transactions, so a slow client doesn't keep a database thread busy or
+        a transaction open while its response is written.
 
-            valuesByObjectID = {}
-            for objectID, tagPaths in values.iteritems():
-                for tagPath, tagValue in tagPaths.iteritems():
-                    value = tagValue.value
-                    if isinstance(value, dict):
-                        size = len(value[u'contents'])
-                        mimeType = value[u'mime-type']
-                        value = {u'value-type': mimeType,
-                                 u'size': size}
-                    elif isinstance(value, UUID):
-                        value = {'value': str(value)}
-                    else:
-                        value = {'value': value}
-                    value['updated-at'] = tagValue.creationTime.isoformat()
-                    value['username'] = tagValue.creator.username
-                    objectID = str(objectID)
-                    valuesByObjectID.setdefault(objectID, {})[tagPath] = value
-            result = {'results': {'id': valuesByObjectID}}
-            return dumps(result)
+        @param session: The L{FluidinfoSession} for the request.
+        @param query: The parsed L{Query} to resolve.
+        @param paths: The L{Tag.path}s to get values for or C{None} to get
+            values for all the L{Tag}s on each object.
+        @param write: The callable to stream the response to.
+        @return: A C{Deferred} that will fire with C{None} once the whole
+            response has been written.
+        """
 
-        return session.transact.run(run)
+        def resolve():
+            objects = SecureObjectAPI(session.auth.user)
+            return list(self._resolveQuery(session, objects, query,
+                                           implicitCreate=False))
+
+        def getBatch(objectIDs, paths):
+            tagValues = SecureTagValueAPI(session.auth.user)
+            values, paths = self._getValuesBatch(session, tagValues,
+                                                 objectIDs, paths)
+            return _serializeValues(values), paths
+
+        objectIDs = yield session.transact.runReadOnly(resolve)
+        separator = '{"results": {"id": {'
+        for i in xrange(0, len(objectIDs), VALUES_BATCH_SIZE):
+            batch = objectIDs[i:i + VALUES_BATCH_SIZE]
+            items, paths = yield session.transact.runReadOnly(getBatch, batch,
+                                                              paths)
+            if items:
+                yield maybeDeferred(write, separator + items)
+                separator = ', '
+            if paths is not None and not paths:
+                break
+        if separator != ', ':
+            yield maybeDeferred(write, separator)
+        yield maybeDeferred(write, '}}}')
+
+    def _getValuesBatch(self, session, tagValues, objectIDs, paths):
+        """Get L{TagValue}s for a batch of objects.
+
+        @param session: The L{FluidinfoSession} for the request.
+        @param tagValues: The L{SecureTagValueAPI} to use.
+        @param objectIDs: A C{list} of object IDs to get values for.
+        @param paths: The L{Tag.path}s to get values for or C{None} to get
+            values for all the L{Tag}s on each object.
+        @raise TNonexistentTag: Raised if the L{User} doesn't have
+            L{Operation.READ_TAG_VALUE} permission on any of the L{Tag}s.
+        @return: A C{(values, paths)} tuple.  C{values} is a C{dict} mapping
+            object IDs to L{Tag.path}s and L{FluidinfoTagValue}s, and C{paths}
+            are the requested L{Tag.path}s that exist, to use for the next
+            batch.
+        """
+        if paths is not None and not paths:
+            return {}, paths
+        try:
+            values = tagValues.get(objectIDs, paths, withContents=False)
+        except UnknownPathError as error:
+            # One or more of the requested return Tag's doesn't exist.
+            # We'll filter them out and try again because we don't want to
+            # fail the request just because of a missing tag.
+            paths = set(paths) - set(error.paths)
+            if not paths:
+                return {}, paths
+            values = tagValues.get(objectIDs, paths, withContents=False)
+        except PermissionDeniedError as error:
+            session.log.exception(error)
+            path_, operation = error.pathsAndOperations[0]
+            raise TNonexistentTag(path_)
+        return values, paths
 
     def deleteValuesForQuery(self, session, query, tags=None):
         """Delete L{TagValue}s that match a query.
@@ -469,3 +702,97 @@ class FacadeTagValueMixin(object):
                     raise TPathPermissionDenied(category, action, path_)
 
         return session.transact.run(run)
+
+
+def _getValue(thriftValue):
+    """Convert a Thrift value to a value that can be stored.
+
+    @param thriftValue: The L{ThriftValue} to convert.
+    @return: The value, in the format expected by L{SecureTagValueAPI.set}.
+    """
+    if thriftValue.valueType == ThriftValueType.BINARY_TYPE:
+        return {'mime-type': thriftValue.binaryKeyMimeType,
+                'contents': thriftValue.binaryKey}
+    value = guessValue(thriftValue)
+    if isinstance(value, list):
+        value = [item.decode('utf-8') for item in value]
+    return value
+
+
+def _isDenied(path, operation, deniedOperations):
+    """Determine whether an operation in a batch has been denied.
+
+    Setting a value for a L{Tag} that doesn't exist yet is denied with the
+    L{Operation.CREATE_NAMESPACE} permission of its nearest existing parent
+    L{Namespace}, so that is matched too.
+
+    @param path: The L{Tag.path} of the operation.
+    @param operation: The L{Operation} to check.
+    @param deniedOperations: A sequence of C{(path, Operation)} 2-tuples
+        for the denied operations.
+    @return: C{True} if the operation has been denied, otherwise C{False}.
+    """
+    for deniedPath, deniedOperation in deniedOperations:
+        if deniedPath == path and deniedOperation == operation:
+            return True
+        if (operation == Operation.WRITE_TAG_VALUE and
+                deniedOperation == Operation.CREATE_NAMESPACE and
+                path.startswith(deniedPath + u'/')):
+            return True
+    return False
+
+
+def _groupBatchOperations(operations):
+    """Group the operations in a batch by the kind of change they make.
+
+    @param operations: A C{list} of C{(index, method, path, objectID,
+        value)} 5-tuples.
+    @return: A C{(reads, values, deletes)} 3-tuple, in the format expected
+        by L{SecureTagValueAPI.batch}.  When more than one operation changes
+        the same tag instance, only the last one is included.
+    """
+    reads = []
+    changes = {}
+    for index, method, path, objectID, value in operations:
+        if method == 'GET':
+            reads.append((objectID, path))
+        else:
+            changes[(objectID, path)] = (method, value)
+    values = {}
+    deletes = []
+    for (objectID, path), (method, value) in changes.iteritems():
+        if method == 'PUT':
+            values.setdefault(objectID, {})[path] = value
+        else:
+            deletes.append((objectID, path))
+    return reads, values, deletes
+
+
+def _serializeValues(values):
+    """Serialize a batch of the results of a /values query to JSON.
+
+    The objects' creators are loaded, so this must be called in the
+    transaction the values were fetched in.
+
+    @param values: A C{dict} mapping object IDs to L{Tag.path}s and
+        L{FluidinfoTagValue}s.
+    @return: A C{str} with the comma-separated JSON members for the objects,
+        to be included in the C{id} object of the response.
+    """
+    items = []
+    for objectID, tagPaths in values.iteritems():
+        valuesByPath = {}
+        for tagPath, tagValue in tagPaths.iteritems():
+            value = tagValue.value
+            if isinstance(value, dict):
+                value = {u'value-type': value[u'mime-type'],
+                         u'size': value[u'size']}
+            elif isinstance(value, UUID):
+                value = {'value': str(value)}
+            else:
+                value = {'value': value}
+            value['updated-at'] = tagValue.creationTime.isoformat()
+            value['username'] = tagValue.creator.username
+            valuesByPath[tagPath] = value
+        items.append('%s: %s' % (dumps(str(objectID)), dumps(valuesByPath)))
+    return ', '.join(items)
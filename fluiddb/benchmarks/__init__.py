@@ -0,0 +1 @@
+"""Logic to measure the performance of Fluidinfo."""
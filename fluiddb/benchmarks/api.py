@@ -0,0 +1,443 @@
+"""Benchmarks for the API service, run against an in-process server.
+
+The API service is started with L{setupApplication}, so it uses the
+PostgreSQL and Redis servers in its configuration, but queries that need the
+object index are answered by a L{FakeIndexResource} running in the same
+process, so Solr doesn't have to be installed.
+"""
+
+from base64 import b64encode
+from collections import deque
+from datetime import datetime
+import json
+import logging
+from random import choice
+from string import ascii_letters
+from StringIO import StringIO
+from urllib import quote, urlencode
+
+from twisted.internet import reactor
+from twisted.internet.defer import (
+    DeferredList, gatherResults, inlineCallbacks, returnValue)
+from twisted.web.client import Agent, FileBodyProducer
+from twisted.web.http_headers import Headers
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+from fluiddb.application import (
+    APIServiceOptions, getConfig, setupApplication)
+from fluiddb.benchmarks.results import BenchmarkResults
+from fluiddb.util.agent import ResponseConsumer
+
+
+PRIMITIVE_CONTENT_TYPE = 'application/vnd.fluiddb.value+json'
+
+
+class OperationError(Exception):
+    """Raised when a request made by a benchmark fails.
+
+    @param name: The name of the operation the request was made for.
+    @param error: A C{str} describing the error.
+    """
+
+    def __init__(self, name, error):
+        self.name = name
+        self.error = error
+
+    def __str__(self):
+        return '%s failed: %s' % (self.name, self.error)
+
+
+def randomString(size):
+    """Get a random string.
+
+    @param size: The number of characters in the string.
+    @return: A C{unicode} string with random ASCII letters.
+    """
+    return u''.join(choice(ascii_letters) for _ in xrange(size))
+
+
+class FakeIndexResource(Resource):
+    """A stand-in for the Solr object index.
+
+    Searches return the most recently added object IDs and updates are
+    ignored, so the benchmarks measure the API service rather than Solr.
+
+    @param size: Optionally, the maximum number of object IDs returned by a
+        search.  Default is C{10}.
+    """
+
+    isLeaf = True
+
+    def __init__(self, size=10):
+        Resource.__init__(self)
+        self.objectIDs = deque(maxlen=size)
+
+    def add(self, objectID):
+        """Add an object ID to the results returned by searches.
+
+        @param objectID: The C{str} ID of the object.
+        """
+        self.objectIDs.append(str(objectID))
+
+    def render_GET(self, request):
+        """Handle a Solr request.
+
+        @param request: The incoming C{twisted.web.server.Request} request.
+        @return: A JSON response in the format used by Solr.
+        """
+        response = {'responseHeader': {'status': 0, 'QTime': 0}}
+        if request.postpath and request.postpath[-1] == 'select':
+            rows = int(request.args.get('rows', [len(self.objectIDs)])[0])
+            documents = [{'fluiddb/id': objectID}
+                         for objectID in list(self.objectIDs)[:rows]]
+            response['response'] = {'numFound': len(documents), 'start': 0,
+                                    'docs': documents}
+        body = json.dumps(response)
+        request.setHeader('Content-Type', 'application/json')
+        request.setHeader('Content-Length', str(len(body)))
+        return body
+
+    render_POST = render_GET
+
+
+class BenchmarkClient(object):
+    """An HTTP client for the API service that authenticates as a user.
+
+    @param endpoint: The URL of the API service, like
+        C{http://127.0.0.1:9000}.
+    @param username: The username to authenticate as, or C{None} to make
+        anonymous requests.
+    @param password: The password of the user.
+    @param agent: Optionally, the C{Agent} instance to make requests with.
+        Default is an C{Agent} instance instantiated with the global
+        C{Reactor}.
+    """
+
+    def __init__(self, endpoint, username, password, agent=None):
+        self._endpoint = endpoint.rstrip('/')
+        self._authorization = None
+        if username is not None:
+            credentials = '%s:%s' % (username, password)
+            self._authorization = 'Basic ' + b64encode(credentials)
+        self._agent = agent or Agent(reactor)
+
+    @inlineCallbacks
+    def request(self, method, path, arguments=None, payload=None,
+                contentType='application/json'):
+        """Make a request to the API service.
+
+        @param method: The HTTP method to use.
+        @param path: The quoted C{str} path to request, like C{/objects}.
+        @param arguments: Optionally, a sequence of C{(name, value)} 2-tuples
+            with the arguments to send in the query string.
+        @param payload: Optionally, a value to send as a JSON payload.
+        @param contentType: Optionally, the content type of the payload.
+        @return: A C{Deferred} that fires with a C{(code, body)} 2-tuple.
+        """
+        url = self._endpoint + path
+        if arguments:
+            url += '?' + urlencode([(name, value.encode('utf-8'))
+                                    for name, value in arguments])
+        headers = Headers()
+        if self._authorization is not None:
+            headers.addRawHeader('Authorization', self._authorization)
+        producer = None
+        if payload is not None:
+            headers.addRawHeader('Content-Type', contentType)
+            producer = FileBodyProducer(StringIO(json.dumps(payload)))
+        response = yield self._agent.request(method, url, headers, producer)
+        consumer = ResponseConsumer()
+        response.deliverBody(consumer)
+        body = yield consumer.deferred
+        returnValue((response.code, body))
+
+
+def quotePath(*segments):
+    """Build a quoted API path.
+
+    @param segments: The C{unicode} segments of the path.  Segments are
+        quoted separately, so C{/} characters in them are preserved, which
+        is what tag and namespace paths need.
+    @return: A C{str} path, like C{/objects/<id>/fluiddb/about}.
+    """
+    return ''.join('/' + quote(segment.encode('utf-8'), safe='/')
+                   for segment in segments)
+
+
+def quoteAboutPath(about, *segments):
+    """Build a quoted C{/about} API path.
+
+    @param about: The C{unicode} about value of the object.  Unlike the
+        other segments, C{/} characters in it are quoted.
+    @param segments: The C{unicode} segments of the rest of the path.
+    @return: A C{str} path, like C{/about/<about>/fluiddb/about}.
+    """
+    return ('/about/' + quote(about.encode('utf-8'), safe='') +
+            quotePath(*segments))
+
+
+class APIBenchmark(object):
+    """Runs the benchmark scenarios against an API service.
+
+    Each iteration creates an object, by ID and by about value, a namespace
+    and a tag, updates, reads and deletes them, like users of the API do.
+    Every request is timed separately and recorded in a
+    L{BenchmarkResults} instance under the name of its operation.
+
+    @param client: The L{BenchmarkClient} to make requests with.
+    @param namespace: Optionally, the C{unicode} path of the namespace to
+        create namespaces and tags in.  The user must have permission to do
+        so.  Default is C{fluiddb/testing}.
+    @param index: Optionally, the L{FakeIndexResource} used by the API
+        service.  Objects are added to it as they're created.
+    @param utcnow: For testing purposes, the implementation of
+        C{datetime.utcnow} to use when calculating the time.
+    """
+
+    def __init__(self, client, namespace=None, index=None, utcnow=None):
+        self._client = client
+        self._namespace = namespace or u'fluiddb/testing'
+        self._index = index
+        self._utcnow = utcnow or datetime.utcnow
+        self.results = BenchmarkResults(utcnow=self._utcnow)
+
+    @inlineCallbacks
+    def call(self, name, method, path, arguments=None, payload=None,
+             contentType='application/json'):
+        """Make a timed request and record its result.
+
+        @param name: The name of the operation the request is made for.
+        @param method: The HTTP method to use.
+        @param path: The quoted C{str} path to request.
+        @param arguments: Optionally, a sequence of C{(name, value)} 2-tuples
+            with the arguments to send in the query string.
+        @param payload: Optionally, a value to send as a JSON payload.
+        @param contentType: Optionally, the content type of the payload.
+        @raise OperationError: Raised if the request failed.
+        @return: A C{Deferred} that fires with the body of the response.
+        """
+        start = self._utcnow()
+        try:
+            code, body = yield self._client.request(
+                method, path, arguments, payload, contentType)
+        except Exception as error:
+            self.results.recordError(name, error.__class__.__name__)
+            raise OperationError(name, error.__class__.__name__)
+        if code >= 400:
+            self.results.recordError(name, str(code))
+            raise OperationError(name, str(code))
+        self.results.record(name, self._utcnow() - start)
+        returnValue(body)
+
+    @inlineCallbacks
+    def runIteration(self):
+        """Run the benchmark scenarios once.
+
+        @raise OperationError: Raised if a request failed.  The rest of the
+            iteration is skipped.
+        @return: A C{Deferred} that fires when the iteration is complete.
+        """
+        term = randomString(25)
+        about = u'benchmark test object ' + term
+        otherAbout = u'benchmark test object ' + randomString(25)
+        name = randomString(25)
+        namespace = self._namespace + u'/' + name
+        tagName = randomString(25)
+        tag = self._namespace + u'/' + tagName
+        equalsQuery = u'fluiddb/about = "%s"' % about
+
+        # Create.
+        body = yield self.call('create-object', 'POST', '/objects',
+                               payload={'about': about})
+        objectID = json.loads(body)['id']
+        if self._index is not None:
+            self._index.add(objectID)
+        yield self.call('create-object-by-about', 'POST',
+                        quoteAboutPath(otherAbout))
+        yield self.call('create-namespace', 'POST',
+                        quotePath(u'namespaces', self._namespace),
+                        payload={'name': name,
+                                 'description': u'Namespace ' + name})
+        yield self.call('create-tag', 'POST',
+                        quotePath(u'tags', self._namespace),
+                        payload={'name': tagName,
+                                 'description': u'Tag ' + tagName,
+                                 'indexed': False})
+
+        # Update.
+        yield self.call('set-tag-value', 'PUT',
+                        quotePath(u'objects', objectID, tag),
+                        payload=randomString(100),
+                        contentType=PRIMITIVE_CONTENT_TYPE)
+        yield self.call('set-tag-value-by-about', 'PUT',
+                        quoteAboutPath(otherAbout, tag),
+                        payload=randomString(100),
+                        contentType=PRIMITIVE_CONTENT_TYPE)
+        yield self.call('update-namespace', 'PUT',
+                        quotePath(u'namespaces', namespace),
+                        payload={'description': randomString(50)})
+        yield self.call('update-tag', 'PUT', quotePath(u'tags', tag),
+                        payload={'description': randomString(50)})
+        yield self.call('set-values', 'PUT', '/values',
+                        payload={'queries': [
+                            [equalsQuery, {tag: {'value': randomString(100)}}]
+                        ]})
+
+        # Read.
+        yield self.call('equals-query', 'GET', '/objects',
+                        arguments=[('query', equalsQuery)])
+        yield self.call('matches-query', 'GET', '/objects',
+                        arguments=[('query',
+                                    u'fluiddb/about matches "%s"' % term)])
+        yield self.call('get-object', 'GET', quotePath(u'objects', objectID),
+                        arguments=[('showAbout', u'True')])
+        yield self.call('get-tag-value', 'GET',
+                        quotePath(u'objects', objectID, tag))
+        yield self.call('has-tag-value', 'HEAD',
+                        quotePath(u'objects', objectID, tag))
+        yield self.call('get-object-by-about', 'GET',
+                        quoteAboutPath(otherAbout))
+        yield self.call('get-tag-value-by-about', 'GET',
+                        quoteAboutPath(otherAbout, tag))
+        yield self.call('has-tag-value-by-about', 'HEAD',
+                        quoteAboutPath(otherAbout, tag))
+        yield self.call('get-namespace', 'GET',
+                        quotePath(u'namespaces', self._namespace),
+                        arguments=[('returnDescription', u'True'),
+                                   ('returnNamespaces', u'True'),
+                                   ('returnTags', u'True')])
+        yield self.call('get-tag', 'GET', quotePath(u'tags', tag),
+                        arguments=[('returnDescription', u'True')])
+        yield self.call('get-values', 'GET', '/values',
+                        arguments=[('query', equalsQuery), ('tag', tag),
+                                   ('tag', u'fluiddb/about')])
+        yield self.call('get-recent-object-activity', 'GET',
+                        quotePath(u'recent', u'objects', objectID))
+        yield self.call('get-recent-about-activity', 'GET',
+                        '/recent' + quoteAboutPath(otherAbout))
+
+        # Delete.
+        yield self.call('delete-tag-value', 'DELETE',
+                        quotePath(u'objects', objectID, tag))
+        yield self.call('delete-tag-value-by-about', 'DELETE',
+                        quoteAboutPath(otherAbout, tag))
+        yield self.call('delete-namespace', 'DELETE',
+                        quotePath(u'namespaces', namespace))
+        yield self.call('delete-tag', 'DELETE', quotePath(u'tags', tag))
+
+    @inlineCallbacks
+    def _runWorker(self, iterations):
+        """Run iterations until there are none left.
+
+        @param iterations: An iterator shared by all the workers, that yields
+            once for each iteration to run.
+        @return: A C{Deferred} that fires when there are no iterations left.
+        """
+        for _ in iterations:
+            try:
+                yield self.runIteration()
+            except OperationError as error:
+                logging.debug(str(error))
+            except Exception:
+                logging.exception('Benchmark iteration failed:')
+
+    @inlineCallbacks
+    def run(self, iterations, concurrency=1):
+        """Run the benchmark scenarios a number of times.
+
+        @param iterations: The total number of iterations to run.
+        @param concurrency: Optionally, the number of iterations to run at
+            the same time.  Default is C{1}.
+        @return: A C{Deferred} that fires with the C{dict} returned by
+            L{BenchmarkResults.dumps}.
+        """
+        remaining = iter(xrange(iterations))
+        self.results.start()
+        yield DeferredList([self._runWorker(remaining)
+                            for _ in xrange(concurrency)])
+        self.results.stop()
+        returnValue(self.results.dumps())
+
+
+class LocalAPIService(object):
+    """An API service running in this process, with a fake object index.
+
+    @param configPath: Optionally, the path of the configuration file to
+        load.  Default values, for a local development setup, are used if
+        it isn't provided.
+    @param logPath: Optionally, the path of the API service log.  Default
+        is C{fluidinfo-api.log}.
+    @ivar index: The L{FakeIndexResource} used by the API service.
+    @ivar endpoint: The URL of the API service, once it's been started.
+    """
+
+    def __init__(self, configPath=None, logPath=None):
+        self._configPath = configPath
+        self._logPath = logPath
+        self._ports = []
+        self.index = FakeIndexResource()
+        self.endpoint = None
+
+    def start(self):
+        """Start the fake index and the API service on free local ports.
+
+        @return: The URL of the API service.
+        """
+        indexPort = reactor.listenTCP(0, Site(self.index),
+                                      interface='127.0.0.1')
+        self._ports.append(indexPort)
+        arguments = []
+        if self._configPath:
+            arguments.extend(['--config', self._configPath])
+        if self._logPath:
+            arguments.extend(['--logfile', self._logPath])
+        options = APIServiceOptions()
+        options.parseOptions(arguments)
+        _, site, _ = setupApplication(options)
+
+        config = getConfig()
+        config.set('index', 'url',
+                   'http://127.0.0.1:%d/solr' % indexPort.getHost().port)
+        config.set('index', 'shards', '')
+        apiPort = reactor.listenTCP(0, site, interface='127.0.0.1')
+        self._ports.append(apiPort)
+        self.endpoint = 'http://127.0.0.1:%d' % apiPort.getHost().port
+        return self.endpoint
+
+    def stop(self):
+        """Stop listening for requests.
+
+        @return: A C{Deferred} that fires when the ports are closed.
+        """
+        ports, self._ports = self._ports, []
+        return gatherResults([port.stopListening() for port in ports])
+
+
+@inlineCallbacks
+def runAPIBenchmark(username, password, iterations, concurrency=1,
+                    configPath=None, logPath=None, namespace=None):
+    """Start a local API service and run the benchmark scenarios against it.
+
+    @param username: The username to make requests as.
+    @param password: The password of the user.
+    @param iterations: The total number of iterations to run.
+    @param concurrency: Optionally, the number of iterations to run at the
+        same time.  Default is C{1}.
+    @param configPath: Optionally, the path of the API service configuration
+        file.
+    @param logPath: Optionally, the path of the API service log.
+    @param namespace: Optionally, the C{unicode} path of the namespace to
+        create namespaces and tags in.
+    @return: A C{Deferred} that fires with the C{dict} returned by
+        L{BenchmarkResults.dumps}.
+    """
+    service = LocalAPIService(configPath, logPath)
+    endpoint = service.start()
+    client = BenchmarkClient(endpoint, username, password)
+    benchmark = APIBenchmark(client, namespace, service.index)
+    try:
+        results = yield benchmark.run(iterations, concurrency)
+    finally:
+        yield service.stop()
+    returnValue(results)
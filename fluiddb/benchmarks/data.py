@@ -0,0 +1,125 @@
+"""Generate data in the main store for model benchmarks."""
+
+import logging
+from random import Random
+from uuid import uuid4
+
+from fluiddb.data.permission import Operation, Policy
+from fluiddb.data.store import getMainStore
+from fluiddb.model.comment import CommentAPI
+from fluiddb.model.object import ObjectAPI
+from fluiddb.model.permission import PermissionAPI
+from fluiddb.model.tag import TagAPI
+from fluiddb.model.user import UserAPI, getUser
+from fluiddb.model.value import TagValueAPI
+
+
+class Dataset(object):
+    """Information about the data created by L{generateDataset}.
+
+    @param parameters: A C{dict} with the parameters used to generate the
+        data.
+    @param username: The L{User.username} of the owner of the data.
+    @param readerUsername: The L{User.username} of another user, who is in
+        the exceptions list of every L{TagPermission} unless the lists are
+        empty.
+    @param paths: The L{Tag.path}s of the tags values were set for.
+    @param objectIDs: The IDs of the objects values were set for.
+    @param abouts: The C{fluiddb/about} values of the objects, in the same
+        order as C{objectIDs}.
+    """
+
+    def __init__(self, parameters, username, readerUsername, paths,
+                 objectIDs, abouts):
+        self.parameters = parameters
+        self.username = username
+        self.readerUsername = readerUsername
+        self.paths = paths
+        self.objectIDs = objectIDs
+        self.abouts = abouts
+
+
+def generateDataset(objects=100, tagsPerObject=10, binaryRatio=0.1,
+                    exceptions=10, comments=10, valueSize=100, seed=None):
+    """Create users, tags, objects, values, permissions and comments.
+
+    A new user, with a unique username, owns the data, so the data from
+    several runs can be kept in the same database.  Every object has a
+    value for each tag, and each tag has a C{READ_TAG_VALUE} permission with
+    an exceptions list of the requested size.  The data is committed.
+
+    @param objects: Optionally, the number of objects to create.  Default
+        is C{100}.
+    @param tagsPerObject: Optionally, the number of tags to set on each
+        object.  Default is C{10}.
+    @param binaryRatio: Optionally, the fraction of values that are binary
+        instead of strings.  Default is C{0.1}.
+    @param exceptions: Optionally, the number of users in the exceptions
+        list of each tag's permission.  Default is C{10}.
+    @param comments: Optionally, the number of comments to make on each of
+        the first ten objects.  Default is C{10}.
+    @param valueSize: Optionally, the size in bytes of each value.  Default
+        is C{100}.
+    @param seed: Optionally, the seed for the random number generator, to
+        generate the same values in different runs.
+    @return: A L{Dataset} with information about the new data.
+    """
+    parameters = {'objects': objects, 'tags-per-object': tagsPerObject,
+                  'binary-ratio': binaryRatio, 'exceptions': exceptions,
+                  'comments': comments, 'value-size': valueSize}
+    random = Random(seed)
+    username = u'benchmark%s' % uuid4().hex[:8]
+    exceptionUsernames = [u'%s-%d' % (username, index)
+                          for index in xrange(max(exceptions, 1))]
+
+    logging.info('Creating %d users.', len(exceptionUsernames) + 1)
+    UserAPI().create([(name, u'secret', u'Benchmark user',
+                       u'benchmark@example.com')
+                      for name in [username] + exceptionUsernames])
+    user = getUser(username)
+
+    paths = [u'%s/tag%d' % (username, index)
+             for index in xrange(tagsPerObject)]
+    logging.info('Creating %d tags.', len(paths))
+    TagAPI(user).create([(path, u'Benchmark tag') for path in paths])
+    PermissionAPI(user).set([
+        (path, Operation.READ_TAG_VALUE, Policy.CLOSED,
+         [username] + exceptionUsernames[:exceptions])
+        for path in paths])
+
+    logging.info('Creating %d objects.', objects)
+    objectAPI = ObjectAPI(user)
+    abouts = [u'benchmark object %s %d' % (username, index)
+              for index in xrange(objects)]
+    objectIDs = [objectAPI.create(about) for about in abouts]
+
+    logging.info('Setting %d values.', objects * tagsPerObject)
+    values = {}
+    for objectID in objectIDs:
+        values[objectID] = {}
+        for path in paths:
+            if random.random() < binaryRatio:
+                contents = ''.join(chr(random.randint(0, 255))
+                                   for _ in xrange(valueSize))
+                value = {'mime-type': 'application/octet-stream',
+                         'contents': contents}
+            else:
+                value = u''.join(random.choice(u'abcdefghijklmnopqrstuvwxyz')
+                                 for _ in xrange(valueSize))
+            values[objectID][path] = value
+    TagValueAPI(user).set(values)
+
+    if comments:
+        if getUser(u'fluidinfo.com') is None:
+            UserAPI().create([(u'fluidinfo.com', u'secret', u'Fluidinfo',
+                               u'info@example.com')])
+        logging.info('Creating %d comments.', comments * min(objects, 10))
+        commentAPI = CommentAPI(user)
+        for about in abouts[:10]:
+            for index in xrange(comments):
+                commentAPI.create(u'Benchmark comment %d' % index, username,
+                                  about=[about])
+
+    getMainStore().commit()
+    return Dataset(parameters, username, exceptionUsernames[0], paths,
+                   objectIDs, abouts)
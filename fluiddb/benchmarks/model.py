@@ -0,0 +1,176 @@
+"""Microbenchmarks for the hot paths of the model layer.
+
+Each benchmark is timed twice, once with the model APIs created by
+L{APIFactory} and once with the caching APIs created by
+L{CachingAPIFactory}, so the effect of the cache can be measured.
+"""
+
+from datetime import datetime
+from random import Random
+
+import transaction
+
+from fluiddb.benchmarks.results import BenchmarkResults
+from fluiddb.cache.factory import CachingAPIFactory
+from fluiddb.data.permission import Operation
+from fluiddb.model.comment import CommentAPI
+from fluiddb.model.factory import APIFactory
+from fluiddb.model.user import getUser
+from fluiddb.query.parser import parseQuery
+from fluiddb.security.permission import UserPermissionChecker
+
+
+# The queries parsed by the parseQuery benchmark, from simple to complex.
+QUERIES = [
+    u'has fluiddb/about',
+    u'fluiddb/about = "benchmark"',
+    u'username/rating > 5 and has username/seen',
+    u'fluiddb/about matches "benchmark" or username/tag contains "value"',
+    u'(username/rating >= 1 and username/rating < 10) except '
+    u'(has username/hidden or username/kind = "spam") and '
+    u'username/tags contains "benchmark"']
+
+# The names of the factories benchmarks are run with.
+FACTORIES = [('model', APIFactory), ('cache', CachingAPIFactory)]
+
+
+class ModelBenchmark(object):
+    """Times model functions against a L{Dataset}.
+
+    Every call is made in its own transaction, which is aborted afterwards,
+    so benchmarks that change data can be repeated.  The time spent
+    aborting transactions isn't measured.
+
+    @param dataset: The L{Dataset} to use.
+    @param number: Optionally, the number of times to call each function.
+        Default is C{100}.
+    @param batchSize: Optionally, the number of objects or tags used in
+        each call.  Default is C{10}.
+    @param seed: Optionally, the seed for the random number generator used
+        to pick objects and tags.
+    @param utcnow: For testing purposes, the implementation of
+        C{datetime.utcnow} to use when calculating the time.
+    """
+
+    def __init__(self, dataset, number=100, batchSize=10, seed=None,
+                 utcnow=None):
+        self._dataset = dataset
+        self._number = number
+        self._batchSize = batchSize
+        self._random = Random(seed)
+        self._utcnow = utcnow or datetime.utcnow
+        self.results = BenchmarkResults(utcnow=self._utcnow)
+
+    def _sample(self, values):
+        """Pick random values for a call.
+
+        @param values: The sequence of values to pick from.
+        @return: A C{list} with up to C{batchSize} values.
+        """
+        return self._random.sample(values, min(self._batchSize, len(values)))
+
+    def time(self, name, function):
+        """Time calls to a function.
+
+        The function is called once before timing starts, to warm up the
+        cache.
+
+        @param name: The name to record the timings under.
+        @param function: The function to call, without arguments.
+        """
+        function()
+        transaction.abort()
+        for _ in xrange(self._number):
+            start = self._utcnow()
+            function()
+            duration = self._utcnow() - start
+            transaction.abort()
+            self.results.record(name, duration)
+
+    def getTagValues(self, factory):
+        """Benchmark L{TagValueAPI.get} for random objects and tags."""
+        tagValues = factory.tagValues(getUser(self._dataset.username))
+        return lambda: tagValues.get(self._sample(self._dataset.objectIDs),
+                                     self._sample(self._dataset.paths))
+
+    def setTagValues(self, factory):
+        """Benchmark L{TagValueAPI.set} for random objects and tags."""
+        tagValues = factory.tagValues(getUser(self._dataset.username))
+
+        def run():
+            paths = self._sample(self._dataset.paths)
+            values = dict(
+                (objectID, dict((path, self._random.random())
+                                for path in paths))
+                for objectID in self._sample(self._dataset.objectIDs))
+            tagValues.set(values)
+
+        return run
+
+    def searchObjects(self, factory):
+        """
+        Benchmark L{ObjectAPI.search} with queries resolved by the database.
+        """
+        objects = factory.objects(getUser(self._dataset.username))
+
+        def run():
+            queries = [parseQuery(u'fluiddb/about = "%s"' % about)
+                       for about in self._sample(self._dataset.abouts)]
+            queries.extend(parseQuery(u'has %s' % path)
+                           for path in self._sample(self._dataset.paths))
+            objects.search(queries, implicitCreate=False).get()
+
+        return run
+
+    def getDeniedOperations(self, factory):
+        """
+        Benchmark L{PermissionCheckerBase._getDeniedOperations} for a user in
+        the exceptions lists of the tags.
+        """
+        user = getUser(self._dataset.readerUsername)
+        checker = UserPermissionChecker(factory.permissionCheckers(), user)
+        return lambda: checker._getDeniedOperations(
+            [(path, Operation.READ_TAG_VALUE)
+             for path in self._sample(self._dataset.paths)])
+
+    def findComments(self, factory):
+        """
+        Benchmark L{CommentAPI._findComments}, through
+        L{CommentAPI.getForObject}.
+        """
+        comments = CommentAPI(getUser(self._dataset.username),
+                              factory=factory)
+        abouts = self._dataset.abouts[:10]
+        return lambda: comments.getForObject(self._random.choice(abouts))
+
+    def run(self):
+        """Run all the benchmarks.
+
+        @return: A C{dict} like the ones returned by
+            L{BenchmarkResults.dumps}, with the parameters of the data set.
+            Names of operations end in C{/model} or C{/cache}, depending on
+            the factory used.
+        """
+        benchmarks = [('TagValueAPI.get', self.getTagValues),
+                      ('TagValueAPI.set', self.setTagValues),
+                      ('ObjectAPI.search', self.searchObjects),
+                      ('PermissionCheckerBase._getDeniedOperations',
+                       self.getDeniedOperations),
+                      ('CommentAPI._findComments', self.findComments)]
+        self.results.start()
+        self.time('parseQuery',
+                  lambda: parseQuery(self._random.choice(QUERIES)))
+        for name, benchmark in benchmarks:
+            for factoryName, factory in FACTORIES:
+                self.time('%s/%s' % (name, factoryName), benchmark(factory()))
+        self.results.stop()
+
+        data = self.results.dumps()
+        # Calls are made one at a time, so the throughput of a function is
+        # the inverse of its mean duration, not the number of calls over the
+        # duration of the whole run.
+        for operation in data['operations'].itervalues():
+            if operation['mean']:
+                operation['throughput'] = 1000.0 / operation['mean']
+        data['dataset'] = self._dataset.parameters
+        return data
@@ -0,0 +1,261 @@
+"""Results of benchmark runs, and comparisons with saved baselines."""
+
+from datetime import datetime
+import json
+
+from fluiddb.util.metrics import Histogram, getMilliseconds
+
+
+# The latency percentiles compared with a baseline.  Larger values in the
+# current results are regressions.
+LATENCY_KEYS = ('p50', 'p99')
+
+
+class OperationResults(object):
+    """The results of the requests made for an operation.
+
+    @ivar latency: A L{Histogram} of the durations, in milliseconds, of the
+        successful requests.
+    @ivar errors: A C{dict} mapping error descriptions, like an HTTP status
+        code, to the number of requests that failed with them.
+    """
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = {}
+
+    def dumps(self, duration):
+        """Write the results to a C{dict}.
+
+        @param duration: The C{float} number of seconds the benchmark ran
+            for.
+        @return: A C{dict} with the number of requests and errors, the
+            throughput in requests per second and a summary of the latency
+            histogram.
+        """
+        errors = sum(self.errors.itervalues())
+        result = self.latency.dumps()
+        result.update({'count': self.latency.count + errors,
+                       'errors': dict(self.errors),
+                       'throughput': (self.latency.count / duration
+                                      if duration else None)})
+        return result
+
+
+class BenchmarkResults(object):
+    """Collects the results of a benchmark run.
+
+    @param utcnow: For testing purposes, the implementation of
+        C{datetime.utcnow} to use when calculating the time.
+    @ivar operations: A C{dict} mapping operation names to
+        L{OperationResults}.
+    """
+
+    def __init__(self, utcnow=None):
+        self._utcnow = utcnow or datetime.utcnow
+        self.startDate = None
+        self.endDate = None
+        self.operations = {}
+
+    def start(self):
+        """Mark the start of the benchmark run."""
+        self.startDate = self._utcnow()
+
+    def stop(self):
+        """Mark the end of the benchmark run."""
+        self.endDate = self._utcnow()
+
+    def _getOperation(self, name):
+        """Get or create the L{OperationResults} for an operation.
+
+        @param name: The name of the operation.
+        @return: An L{OperationResults} instance.
+        """
+        operation = self.operations.get(name)
+        if operation is None:
+            operation = self.operations[name] = OperationResults()
+        return operation
+
+    def record(self, name, duration):
+        """Record a successful request.
+
+        @param name: The name of the operation the request was made for.
+        @param duration: The C{timedelta} the request took.
+        """
+        self._getOperation(name).latency.add(getMilliseconds(duration))
+
+    def recordError(self, name, error):
+        """Record a failed request.
+
+        @param name: The name of the operation the request was made for.
+        @param error: A C{str} describing the error, like an HTTP status code
+            or an exception class name.
+        """
+        errors = self._getOperation(name).errors
+        errors[error] = errors.get(error, 0) + 1
+
+    def dumps(self):
+        """Write the results to a C{dict}.
+
+        @return: A C{dict} with the duration of the run in seconds, the total
+            number of requests and errors, the overall throughput and the
+            results of each operation.
+        """
+        if self.startDate is None:
+            duration = 0.0
+        else:
+            endDate = self.endDate or self._utcnow()
+            duration = getMilliseconds(endDate - self.startDate) / 1000.0
+        operations = dict((name, operation.dumps(duration))
+                          for name, operation in self.operations.iteritems())
+        requests = sum(operation['count']
+                       for operation in operations.itervalues())
+        errors = sum(sum(operation['errors'].itervalues())
+                     for operation in operations.itervalues())
+        return {'duration': duration,
+                'requests': requests,
+                'errors': errors,
+                'throughput': ((requests - errors) / duration
+                               if duration else None),
+                'operations': operations}
+
+
+def saveResults(data, path):
+    """Save benchmark results, so they can be used as a baseline later.
+
+    @param data: A C{dict} returned by L{BenchmarkResults.dumps}.
+    @param path: The path of the file to write.
+    """
+    with open(path, 'w') as resultsFile:
+        json.dump(data, resultsFile, indent=2, sort_keys=True)
+
+
+def loadResults(path):
+    """Load benchmark results saved with L{saveResults}.
+
+    @param path: The path of the file to read.
+    @return: A C{dict} like the ones returned by L{BenchmarkResults.dumps}.
+    """
+    with open(path, 'r') as resultsFile:
+        return json.load(resultsFile)
+
+
+def compareResults(baseline, current, threshold=0.2):
+    """Find the operations that got slower than in a baseline.
+
+    An operation regressed if one of its L{LATENCY_KEYS} percentiles grew,
+    or its throughput dropped, by more than C{threshold}.  Operations that
+    only appear in one of the results are ignored.
+
+    @param baseline: A C{dict} returned by L{BenchmarkResults.dumps} or
+        L{loadResults}, to compare with.
+    @param current: A C{dict} returned by L{BenchmarkResults.dumps}.
+    @param threshold: Optionally, the relative change considered a
+        regression.  Default is C{0.2}, for 20%.
+    @return: A sorted C{list} of C{(operation, key, baselineValue,
+        currentValue)} 4-tuples, one for each regression.
+    """
+    regressions = []
+    baselineOperations = baseline['operations']
+    for name, operation in current['operations'].iteritems():
+        baselineOperation = baselineOperations.get(name)
+        if baselineOperation is None:
+            continue
+        for key in LATENCY_KEYS:
+            before, after = baselineOperation.get(key), operation.get(key)
+            if before is None or after is None:
+                continue
+            if after > before * (1 + threshold):
+                regressions.append((name, key, before, after))
+        before = baselineOperation.get('throughput')
+        after = operation.get('throughput')
+        if before and after is not None:
+            if after < before * (1 - threshold):
+                regressions.append((name, 'throughput', before, after))
+    return sorted(regressions)
+
+
+def _formatNumber(value):
+    """Format an optional number for a report.
+
+    @param value: A C{float}, or C{None}.
+    @return: The formatted C{str}.
+    """
+    return '-' if value is None else '%.1f' % value
+
+
+def getResultRows(data):
+    """Get the rows of a report about benchmark results.
+
+    @param data: A C{dict} returned by L{BenchmarkResults.dumps}.
+    @return: A C{list} of C{str} tuples, starting with a header row and
+        ending with a row with the totals.
+    """
+    rows = [('Operation', 'Requests', 'Errors', 'Req/s', 'Mean (ms)',
+             'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'Max (ms)')]
+    for name, operation in sorted(data['operations'].iteritems()):
+        errors = sum(operation['errors'].itervalues())
+        rows.append((name, str(operation['count']), str(errors)) +
+                    tuple(_formatNumber(operation[key])
+                          for key in ('throughput', 'mean', 'p50', 'p90',
+                                      'p99', 'max')))
+    rows.append(('Total', str(data['requests']), str(data['errors']),
+                 _formatNumber(data['throughput']), '', '', '', '', ''))
+    return rows
+
+
+def getComparisonRows(regressions):
+    """Get the rows of a report about regressions.
+
+    @param regressions: A C{list} returned by L{compareResults}.
+    @return: A C{list} of C{str} tuples, starting with a header row.
+    """
+    rows = [('Operation', 'Metric', 'Baseline', 'Current', 'Change')]
+    for name, key, before, after in regressions:
+        change = ('%+.0f%%' % ((after - before) * 100.0 / before)
+                  if before else '-')
+        rows.append((name, key, _formatNumber(before), _formatNumber(after),
+                     change))
+    return rows
+
+
+def getErrorRows(data):
+    """Get the rows of a report about the errors in benchmark results.
+
+    @param data: A C{dict} returned by L{BenchmarkResults.dumps}.
+    @return: A C{list} of C{str} tuples, starting with a header row, with
+        the number of requests that failed with each error, for each
+        operation.
+    """
+    rows = [('Operation', 'Error', 'Count')]
+    for name, operation in sorted(data['operations'].iteritems()):
+        for error, count in sorted(operation['errors'].iteritems()):
+            rows.append((name, error, str(count)))
+    return rows
+
+
+def getLatencyComparisonRows(before, after):
+    """Get the rows of a report comparing latency in two sets of results.
+
+    @param before: A C{dict} returned by L{BenchmarkResults.dumps}, for the
+        earlier results.
+    @param after: A C{dict} returned by L{BenchmarkResults.dumps}, for the
+        later results.
+    @return: A C{list} of C{str} tuples, starting with a header row, with
+        the number of requests and the L{LATENCY_KEYS} percentiles of each
+        operation in either of the results.
+    """
+    header = ('Operation', 'Requests')
+    for key in LATENCY_KEYS:
+        header += ('%s before' % key, '%s after' % key)
+    rows = [header]
+    names = set(before['operations']) | set(after['operations'])
+    for name in sorted(names):
+        beforeOperation = before['operations'].get(name, {})
+        afterOperation = after['operations'].get(name, {})
+        row = (name, str(afterOperation.get('count', 0)))
+        for key in LATENCY_KEYS:
+            row += (_formatNumber(beforeOperation.get(key)),
+                    _formatNumber(afterOperation.get(key)))
+        rows.append(row)
+    return rows
@@ -0,0 +1,180 @@
+from json import dumps, loads
+from uuid import uuid4
+
+from twisted.internet.defer import fail, inlineCallbacks, succeed
+
+from fluiddb.benchmarks.api import (
+    APIBenchmark, FakeIndexResource, OperationError, quoteAboutPath,
+    quotePath)
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.doubles import FakeRequest
+
+
+class FakeClient(object):
+    """A fake L{BenchmarkClient} that records the requests it makes.
+
+    @param errors: Optionally, a C{dict} mapping C{(method, path)} 2-tuples
+        to the status code or exception to fail requests with.
+    """
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.requests = []
+        self.objectID = str(uuid4())
+
+    def request(self, method, path, arguments=None, payload=None,
+                contentType='application/json'):
+        self.requests.append((method, path, arguments, payload, contentType))
+        error = self.errors.get((method, path))
+        if isinstance(error, Exception):
+            return fail(error)
+        elif error is not None:
+            return succeed((error, ''))
+        elif (method, path) == ('POST', '/objects'):
+            return succeed((201, dumps({'id': self.objectID})))
+        return succeed((200, ''))
+
+
+class FakeIndexResourceTest(FluidinfoTestCase):
+
+    def testSearch(self):
+        """
+        L{FakeIndexResource} answers searches with the object IDs that have
+        been added to it, in the format used by Solr.
+        """
+        index = FakeIndexResource()
+        index.add('object-1')
+        index.add('object-2')
+        request = FakeRequest(postpath=['solr', 'select'],
+                              args={'rows': ['1']})
+        result = loads(index.render_GET(request))
+        self.assertEqual(0, result['responseHeader']['status'])
+        self.assertEqual([{'fluiddb/id': 'object-1'}],
+                         result['response']['docs'])
+
+    def testSearchWithTooManyObjects(self):
+        """
+        L{FakeIndexResource} only returns the most recently added object
+        IDs.
+        """
+        index = FakeIndexResource(size=1)
+        index.add('object-1')
+        index.add('object-2')
+        request = FakeRequest(postpath=['solr', 'select'])
+        result = loads(index.render_POST(request))
+        self.assertEqual([{'fluiddb/id': 'object-2'}],
+                         result['response']['docs'])
+
+    def testUpdate(self):
+        """L{FakeIndexResource} ignores updates."""
+        index = FakeIndexResource()
+        request = FakeRequest(postpath=['solr', 'update'])
+        result = loads(index.render_POST(request))
+        self.assertEqual({'responseHeader': {'status': 0, 'QTime': 0}},
+                         result)
+
+
+class QuotePathTest(FluidinfoTestCase):
+
+    def testQuotePath(self):
+        """L{quotePath} quotes each segment but preserves C{/}s."""
+        self.assertEqual('/tags/username/t%C3%A1g',
+                         quotePath(u'tags', u'username/t\xe1g'))
+
+    def testQuoteAboutPath(self):
+        """L{quoteAboutPath} quotes C{/}s in the about value."""
+        self.assertEqual(
+            '/about/http%3A%2F%2Fexample.com/username/tag',
+            quoteAboutPath(u'http://example.com', u'username/tag'))
+
+
+class APIBenchmarkTest(FluidinfoTestCase):
+
+    @inlineCallbacks
+    def testRunIteration(self):
+        """
+        L{APIBenchmark.runIteration} runs the benchmark scenarios and
+        records the result of every request under the name of its
+        operation.
+        """
+        client = FakeClient()
+        index = FakeIndexResource()
+        benchmark = APIBenchmark(client, index=index)
+        yield benchmark.runIteration()
+        operations = benchmark.results.operations
+        self.assertEqual(len(client.requests), len(operations))
+        self.assertIn('create-object', operations)
+        self.assertIn('set-values', operations)
+        self.assertIn('get-values', operations)
+        self.assertIn('get-recent-object-activity', operations)
+        self.assertIn('delete-tag', operations)
+        self.assertEqual([client.objectID], list(index.objectIDs))
+        self.assertIn(('GET', '/recent/objects/%s' % client.objectID),
+                      [request[:2] for request in client.requests])
+
+    @inlineCallbacks
+    def testRunIterationWithCustomNamespace(self):
+        """
+        L{APIBenchmark.runIteration} creates namespaces and tags in the
+        namespace it was given.
+        """
+        client = FakeClient()
+        benchmark = APIBenchmark(client, namespace=u'username/benchmarks')
+        yield benchmark.runIteration()
+        self.assertIn(('POST', '/tags/username/benchmarks'),
+                      [request[:2] for request in client.requests])
+
+    @inlineCallbacks
+    def testRunIterationWithError(self):
+        """
+        L{APIBenchmark.runIteration} records the status code of failed
+        requests and raises L{OperationError}, skipping the rest of the
+        iteration.
+        """
+        client = FakeClient(errors={('POST', '/objects'): 503})
+        benchmark = APIBenchmark(client)
+        try:
+            yield benchmark.runIteration()
+        except OperationError as error:
+            self.assertEqual('create-object failed: 503', str(error))
+        else:
+            self.fail('OperationError not raised.')
+        self.assertEqual(1, len(client.requests))
+        self.assertEqual({'503': 1},
+                         benchmark.results.operations['create-object'].errors)
+
+    @inlineCallbacks
+    def testRunIterationWithConnectionError(self):
+        """
+        L{APIBenchmark.runIteration} records the class of exceptions raised
+        while making requests.
+        """
+        client = FakeClient(errors={('POST', '/objects'): RuntimeError()})
+        benchmark = APIBenchmark(client)
+        yield self.assertFailure(benchmark.runIteration(), OperationError)
+        self.assertEqual({'RuntimeError': 1},
+                         benchmark.results.operations['create-object'].errors)
+
+    @inlineCallbacks
+    def testRun(self):
+        """
+        L{APIBenchmark.run} runs the requested number of iterations and
+        returns a summary of the results.
+        """
+        benchmark = APIBenchmark(FakeClient())
+        data = yield benchmark.run(3, concurrency=2)
+        self.assertEqual(3, data['operations']['create-object']['count'])
+        self.assertEqual(3, data['operations']['delete-tag']['count'])
+        self.assertEqual(0, data['errors'])
+
+    @inlineCallbacks
+    def testRunWithErrors(self):
+        """
+        L{APIBenchmark.run} carries on with the next iteration when one
+        fails.
+        """
+        client = FakeClient(errors={('POST', '/objects'): 500})
+        benchmark = APIBenchmark(client)
+        data = yield benchmark.run(3)
+        self.assertEqual(3, data['requests'])
+        self.assertEqual(3, data['errors'])
@@ -0,0 +1,87 @@
+from fluiddb.benchmarks.data import generateDataset
+from fluiddb.data.comment import Comment
+from fluiddb.data.permission import Operation, getTagPermissions
+from fluiddb.data.store import getMainStore
+from fluiddb.data.system import createSystemData
+from fluiddb.data.tag import getTags
+from fluiddb.data.value import getTagValues
+from fluiddb.model.object import ObjectAPI
+from fluiddb.model.user import getUser
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.resources import (
+    ConfigResource, DatabaseResource, ThreadPoolResource)
+
+
+class GenerateDatasetTest(FluidinfoTestCase):
+
+    resources = [('config', ConfigResource()),
+                 ('store', DatabaseResource()),
+                 ('threadPool', ThreadPoolResource())]
+
+    def setUp(self):
+        super(GenerateDatasetTest, self).setUp()
+        createSystemData()
+
+    def testGenerateDataset(self):
+        """
+        L{generateDataset} creates a user that owns the requested number of
+        objects and tags, with a value for each of them.
+        """
+        dataset = generateDataset(objects=3, tagsPerObject=2, comments=0)
+        user = getUser(dataset.username)
+        self.assertNotIdentical(None, user)
+        self.assertEqual(3, len(dataset.objectIDs))
+        self.assertEqual(2, len(dataset.paths))
+        self.assertEqual(dict(zip(dataset.abouts, dataset.objectIDs)),
+                         ObjectAPI(user).get(dataset.abouts))
+        values = getTagValues([(objectID, tagID)
+                               for objectID in dataset.objectIDs
+                               for tagID in self.getTagIDs(dataset.paths)])
+        self.assertEqual(6, values.count())
+
+    def getTagIDs(self, paths):
+        """Get the IDs of the tags with the given paths."""
+        return [tag.id for tag in getTags(paths=paths)]
+
+    def testGenerateDatasetWithBinaryValues(self):
+        """
+        L{generateDataset} creates binary values for the requested fraction
+        of values.
+        """
+        dataset = generateDataset(objects=2, tagsPerObject=2,
+                                  binaryRatio=1.0, valueSize=10,
+                                  comments=0)
+        values = getTagValues([(objectID, tagID)
+                               for objectID in dataset.objectIDs
+                               for tagID in self.getTagIDs(dataset.paths)])
+        for value in values:
+            self.assertEqual({'mime-type': 'application/octet-stream',
+                              'size': 10}, value.value)
+
+    def testGenerateDatasetWithExceptions(self):
+        """
+        L{generateDataset} creates C{READ_TAG_VALUE} permissions with
+        exceptions lists of the requested size.
+        """
+        dataset = generateDataset(objects=1, tagsPerObject=1, exceptions=5,
+                                  comments=0)
+        [(tag, permission)] = getTagPermissions(dataset.paths)
+        policy, exceptions = permission.get(Operation.READ_TAG_VALUE)
+        self.assertEqual(6, len(exceptions))
+        self.assertIn(getUser(dataset.readerUsername).id, exceptions)
+
+    def testGenerateDatasetWithComments(self):
+        """
+        L{generateDataset} makes the requested number of comments on the
+        first objects.
+        """
+        generateDataset(objects=2, tagsPerObject=1, comments=3)
+        self.assertEqual(6, getMainStore().find(Comment).count())
+
+    def testParameters(self):
+        """L{Dataset.parameters} has the parameters used to generate it."""
+        dataset = generateDataset(objects=1, tagsPerObject=1, comments=0)
+        self.assertEqual({'objects': 1, 'tags-per-object': 1,
+                          'binary-ratio': 0.1, 'exceptions': 10,
+                          'comments': 0, 'value-size': 100},
+                         dataset.parameters)
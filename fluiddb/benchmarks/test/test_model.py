@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from fluiddb.benchmarks.data import generateDataset
+from fluiddb.benchmarks.model import ModelBenchmark
+from fluiddb.cache.factory import CachingAPIFactory
+from fluiddb.data.system import createSystemData
+from fluiddb.model.factory import APIFactory
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.resources import (
+    CacheResource, ConfigResource, DatabaseResource, ThreadPoolResource)
+
+
+class ModelBenchmarkTimeTest(FluidinfoTestCase):
+
+    def testTime(self):
+        """
+        L{ModelBenchmark.time} calls a function once to warm up and then
+        records the duration of the requested number of calls.
+        """
+        now = datetime.utcnow()
+        dates = [now, now + timedelta(milliseconds=4)] * 3
+        calls = []
+        benchmark = ModelBenchmark(None, number=3,
+                                   utcnow=lambda: dates.pop(0))
+        benchmark.time('function', lambda: calls.append(None))
+        self.assertEqual(4, len(calls))
+        latency = benchmark.results.operations['function'].latency
+        self.assertEqual(3, latency.count)
+        self.assertEqual(12, latency.total)
+
+
+class ModelBenchmarkTest(FluidinfoTestCase):
+
+    resources = [('cache', CacheResource()),
+                 ('config', ConfigResource()),
+                 ('store', DatabaseResource()),
+                 ('threadPool', ThreadPoolResource())]
+
+    def setUp(self):
+        super(ModelBenchmarkTest, self).setUp()
+        createSystemData()
+        self.dataset = generateDataset(objects=5, tagsPerObject=3,
+                                       exceptions=2, comments=2, seed=0)
+
+    def testRun(self):
+        """
+        L{ModelBenchmark.run} times each benchmark with the model and the
+        caching APIs, and returns the results with the parameters of the
+        data set.
+        """
+        benchmark = ModelBenchmark(self.dataset, number=2, batchSize=2,
+                                   seed=0)
+        data = benchmark.run()
+        self.assertEqual(self.dataset.parameters, data['dataset'])
+        self.assertEqual(0, data['errors'])
+        self.assertEqual(
+            ['CommentAPI._findComments/cache',
+             'CommentAPI._findComments/model',
+             'ObjectAPI.search/cache', 'ObjectAPI.search/model',
+             'PermissionCheckerBase._getDeniedOperations/cache',
+             'PermissionCheckerBase._getDeniedOperations/model',
+             'TagValueAPI.get/cache', 'TagValueAPI.get/model',
+             'TagValueAPI.set/cache', 'TagValueAPI.set/model',
+             'parseQuery'],
+            sorted(data['operations'].keys()))
+        for operation in data['operations'].itervalues():
+            self.assertEqual(2, operation['count'])
+
+    def testGetDeniedOperations(self):
+        """
+        The C{_getDeniedOperations} benchmark checks permissions for a user
+        that is allowed to read the tags.
+        """
+        benchmark = ModelBenchmark(self.dataset, batchSize=3)
+        for factory in (APIFactory(), CachingAPIFactory()):
+            self.assertEqual(([], set()),
+                             benchmark.getDeniedOperations(factory)())
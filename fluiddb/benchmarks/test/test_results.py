@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta
+
+from fluiddb.benchmarks.results import (
+    BenchmarkResults, compareResults, getComparisonRows, getErrorRows,
+    getLatencyComparisonRows, getResultRows, loadResults, saveResults)
+from fluiddb.testing.basic import FluidinfoTestCase
+
+
+class BenchmarkResultsTest(FluidinfoTestCase):
+
+    def createResults(self, seconds=10):
+        """Create a L{BenchmarkResults} for a run of C{seconds} seconds."""
+        now = datetime.utcnow()
+        dates = [now, now + timedelta(seconds=seconds)]
+        results = BenchmarkResults(utcnow=lambda: dates.pop(0))
+        results.start()
+        return results
+
+    def testRecord(self):
+        """
+        L{BenchmarkResults.record} adds the duration of a request to the
+        latency histogram of its operation.
+        """
+        results = self.createResults()
+        results.record('get-tag', timedelta(milliseconds=5))
+        results.record('get-tag', timedelta(milliseconds=15))
+        latency = results.operations['get-tag'].latency
+        self.assertEqual(2, latency.count)
+        self.assertEqual(20, latency.total)
+
+    def testRecordError(self):
+        """L{BenchmarkResults.recordError} counts errors for an operation."""
+        results = self.createResults()
+        results.recordError('get-tag', '404')
+        results.recordError('get-tag', '404')
+        results.recordError('get-tag', 'ConnectionRefusedError')
+        self.assertEqual({'404': 2, 'ConnectionRefusedError': 1},
+                         results.operations['get-tag'].errors)
+        self.assertEqual(0, results.operations['get-tag'].latency.count)
+
+    def testDumps(self):
+        """
+        L{BenchmarkResults.dumps} returns the totals for the run and the
+        throughput and latency percentiles of each operation.
+        """
+        results = self.createResults(seconds=10)
+        for index in range(20):
+            results.record('get-tag', timedelta(milliseconds=5))
+        results.recordError('get-tag', '500')
+        results.stop()
+        data = results.dumps()
+        self.assertEqual(10, data['duration'])
+        self.assertEqual(21, data['requests'])
+        self.assertEqual(1, data['errors'])
+        self.assertEqual(2, data['throughput'])
+        operation = data['operations']['get-tag']
+        self.assertEqual(21, operation['count'])
+        self.assertEqual({'500': 1}, operation['errors'])
+        self.assertEqual(2, operation['throughput'])
+        self.assertEqual(5, operation['p50'])
+        self.assertEqual(5, operation['p99'])
+
+    def testDumpsWithoutStart(self):
+        """
+        L{BenchmarkResults.dumps} doesn't report a throughput if the run
+        hasn't started.
+        """
+        data = BenchmarkResults().dumps()
+        self.assertEqual({'duration': 0.0, 'requests': 0, 'errors': 0,
+                          'throughput': None, 'operations': {}}, data)
+
+
+class SaveResultsTest(FluidinfoTestCase):
+
+    def testSaveAndLoad(self):
+        """L{loadResults} loads the results saved with L{saveResults}."""
+        path = self.mktemp()
+        data = {'duration': 1.0, 'requests': 0, 'errors': 0,
+                'throughput': None, 'operations': {}}
+        saveResults(data, path)
+        self.assertEqual(data, loadResults(path))
+
+
+class CompareResultsTest(FluidinfoTestCase):
+
+    def createData(self, **operations):
+        """Create results with the given operation summaries."""
+        return {'operations': operations}
+
+    def testCompareResults(self):
+        """
+        L{compareResults} returns nothing if the results are within the
+        threshold of the baseline.
+        """
+        baseline = self.createData(
+            get={'p50': 10, 'p99': 20, 'throughput': 100})
+        current = self.createData(
+            get={'p50': 11, 'p99': 23, 'throughput': 85})
+        self.assertEqual([], compareResults(baseline, current, 0.2))
+
+    def testCompareResultsWithSlowerLatency(self):
+        """
+        L{compareResults} reports percentiles that grew by more than the
+        threshold.
+        """
+        baseline = self.createData(
+            get={'p50': 10, 'p99': 20, 'throughput': 100})
+        current = self.createData(
+            get={'p50': 10, 'p99': 30, 'throughput': 100})
+        self.assertEqual([('get', 'p99', 20, 30)],
+                         compareResults(baseline, current, 0.2))
+
+    def testCompareResultsWithLowerThroughput(self):
+        """
+        L{compareResults} reports throughput that dropped by more than the
+        threshold.
+        """
+        baseline = self.createData(
+            get={'p50': 10, 'p99': 20, 'throughput': 100})
+        current = self.createData(
+            get={'p50': 10, 'p99': 20, 'throughput': 50})
+        self.assertEqual([('get', 'throughput', 100, 50)],
+                         compareResults(baseline, current, 0.2))
+
+    def testCompareResultsIgnoresMissingValues(self):
+        """
+        L{compareResults} ignores operations and values that are missing in
+        either of the results.
+        """
+        baseline = self.createData(
+            get={'p50': None, 'p99': None, 'throughput': None})
+        current = self.createData(
+            get={'p50': 10, 'p99': 20, 'throughput': 100},
+            put={'p50': 10, 'p99': 20, 'throughput': 100})
+        self.assertEqual([], compareResults(baseline, current, 0.2))
+
+
+class GetResultRowsTest(FluidinfoTestCase):
+
+    def testGetResultRows(self):
+        """
+        L{getResultRows} returns a header, a row for each operation and a
+        row with the totals.
+        """
+        data = {'duration': 2.0, 'requests': 3, 'errors': 1,
+                'throughput': 1.0,
+                'operations': {
+                    'get': {'count': 3, 'errors': {'404': 1},
+                            'throughput': 1.0, 'mean': 2.5, 'p50': 2.0,
+                            'p90': 3.0, 'p99': 3.0, 'max': 3.0}}}
+        rows = getResultRows(data)
+        self.assertEqual(3, len(rows))
+        self.assertEqual(('get', '3', '1', '1.0', '2.5', '2.0', '3.0', '3.0',
+                          '3.0'), rows[1])
+        self.assertEqual(('Total', '3', '1', '1.0', '', '', '', '', ''),
+                         rows[2])
+
+    def testGetComparisonRows(self):
+        """
+        L{getComparisonRows} returns a header and a row for each regression.
+        """
+        rows = getComparisonRows([('get', 'p99', 20, 30)])
+        self.assertEqual([('Operation', 'Metric', 'Baseline', 'Current',
+                           'Change'),
+                          ('get', 'p99', '20.0', '30.0', '+50%')], rows)
+
+    def testGetErrorRows(self):
+        """
+        L{getErrorRows} returns a header and a row for each error of each
+        operation.
+        """
+        data = {'operations': {
+            'get': {'errors': {'404': 2, '500': 1}},
+            'put': {'errors': {}}}}
+        self.assertEqual([('Operation', 'Error', 'Count'),
+                          ('get', '404', '2'),
+                          ('get', '500', '1')],
+                         getErrorRows(data))
+
+    def testGetLatencyComparisonRows(self):
+        """
+        L{getLatencyComparisonRows} returns a header and a row with the
+        percentiles before and after for each operation in either of the
+        results.
+        """
+        before = {'operations': {'GET /objects': {'count': 2, 'p50': 1.0,
+                                                  'p99': 2.0}}}
+        after = {'operations': {'GET /objects': {'count': 4, 'p50': 1.5,
+                                                 'p99': 3.0},
+                                'GET /users': {'count': 1, 'p50': 1.0,
+                                               'p99': 1.0}}}
+        self.assertEqual(
+            [('Operation', 'Requests', 'p50 before', 'p50 after',
+              'p99 before', 'p99 after'),
+             ('GET /objects', '4', '1.0', '1.5', '2.0', '3.0'),
+             ('GET /users', '1', '-', '1.0', '-', '1.0')],
+            getLatencyComparisonRows(before, after))
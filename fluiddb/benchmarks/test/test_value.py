@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from fluiddb.benchmarks.value import benchmarkTagValueQueries
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.resources import DatabaseResource, LoggingResource
+
+
+class BenchmarkTagValueQueriesTest(FluidinfoTestCase):
+
+    resources = [('log', LoggingResource()),
+                 ('store', DatabaseResource())]
+
+    def testBenchmarkTagValueQueries(self):
+        """
+        L{benchmarkTagValueQueries} records the planning and execution times
+        of each query strategy for each size.
+        """
+        data = benchmarkTagValueQueries([1, 10])
+        self.assertEqual(
+            ['array/1/execute', 'array/1/plan', 'array/10/execute',
+             'array/10/plan', 'or/1/execute', 'or/1/plan', 'or/10/execute',
+             'or/10/plan'],
+            sorted(data['operations']))
+        self.assertEqual(8, data['requests'])
+        self.assertEqual(0, data['errors'])
+        for operation in data['operations'].itervalues():
+            self.assertEqual(1, operation['count'])
+            self.assertTrue(operation['mean'] >= 0)
+
+    def testBenchmarkTagValueQueriesWithNumber(self):
+        """
+        L{benchmarkTagValueQueries} looks up each size the requested number
+        of times.
+        """
+        data = benchmarkTagValueQueries([1], number=3)
+        self.assertEqual(3, data['operations']['array/1/plan']['count'])
+        self.assertEqual(3, data['operations']['or/1/execute']['count'])
+
+    def testBenchmarkTagValueQueriesThroughput(self):
+        """
+        The throughput of each query is the inverse of its mean latency,
+        since queries are run one at a time.
+        """
+        now = [datetime(2012, 1, 1)]
+
+        def utcnow():
+            now[0] += timedelta(milliseconds=100)
+            return now[0]
+
+        data = benchmarkTagValueQueries([1], number=2, utcnow=utcnow)
+        operation = data['operations']['array/1/plan']
+        self.assertEqual(100.0, operation['mean'])
+        self.assertEqual(10.0, operation['throughput'])
+
+    def testBenchmarkTagValueQueriesWithFailingStrategy(self):
+        """
+        L{benchmarkTagValueQueries} records an error, with the name of the
+        exception class, and logs a message if a query fails.
+        """
+
+        def fail(values):
+            raise RuntimeError('Query failed.')
+
+        data = benchmarkTagValueQueries([1], [('broken', fail)])
+        self.assertEqual(2, data['errors'])
+        self.assertEqual({'RuntimeError': 1},
+                         data['operations']['broken/1/plan']['errors'])
+        self.assertEqual({'RuntimeError': 1},
+                         data['operations']['broken/1/execute']['errors'])
+        self.assertIn('Looking up 1 pairs with the broken strategy failed.',
+                      self.log.getvalue())
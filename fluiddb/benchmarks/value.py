@@ -0,0 +1,113 @@
+"""Benchmarks for the SQL queries that look up tag values."""
+
+from datetime import datetime
+import logging
+import random
+from uuid import uuid4
+
+from storm.databases.postgres import compile
+from storm.expr import And, Or, State
+import transaction
+
+from fluiddb.benchmarks.results import BenchmarkResults
+from fluiddb.data.store import getMainStore
+from fluiddb.data.tag import Tag
+from fluiddb.data.value import TagValue, getTagValues
+
+
+def _getTagValuesWithOr(values):
+    """Get L{TagValue}s with the OR-of-ANDs predicate used before
+    L{getTagValues} switched to an array join.
+
+    @param values: A sequence of C{(objectID, Tag.id)} 2-tuples to filter the
+        result with.
+    @return: A C{ResultSet} with L{TagValue}s.
+    """
+    store = getMainStore()
+    expressions = [And(TagValue.objectID == objectID, TagValue.tagID == tagID)
+                   for objectID, tagID in values]
+    return store.find(TagValue, Or(*expressions))
+
+
+QUERY_STRATEGIES = [('array', getTagValues), ('or', _getTagValuesWithOr)]
+
+
+def _timeStatement(statement, parameters, utcnow):
+    """Run a statement in the main store and measure how long it takes.
+
+    @param statement: The SQL statement to run.
+    @param parameters: The parameters for the statement.
+    @param utcnow: The implementation of C{datetime.utcnow} to use.
+    @return: The C{timedelta} it took to run the statement and fetch its
+        results.
+    """
+    store = getMainStore()
+    start = utcnow()
+    store.execute(statement, parameters).get_all()
+    return utcnow() - start
+
+
+def benchmarkTagValueQueries(sizes, strategies=None, number=1, utcnow=None):
+    """Measure the cost of looking up L{TagValue}s by object ID and tag.
+
+    For each size, random C{(objectID, Tag.id)} pairs are generated and the
+    query built by each strategy is planned, with C{EXPLAIN}, and executed.
+    Every measurement runs in its own transaction, which is aborted
+    afterwards.
+
+    @param sizes: A sequence with the numbers of pairs to look up.
+    @param strategies: Optionally, a sequence of C{(name, function)}
+        2-tuples with the functions to build queries with.  Default is
+        L{QUERY_STRATEGIES}.
+    @param number: Optionally, the number of times to look up each size
+        with each strategy.  Default is C{1}.
+    @param utcnow: For testing purposes, the implementation of
+        C{datetime.utcnow} to use when calculating the time.
+    @return: A C{dict} like the ones returned by L{BenchmarkResults.dumps}.
+        Operations are named C{<strategy>/<size>/plan} and
+        C{<strategy>/<size>/execute}.  Queries the database fails to run
+        are recorded as errors, with the name of the exception class.
+    """
+    utcnow = utcnow or datetime.utcnow
+    if strategies is None:
+        strategies = QUERY_STRATEGIES
+    store = getMainStore()
+    tagIDs = list(store.find(Tag.id)) or [1]
+    transaction.abort()
+
+    results = BenchmarkResults(utcnow=utcnow)
+    results.start()
+    for size in sizes:
+        for _ in xrange(number):
+            values = [(uuid4(), random.choice(tagIDs)) for i in xrange(size)]
+            for name, function in strategies:
+                prefix = '%s/%d' % (name, size)
+                try:
+                    select = function(values).get_select_expr(TagValue.id)
+                    state = State()
+                    statement = compile(select, state)
+                    planTime = _timeStatement('EXPLAIN ' + statement,
+                                              state.parameters, utcnow)
+                    executeTime = _timeStatement(statement, state.parameters,
+                                                 utcnow)
+                except Exception as error:
+                    logging.exception('Looking up %d pairs with the %s '
+                                      'strategy failed.' % (size, name))
+                    for step in ('plan', 'execute'):
+                        results.recordError('%s/%s' % (prefix, step),
+                                            error.__class__.__name__)
+                else:
+                    results.record('%s/plan' % prefix, planTime)
+                    results.record('%s/execute' % prefix, executeTime)
+                finally:
+                    transaction.abort()
+    results.stop()
+
+    data = results.dumps()
+    # Queries are run one at a time, so the throughput of a query is the
+    # inverse of its mean duration, not the number of queries over the
+    # duration of the whole run.
+    for operation in data['operations'].itervalues():
+        if operation['mean']:
+            operation['throughput'] = 1000.0 / operation['mean']
+    return data
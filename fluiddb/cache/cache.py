@@ -3,6 +3,8 @@ import logging
 from redis import Redis, RedisError
 
 from fluiddb.application import getConfig, getCacheConnectionPool
+from fluiddb.data.store import getStoreName
+from fluiddb.util.session import getCurrentSession
 
 
 class CacheResult(object):
@@ -58,15 +60,28 @@ class BaseCache(object):
             return []
         try:
             keys = [self._getKey(identifier) for identifier in identifiers]
-            return self._client.mget(keys)
+            values = self._client.mget(keys)
         except RedisError as error:
             logging.error('Redis error: %s', error)
+            return
+        cache = getattr(getCurrentSession(), 'cache', None)
+        if cache is not None:
+            hits = len(values) - values.count(None)
+            cache.record(self.keyPrefix, hits, len(values) - hits)
+        return values
 
     def setValues(self, values):
         """Set values in the cache for the given identifiers.
 
+        Nothing is cached while the current thread reads from a replica of
+        the C{main} store.  A lagging replica could otherwise put a value
+        back in the cache right after a write to the C{main} store removed
+        it, and the stale value would stay there until it expired.
+
         @param values: A C{dict} mapping identifiers to values.
         """
+        if getStoreName() != 'main':
+            return
         pipe = self._client.pipeline()
         for identifier, value in values.iteritems():
             pipe.setex(self._getKey(identifier), value, self.expireTimeout)
@@ -21,6 +21,10 @@ class CachingObjectAPI(object):
         """See L{ObjectAPI.create}."""
         return self._api.create(value)
 
+    def createMany(self, values):
+        """See L{ObjectAPI.createMany}."""
+        return self._api.createMany(values)
+
     def get(self, values):
         """Get object IDs matching C{fluiddb/about} tag values.
 
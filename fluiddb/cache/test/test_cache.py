@@ -2,9 +2,11 @@ from redis import Redis, ConnectionPool
 
 from fluiddb.application import getCacheConnectionPool
 from fluiddb.cache.cache import getCacheClient, BaseCache
+from fluiddb.data.store import setStoreName
 from fluiddb.testing.basic import FluidinfoTestCase
 from fluiddb.testing.resources import CacheResource, ConfigResource,\
     LoggingResource
+from fluiddb.util.session import CachePlugin, Session, setCurrentSession
 
 
 class GetCacheClientTest(FluidinfoTestCase):
@@ -67,6 +69,21 @@ class BaseCacheTest(FluidinfoTestCase):
         result = BaseCache().getValues([u'identifier1', u'identifier2'])
         self.assertEqual([u'test1', None], result)
 
+    def testGetValuesRecordsHitsAndMisses(self):
+        """
+        L{BaseCache.getValues} counts cache hits and misses in the
+        L{CachePlugin} of the current session.
+        """
+        self.cache.set('prefix:identifier1', 'test1')
+        session = Session('id', {'cache': CachePlugin()})
+        setCurrentSession(session)
+        self.addCleanup(setCurrentSession, None)
+        cache = BaseCache()
+        cache.keyPrefix = 'prefix:'
+        cache.getValues([u'identifier1', u'identifier2', u'identifier3'])
+        self.assertEqual({'prefix:': 1}, session.cache.hits)
+        self.assertEqual({'prefix:': 2}, session.cache.misses)
+
     def testGetValuesWithEmptyIdentifiers(self):
         """
         L{BaseCache.getValues} returns an empty list if the list of identifiers
@@ -92,6 +109,16 @@ class BaseCacheTest(FluidinfoTestCase):
         self.assertEqual('test1', self.cache.get('identifier1'))
         self.assertEqual('test2', self.cache.get('identifier2'))
 
+    def testSetValuesWithReplicaStore(self):
+        """
+        L{BaseCache.setValues} doesn't cache anything while the current
+        thread reads from a replica.
+        """
+        setStoreName('replica-1')
+        self.addCleanup(setStoreName, None)
+        BaseCache().setValues({'identifier1': 'test1'})
+        self.assertIdentical(None, self.cache.get('identifier1'))
+
     def testSetValuesWithTimeout(self):
         """L{BaseCache.setValues} set the expire timout of the values."""
         BaseCache().setValues({'identifier1': 'test1', 'identifier2': 'test2'})
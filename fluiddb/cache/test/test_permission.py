@@ -1,9 +1,13 @@
 import json
 
+from storm.zope.interfaces import IZStorm
+from zope.component import getUtility
+
 from fluiddb.cache.permission import (
     CachingPermissionAPI, CachingPermissionCheckerAPI, PermissionCache)
 from fluiddb.data.permission import (
     Operation, Policy, TagPermission, NamespacePermission, getTagPermissions)
+from fluiddb.data.store import setStoreName
 from fluiddb.data.system import createSystemData
 from fluiddb.model.tag import TagAPI
 from fluiddb.model.test.test_permission import (
@@ -127,6 +131,41 @@ class CachingPermissionCheckerAPITest(PermissionCheckerAPITestMixin,
         permission = result[u'username/tag']
         self.assertTrue(isinstance(permission, TagPermission))
 
+    def testGetTagPermissionsFromReplicaDoesNotFillCache(self):
+        """
+        L{CachingPermissionCheckerAPI.getTagPermissions} doesn't add
+        L{TagPermission}s read from a lagging replica to the cache, so a
+        permission changed in the C{main} store isn't replaced with a stale
+        one.
+        """
+        TagAPI(self.user).create([(u'username/tag', u'A tag')])
+        self.store.commit()
+        # A second connection to the same database, which doesn't see the
+        # uncommitted changes made in the main store, plays the replica.
+        zstorm = getUtility(IZStorm)
+        zstorm.create('replica-1', zstorm.get_default_uris()['main'])
+        self.addCleanup(zstorm.remove, zstorm.get('replica-1'))
+        self.addCleanup(setStoreName, None)
+
+        CachingPermissionAPI(self.user).set(
+            [(u'username/tag', Operation.READ_TAG_VALUE, Policy.CLOSED,
+              [u'username'])])
+        setStoreName('replica-1')
+        result = self.api.getTagPermissions([u'username/tag'])
+        self.assertEqual(
+            Policy.OPEN,
+            result[u'username/tag'].get(Operation.READ_TAG_VALUE)[0])
+        cached = PermissionCache().getTagPermissions([u'username/tag'])
+        self.assertEqual({}, cached.results)
+
+        setStoreName(None)
+        result = self.api.getTagPermissions([u'username/tag'])
+        self.assertEqual(
+            Policy.CLOSED,
+            result[u'username/tag'].get(Operation.READ_TAG_VALUE)[0])
+        cached = PermissionCache().getTagPermissions([u'username/tag'])
+        self.assertEqual([u'username/tag'], cached.results.keys())
+
 
 class PermissionCacheTest(FluidinfoTestCase):
 
@@ -79,6 +79,26 @@ class CachingTagValueAPITestMixin(object):
         self.assertEqual({}, result.results)
         self.assertEqual([u'username'], result.uncachedValues)
 
+    def testBatchInvalidatesRecentObjectActivity(self):
+        """
+        L{CachingTagValueAPI.batch} invalidates cached recent activity data
+        for the object IDs that have been modified.
+        """
+        objectID1 = uuid4()
+        objectID2 = uuid4()
+        CachingTagAPI(self.user).create([(u'username/tag', u'A tag')])
+        cache = RecentObjectActivityCache()
+        for objectID in (objectID1, objectID2):
+            cache.save(objectID, [(u'username/tag', objectID, u'about-value',
+                                   u'tag-value', u'username',
+                                   datetime.utcnow())])
+        self.tagValues.batch(values={objectID1: {u'username/tag': 42}},
+                             deletes=[(objectID2, u'username/tag')])
+        for objectID in (objectID1, objectID2):
+            result = cache.get(objectID)
+            self.assertEqual({}, result.results)
+            self.assertEqual([objectID], result.uncachedValues)
+
 
 class CachingTagValueAPITest(TagValueAPITestMixin, CachingTagValueAPITestMixin,
                              FluidinfoTestCase):
@@ -16,9 +16,11 @@ class CachingTagValueAPI(object):
         self._api = TagValueAPI(user, factory=CachingAPIFactory())
         self._user = user
 
-    def get(self, objectIDs, paths=None):
+    def get(self, objectIDs, paths=None, openContents=False,
+            withContents=True):
         """See L{TagValueAPI.get}."""
-        return self._api.get(objectIDs, paths)
+        return self._api.get(objectIDs, paths, openContents=openContents,
+                             withContents=withContents)
 
     def set(self, values):
         """See L{TagValueAPI.set}."""
@@ -36,3 +38,15 @@ class CachingTagValueAPI(object):
         RecentObjectActivityCache().clear(objectIDs)
         RecentUserActivityCache().clear([self._user.username])
         return result
+
+    def batch(self, reads=None, values=None, deletes=None):
+        """See L{TagValueAPI.batch}."""
+        deletes = list(deletes or [])
+        result = self._api.batch(reads, values, deletes)
+        objectIDs = set(objectID for objectID, path in deletes)
+        if values:
+            objectIDs.update(values.iterkeys())
+        if objectIDs:
+            RecentObjectActivityCache().clear(list(objectIDs))
+            RecentUserActivityCache().clear([self._user.username])
+        return result
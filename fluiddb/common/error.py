@@ -224,6 +224,14 @@ class QueryParseError(Error):
     pass
 
 
+class RangeNotSatisfiable(Error):
+    pass
+
+
+class RequestEntityTooLarge(Error):
+    pass
+
+
 class TimeoutError(Error):
     pass
 
@@ -0,0 +1,222 @@
+"""Storage for the contents of opaque values outside the database."""
+
+import errno
+from hashlib import sha256
+import os
+import shutil
+from tempfile import mkstemp
+
+from zope.interface import Interface, implements
+
+
+class IBlobStore(Interface):
+    """A store for the contents of opaque values outside the database.
+
+    A blob store is registered as a global utility when one is configured.
+    Contents are stored in the database when there isn't one.
+    """
+
+    def has(fileID):
+        """Determine whether a blob is in the store."""
+
+    def put(fileID, content):
+        """Write a blob to the store, unless it's already there."""
+
+    def putFile(fileID, path):
+        """Move a file into the store, unless the blob is already there."""
+
+    def open(fileID):
+        """Open a blob for reading."""
+
+    def getSize(fileID):
+        """Get the size of a blob."""
+
+
+class FileSystemBlobStore(object):
+    """A content-addressed store for blobs in a local directory.
+
+    Blobs are keyed by the hex digest of their SHA-256 hash and stored in a
+    directory tree four levels deep, named after the first eight characters
+    of the key, the same layout used by the old file store.  Blobs are never
+    modified once written, so they can safely be read without locking.
+
+    @param path: The root directory of the store.
+    """
+
+    implements(IBlobStore)
+
+    def __init__(self, path):
+        self.path = path
+
+    def getPath(self, fileID):
+        """Get the path of a blob.
+
+        @param fileID: The hex digest of the SHA-256 hash of the blob.
+        @return: The fully-qualified path of the blob on disk.
+        """
+        parts = [fileID[i:i + 2] for i in range(0, 8, 2)]
+        return os.path.join(self.path, *(parts + [fileID]))
+
+    def has(self, fileID):
+        """Determine whether a blob is in the store.
+
+        @param fileID: The hex digest of the SHA-256 hash of the blob.
+        @return: C{True} if the blob exists, otherwise C{False}.
+        """
+        return os.path.exists(self.getPath(fileID))
+
+    def put(self, fileID, content):
+        """Write a blob to the store, unless it's already there.
+
+        @param fileID: The hex digest of the SHA-256 hash of C{content}.
+        @param content: The binary content of the blob.
+        """
+        if self.has(fileID):
+            return
+        temporaryPath = self._createTemporaryFile(fileID)
+        try:
+            with open(temporaryPath, 'wb') as blobFile:
+                blobFile.write(content)
+                blobFile.flush()
+                os.fsync(blobFile.fileno())
+            os.rename(temporaryPath, self.getPath(fileID))
+        except:
+            os.unlink(temporaryPath)
+            raise
+
+    def putFile(self, fileID, path):
+        """Move a file into the store, unless the blob is already there.
+
+        The file is renamed into place when it's on the same filesystem as
+        the store and copied otherwise.  It's removed in both cases.
+
+        @param fileID: The hex digest of the SHA-256 hash of the file.
+        @param path: The path of the file to move.
+        """
+        if self.has(fileID):
+            os.unlink(path)
+            return
+        temporaryPath = self._createTemporaryFile(fileID)
+        try:
+            shutil.move(path, temporaryPath)
+            os.rename(temporaryPath, self.getPath(fileID))
+        except:
+            if os.path.exists(temporaryPath):
+                os.unlink(temporaryPath)
+            raise
+
+    def open(self, fileID):
+        """Open a blob for reading.
+
+        @param fileID: The hex digest of the SHA-256 hash of the blob.
+        @raise IOError: Raised if the blob doesn't exist.
+        @return: A file object positioned at the start of the blob.
+        """
+        return open(self.getPath(fileID), 'rb')
+
+    def getSize(self, fileID):
+        """Get the size of a blob.
+
+        @param fileID: The hex digest of the SHA-256 hash of the blob.
+        @raise OSError: Raised if the blob doesn't exist.
+        @return: The size of the blob in bytes.
+        """
+        return os.path.getsize(self.getPath(fileID))
+
+    def _createTemporaryFile(self, fileID):
+        """Create an empty temporary file next to the final path of a blob.
+
+        Writing to a temporary file in the same directory and renaming it
+        means readers never see a partially written blob.
+
+        @param fileID: The hex digest of the SHA-256 hash of the blob.
+        @return: The path of the temporary file.
+        """
+        directory = os.path.dirname(self.getPath(fileID))
+        try:
+            os.makedirs(directory)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+        descriptor, path = mkstemp(prefix='.%s.' % fileID, dir=directory)
+        os.close(descriptor)
+        return path
+
+
+class SpooledFile(object):
+    """A temporary file that hashes its content as it's written.
+
+    Large request bodies are spooled to disk as they arrive, so binary values
+    can be moved into a L{FileSystemBlobStore} with
+    L{FileSystemBlobStore.putFile} without being loaded into memory.  The
+    file is removed when it's closed, unless it has been moved.
+
+    @param directory: Optionally, the directory to create the file in.
+        Default is the system temporary directory.
+    @param maxSize: Optionally, the maximum number of bytes to accept.
+        Content past the limit is discarded and L{tooLarge} is set.  Default
+        is no limit.
+    @ivar name: The path of the file.
+    @ivar size: The number of bytes written.
+    @ivar tooLarge: C{True} if more than C{maxSize} bytes have been written.
+    """
+
+    def __init__(self, directory=None, maxSize=None):
+        descriptor, self.name = mkstemp(prefix='.upload.', dir=directory)
+        self._file = os.fdopen(descriptor, 'w+b')
+        self._hash = sha256()
+        self.maxSize = maxSize
+        self.size = 0
+        self.tooLarge = False
+
+    @property
+    def fileID(self):
+        """The hex digest of the SHA-256 hash of the content written so far."""
+        return self._hash.hexdigest()
+
+    def write(self, data):
+        """Write and hash data.
+
+        @param data: A C{str} with the bytes to append to the file.
+        """
+        if self.tooLarge:
+            return
+        if self.maxSize is not None and self.size + len(data) > self.maxSize:
+            self.tooLarge = True
+            self._file.truncate(0)
+            return
+        self._file.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+
+    def read(self, size=-1):
+        """Read content from the file.
+
+        @param size: Optionally, the maximum number of bytes to read.
+        @return: A C{str} with the bytes read.
+        """
+        return self._file.read(size)
+
+    def seek(self, offset, whence=0):
+        """Move to a new position in the file."""
+        self._file.seek(offset, whence)
+
+    def tell(self):
+        """Get the current position in the file."""
+        return self._file.tell()
+
+    def flush(self):
+        """Flush buffered content to disk, before the file is moved."""
+        self._file.flush()
+
+    def close(self):
+        """Close and remove the file, unless it has been moved."""
+        self._file.close()
+        try:
+            os.unlink(self.name)
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+
+    def __len__(self):
+        return self.size
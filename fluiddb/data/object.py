@@ -1,3 +1,4 @@
+from datetime import datetime
 import re
 from uuid import UUID
 
@@ -12,6 +13,7 @@ from fluiddb.query.grammar import Node
 
 
 DEFAULT_ROW_LIMIT = 10 ** 6
+DIRTY_OBJECTS_CHUNK_SIZE = 1000
 CONTAINS_SPACES_REGEX = re.compile(r'\s', flags=re.UNICODE)
 
 
@@ -74,10 +76,13 @@ class ObjectIndex(object):
             documents.append(document)
         yield self._client.add(documents)
 
-    def search(self, query):
+    def search(self, query, session=None):
         """Find object IDs matching the specified L{Query}.
 
         @param query: The L{Query} to resolve.
+        @param session: Optionally, the L{Session} to record the Solr query,
+            the number of documents it returned and its C{QTime} in, with
+            its C{index} plugin.
         @return: A C{Deferred} that will fire with a C{set} of matching object
             IDs.
         """
@@ -86,6 +91,7 @@ class ObjectIndex(object):
         except SearchError as error:
             return fail(error)
 
+        startDate = datetime.utcnow()
         if self._shards:
             deferred = self._client.search(solrQuery, rows=DEFAULT_ROW_LIMIT,
                                            shards=self._shards)
@@ -93,6 +99,11 @@ class ObjectIndex(object):
             deferred = self._client.search(solrQuery, rows=DEFAULT_ROW_LIMIT)
 
         def unpackObjectIDs(response):
+            index = getattr(session, 'index', None)
+            if index is not None:
+                qtime = getattr(response, 'header', {}).get('QTime')
+                index.record(solrQuery, len(response.results.docs), qtime,
+                             startDate)
             return set(UUID(document['fluiddb/id'])
                        for document in response.results.docs)
 
@@ -250,6 +261,24 @@ def createDirtyObject(objectID):
     return store.add(DirtyObject(objectID))
 
 
+def getDirtyObjectsBacklog():
+    """Get the number of L{DirtyObject}s that haven't been indexed yet.
+
+    The backlog is measured against the shard that is furthest behind, as
+    recorded in the C{last_indexed_objects} table.
+
+    @return: The number of C{dirty_objects} rows waiting to be indexed.
+    """
+    store = getMainStore()
+    result = store.execute("""
+        SELECT COUNT(*)
+        FROM dirty_objects
+        WHERE id > (SELECT COALESCE(MIN(last_indexed), 0)
+                    FROM last_indexed_objects)
+        """)
+    return result.get_one()[0]
+
+
 def getDirtyObjects(objectIDs=None):
     """Get L{DirtyObject}s.
 
@@ -265,9 +294,25 @@ def getDirtyObjects(objectIDs=None):
 
 
 def touchObjects(objectIDs):
-    """Add an object ID to the list of dirty objects.
+    """Add object IDs to the list of dirty objects.
+
+    Duplicate object IDs are only stored once for each call.  Rows are only
+    ever inserted, so concurrent transactions touching the same objects
+    don't conflict; an object touched again gets another row, and the
+    indexer reads distinct object IDs.  Older rows for objects that have
+    been touched again are removed by the C{clean-dirty-objects.sh} cron
+    job.  Rows are written with multi-row C{INSERT} statements, in chunks
+    of L{DIRTY_OBJECTS_CHUNK_SIZE} object IDs.
 
     @param objectIDs: A sequence of object IDs.
     """
-    for objectID in objectIDs:
-        createDirtyObject(objectID)
+    objectIDs = list(set(objectIDs))
+    if not objectIDs:
+        return
+    store = getMainStore()
+    for i in xrange(0, len(objectIDs), DIRTY_OBJECTS_CHUNK_SIZE):
+        chunk = objectIDs[i:i + DIRTY_OBJECTS_CHUNK_SIZE]
+        rows = ', '.join(['(?::UUID)'] * len(chunk))
+        store.execute('INSERT INTO dirty_objects (object_id) VALUES ' + rows,
+                      [unicode(objectID) for objectID in chunk],
+                      noresult=True)
@@ -1,15 +1,207 @@
 """C{main} store access functions."""
 
-from zope.component import getUtility
+import logging
+from threading import Lock, local
+import time
 
+import psycopg2
+from storm.exceptions import DisconnectionError
 from storm.zope.interfaces import IZStorm
+from zope.component import getUtility
+
+
+_routing = local()
 
 
 def getMainStore():
     """Get a C{Store} instance for the C{main} database.
 
+    Read-only transactions may have been routed to a replica of the C{main}
+    database with L{setStoreName}, in which case the replica's C{Store} is
+    returned.
+
     @return: A C{Store} instance for the C{main} database or C{None} if a
         C{main} database is not configured.
     """
     zstorm = getUtility(IZStorm)
-    return zstorm.get('main')
+    return zstorm.get(getStoreName())
+
+
+def getRawCursor(store):
+    """Get a cursor for the raw database connection of a C{Store}.
+
+    Storm doesn't expose some bulk operations, such as C{COPY} and
+    C{executemany}.  A statement is executed through the store first, which
+    flushes pending changes, connects to the database and begins a
+    transaction, so the statements run with the cursor are committed or
+    rolled back with the rest of the store's current transaction.
+
+    @param store: The C{Store} to get a cursor for.
+    @return: A DB-API cursor, which must be closed by the caller.
+    """
+    store.execute('SELECT 1', noresult=True)
+    return store._connection._raw_connection.cursor()
+
+
+def getStoreName():
+    """Get the name of the store used by L{getMainStore} in this thread.
+
+    @return: The name of the store, C{main} by default.
+    """
+    return getattr(_routing, 'storeName', 'main')
+
+
+def setStoreName(name):
+    """Set the name of the store used by L{getMainStore} in this thread.
+
+    @param name: The name of the store, or C{None} to use C{main}.
+    """
+    _routing.storeName = name or 'main'
+
+
+def getReplicationLag(store):
+    """Get the replication lag of a PostgreSQL hot standby.
+
+    The lag is the time since the last replayed transaction.  A standby that
+    has replayed everything it has received is considered up-to-date, even
+    if no transactions have been committed on the primary for a while.
+
+    @param store: The C{Store} for the standby database.
+    @return: The lag in seconds as a C{float}, or C{None} if C{store} isn't
+        connected to a database in recovery mode.
+    """
+    result = store.execute("""
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN NULL
+            WHEN pg_last_xlog_receive_location() =
+                 pg_last_xlog_replay_location() THEN 0
+            ELSE EXTRACT(EPOCH FROM
+                         now() - pg_last_xact_replay_timestamp())
+            END
+        """)
+    lag = result.get_one()[0]
+    return None if lag is None else float(lag)
+
+
+def getStoreLag(name):
+    """Check the health and replication lag of a replica store.
+
+    @param name: The name of the replica store.
+    @return: The lag in seconds as a C{float}, or C{None} if the replica is
+        unavailable.  A database that isn't in recovery mode has no lag.
+    """
+    store = getUtility(IZStorm).get(name)
+    try:
+        lag = getReplicationLag(store)
+    except (DisconnectionError, psycopg2.Error) as error:
+        logging.warning('Replica %s is unavailable: %r' % (name, error))
+        store.rollback()
+        return None
+    return 0.0 if lag is None else lag
+
+
+class ReplicaRouter(object):
+    """Choose the store read-only transactions should run against.
+
+    Replicas are checked for health and replication lag at most once every
+    C{checkInterval} seconds.  The healthy replica with the least lag is
+    chosen, unless it's lagging by more than C{maxLag} seconds.  Clients
+    that have recently written to the C{main} store are pinned to it for
+    C{pinDuration} seconds, so that they always read their own writes.
+
+    @param names: The names of the replica stores.
+    @param maxLag: The maximum acceptable replication lag, in seconds.
+    @param pinDuration: The number of seconds to keep clients on the C{main}
+        store after they write.
+    @param checkInterval: Optionally, the number of seconds to cache the
+        health and lag of a replica for.  Default is 5.
+    @param getLag: Optionally, the function to measure the replication lag
+        of a store with, given its name.  Default is L{getStoreLag}.
+    @param clock: Optionally, the function to get the current time with, for
+        testing purposes.  Default is C{time.time}.
+    """
+
+    def __init__(self, names, maxLag, pinDuration, checkInterval=None,
+                 getLag=None, clock=None):
+        self.names = list(names)
+        self.maxLag = maxLag
+        self.pinDuration = pinDuration
+        self.checkInterval = 5 if checkInterval is None else checkInterval
+        self._getLag = getLag or getStoreLag
+        self._clock = clock or time.time
+        self._lock = Lock()
+        self._pins = {}
+        self._pruneTime = None
+        self._lags = {}
+
+    def pin(self, key):
+        """Keep a client on the C{main} store for C{pinDuration} seconds.
+
+        Expired pins are removed at most once every C{pinDuration} seconds,
+        so only clients that wrote recently are remembered.
+
+        @param key: The key identifying the client, such as a username.
+        """
+        now = self._clock()
+        with self._lock:
+            if self._pruneTime is None or self._pruneTime <= now:
+                for pinnedKey, expiry in self._pins.items():
+                    if expiry <= now:
+                        del self._pins[pinnedKey]
+                self._pruneTime = now + self.pinDuration
+            self._pins[key] = now + self.pinDuration
+
+    def isPinned(self, key):
+        """Determine whether a client is pinned to the C{main} store.
+
+        @param key: The key identifying the client.
+        @return: C{True} if the client wrote recently, otherwise C{False}.
+        """
+        with self._lock:
+            expiry = self._pins.get(key)
+            if expiry is None:
+                return False
+            if expiry <= self._clock():
+                del self._pins[key]
+                return False
+            return True
+
+    def getStoreName(self, key=None):
+        """Get the name of the store to run a read-only transaction against.
+
+        This method runs statements against replicas to check their health,
+        so it must be called in a database thread.
+
+        @param key: Optionally, the key identifying the client running the
+            transaction.
+        @return: The name of the replica store to use, or C{main} if the
+            client is pinned or no replica is healthy and up-to-date.
+        """
+        if key is not None and self.isPinned(key):
+            return 'main'
+        candidates = []
+        for name in self.names:
+            lag = self._checkLag(name)
+            if lag is not None and lag <= self.maxLag:
+                candidates.append((lag, name))
+        if not candidates:
+            return 'main'
+        return min(candidates)[1]
+
+    def _checkLag(self, name):
+        """Get the replication lag of a replica, using a cached value if
+        it's recent enough.
+
+        @param name: The name of the replica store.
+        @return: The lag in seconds or C{None} if the replica is unhealthy.
+        """
+        now = self._clock()
+        with self._lock:
+            if name in self._lags:
+                checkTime, lag = self._lags[name]
+                if now - checkTime < self.checkInterval:
+                    return lag
+        lag = self._getLag(name)
+        with self._lock:
+            self._lags[name] = (now, lag)
+        return lag
@@ -0,0 +1,157 @@
+from hashlib import sha256
+import os
+
+from zope.interface.verify import verifyObject
+
+from fluiddb.data.blob import FileSystemBlobStore, IBlobStore, SpooledFile
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.resources import TemporaryDirectoryResource
+
+
+class FileSystemBlobStoreTest(FluidinfoTestCase):
+
+    resources = [('fs', TemporaryDirectoryResource())]
+
+    def setUp(self):
+        super(FileSystemBlobStoreTest, self).setUp()
+        self.blobStore = FileSystemBlobStore(self.fs.path)
+        self.fileID = sha256('content').hexdigest()
+
+    def testImplementsIBlobStore(self):
+        """L{FileSystemBlobStore} provides L{IBlobStore}."""
+        self.assertTrue(verifyObject(IBlobStore, self.blobStore))
+
+    def testGetPath(self):
+        """
+        L{FileSystemBlobStore.getPath} returns a path four directories deep,
+        named after the first eight characters of the file ID.
+        """
+        path = self.blobStore.getPath('0123456789' + 'a' * 54)
+        self.assertEqual(
+            os.path.join(self.fs.path, '01', '23', '45', '67',
+                         '0123456789' + 'a' * 54),
+            path)
+
+    def testHasWithoutBlob(self):
+        """
+        L{FileSystemBlobStore.has} returns C{False} if a blob isn't in the
+        store.
+        """
+        self.assertFalse(self.blobStore.has(self.fileID))
+
+    def testPut(self):
+        """L{FileSystemBlobStore.put} writes a blob to the store."""
+        self.blobStore.put(self.fileID, 'content')
+        self.assertTrue(self.blobStore.has(self.fileID))
+        with open(self.blobStore.getPath(self.fileID), 'rb') as blobFile:
+            self.assertEqual('content', blobFile.read())
+
+    def testPutDoesNotLeaveTemporaryFiles(self):
+        """
+        L{FileSystemBlobStore.put} renames the temporary file it writes to, so
+        only the blob is left in its directory.
+        """
+        self.blobStore.put(self.fileID, 'content')
+        directory = os.path.dirname(self.blobStore.getPath(self.fileID))
+        self.assertEqual([self.fileID], os.listdir(directory))
+
+    def testPutExistingBlob(self):
+        """
+        L{FileSystemBlobStore.put} doesn't rewrite a blob that's already in
+        the store.
+        """
+        self.blobStore.put(self.fileID, 'content')
+        self.blobStore.put(self.fileID, 'other content')
+        with self.blobStore.open(self.fileID) as blobFile:
+            self.assertEqual('content', blobFile.read())
+
+    def testPutFile(self):
+        """
+        L{FileSystemBlobStore.putFile} moves a file into the store.
+        """
+        path = os.path.join(self.fs.path, 'upload')
+        with open(path, 'wb') as uploadFile:
+            uploadFile.write('content')
+        self.blobStore.putFile(self.fileID, path)
+        self.assertFalse(os.path.exists(path))
+        with self.blobStore.open(self.fileID) as blobFile:
+            self.assertEqual('content', blobFile.read())
+
+    def testPutFileWithExistingBlob(self):
+        """
+        L{FileSystemBlobStore.putFile} removes the file if the blob is already
+        in the store.
+        """
+        self.blobStore.put(self.fileID, 'content')
+        path = os.path.join(self.fs.path, 'upload')
+        with open(path, 'wb') as uploadFile:
+            uploadFile.write('content')
+        self.blobStore.putFile(self.fileID, path)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(self.blobStore.has(self.fileID))
+
+    def testOpenWithoutBlob(self):
+        """
+        L{FileSystemBlobStore.open} raises C{IOError} if the blob isn't in the
+        store.
+        """
+        self.assertRaises(IOError, self.blobStore.open, self.fileID)
+
+    def testGetSize(self):
+        """L{FileSystemBlobStore.getSize} returns the size of a blob."""
+        self.blobStore.put(self.fileID, 'content')
+        self.assertEqual(7, self.blobStore.getSize(self.fileID))
+
+
+class SpooledFileTest(FluidinfoTestCase):
+
+    resources = [('fs', TemporaryDirectoryResource())]
+
+    def testWrite(self):
+        """
+        L{SpooledFile.write} writes data to a file in the given directory and
+        keeps track of its size and hash.
+        """
+        spool = SpooledFile(self.fs.path)
+        self.addCleanup(spool.close)
+        spool.write('Hello, ')
+        spool.write('world!')
+        self.assertEqual(self.fs.path, os.path.dirname(spool.name))
+        self.assertEqual(13, spool.size)
+        self.assertEqual(13, len(spool))
+        self.assertEqual(sha256('Hello, world!').hexdigest(), spool.fileID)
+        spool.seek(0)
+        self.assertEqual('Hello, world!', spool.read())
+
+    def testWriteTooLarge(self):
+        """
+        L{SpooledFile.write} discards the content and sets C{tooLarge} if more
+        than C{maxSize} bytes are written.
+        """
+        spool = SpooledFile(self.fs.path, maxSize=10)
+        self.addCleanup(spool.close)
+        spool.write('Hello, ')
+        self.assertFalse(spool.tooLarge)
+        spool.write('world!')
+        self.assertTrue(spool.tooLarge)
+        self.assertEqual(0, os.path.getsize(spool.name))
+
+    def testClose(self):
+        """L{SpooledFile.close} removes the file."""
+        spool = SpooledFile(self.fs.path)
+        spool.write('content')
+        spool.close()
+        self.assertFalse(os.path.exists(spool.name))
+
+    def testCloseAfterMove(self):
+        """
+        L{SpooledFile.close} doesn't fail if the file has been moved into a
+        blob store.
+        """
+        blobStore = FileSystemBlobStore(self.fs.path)
+        spool = SpooledFile(self.fs.path)
+        spool.write('content')
+        blobStore.putFile(spool.fileID, spool.name)
+        spool.close()
+        with blobStore.open(spool.fileID) as blobFile:
+            self.assertEqual('content', blobFile.read())
@@ -1,14 +1,16 @@
+from datetime import timedelta
 from uuid import uuid4
 
 from twisted.internet.defer import inlineCallbacks
 
 from fluiddb.data.object import (
     DirtyObject, ObjectIndex, SearchError, escapeWithWildcards,
-    createDirtyObject, getDirtyObjects, touchObjects)
+    createDirtyObject, getDirtyObjects, getDirtyObjectsBacklog, touchObjects)
 from fluiddb.query.parser import parseQuery
 from fluiddb.testing.basic import FluidinfoTestCase
 from fluiddb.testing.resources import (
     ConfigResource, IndexResource, DatabaseResource)
+from fluiddb.util.session import IndexPlugin, Session
 
 
 class ObjectIndexTest(FluidinfoTestCase):
@@ -151,6 +153,24 @@ class ObjectIndexTest(FluidinfoTestCase):
         result = yield self.index.search(query)
         self.assertEqual(set(), result)
 
+    @inlineCallbacks
+    def testSearchRecordsQuery(self):
+        """
+        L{ObjectIndex.search} records the Solr query, the number of
+        documents it returned and its C{QTime} in the L{IndexPlugin} of a
+        session, if one is provided.
+        """
+        yield self.index.update({uuid4(): {u'test/tag': 42}})
+        yield self.index.commit()
+        session = Session('id', {'index': IndexPlugin()})
+        query = parseQuery(u'test/tag = 42')
+        yield self.index.search(query, session)
+        [trace] = session.index.queries
+        self.assertIn(u'test/tag_tag_number', trace['query'])
+        self.assertEqual(1, trace['rows'])
+        self.assertTrue(isinstance(trace['qtime'], int))
+        self.assertTrue(isinstance(trace['duration'], timedelta))
+
     @inlineCallbacks
     def testSearchWithoutMatch(self):
         """
@@ -1075,6 +1095,32 @@ class CreateObjectTest(FluidinfoTestCase):
         self.assertIdentical(object1, result.one())
 
 
+class GetDirtyObjectsBacklogTest(FluidinfoTestCase):
+
+    resources = [('store', DatabaseResource())]
+
+    def testGetDirtyObjectsBacklog(self):
+        """
+        L{getDirtyObjectsBacklog} returns the number of C{dirty_objects} rows
+        if nothing has been indexed yet.
+        """
+        touchObjects([uuid4(), uuid4()])
+        self.assertEqual(2, getDirtyObjectsBacklog())
+
+    def testGetDirtyObjectsBacklogSkipsIndexedObjects(self):
+        """
+        L{getDirtyObjectsBacklog} only counts rows that have been added after
+        the last indexed row of the slowest shard.
+        """
+        object1 = createDirtyObject(uuid4())
+        object2 = createDirtyObject(uuid4())
+        createDirtyObject(uuid4())
+        self.store.execute(
+            'INSERT INTO last_indexed_objects (shard_id, last_indexed) '
+            'VALUES (0, ?), (1, ?)', (object2.id, object1.id))
+        self.assertEqual(2, getDirtyObjectsBacklog())
+
+
 class GetObjectsTest(FluidinfoTestCase):
 
     resources = [('store', DatabaseResource())]
@@ -1108,3 +1154,47 @@ class TouchObjectsTest(FluidinfoTestCase):
         objectID = uuid4()
         touchObjects([objectID])
         self.assertNotIdentical(None, getDirtyObjects([objectID]).one())
+
+    def testTouchObjectsWithManyObjects(self):
+        """
+        L{touchObjects} splits large sequences of object IDs into several
+        statements.
+        """
+        objectIDs = [uuid4() for i in range(2500)]
+        touchObjects(objectIDs)
+        result = getDirtyObjects().values(DirtyObject.objectID)
+        self.assertEqual(sorted(objectIDs), sorted(result))
+
+    def testTouchObjectsWithoutObjects(self):
+        """L{touchObjects} is a no-op if no object IDs are provided."""
+        touchObjects([])
+        self.assertTrue(getDirtyObjects().is_empty())
+
+    def testTouchObjectsRemovesDuplicates(self):
+        """L{touchObjects} only adds one row for each distinct object ID."""
+        objectID = uuid4()
+        touchObjects([objectID, objectID, objectID])
+        self.assertEqual(1, getDirtyObjects([objectID]).count())
+
+    def testTouchObjectsWithDirtyObject(self):
+        """
+        L{touchObjects} adds a new row for an object that is already dirty,
+        with a higher ID so that it's picked up by the indexer again.
+        """
+        objectID = uuid4()
+        touchObjects([objectID])
+        touchObjects([objectID])
+        result = getDirtyObjects([objectID]).order_by(DirtyObject.id)
+        oldID, newID = result.values(DirtyObject.id)
+        self.assertTrue(newID > oldID)
+
+    def testTouchObjectsTwiceKeepsBothRows(self):
+        """
+        L{touchObjects} only appends rows, so touching the same object in two
+        calls leaves two rows in the C{dirty_objects} table created by the
+        schema.
+        """
+        objectID = uuid4()
+        touchObjects([objectID])
+        touchObjects([objectID])
+        self.assertEqual(2, getDirtyObjects([objectID]).count())
@@ -1,6 +1,10 @@
+from storm.database import create_database
 from storm.store import Store
+from storm.zope.zstorm import ZStormError
 
-from fluiddb.data.store import getMainStore
+from fluiddb.data.store import (
+    ReplicaRouter, getMainStore, getRawCursor, getReplicationLag,
+    getStoreLag, getStoreName, setStoreName)
 from fluiddb.testing.basic import FluidinfoTestCase
 from fluiddb.testing.resources import DatabaseResource
 
@@ -9,6 +13,10 @@ class GetMainStoreTest(FluidinfoTestCase):
 
     resources = [('store', DatabaseResource())]
 
+    def tearDown(self):
+        setStoreName(None)
+        super(GetMainStoreTest, self).tearDown()
+
     def testGetMainStore(self):
         """
         L{getMainStore} returns a C{Store} instance for the main store, when
@@ -17,3 +25,168 @@ class GetMainStoreTest(FluidinfoTestCase):
         store = getMainStore()
         self.assertTrue(isinstance(store, Store))
         self.assertIdentical(self.store, store)
+
+    def testGetMainStoreWithStoreName(self):
+        """
+        L{getMainStore} returns the C{Store} set with L{setStoreName} in the
+        current thread.
+        """
+        setStoreName('unknown')
+        self.assertEqual('unknown', getStoreName())
+        self.assertRaises(ZStormError, getMainStore)
+        setStoreName(None)
+        self.assertEqual('main', getStoreName())
+        self.assertIdentical(self.store, getMainStore())
+
+
+
+class GetRawCursorTest(FluidinfoTestCase):
+
+    def setUp(self):
+        super(GetRawCursorTest, self).setUp()
+        self.store = Store(create_database('sqlite:'))
+        self.addCleanup(self.store.close)
+        self.store.execute('CREATE TABLE test (id INTEGER)')
+        self.store.commit()
+
+    def testGetRawCursor(self):
+        """
+        L{getRawCursor} returns a cursor for the raw connection of a
+        C{Store}, which runs statements in the store's current transaction.
+        """
+        cursor = getRawCursor(self.store)
+        try:
+            cursor.executemany('INSERT INTO test VALUES (?)', [(1,), (2,)])
+        finally:
+            cursor.close()
+        self.assertEqual([(1,), (2,)],
+                         list(self.store.execute('SELECT id FROM test')))
+        self.store.rollback()
+        self.assertEqual([], list(self.store.execute('SELECT id FROM test')))
+
+    def testGetRawCursorWithCommit(self):
+        """
+        Statements run with a cursor from L{getRawCursor} are committed with
+        the C{Store}.
+        """
+        cursor = getRawCursor(self.store)
+        try:
+            cursor.executemany('INSERT INTO test VALUES (?)', [(1,), (2,)])
+        finally:
+            cursor.close()
+        self.store.commit()
+        self.store.rollback()
+        self.assertEqual([(1,), (2,)],
+                         list(self.store.execute('SELECT id FROM test')))
+
+class GetReplicationLagTest(FluidinfoTestCase):
+
+    resources = [('store', DatabaseResource())]
+
+    def testGetReplicationLagWithoutStandby(self):
+        """
+        L{getReplicationLag} returns C{None} if the database isn't in recovery
+        mode.
+        """
+        self.assertIdentical(None, getReplicationLag(self.store))
+
+    def testGetStoreLagWithoutStandby(self):
+        """
+        L{getStoreLag} returns C{0.0} for a database that isn't in recovery
+        mode.
+        """
+        self.assertEqual(0.0, getStoreLag('main'))
+
+
+class ReplicaRouterTest(FluidinfoTestCase):
+
+    def setUp(self):
+        super(ReplicaRouterTest, self).setUp()
+        self.now = 1000.0
+        self.lags = {'replica-1': 0.5, 'replica-2': 0.1}
+        self.checks = []
+
+    def getLag(self, name):
+        self.checks.append(name)
+        return self.lags[name]
+
+    def createRouter(self, **kwargs):
+        return ReplicaRouter(['replica-1', 'replica-2'], 5, 10,
+                             getLag=self.getLag, clock=lambda: self.now,
+                             **kwargs)
+
+    def testGetStoreName(self):
+        """
+        L{ReplicaRouter.getStoreName} returns the replica with the least
+        replication lag.
+        """
+        router = self.createRouter()
+        self.assertEqual('replica-2', router.getStoreName(u'user'))
+
+    def testGetStoreNameWithLaggingReplicas(self):
+        """
+        L{ReplicaRouter.getStoreName} ignores replicas lagging behind by more
+        than the maximum lag, and returns C{main} if none is left.
+        """
+        self.lags = {'replica-1': 6, 'replica-2': 2}
+        router = self.createRouter()
+        self.assertEqual('replica-2', router.getStoreName(u'user'))
+        self.lags = {'replica-1': 6, 'replica-2': 7}
+        router = self.createRouter()
+        self.assertEqual('main', router.getStoreName(u'user'))
+
+    def testGetStoreNameWithUnavailableReplica(self):
+        """
+        L{ReplicaRouter.getStoreName} ignores replicas that are unavailable.
+        """
+        self.lags = {'replica-1': 0.5, 'replica-2': None}
+        router = self.createRouter()
+        self.assertEqual('replica-1', router.getStoreName(u'user'))
+
+    def testGetStoreNameWithoutReplicas(self):
+        """
+        L{ReplicaRouter.getStoreName} returns C{main} if no replicas are
+        configured.
+        """
+        router = ReplicaRouter([], 5, 10)
+        self.assertEqual('main', router.getStoreName(u'user'))
+
+    def testGetStoreNameCachesLag(self):
+        """
+        L{ReplicaRouter.getStoreName} only checks the lag of a replica again
+        after the check interval has passed.
+        """
+        router = self.createRouter(checkInterval=3)
+        router.getStoreName(u'user')
+        self.now += 2
+        router.getStoreName(u'user')
+        self.assertEqual(['replica-1', 'replica-2'], self.checks)
+        self.lags = {'replica-1': 0.5, 'replica-2': 8}
+        self.now += 1
+        self.assertEqual('replica-1', router.getStoreName(u'user'))
+        self.assertEqual(['replica-1', 'replica-2'] * 2, self.checks)
+
+    def testPin(self):
+        """
+        L{ReplicaRouter.getStoreName} returns C{main} for a pinned client
+        until the pin duration has passed.
+        """
+        router = self.createRouter()
+        router.pin(u'user')
+        self.assertTrue(router.isPinned(u'user'))
+        self.assertEqual('main', router.getStoreName(u'user'))
+        self.assertEqual('replica-2', router.getStoreName(u'other'))
+        self.now += 10
+        self.assertFalse(router.isPinned(u'user'))
+        self.assertEqual('replica-2', router.getStoreName(u'user'))
+
+    def testPinRemovesExpiredPins(self):
+        """
+        L{ReplicaRouter.pin} forgets clients whose pins have expired, even if
+        they're never looked up again.
+        """
+        router = self.createRouter()
+        router.pin(u'user')
+        self.now += 10
+        router.pin(u'other')
+        self.assertEqual([u'other'], router._pins.keys())
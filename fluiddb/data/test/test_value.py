@@ -1,11 +1,14 @@
 from datetime import datetime, timedelta
 from hashlib import sha256
+import os
 import sys
 from uuid import uuid4
 
 from storm.exceptions import IntegrityError
 from storm.store import ResultSet
+from zope.component import getGlobalSiteManager, provideUtility
 
+from fluiddb.data.blob import FileSystemBlobStore, IBlobStore, SpooledFile
 from fluiddb.data.namespace import createNamespace
 from fluiddb.data.tag import createTag
 from fluiddb.data.user import createUser
@@ -13,9 +16,11 @@ from fluiddb.data.value import (
     TagValue, TagValueCollection, AboutTagValue, createAboutTagValue,
     createTagValue, getAboutTagValues, getTagPathsAndObjectIDs,
     getTagPathsForObjectIDs, getTagValues, getObjectIDs, OpaqueValue,
-    OpaqueValueLink, createOpaqueValue, getOpaqueValues)
+    OpaqueValueLink, createOpaqueValue, getOpaqueValues, getOpaqueValueLinks,
+    copyTagValues)
 from fluiddb.testing.basic import FluidinfoTestCase
-from fluiddb.testing.resources import DatabaseResource
+from fluiddb.testing.resources import (
+    DatabaseResource, TemporaryDirectoryResource)
 
 
 class GetTagPathsForObjectIDsTest(FluidinfoTestCase):
@@ -164,6 +169,91 @@ class CreateTagValueTest(FluidinfoTestCase):
         self.assertIdentical(value, self.store.find(TagValue).one())
 
 
+class CopyTagValuesTest(FluidinfoTestCase):
+
+    resources = [('store', DatabaseResource())]
+
+    def setUp(self):
+        super(CopyTagValuesTest, self).setUp()
+        self.user = createUser(u'username', u'password', u'User',
+                               u'user@example.com')
+        self.user.namespaceID = createNamespace(self.user,
+                                                self.user.username, None).id
+        self.tag = createTag(self.user, self.user.namespace, u'name')
+
+    def testCopyTagValues(self):
+        """L{copyTagValues} creates new L{TagValue}s for each row."""
+        objectID1 = uuid4()
+        objectID2 = uuid4()
+        copyTagValues(self.user.id, [(objectID1, self.tag.id, 42),
+                                     (objectID2, self.tag.id, None)])
+        result = self.store.find(TagValue)
+        self.assertEqual(
+            {objectID1: 42, objectID2: None},
+            dict(result.values(TagValue.objectID, TagValue.value)))
+        for value in result:
+            self.assertEqual(self.user.id, value.creatorID)
+            self.assertEqual(self.tag.id, value.tagID)
+
+    def testCopyTagValuesStoresNoneAsNull(self):
+        """
+        L{copyTagValues} stores C{None} values as SQL C{NULL}, like
+        L{createTagValue} does, instead of as a JSON C{null}.
+        """
+        objectID = uuid4()
+        copyTagValues(self.user.id, [(objectID, self.tag.id, None)])
+        result = self.store.execute(
+            'SELECT object_id FROM tag_values WHERE value IS NULL')
+        self.assertEqual([str(objectID)],
+                         [str(row[0]) for row in result])
+
+    def testCopyTagValuesWithSpecialCharacters(self):
+        """
+        L{copyTagValues} correctly escapes values containing characters that
+        are special to C{COPY}.
+        """
+        objectID = uuid4()
+        value = [u'tab\there', u'new\nline', u'back\\slash', u'\\N',
+                 u'\xe1\xe9\xed\xf3\xfa']
+        copyTagValues(self.user.id, [(objectID, self.tag.id, value)])
+        self.assertEqual(value, self.store.find(TagValue).one().value)
+
+    def testCopyTagValuesReplacesExistingValues(self):
+        """
+        L{copyTagValues} replaces existing L{TagValue}s for the same object
+        ID and L{Tag.id}.
+        """
+        objectID = uuid4()
+        createTagValue(self.user.id, self.tag.id, objectID, 42)
+        copyTagValues(self.user.id, [(objectID, self.tag.id, u'new')])
+        self.assertEqual([u'new'],
+                         list(self.store.find(TagValue).values(
+                             TagValue.value)))
+
+    def testCopyTagValuesReturnsBinaryValueIDs(self):
+        """
+        L{copyTagValues} returns the new L{TagValue.id}s of binary values,
+        keyed by object ID and L{Tag.id}.
+        """
+        objectID1 = uuid4()
+        objectID2 = uuid4()
+        result = copyTagValues(
+            self.user.id,
+            [(objectID1, self.tag.id, {'mime-type': 'text/plain',
+                                       'size': 3}),
+             (objectID2, self.tag.id, 42)])
+        value = getTagValues([(objectID1, self.tag.id)]).one()
+        self.assertEqual({(objectID1, self.tag.id): value.id}, result)
+
+    def testCopyTagValuesWithInvalidBinaryValue(self):
+        """
+        L{copyTagValues} raises C{ValueError} if a binary value doesn't match
+        the expected format.
+        """
+        self.assertRaises(ValueError, copyTagValues, self.user.id,
+                          [(uuid4(), self.tag.id, {'contents': 'hello'})])
+
+
 class GetTagValuesTest(FluidinfoTestCase):
 
     resources = [('store', DatabaseResource())]
@@ -197,6 +287,25 @@ class GetTagValuesTest(FluidinfoTestCase):
         self.store.add(TagValue(user.id, tag.id, objectID2, 42))
         self.assertEqual(value, getTagValues([(objectID1, tag.id)]).one())
 
+    def testGetTagValuesMatchesPairs(self):
+        """
+        L{getTagValues} only returns L{TagValue}s matching one of the given
+        C{(object ID, Tag.id)} pairs, not any combination of them.
+        """
+        objectID1 = uuid4()
+        objectID2 = uuid4()
+        user = createUser(u'username', u'password', u'User',
+                          u'user@example.com')
+        user.namespaceID = createNamespace(user, user.username, None).id
+        tag1 = createTag(user, user.namespace, u'tag1')
+        tag2 = createTag(user, user.namespace, u'tag2')
+        value1 = createTagValue(user.id, tag1.id, objectID1, 42)
+        createTagValue(user.id, tag2.id, objectID1, 42)
+        createTagValue(user.id, tag1.id, objectID2, 42)
+        value2 = createTagValue(user.id, tag2.id, objectID2, 42)
+        result = getTagValues([(objectID1, tag1.id), (objectID2, tag2.id)])
+        self.assertEqual(sorted([value1, value2]), sorted(result))
+
 
 class TagValueCollectionTest(FluidinfoTestCase):
 
@@ -444,6 +553,56 @@ class OpaqueValueSchemaTest(FluidinfoTestCase):
         self.store.rollback()
 
 
+class OpaqueValueTest(FluidinfoTestCase):
+
+    resources = [('fs', TemporaryDirectoryResource()),
+                 ('store', DatabaseResource())]
+
+    def setUp(self):
+        super(OpaqueValueTest, self).setUp()
+        self.blobStore = FileSystemBlobStore(self.fs.path)
+        self.addCleanup(getGlobalSiteManager().unregisterUtility,
+                        provided=IBlobStore)
+
+    def testOpenWithContentInDatabase(self):
+        """
+        L{OpaqueValue.open} returns a file-like object with content stored in
+        the database.
+        """
+        opaque = OpaqueValue(sha256('content').hexdigest(), 'content')
+        self.assertEqual('content', opaque.open().read())
+
+    def testOpenWithContentInBlobStore(self):
+        """
+        L{OpaqueValue.open} returns an open file for content stored in the
+        blob store.
+        """
+        provideUtility(self.blobStore, IBlobStore)
+        fileID = sha256('content').hexdigest()
+        self.blobStore.put(fileID, 'content')
+        opaqueFile = OpaqueValue(fileID, None).open()
+        try:
+            self.assertEqual('content', opaqueFile.read())
+        finally:
+            opaqueFile.close()
+
+    def testOpenWithoutBlobStore(self):
+        """
+        L{OpaqueValue.open} raises a C{RuntimeError} if the content is stored
+        in the blob store but one isn't configured.
+        """
+        opaque = OpaqueValue(sha256('content').hexdigest(), None)
+        self.assertRaises(RuntimeError, opaque.open)
+
+    def testRead(self):
+        """L{OpaqueValue.read} returns the content of the value."""
+        provideUtility(self.blobStore, IBlobStore)
+        fileID = sha256('content').hexdigest()
+        self.blobStore.put(fileID, 'content')
+        self.assertEqual('content', OpaqueValue(fileID, 'content').read())
+        self.assertEqual('content', OpaqueValue(fileID, None).read())
+
+
 class OpaqueValueLinkSchemaTest(FluidinfoTestCase):
 
     resources = [('store', DatabaseResource())]
@@ -570,6 +729,78 @@ class CreateOpaqueValueTest(FluidinfoTestCase):
         self.assertEqual(2, result.count())
 
 
+class CreateOpaqueValueWithBlobStoreTest(FluidinfoTestCase):
+
+    resources = [('fs', TemporaryDirectoryResource()),
+                 ('store', DatabaseResource())]
+
+    def setUp(self):
+        super(CreateOpaqueValueWithBlobStoreTest, self).setUp()
+        self.blobStore = FileSystemBlobStore(self.fs.path)
+        provideUtility(self.blobStore, IBlobStore)
+        self.addCleanup(getGlobalSiteManager().unregisterUtility,
+                        provided=IBlobStore)
+
+    def testCreateOpaqueValue(self):
+        """
+        L{createOpaqueValue} writes the content to the blob store, instead of
+        the database, when one is configured.
+        """
+        user = createUser(u'name', u'password', u'User', u'user@example.com')
+        user.namespaceID = createNamespace(user, user.username, None).id
+        tag = createTag(user, user.namespace, u'tag')
+        value = createTagValue(user.id, tag.id, uuid4(), None)
+        self.store.commit()
+        createOpaqueValue(value.id, 'content')
+        fileID = sha256('content').hexdigest()
+        result = self.store.find(OpaqueValue,
+                                 OpaqueValue.fileID == fileID).one()
+        self.assertIdentical(None, result.content)
+        self.assertEqual('content', result.read())
+        self.assertTrue(self.blobStore.has(fileID))
+
+    def testCreateOpaqueValueWithSpooledFile(self):
+        """
+        L{createOpaqueValue} moves a L{SpooledFile} into the blob store
+        without reading it.
+        """
+        user = createUser(u'name', u'password', u'User', u'user@example.com')
+        user.namespaceID = createNamespace(user, user.username, None).id
+        tag = createTag(user, user.namespace, u'tag')
+        value = createTagValue(user.id, tag.id, uuid4(), None)
+        self.store.commit()
+        spool = SpooledFile(self.fs.path)
+        self.addCleanup(spool.close)
+        spool.write('content')
+        createOpaqueValue(value.id, spool)
+        fileID = sha256('content').hexdigest()
+        result = self.store.find(OpaqueValue,
+                                 OpaqueValue.fileID == fileID).one()
+        self.assertIdentical(None, result.content)
+        self.assertFalse(os.path.exists(spool.name))
+        self.assertEqual('content', result.read())
+
+    def testCreateOpaqueValueWithSpooledFileWithoutBlobStore(self):
+        """
+        L{createOpaqueValue} stores the content of a L{SpooledFile} in the
+        database if a blob store isn't configured.
+        """
+        getGlobalSiteManager().unregisterUtility(provided=IBlobStore)
+        user = createUser(u'name', u'password', u'User', u'user@example.com')
+        user.namespaceID = createNamespace(user, user.username, None).id
+        tag = createTag(user, user.namespace, u'tag')
+        value = createTagValue(user.id, tag.id, uuid4(), None)
+        self.store.commit()
+        spool = SpooledFile(self.fs.path)
+        self.addCleanup(spool.close)
+        spool.write('content')
+        createOpaqueValue(value.id, spool)
+        fileID = sha256('content').hexdigest()
+        result = self.store.find(OpaqueValue,
+                                 OpaqueValue.fileID == fileID).one()
+        self.assertEqual('content', result.content)
+
+
 class GetOpaqueValuesTest(FluidinfoTestCase):
 
     resources = [('store', DatabaseResource())]
@@ -590,6 +821,28 @@ class GetOpaqueValuesTest(FluidinfoTestCase):
                          sorted(getOpaqueValues([value1.id, value2.id])))
 
 
+class GetOpaqueValueLinksTest(FluidinfoTestCase):
+
+    resources = [('store', DatabaseResource())]
+
+    def testGetOpaqueValueLinks(self):
+        """
+        L{getOpaqueValueLinks} returns the file IDs of the L{OpaqueValue}s
+        linked to the given L{TagValue}s.
+        """
+        user = createUser(u'name', u'password', u'User', u'user@example.com')
+        user.namespaceID = createNamespace(user, user.username, None).id
+        tag = createTag(user, user.namespace, u'tag')
+        value1 = createTagValue(user.id, tag.id, uuid4(), None)
+        value2 = createTagValue(user.id, tag.id, uuid4(), None)
+        self.store.commit()
+        opaque1 = createOpaqueValue(value1.id, 'content1')
+        opaque2 = createOpaqueValue(value2.id, 'content2')
+        self.assertEqual(
+            sorted([(value1.id, opaque1.fileID), (value2.id, opaque2.fileID)]),
+            sorted(getOpaqueValueLinks([value1.id, value2.id])))
+
+
 class AboutTagValueSchemaTest(FluidinfoTestCase):
 
     resources = [('store', DatabaseResource())]
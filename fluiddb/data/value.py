@@ -1,11 +1,16 @@
+from cStringIO import StringIO
 from hashlib import sha256
+from json import dumps
+from uuid import UUID as PythonUUID
 
 from storm.locals import (
-    Storm, DateTime, Int, Unicode, UUID, RawStr, Reference, AutoReload, And,
-    Or)
+    Storm, DateTime, Int, Unicode, UUID, RawStr, Reference, AutoReload, Or)
+from storm.expr import SQL
 from storm.store import EmptyResultSet
+from zope.component import queryUtility
 
-from fluiddb.data.store import getMainStore
+from fluiddb.data.blob import IBlobStore, SpooledFile
+from fluiddb.data.store import getMainStore, getRawCursor
 from fluiddb.data.tag import Tag
 from fluiddb.util.database import BinaryJSON
 
@@ -60,18 +65,50 @@ class OpaqueValue(Storm):
     """An opaque tag value
 
     @param fileID: The sha-256 hash of the file.
-    @param content: The content of the file.
+    @param content: The content of the file, or C{None} if it's kept in the
+        blob store.
     """
 
     __storm_table__ = 'opaque_values'
 
     fileID = RawStr('file_id', primary=True, allow_none=False)
-    content = RawStr('content', allow_none=False)
+    content = RawStr('content')
 
     def __init__(self, fileID, content):
         self.fileID = fileID
         self.content = content
 
+    def open(self):
+        """Open the content of this value for reading.
+
+        Content kept in the blob store is streamed from disk, instead of
+        being loaded into memory.
+
+        @raise RuntimeError: Raised if the content is kept in the blob store
+            but one isn't configured.
+        @return: A file-like object positioned at the start of the content.
+        """
+        if self.content is not None:
+            return StringIO(self.content)
+        blobStore = queryUtility(IBlobStore)
+        if blobStore is None:
+            raise RuntimeError('Opaque value %s is in the blob store, but '
+                               'one is not configured.' % self.fileID)
+        return blobStore.open(self.fileID)
+
+    def read(self):
+        """Read the content of this value.
+
+        @return: The content as a C{str}.
+        """
+        if self.content is not None:
+            return self.content
+        opaqueFile = self.open()
+        try:
+            return opaqueFile.read()
+        finally:
+            opaqueFile.close()
+
 
 class OpaqueValueLink(Storm):
     """A representation of tag_value - opaque_value many-to-one relation.
@@ -94,13 +131,35 @@ class OpaqueValueLink(Storm):
 def createOpaqueValue(valueID, content):
     """Create a new L{OpaqueValue} associated with the given L{TagValue}.
 
+    If a blob store is configured the content is written to it, instead of
+    the database.
+
     @param valueID: The L{TagValue.id} for the associated value.
-    @param content: The binary content of the opaque value.
+    @param content: The binary content of the opaque value, either a C{str}
+        or a L{SpooledFile}.  A L{SpooledFile} is moved into the blob store
+        without being read, if one is configured.
     """
-    fileID = sha256(content).hexdigest()
+    if isinstance(content, SpooledFile):
+        fileID = content.fileID
+    else:
+        fileID = sha256(content).hexdigest()
     store = getMainStore()
     opaque = store.find(OpaqueValue, OpaqueValue.fileID == fileID).one()
     if opaque is None:
+        blobStore = queryUtility(IBlobStore)
+        if blobStore is not None:
+            # The blob may already be there if a previous attempt to run
+            # this transaction failed.
+            if not blobStore.has(fileID):
+                if isinstance(content, SpooledFile):
+                    content.flush()
+                    blobStore.putFile(fileID, content.name)
+                else:
+                    blobStore.put(fileID, content)
+            content = None
+        elif isinstance(content, SpooledFile):
+            content.seek(0)
+            content = content.read()
         opaque = OpaqueValue(fileID, content)
         store.add(opaque)
     store.add(OpaqueValueLink(valueID, fileID))
@@ -119,6 +178,21 @@ def getOpaqueValues(valueIDs):
                       OpaqueValueLink.valueID.is_in(valueIDs))
 
 
+def getOpaqueValueLinks(valueIDs):
+    """Get the L{OpaqueValue.fileID}s linked to the given L{TagValue}s.
+
+    Only the C{opaque_value_link} table is queried, so the contents of the
+    L{OpaqueValue}s are never loaded.
+
+    @param valueIDs: A sequence of L{TagValue.id}s.
+    @return: A C{ResultSet} with C{(TagValue.id, OpaqueValue.fileID)}
+        2-tuples.
+    """
+    store = getMainStore()
+    return store.find((OpaqueValueLink.valueID, OpaqueValueLink.fileID),
+                      OpaqueValueLink.valueID.is_in(valueIDs))
+
+
 def createTagValue(creatorID, tagID, objectID, value):
     """Create a new L{TagValue}.
 
@@ -132,6 +206,88 @@ def createTagValue(creatorID, tagID, objectID, value):
     return store.add(TagValue(creatorID, tagID, objectID, value))
 
 
+def _escapeCopyText(text):
+    """Escape a string for use as a field in a text-format C{COPY} stream.
+
+    @param text: The C{str} to escape.
+    @return: The escaped C{str}.
+    """
+    return (text.replace('\\', '\\\\').replace('\n', '\\n')
+            .replace('\r', '\\r').replace('\t', '\\t'))
+
+
+def copyTagValues(creatorID, values):
+    """Replace L{TagValue}s in bulk using C{COPY}.
+
+    Rows are streamed with C{COPY} into a temporary table and then applied
+    with a single C{DELETE ... USING} and a single C{INSERT ... SELECT},
+    instead of one statement per value.  Existing L{TagValue}s for the
+    specified object IDs and L{Tag.id}s are replaced.
+
+    @param creatorID: The L{User.id} of the person creating the values.
+    @param values: A sequence of C{(objectID, Tag.id, value)} 3-tuples.
+        Binary values must be provided in the C{{'mime-type': <mime-type>,
+        'size': <size>}} format stored in the database, without contents.
+    @return: A C{dict} mapping C{(objectID, Tag.id)} 2-tuples to the new
+        L{TagValue.id}s of binary values, so that L{OpaqueValue}s can be
+        linked to them.
+    """
+    stream = StringIO()
+    for objectID, tagID, value in values:
+        validateTagValue(None, 'value', value)
+        opaque = 't' if isinstance(value, dict) else 'f'
+        # None is stored as SQL NULL, like TagValue.value does, instead of
+        # as a JSON null.
+        value = '\\N' if value is None else _escapeCopyText(dumps(value))
+        stream.write('%d\t%d\t%s\t%s\t%s\n'
+                     % (creatorID, tagID, objectID, value, opaque))
+    stream.seek(0)
+
+    store = getMainStore()
+    store.execute("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS tag_values_copy (
+            creator_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+            object_id UUID NOT NULL,
+            value TEXT,
+            opaque BOOLEAN NOT NULL)
+        ON COMMIT DROP
+        """, noresult=True)
+    store.execute('TRUNCATE tag_values_copy', noresult=True)
+    cursor = getRawCursor(store)
+    try:
+        cursor.copy_from(stream, 'tag_values_copy',
+                         columns=('creator_id', 'tag_id', 'object_id',
+                                  'value', 'opaque'))
+    finally:
+        cursor.close()
+
+    store.execute("""
+        DELETE FROM tag_values
+        USING tag_values_copy
+        WHERE tag_values.object_id = tag_values_copy.object_id
+            AND tag_values.tag_id = tag_values_copy.tag_id
+        """, noresult=True)
+    result = store.execute("""
+        WITH inserted AS (
+            INSERT INTO tag_values (creator_id, tag_id, object_id, value)
+            SELECT creator_id, tag_id, object_id, convert_to(value, 'UTF8')
+            FROM tag_values_copy
+            RETURNING id, object_id, tag_id)
+        SELECT inserted.id, inserted.object_id, inserted.tag_id
+        FROM inserted JOIN tag_values_copy
+            ON inserted.object_id = tag_values_copy.object_id
+            AND inserted.tag_id = tag_values_copy.tag_id
+        WHERE tag_values_copy.opaque
+        """)
+    valueIDs = dict(((PythonUUID(str(objectID)), tagID), valueID)
+                    for valueID, objectID, tagID in result)
+    # The rows were changed behind Storm's back, so make sure that cached
+    # TagValue objects are reloaded from the database.
+    store.invalidate()
+    return valueIDs
+
+
 def getTagValues(values=None):
     """Get L{TagValue}s.
 
@@ -142,10 +298,18 @@ def getTagValues(values=None):
     store = getMainStore()
     where = []
     if values:
-        expressions = [
-            And(TagValue.objectID == objectID, TagValue.tagID == tagID)
-            for objectID, tagID in values]
-        where = [Or(*expressions)]
+        # Partial SQL, because Storm doesn't do row comparisons.  The pairs
+        # are passed as two array literals, instead of a large OR of ANDs,
+        # so that PostgreSQL plans a single semi-join however many pairs
+        # there are.
+        objectIDs, tagIDs = zip(*values)
+        objectIDs = u'{%s}' % u','.join(map(unicode, objectIDs))
+        tagIDs = u'{%s}' % u','.join(map(unicode, tagIDs))
+        where.append(SQL("""
+            (tag_values.object_id, tag_values.tag_id) IN (
+                SELECT unnest(?::uuid[]), unnest(?::integer[])
+            )
+        """, [objectIDs, tagIDs]))
     return store.find(TagValue, *where)
 
 
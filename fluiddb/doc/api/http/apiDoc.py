@@ -15,6 +15,8 @@ def httpCode(code):
     return spanWrap('httpError', '%d (%s)' % (n, text))
 
 OK = httpCode('OK')
+PARTIAL_CONTENT = httpCode('PARTIAL_CONTENT')
+NOT_MODIFIED = httpCode('NOT_MODIFIED')
 CREATED = httpCode('CREATED')
 NO_CONTENT = httpCode('NO_CONTENT')
 BAD_REQUEST = httpCode('BAD_REQUEST')
@@ -24,6 +26,7 @@ PRECONDITION_FAILED = httpCode('PRECONDITION_FAILED')
 REQUEST_ENTITY_TOO_LARGE = httpCode('REQUEST_ENTITY_TOO_LARGE')
 NOT_ACCEPTABLE = httpCode('NOT_ACCEPTABLE')
 UNSUPPORTED_MEDIA_TYPE = httpCode('UNSUPPORTED_MEDIA_TYPE')
+REQUESTED_RANGE_NOT_SATISFIABLE = httpCode('REQUESTED_RANGE_NOT_SATISFIABLE')
 
 LIST = spanWrap('perm', 'LIST')
 CREATE = spanWrap('perm', 'CREATE')
@@ -152,3 +155,20 @@ def addCannotRespondWithPayload(usage):
         '''An error with the request makes it impossible to respond. <a
         href="http://doc.fluidinfo.com/fluidDB/api/'''
         '''http.html#bad-request">More details</a>.'''))
+
+
+def addConditionalGet(usage):
+    usage.addReturn(Return(
+        NOT_MODIFIED,
+        'If the ' + spanWrap('httpHeader', 'If-None-Match') + ' header '
+        'matches the ' + spanWrap('httpHeader', 'ETag') + ' of the value, '
+        'or the value has not changed since the time given in the ' +
+        spanWrap('httpHeader', 'If-Modified-Since') + ' header.'))
+    usage.addReturn(Return(
+        PARTIAL_CONTENT,
+        'If the value is opaque and a single byte range was requested with '
+        'a ' + spanWrap('httpHeader', 'Range') + ' header.'))
+    usage.addReturn(Return(
+        REQUESTED_RANGE_NOT_SATISFIABLE,
+        'If the requested byte range starts after the end of an opaque '
+        'value.'))
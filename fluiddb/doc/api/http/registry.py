@@ -1,6 +1,7 @@
 import copy
 import logging
 import operator
+import random
 
 from twisted.web import http
 
@@ -54,6 +55,12 @@ class Registry(object):
         # that top-level / verb combination. self._toplevels is populated
         # by passing instances of HTTPTopLevel to self.register.
         self._toplevels = {}
+        # Keys of self._usages are the arguments passed to self.findUsage
+        # and values are the usages it found, so the documentation objects
+        # only have to be searched once.  self.compile fills it in advance.
+        self._usages = {}
+        # The fraction of responses that self.checkResponse validates.
+        self.responseValidationRate = 1.0
 
     def _verbKey(self, verb):
         """
@@ -162,9 +169,47 @@ class Registry(object):
                 (httpToplevel.toplevel, httpToplevel.verb))
         else:
             verbDict[httpToplevel.verb] = httpToplevel
+            self._usages.clear()
+
+    def compile(self):
+        """Build the usage dispatch table and payload validators.
+
+        This should be called once all the API functions are registered, so
+        requests don't have to search the documentation objects.  Usages
+        and payloads must not be changed afterwards.
+        """
+        self._usages.clear()
+        for toplevel, verbDict in self._toplevels.iteritems():
+            for verb, httpTopLevel in verbDict.iteritems():
+                for usage in httpTopLevel.usages:
+                    if usage.resourceClass is None:
+                        continue
+                    try:
+                        self.findUsage(toplevel, verb, usage.resourceClass)
+                    except (error.InternalInconsistency, error.NoSuchUsage):
+                        # The error will be raised again if the usage is
+                        # ever requested.
+                        continue
+                    for payload in usage.requestPayloads.itervalues():
+                        payload.getValidator()
+                    for responseType, payload in (
+                            usage.responsePayloads.iteritems()):
+                        payload.getValidator(
+                            strCountsAsUnicode=(
+                                responseType == 'application/json'))
 
     def findUsage(self, toplevels, verbs, usageResourceClass,
                   showUnimplemented=False, showAdmin=True):
+        key = (toplevels, verbs, usageResourceClass, showUnimplemented,
+               showAdmin)
+        usage = self._usages.get(key)
+        if usage is None:
+            usage = self._findUsage(*key)
+            self._usages[key] = usage
+        return usage
+
+    def _findUsage(self, toplevels, verbs, usageResourceClass,
+                   showUnimplemented, showAdmin):
         toplevelList = self.get(toplevels, verbs,
                                 usageResourceClass=usageResourceClass,
                                 showUnimplemented=showUnimplemented,
@@ -212,7 +257,8 @@ class Registry(object):
 
         TODO: This method would be cleaner if we had the wsfe resource
         method extract the payload and pass it in."""
-        payload = payloads.extractPayload(request)
+        payload = payloads.extractPayload(
+            request, spooled=usage.spooledPayloadPermitted)
 
         if usage.requestPayloads:
             if not payload:
@@ -235,25 +281,27 @@ class Registry(object):
                 logging.info('Request %s: payload dictionary %r' % (
                     request._fluidDB_reqid, loggedDictionary,))
 
+                validator = usagePayload.getValidator()
+
                 # Check that mandatory usage payload fields are present in
                 # the request.
-                for field in usagePayload.fields():
-                    if field.mandatory:
-                        if field.name not in dictionary:
-                            # Just tell them about the first error, not all
-                            # missing fields.
-                            raise error.PayloadFieldMissing(field.name)
+                for name in validator.mandatory:
+                    if name not in dictionary:
+                        # Just tell them about the first error, not all
+                        # missing fields.
+                        raise error.PayloadFieldMissing(name)
 
                 # Check that all payload fields given in the request are
                 # mentioned in the usage and that they all have the correct
                 # type.
+                checkers = validator.checkers
                 for field in dictionary:
-                    if field not in usagePayload:
+                    checker = checkers.get(field)
+                    if checker is None:
                         # XXX Since the unknown arg limit was removed, should
                         # unknown payload fields be allowed?
                         raise error.UnknownPayloadField(field)
-                    if not payloads.checkPayloadFieldType(
-                            dictionary[field], usagePayload[field]):
+                    if not checker(dictionary[field]):
                         raise error.InvalidPayloadField(field)
 
             result = dictionary
@@ -271,6 +319,11 @@ class Registry(object):
         return result
 
     def checkResponse(self, responseType, responseDict, usage, request):
+        """Check a response payload against the usage's documentation.
+
+        Only a sample of responses is checked if L{responseValidationRate}
+        is less than C{1}.
+        """
         if not usage.responsePayloads:
             raise error.InternalError('Usage has no response payloads.')
 
@@ -280,28 +333,34 @@ class Registry(object):
             raise error.InternalError('Usage has no %r response payloads.' %
                                       responseType)
 
+        if (self.responseValidationRate < 1.0 and
+                random.random() >= self.responseValidationRate):
+            return
+
+        validator = usagePayload.getValidator(
+            strCountsAsUnicode=(responseType == 'application/json'))
+
         # Check that mandatory usage payload fields are present in the
         # response.
-        for field in usagePayload.fields():
-            if field.mandatory:
-                if field.name not in responseDict:
-                    # Complain about the first error, not all missing fields.
-                    logging.error('Request %s: mandatory response payload '
-                                  'field %r missing' %
-                                  (request._fluidDB_reqid, field.name))
-                    raise error.ResponsePayloadFieldMissing(field.name)
+        for name in validator.mandatory:
+            if name not in responseDict:
+                # Complain about the first error, not all missing fields.
+                logging.error('Request %s: mandatory response payload '
+                              'field %r missing' %
+                              (request._fluidDB_reqid, name))
+                raise error.ResponsePayloadFieldMissing(name)
 
         # Check that all payload fields given in the response are
         # mentioned in the usage.
+        checkers = validator.checkers
         for field in responseDict:
-            if field not in usagePayload:
+            checker = checkers.get(field)
+            if checker is None:
                 logging.error('Request %s: unknown response payload field %r' %
                               (request._fluidDB_reqid, field))
                 # XXX raise error.UnknownResponsePayloadField(field)
                 continue
-            if not payloads.checkPayloadFieldType(
-                    responseDict[field], usagePayload[field],
-                    strCountsAsUnicode=(responseType == 'application/json')):
+            if not checker(responseDict[field]):
                 logging.error('Request %s: response payload field '
                               '%r has incorrect type (%r instead of %r).' %
                               (request._fluidDB_reqid, field,
@@ -356,19 +415,56 @@ class PayloadField(object):
             (self.type, self.name, self.description))
 
 
+class PayloadValidator(object):
+    """The fields of a L{Payload}, compiled for fast validation.
+
+    @param payload: The L{Payload} to validate.
+    @param strCountsAsUnicode: A flag indicating whether C{str} values are
+        accepted for C{unicode} fields.
+    @ivar mandatory: A C{tuple} with the names of mandatory fields, sorted.
+    @ivar checkers: A C{dict} mapping field names to functions that check
+        the type of their values.
+    """
+
+    def __init__(self, payload, strCountsAsUnicode):
+        fields = payload.fields()
+        self.mandatory = tuple(field.name for field in fields
+                               if field.mandatory)
+        self.checkers = dict(
+            (field.name,
+             payloads.compileFieldChecker(field, strCountsAsUnicode))
+            for field in fields)
+
+
 class Payload(object):
     format = None
 
     def __init__(self):
         self._fields = {}
+        self._validators = {}
         self.mandatory = False
 
     def addField(self, field):
         assert field.name not in self._fields
         self._fields[field.name] = field
+        self._validators.clear()
         if field.mandatory:
             self.mandatory = True
 
+    def getValidator(self, strCountsAsUnicode=False):
+        """Get the compiled L{PayloadValidator} for this payload.
+
+        @param strCountsAsUnicode: Optionally, a flag indicating whether
+            C{str} values are accepted for C{unicode} fields.  Default is
+            C{False}.
+        @return: A L{PayloadValidator} instance.
+        """
+        validator = self._validators.get(strCountsAsUnicode)
+        if validator is None:
+            validator = PayloadValidator(self, strCountsAsUnicode)
+            self._validators[strCountsAsUnicode] = validator
+        return validator
+
     def fields(self):
         return [self._fields[f] for f in sorted(self._fields.keys())]
 
@@ -448,6 +544,10 @@ class HTTPUsage(object):
         # registry's checkRequest method to complain about. Setting
         # unformattedPayloadPermitted will disable the check.
         self.unformattedPayloadPermitted = False
+        # Large payloads are spooled to disk as they arrive. Setting
+        # spooledPayloadPermitted makes checkRequest return them as an open
+        # SpooledFile, instead of reading them into memory.
+        self.spooledPayloadPermitted = False
         # The examples list contains instances of HTTPExample.
         self.examples = []
 
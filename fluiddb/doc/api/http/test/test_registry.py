@@ -3,6 +3,7 @@ from fluiddb.doc.api.http.registry import (
     Registry, HTTPTopLevel, Note, HTTPUsage, Payload, PayloadField,
     JSONPayload, HTTPExample)
 from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.doubles import FakeRequest
 
 
 class TestRegistry(FluidinfoTestCase):
@@ -119,6 +120,111 @@ class TestRegistry(FluidinfoTestCase):
                           self.reg.findUsage, 'dummy', 'PUT',
                           usageResourceClass=Dummy2)
 
+    def testFindUsageIsCached(self):
+        """
+        L{Registry.findUsage} only searches the registered L{HTTPTopLevel}s
+        the first time a usage is requested.
+        """
+
+        class Dummy(object):
+            pass
+
+        f = HTTPTopLevel('users', 'GET')
+        self.reg.register(f)
+        usage = HTTPUsage('', "Return a list of all users.")
+        usage.resourceClass = Dummy
+        f.addUsage(usage)
+        u = self.reg.findUsage('users', 'GET', usageResourceClass=Dummy)
+        self.reg.get = None
+        self.assertIdentical(
+            u, self.reg.findUsage('users', 'GET', usageResourceClass=Dummy))
+
+    def testRegisterClearsFindUsageCache(self):
+        """
+        Registering a new L{HTTPTopLevel} clears the usages cached by
+        L{Registry.findUsage}.
+        """
+
+        class Dummy(object):
+            pass
+
+        f = HTTPTopLevel('users', 'GET')
+        self.reg.register(f)
+        usage = HTTPUsage('', "Return a list of all users.")
+        usage.resourceClass = Dummy
+        f.addUsage(usage)
+        u = self.reg.findUsage('users', 'GET', usageResourceClass=Dummy)
+        self.reg.register(HTTPTopLevel('users', 'PUT'))
+        self.assertNotIdentical(
+            u, self.reg.findUsage('users', 'GET', usageResourceClass=Dummy))
+
+    def testCompile(self):
+        """
+        L{Registry.compile} finds the usages of all registered
+        L{HTTPTopLevel}s and compiles validators for their payloads.
+        """
+
+        class Dummy(object):
+            pass
+
+        f = HTTPTopLevel('users', 'GET')
+        usage = HTTPUsage('', "Return a list of all users.")
+        usage.resourceClass = Dummy
+        payload = JSONPayload()
+        payload.addField(PayloadField('name', unicode, 'The name.'))
+        usage.addResponsePayload(payload)
+        f.addUsage(usage)
+        self.reg.register(f)
+        self.reg.compile()
+        self.reg.get = None
+        u = self.reg.findUsage('users', 'GET', usageResourceClass=Dummy)
+        self.assertIdentical(usage.responsePayloads,
+                             u.responsePayloads)
+        self.assertEqual({True: payload.getValidator(True)},
+                         payload._validators)
+
+    def createResponseUsage(self):
+        """Create a usage with a JSON response payload with one field."""
+        usage = HTTPUsage('', "Return a user.")
+        payload = JSONPayload()
+        payload.addField(PayloadField('name', unicode, 'The name.'))
+        usage.addResponsePayload(payload)
+        return usage
+
+    def testCheckResponse(self):
+        """
+        L{Registry.checkResponse} raises an error if a response payload
+        field has the wrong type.
+        """
+        usage = self.createResponseUsage()
+        request = FakeRequest()
+        self.assertRaises(
+            error.InvalidResponsePayloadField, self.reg.checkResponse,
+            'application/json', {'name': 42}, usage, request)
+        self.reg.checkResponse('application/json', {'name': 'fred'}, usage,
+                               request)
+
+    def testCheckResponseWithMissingField(self):
+        """
+        L{Registry.checkResponse} raises an error if a mandatory response
+        payload field is missing.
+        """
+        usage = self.createResponseUsage()
+        self.assertRaises(
+            error.ResponsePayloadFieldMissing, self.reg.checkResponse,
+            'application/json', {}, usage, FakeRequest())
+
+    def testCheckResponseWithSampling(self):
+        """
+        L{Registry.checkResponse} skips validation for responses that
+        aren't sampled, if L{Registry.responseValidationRate} is less than
+        C{1}.
+        """
+        usage = self.createResponseUsage()
+        self.reg.responseValidationRate = 0.0
+        self.reg.checkResponse('application/json', {'name': 42}, usage,
+                               FakeRequest())
+
     def TestUsageExamples(self):
         """
         Rather un-exciting test but at least the code is exercised and expected
@@ -169,6 +275,39 @@ class TestPayload(FluidinfoTestCase):
         names = [f.name for f in self.payload.fields()]
         self.assertEqual(names, ['email', 'name', 'password'])
 
+    def testGetValidator(self):
+        """
+        L{Payload.getValidator} compiles the names of the mandatory fields
+        and a type checker for each field.
+        """
+        self.payload.addField(PayloadField('name', unicode, 'The name.'))
+        self.payload.addField(PayloadField('age', int, 'The age.',
+                                           mandatory=False))
+        validator = self.payload.getValidator()
+        self.assertEqual(('name',), validator.mandatory)
+        self.assertTrue(validator.checkers['name'](u'fred'))
+        self.assertFalse(validator.checkers['name']('fred'))
+        self.assertTrue(validator.checkers['age'](42))
+        self.assertFalse(validator.checkers['age'](None))
+
+    def testGetValidatorWithStrCountsAsUnicode(self):
+        """
+        L{Payload.getValidator} accepts C{str} values for C{unicode} fields
+        if C{strCountsAsUnicode} is C{True}.
+        """
+        self.payload.addField(PayloadField('name', unicode, 'The name.'))
+        validator = self.payload.getValidator(strCountsAsUnicode=True)
+        self.assertTrue(validator.checkers['name']('fred'))
+
+    def testGetValidatorIsCached(self):
+        """
+        L{Payload.getValidator} reuses validators until a field is added.
+        """
+        validator = self.payload.getValidator()
+        self.assertIdentical(validator, self.payload.getValidator())
+        self.payload.addField(PayloadField('name', unicode, 'The name.'))
+        self.assertNotIdentical(validator, self.payload.getValidator())
+
     def testMandatory(self):
         self.assertFalse(self.payload.mandatory)
 
@@ -11,6 +11,7 @@ from fluiddb.data.value import (
 from fluiddb.exceptions import FeatureError
 from fluiddb.model.factory import APIFactory
 from fluiddb.query.grammar import Node
+from fluiddb.util.session import getCurrentSession
 
 
 class ObjectAPI(object):
@@ -52,6 +53,32 @@ class ObjectAPI(object):
             createAboutTagValue(objectID, value)
             return objectID
 
+    def createMany(self, values):
+        """Create new objects for many about values at once.
+
+        Objects that already exist for an about value are reused, as with
+        L{ObjectAPI.create}.  The C{fluiddb/about} values for the new objects
+        are stored with a single L{TagValueAPI.set} call.
+
+        @param values: A sequence of L{AboutTagValue.value}s.
+        @return: A C{dict} mapping the about values to object IDs.
+        """
+        from fluiddb.model.user import getUser
+
+        values = set(values)
+        if not values:
+            return {}
+        result = self.get(values)
+        updates = {}
+        for value in values - set(result):
+            objectID = uuid4()
+            updates[objectID] = {u'fluiddb/about': value}
+            createAboutTagValue(objectID, value)
+            result[value] = objectID
+        if updates:
+            self._factory.tagValues(getUser(u'fluiddb')).set(updates)
+        return result
+
     def get(self, values):
         """Get object IDs matching C{fluiddb/about} tag values.
 
@@ -116,7 +143,8 @@ class ObjectAPI(object):
                                                    implicitCreate)
         specialResults.update(self._resolveFluiddbIDQueries(idQueries))
         specialResults.update(self._resolveHasQueries(hasQueries))
-        return SearchResult(index, solrQueries, specialResults)
+        return SearchResult(index, solrQueries, specialResults,
+                            getCurrentSession())
 
     def _resolveAboutQueries(self, queries, implicitCreate):
         """
@@ -212,12 +240,15 @@ class SearchResult(object):
     @param index: The L{ObjectIndex} to use when resolving queries.
     @param queries: A sequence of L{Query} instances to resolve.
     @param results: Previous results of special queries already resolved.
+    @param session: Optionally, the L{Session} to record the Solr queries
+        run to resolve the queries in.
     """
 
-    def __init__(self, index, queries, results):
+    def __init__(self, index, queries, results, session=None):
         self._index = index
         self._queries = queries
         self._specialResults = results
+        self._session = session
 
     def get(self):
         """Get the results of a search.
@@ -234,7 +265,7 @@ class SearchResult(object):
 
         deferreds = []
         for query in self._queries:
-            deferreds.append(self._index.search(query))
+            deferreds.append(self._index.search(query, self._session))
         deferreds = DeferredList(deferreds, consumeErrors=True)
 
         def unpackValues(values):
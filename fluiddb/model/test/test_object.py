@@ -75,6 +75,33 @@ class ObjectAPITestMixin(object):
         objectID2 = self.objects.create(u'A fancy about tag value')
         self.assertEqual(objectID1, objectID2)
 
+    def testCreateMany(self):
+        """
+        L{ObjectAPI.createMany} creates objects for many about values at once
+        and returns a C{dict} mapping the about values to object IDs.  Objects
+        that already exist are reused.
+        """
+        objectID = uuid4()
+        createAboutTagValue(objectID, u'existing')
+        result = self.objects.createMany([u'existing', u'new1', u'new2'])
+        self.assertEqual(set([u'existing', u'new1', u'new2']), set(result))
+        self.assertEqual(objectID, result[u'existing'])
+        tag = self.system.tags[u'fluiddb/about']
+        for value in (u'new1', u'new2'):
+            about = getTagValues([(result[value], tag.id)]).one()
+            self.assertEqual(value, about.value)
+            self.assertEqual(self.system.users[u'fluiddb'].id,
+                             about.creatorID)
+        self.assertEqual(result, self.objects.get([u'existing', u'new1',
+                                                   u'new2']))
+
+    def testCreateManyWithoutValues(self):
+        """
+        L{ObjectAPI.createMany} returns an empty C{dict} if no about values
+        are given.
+        """
+        self.assertEqual({}, self.objects.createMany([]))
+
     def testGetWithoutMatchingAboutTagValue(self):
         """
         L{ObjectAPI.get} returns an empty C{dict} if no L{AboutTagValue}s
@@ -1,3 +1,4 @@
+from hashlib import sha256
 from uuid import uuid4
 
 from storm.locals import Not
@@ -8,11 +9,13 @@ from fluiddb.data.permission import (
     createNamespacePermission, createTagPermission)
 from fluiddb.data.system import createSystemData
 from fluiddb.data.tag import Tag, createTag
-from fluiddb.data.value import TagValue, createTagValue, getTagValues
+from fluiddb.data.value import (
+    TagValue, createTagValue, getTagValues, getOpaqueValues)
 from fluiddb.exceptions import FeatureError
 from fluiddb.model.permission import PermissionAPI
 from fluiddb.model.tag import TagAPI
 from fluiddb.model.user import UserAPI, getUser
+from fluiddb.model import value as valueModule
 from fluiddb.model.value import TagValueAPI
 from fluiddb.testing.basic import FluidinfoTestCase
 from fluiddb.testing.resources import DatabaseResource
@@ -97,6 +100,29 @@ class TagValueAPITestMixin(object):
                          result[objectID][u'name/tag'].value['mime-type'])
         self.assertEqual(values[objectID][u'name/tag']['contents'],
                          result[objectID][u'name/tag'].value['contents'])
+        self.assertEqual(sha256('Hello \xA2').hexdigest(),
+                         result[objectID][u'name/tag'].fileID)
+
+    def testGetBinaryValueWithoutContents(self):
+        """
+        L{TagValueAPI.get} only returns the MIME type, size and file ID of
+        binary L{TagValue}s if C{withContents} is C{False}.
+        """
+        namespace = createNamespace(self.user, u'name')
+        createNamespacePermission(namespace)
+        tag = createTag(self.user, namespace, u'tag')
+        createTagPermission(tag)
+        objectID = uuid4()
+        values = {objectID: {u'name/tag': {'mime-type': 'text/plain',
+                                           'contents': 'Hello, world!'}}}
+        self.tagValues.set(values)
+        result = self.tagValues.get([objectID], [u'name/tag'],
+                                    withContents=False)
+        tagValue = result[objectID][u'name/tag']
+        self.assertEqual({'mime-type': 'text/plain', 'size': 13},
+                         tagValue.value)
+        self.assertEqual(sha256('Hello, world!').hexdigest(),
+                         tagValue.fileID)
 
     def testGetOnlyFluidDBID(self):
         """
@@ -323,6 +349,74 @@ class TagValueAPITestMixin(object):
         self.assertNotIn(objectID,
                          getDirtyObjects().values(DirtyObject.objectID))
 
+    def testBatchWithoutOperations(self):
+        """
+        L{TagValueAPI.batch} raises L{FeatureError} if there's nothing to
+        get, set or delete.
+        """
+        self.assertRaises(FeatureError, self.tagValues.batch, [], {}, [])
+
+    def testBatch(self):
+        """
+        L{TagValueAPI.batch} gets, sets and deletes L{TagValue}s and marks
+        the changed objects as dirty.
+        """
+        objectID1 = uuid4()
+        objectID2 = uuid4()
+        namespace = createNamespace(self.user, u'name')
+        createNamespacePermission(namespace)
+        tag = createTag(self.user, namespace, u'tag')
+        createTagPermission(tag)
+        createTagValue(self.user.id, tag.id, objectID1, 42)
+        createTagValue(self.user.id, tag.id, objectID2, 17)
+        result = self.tagValues.batch(
+            reads=[(objectID1, u'name/tag')],
+            values={objectID1: {u'name/tag': 43}},
+            deletes=[(objectID2, u'name/tag')])
+        self.assertEqual([objectID1], result.keys())
+        self.assertEqual(42, result[objectID1][u'name/tag'].value)
+        self.assertEqual(43, getTagValues([(objectID1, tag.id)]).one().value)
+        self.assertIdentical(None, getTagValues([(objectID2, tag.id)]).one())
+        dirtyObjectIDs = list(getDirtyObjects().values(DirtyObject.objectID))
+        self.assertIn(objectID1, dirtyObjectIDs)
+        self.assertIn(objectID2, dirtyObjectIDs)
+
+    def testBatchOnlyReturnsRequestedReads(self):
+        """
+        L{TagValueAPI.batch} only returns values for the requested
+        C{(objectID, path)} pairs, not every combination of them.
+        """
+        objectID1 = uuid4()
+        objectID2 = uuid4()
+        namespace = createNamespace(self.user, u'name')
+        createNamespacePermission(namespace)
+        tag1 = createTag(self.user, namespace, u'tag1')
+        createTagPermission(tag1)
+        tag2 = createTag(self.user, namespace, u'tag2')
+        createTagPermission(tag2)
+        createTagValue(self.user.id, tag1.id, objectID1, 1)
+        createTagValue(self.user.id, tag2.id, objectID1, 2)
+        createTagValue(self.user.id, tag1.id, objectID2, 3)
+        createTagValue(self.user.id, tag2.id, objectID2, 4)
+        result = self.tagValues.batch(reads=[(objectID1, u'name/tag1'),
+                                             (objectID2, u'name/tag2')])
+        self.assertEqual([u'name/tag1'], result[objectID1].keys())
+        self.assertEqual([u'name/tag2'], result[objectID2].keys())
+
+    def testBatchWithoutChangesDoesNotDirtyObjects(self):
+        """
+        L{TagValueAPI.batch} doesn't mark objects as dirty if deleting values
+        doesn't remove anything.
+        """
+        objectID = uuid4()
+        namespace = createNamespace(self.user, u'name')
+        createNamespacePermission(namespace)
+        tag = createTag(self.user, namespace, u'tag')
+        createTagPermission(tag)
+        self.tagValues.batch(deletes=[(objectID, u'name/tag')])
+        self.assertNotIn(objectID,
+                         getDirtyObjects().values(DirtyObject.objectID))
+
 
 class TagValueAPITest(TagValueAPITestMixin, FluidinfoTestCase):
 
@@ -336,3 +430,40 @@ class TagValueAPITest(TagValueAPITestMixin, FluidinfoTestCase):
         self.user = getUser(u'username')
         self.permissions = PermissionAPI(self.user)
         self.tagValues = TagValueAPI(self.user)
+
+    def testSetInBulk(self):
+        """
+        L{TagValueAPI.set} stores values with a bulk C{COPY} when the number
+        of values reaches C{BULK_SET_THRESHOLD}.
+        """
+        self.patch(valueModule, 'BULK_SET_THRESHOLD', 2)
+        objectID1 = uuid4()
+        objectID2 = uuid4()
+        createTagValue(self.user.id,
+                       createTag(self.user, self.user.namespace, u'tag').id,
+                       objectID1, 13)
+        self.tagValues.set({objectID1: {u'username/tag': 42},
+                            objectID2: {u'username/tag': u'hello'}})
+        result = self.tagValues.get([objectID1, objectID2],
+                                    [u'username/tag'])
+        self.assertEqual(42, result[objectID1][u'username/tag'].value)
+        self.assertEqual(u'hello', result[objectID2][u'username/tag'].value)
+        dirtyObjectIDs = list(getDirtyObjects().values(DirtyObject.objectID))
+        self.assertIn(objectID1, dirtyObjectIDs)
+        self.assertIn(objectID2, dirtyObjectIDs)
+
+    def testSetBinaryValueInBulk(self):
+        """
+        L{TagValueAPI.set} stores the contents of binary values when values
+        are written with a bulk C{COPY}.
+        """
+        self.patch(valueModule, 'BULK_SET_THRESHOLD', 1)
+        objectID = uuid4()
+        self.tagValues.set(
+            {objectID: {u'username/tag': {'mime-type': 'text/plain',
+                                          'contents': 'Hello, world!'}}})
+        tag = self.store.find(Tag, Tag.path == u'username/tag').one()
+        value = getTagValues([(objectID, tag.id)]).one()
+        self.assertEqual({'mime-type': 'text/plain', 'size': 13}, value.value)
+        self.assertEqual('Hello, world!',
+                         getOpaqueValues([value.id]).one().content)
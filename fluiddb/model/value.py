@@ -7,11 +7,16 @@ from fluiddb.data.object import touchObjects
 from fluiddb.data.tag import Tag, getTags
 from fluiddb.data.value import (
     TagValueCollection, createTagValue, getTagValues, getOpaqueValues,
-    createOpaqueValue)
+    getOpaqueValueLinks, createOpaqueValue, copyTagValues)
 from fluiddb.exceptions import FeatureError
 from fluiddb.model.factory import APIFactory
 
 
+# The number of values at which TagValueAPI.set switches from individual
+# statements to a bulk COPY.
+BULK_SET_THRESHOLD = 1000
+
+
 class TagValueAPI(object):
     """The public API for L{TagValue}s in the model layer.
 
@@ -24,12 +29,21 @@ class TagValueAPI(object):
         self._user = user
         self._factory = factory or APIFactory()
 
-    def get(self, objectIDs, paths=None):
+    def get(self, objectIDs, paths=None, openContents=False,
+            withContents=True):
         """Get L{TagValue}s matching filtering criteria.
 
         @param objectIDs: A sequence of object IDs to retrieve values for.
         @param paths: Optionally, a sequence of L{Tag.path}s to return.  The
             default is to return values for all available L{Tag.path}s.
+        @param openContents: Optionally, a flag indicating whether the
+            C{contents} of binary values should be open file-like objects,
+            that can be streamed, instead of C{str}s.  Default is C{False}.
+        @param withContents: Optionally, a flag indicating whether the
+            C{contents} of binary values should be loaded at all.  If
+            C{False}, binary values only have their C{mime-type} and C{size}
+            and the contents of L{OpaqueValue}s are never read, so the cost
+            doesn't depend on the size of the value.  Default is C{True}.
         @raise FeatureError: Raised if any of the arguments is empty or
             C{None}.
         @return: A C{dict} mapping object IDs to tags and values, matching the
@@ -57,11 +71,15 @@ class TagValueAPI(object):
             return result
 
         collection = TagValueCollection(objectIDs=objectIDs, paths=paths)
+        binaryValues = []
         for tag, tagValue in collection.values():
             if tagValue.objectID not in result:
                 result[tagValue.objectID] = {}
             tagValue = FluidinfoTagValue.fromTagValue(tagValue)
-            if isinstance(tagValue.value, dict):
+            if isinstance(tagValue.value, dict) and not withContents:
+                tagValue.value = dict(tagValue.value)
+                binaryValues.append(tagValue)
+            elif isinstance(tagValue.value, dict):
                 # We have to make a copy of the value because we don't want
                 # storm to try to add the 'contents' binary value to the
                 # database.
@@ -69,9 +87,21 @@ class TagValueAPI(object):
                 opaque = getOpaqueValues([tagValue.id]).one()
                 if opaque is None:
                     raise RuntimeError('Opaque value not found.')
-                tagValue.value['contents'] = opaque.content
+                tagValue.fileID = opaque.fileID
+                if openContents:
+                    tagValue.value['contents'] = opaque.open()
+                else:
+                    tagValue.value['contents'] = opaque.read()
             result[tagValue.objectID][tag.path] = tagValue
 
+        if binaryValues:
+            valueIDs = [binaryValue.id for binaryValue in binaryValues]
+            fileIDs = dict(getOpaqueValueLinks(valueIDs))
+            for tagValue in binaryValues:
+                if tagValue.id not in fileIDs:
+                    raise RuntimeError('Opaque value not found.')
+                tagValue.fileID = fileIDs[tagValue.id]
+
         return result
 
     def set(self, values):
@@ -96,9 +126,15 @@ class TagValueAPI(object):
         """
         if not values:
             raise FeatureError("Can't set an empty list of tag values.")
+        self._setValues(values)
+        touchObjects(values.keys())
 
-        objectIDs = set(values.keys())
+    def _setValues(self, values):
+        """Set or update L{TagValue}s without marking objects as dirty.
 
+        @param values: A C{dict} mapping object IDs to tags and values, as
+            passed to L{TagValueAPI.set}.
+        """
         # Implicitly create missing tags, if there are any.
         paths = set()
         for tagValues in values.itervalues():
@@ -112,6 +148,19 @@ class TagValueAPI(object):
             self._factory.tags(self._user).create(tags)
             tagIDs = dict(getTags(paths=paths).values(Tag.path, Tag.id))
 
+        count = sum(len(tagValues) for tagValues in values.itervalues())
+        if count >= BULK_SET_THRESHOLD:
+            self._bulkSet(values, tagIDs)
+        else:
+            self._set(values, tagIDs)
+
+    def _set(self, values, tagIDs):
+        """Set or update L{TagValue}s one statement at a time.
+
+        @param values: A C{dict} mapping object IDs to tags and values, as
+            passed to L{TagValueAPI.set}.
+        @param tagIDs: A C{dict} mapping L{Tag.path}s to L{Tag.id}s.
+        """
         # Delete all existing tag values for the specified object IDs and
         # paths.
         deleteValues = []
@@ -138,7 +187,29 @@ class TagValueAPI(object):
                     createOpaqueValue(value.id, content)
                 else:
                     createTagValue(self._user.id, tagID, objectID, value)
-        touchObjects(objectIDs)
+
+    def _bulkSet(self, values, tagIDs):
+        """Set or update L{TagValue}s with a single C{COPY}.
+
+        @param values: A C{dict} mapping object IDs to tags and values, as
+            passed to L{TagValueAPI.set}.
+        @param tagIDs: A C{dict} mapping L{Tag.path}s to L{Tag.id}s.
+        """
+        rows = []
+        contents = {}
+        for objectID, tagValues in values.iteritems():
+            for path, value in tagValues.iteritems():
+                tagID = tagIDs[path]
+                if isinstance(value, dict):
+                    content = value['contents']
+                    contents[(objectID, tagID)] = content
+                    value = {'mime-type': value['mime-type'],
+                             'size': len(content)}
+                rows.append((objectID, tagID, value))
+
+        valueIDs = copyTagValues(self._user.id, rows)
+        for key, content in contents.iteritems():
+            createOpaqueValue(valueIDs[key], content)
 
     def delete(self, values):
         """Delete L{TagValue}s.
@@ -152,14 +223,69 @@ class TagValueAPI(object):
             values = list(values)
         if not values:
             raise FeatureError("Can't delete an empty list of tag values.")
+        result = self._deleteValues(values)
+        if result:
+            touchObjects(objectID for objectID, path in values)
+        return result
+
+    def _deleteValues(self, values):
+        """Delete L{TagValue}s without marking objects as dirty.
 
+        @param values: A C{list} of C{(objectID, Tag.path)} 2-tuples to
+            delete values for.
+        @return: The number of values deleted.
+        """
         paths = set([path for objectID, path in values])
-        objectIDs = set([objectID for objectID, path in values])
         tagIDs = dict(getTags(paths).values(Tag.path, Tag.id))
         values = [(objectID, tagIDs[path]) for objectID, path in values]
-        result = getTagValues(values).remove()
-        if result:
-            touchObjects(objectIDs)
+        return getTagValues(values).remove()
+
+    def batch(self, reads=None, values=None, deletes=None):
+        """Get, set and delete L{TagValue}s together.
+
+        Values are read before any changes are made.  Objects affected by the
+        changes are marked as dirty with a single L{touchObjects} call,
+        instead of one for the values set and another for those deleted.
+
+        @param reads: Optionally, a sequence of C{(objectID, Tag.path)}
+            2-tuples to get values for.  Binary values are loaded without
+            their contents, as with L{TagValueAPI.get}, when C{withContents}
+            is C{False}.
+        @param values: Optionally, a C{dict} mapping object IDs to tags and
+            values to set, as passed to L{TagValueAPI.set}.
+        @param deletes: Optionally, a sequence of C{(objectID, Tag.path)}
+            2-tuples to delete values for.  Deletes are applied after values
+            are set.
+        @raise FeatureError: Raised if there's nothing to get, set or delete.
+        @raise MalformedPathError: Raised if one of the given paths for a
+            nonexistent tag is empty or has unacceptable characters.
+        @return: A C{dict} mapping object IDs to tags and values for the
+            requested C{reads} that exist, matching the following format::
+
+              {<object-id>: {<path>: <L{TagValue}>}}
+        """
+        reads = list(reads or [])
+        deletes = list(deletes or [])
+        if not (reads or values or deletes):
+            raise FeatureError("Can't run an empty batch of tag values.")
+
+        result = {}
+        if reads:
+            objectIDs = list(set(objectID for objectID, path in reads))
+            paths = list(set(path for objectID, path in reads))
+            found = self.get(objectIDs, paths, withContents=False)
+            for objectID, path in reads:
+                value = found.get(objectID, {}).get(path)
+                if value is not None:
+                    result.setdefault(objectID, {})[path] = value
+
+        objectIDs = set()
+        if values:
+            self._setValues(values)
+            objectIDs.update(values.iterkeys())
+        if deletes and self._deleteValues(deletes):
+            objectIDs.update(objectID for objectID, path in deletes)
+        touchObjects(objectIDs)
         return result
 
 
@@ -172,6 +298,8 @@ class FluidinfoTagValue(object):
     @param objectID: The object this value is for.
     @param creationgTime: The date and time when the value was created.
     @param value: The value to store.
+    @ivar fileID: The L{OpaqueValue.fileID} of a binary value, or C{None} for
+        other values.
     """
 
     class Creator:
@@ -186,6 +314,7 @@ class FluidinfoTagValue(object):
         self.objectID = objectID
         self.creationTime = creationTime
         self.value = value
+        self.fileID = None
 
     @classmethod
     def fromTagValue(cls, tagValue):
@@ -33,7 +33,17 @@ CREATE = [
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         duration TEXT NOT NULL,
         endpoint TEXT NOT NULL,
-        session_id TEXT NOT NULL)
+        session_id TEXT NOT NULL,
+        start_time TEXT,
+        method TEXT,
+        uri TEXT,
+        code INT,
+        statements INT,
+        statement_duration TEXT,
+        statement_rows INT)
+    """,
+    """
+    CREATE INDEX trace_logs_duration_idx ON trace_logs (duration)
     """
 ]
 
@@ -0,0 +1,22 @@
+"""
+Add the start time, method, URI, status code and SQL statement totals and
+rows of requests to the trace_logs table.
+"""
+
+
+STATEMENTS = [
+    'ALTER TABLE trace_logs ADD COLUMN start_time TEXT',
+    'ALTER TABLE trace_logs ADD COLUMN method TEXT',
+    'ALTER TABLE trace_logs ADD COLUMN uri TEXT',
+    'ALTER TABLE trace_logs ADD COLUMN code INT',
+    'ALTER TABLE trace_logs ADD COLUMN statements INT',
+    'ALTER TABLE trace_logs ADD COLUMN statement_duration TEXT',
+    'ALTER TABLE trace_logs ADD COLUMN statement_rows INT',
+    'CREATE INDEX trace_logs_duration_idx ON trace_logs (duration)',
+]
+
+
+def apply(store):
+    print __doc__
+    for statement in STATEMENTS:
+        store.execute(statement)
@@ -174,7 +174,7 @@ CREATE = [
     """
     CREATE TABLE opaque_values (
         file_id BYTEA NOT NULL PRIMARY KEY,
-        content BYTEA NOT NULL)
+        content BYTEA)
     """,
 
     """
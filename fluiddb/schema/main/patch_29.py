@@ -0,0 +1,14 @@
+"""
+Allow opaque values without content in the database, for values whose
+content is kept in the blob store.
+"""
+
+STATEMENTS = [
+    'ALTER TABLE opaque_values ALTER COLUMN content DROP NOT NULL',
+]
+
+
+def apply(store):
+    print __doc__
+    for statement in STATEMENTS:
+        store.execute(statement)
@@ -2,6 +2,7 @@ from datetime import datetime
 from itertools import groupby
 import logging
 from operator import itemgetter
+import os
 import sys
 from uuid import UUID
 import time
@@ -10,7 +11,7 @@ import transaction
 from txsolr.client import SolrClient
 from twisted.internet.defer import inlineCallbacks
 
-from fluiddb.data.object import touchObjects
+from fluiddb.data.object import getDirtyObjectsBacklog, touchObjects
 from fluiddb.data.store import getMainStore
 from fluiddb.data.tag import Tag
 from fluiddb.data.value import TagValue
@@ -124,47 +125,175 @@ def _getAllTagValues(updatedSince):
             yield row[:-1]
 
 
-def batchIndex(objectsFilename, interval, maxObjects, sleepFunction=None):
+class BatchThrottle(object):
+    """Adapt the pace of L{batchIndex} to the load on the database.
+
+    The throttle uses an additive-increase/multiplicative-decrease policy.
+    When the replication lag or the C{dirty_objects} backlog exceed their
+    limits the batch size is halved and the delay between batches is
+    doubled.  Otherwise the batch size grows back towards C{maxObjects} and
+    the delay shrinks back towards C{interval}.
+
+    @param maxObjects: The maximum number of objects to process in each batch.
+    @param interval: The minimum delay between batches, in seconds.
+    @param maxLag: Optionally, the maximum replication lag in seconds that is
+        acceptable before slowing down.
+    @param maxBacklog: Optionally, the maximum number of unindexed
+        C{dirty_objects} rows that is acceptable before slowing down.
+    @param getLag: A function returning the current replication lag in
+        seconds, or C{None} if it's unknown.
+    @param getBacklog: A function returning the current size of the
+        C{dirty_objects} backlog.
+    """
+
+    MAX_BACKOFF = 32
+
+    def __init__(self, maxObjects, interval, maxLag=None, maxBacklog=None,
+                 getLag=None, getBacklog=None):
+        self.maxObjects = maxObjects
+        self.minInterval = interval
+        self.maxLag = maxLag
+        self.maxBacklog = maxBacklog
+        self._getLag = getLag
+        self._getBacklog = getBacklog or getDirtyObjectsBacklog
+        self.batchSize = maxObjects
+        self.interval = interval
+
+    def isOverloaded(self):
+        """Determine if the database is under too much pressure.
+
+        @return: C{True} if the replication lag or the backlog exceed their
+            limits, otherwise C{False}.
+        """
+        if self.maxLag is not None and self._getLag is not None:
+            lag = self._getLag()
+            if lag is not None and lag > self.maxLag:
+                logging.info('Replication lag is %.1f seconds.', lag)
+                return True
+        if self.maxBacklog is not None:
+            backlog = self._getBacklog()
+            if backlog > self.maxBacklog:
+                logging.info('Dirty objects backlog is %d rows.', backlog)
+                return True
+        return False
+
+    def update(self):
+        """Recalculate L{batchSize} and L{interval} from observed load."""
+        if self.isOverloaded():
+            self.batchSize = max(1, self.batchSize // 2)
+            self.interval = min(self.interval * 2 or 1,
+                                (self.minInterval or 1) * self.MAX_BACKOFF)
+        else:
+            step = max(1, self.maxObjects // 10)
+            self.batchSize = min(self.maxObjects, self.batchSize + step)
+            self.interval = max(self.minInterval, self.interval // 2)
+
+
+def readCheckpoint(path):
+    """Read the file offset stored in a L{batchIndex} checkpoint file.
+
+    @param path: The path of the checkpoint file.
+    @return: The offset as an C{int}, or C{0} if there is no checkpoint.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path) as checkpointFile:
+        content = checkpointFile.read().strip()
+    try:
+        return int(content)
+    except ValueError:
+        logging.error('Ignoring invalid checkpoint: %r', content)
+        return 0
+
+
+def writeCheckpoint(path, offset):
+    """Atomically store a file offset in a L{batchIndex} checkpoint file.
+
+    @param path: The path of the checkpoint file.
+    @param offset: The offset to store.
+    """
+    temporaryPath = path + '.tmp'
+    with open(temporaryPath, 'w') as checkpointFile:
+        checkpointFile.write('%d\n' % offset)
+        checkpointFile.flush()
+        os.fsync(checkpointFile.fileno())
+    os.rename(temporaryPath, path)
+
+
+def batchIndex(objectsFilename, interval, maxObjects, sleepFunction=None,
+               checkpointFilename=None, maxLag=None, maxBacklog=None,
+               getLag=None):
     """
     Touches all the objects in a given file in batches every a given interval.
 
+    The offset of the last committed batch is stored in a checkpoint file, so
+    that an interrupted run continues where it left off when it's restarted.
+    The checkpoint file is removed once all objects have been processed.
+
+    If C{maxLag} or C{maxBacklog} are provided the size of each batch and the
+    delay between batches are adapted to the load on the database, using a
+    L{BatchThrottle}.
+
     @param objectsFilename: The path of the file with the object IDS to touch.
     @param interval: The interval in minutes to touch a batch of objects.
     @param maxObjects: The number of objects to process in each batch.
     @param sleepFunction: a C{time.sleep} like function used for testing
         purposes.
+    @param checkpointFilename: Optionally, the path of the checkpoint file.
+        Default is C{objectsFilename} with a C{.checkpoint} suffix.
+    @param maxLag: Optionally, the replication lag in seconds above which
+        batches are slowed down.
+    @param maxBacklog: Optionally, the number of unindexed C{dirty_objects}
+        rows above which batches are slowed down.
+    @param getLag: Optionally, a function returning the current replication
+        lag in seconds.  It's required for C{maxLag} to have any effect.
     """
     if sleepFunction is None:
         sleepFunction = time.sleep
+    if checkpointFilename is None:
+        checkpointFilename = objectsFilename + '.checkpoint'
+    throttle = BatchThrottle(maxObjects, interval * 60, maxLag=maxLag,
+                             maxBacklog=maxBacklog, getLag=getLag)
     objectIDs = []
     batch = 0
-    interval = interval * 60
+    processed = 0
+
+    def commit(objectIDs, offset):
+        touchObjects(objectIDs)
+        try:
+            transaction.commit()
+        except:
+            transaction.abort()
+            raise
+        writeCheckpoint(checkpointFilename, offset)
+
     with open(objectsFilename) as objectsFile:
-        for line in objectsFile:
+        offset = readCheckpoint(checkpointFilename)
+        if offset:
+            logging.info('Resuming from offset %d.', offset)
+            objectsFile.seek(offset)
+        # Iterating over the file directly uses a read-ahead buffer, which
+        # makes tell() unusable, so we read it line by line instead.
+        for line in iter(objectsFile.readline, ''):
             if len(objectIDs) == 0:
                 logging.info('Processing batch %d (%d objects processed).'
-                             % (batch, batch * maxObjects))
+                             % (batch, processed))
             try:
                 objectID = UUID(line.strip())
                 objectIDs.append(objectID)
             except ValueError:
                 logging.error('Invalid objectID: %r', line)
                 continue
-            if len(objectIDs) >= maxObjects:
-                touchObjects(objectIDs)
-                try:
-                    transaction.commit()
-                except:
-                    transaction.abort()
-                    raise
+            if len(objectIDs) >= throttle.batchSize:
+                commit(objectIDs, objectsFile.tell())
+                processed += len(objectIDs)
                 logging.info('Batch done. Sleeping until next batch.')
                 objectIDs = []
                 batch += 1
-                sleepFunction(interval)
-        touchObjects(objectIDs)
-        try:
-            transaction.commit()
-        except:
-            transaction.abort()
-            raise
-        logging.info('All objects processed.')
+                throttle.update()
+                sleepFunction(throttle.interval)
+        commit(objectIDs, objectsFile.tell())
+        processed += len(objectIDs)
+
+    os.remove(checkpointFilename)
+    logging.info('All objects processed.')
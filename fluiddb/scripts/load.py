@@ -1,15 +1,25 @@
 from datetime import datetime, timedelta
 import errno
+from json import loads
 import logging
 from multiprocessing import Pool, Queue
 from Queue import Empty
-from random import choice, randint, random
+from random import Random, choice, randint, random
 from string import ascii_letters
 import time
 from uuid import uuid4
 
 from fom.session import Fluid
 from fom.mapping import Namespace, Object
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, DeferredList, maybeDeferred
+
+from fluiddb.benchmarks.api import (
+    PRIMITIVE_CONTENT_TYPE, BenchmarkClient, quoteAboutPath, quotePath)
+from fluiddb.benchmarks.results import BenchmarkResults
+from fluiddb.scripts.logs import getTraceLogPaths
+from fluiddb.util.metrics import getEndpointName
+from fluiddb.util.session import decodeObject
 
 
 logQueue = Queue()
@@ -142,3 +152,553 @@ def getRandomValue():
     """
     return choice([randint(0, 1024 * 1024), random(), True, choice(WORDS),
                    None, [choice(WORDS) for i in range(randint(1, 12))]])
+
+
+# The operations that can be used in a workload mix.
+OPERATIONS = ('get-tag-value', 'put-tag-value', 'values-query',
+              'recent-activity', 'comment-rpc')
+
+# The default workload mix, with the weight of each operation.
+DEFAULT_MIX = ('get-tag-value=60,put-tag-value=20,values-query=10,'
+               'recent-activity=5,comment-rpc=5')
+
+# The methods of requests that can be replayed from trace logs.  Trace logs
+# don't include request bodies, so other requests can't be reproduced.
+REPLAYABLE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def parseProfile(spec):
+    """Parse an arrival rate profile.
+
+    A profile is a comma-separated list of stages.  Each stage has a
+    duration in seconds and a rate in requests per second, like C{60:100},
+    or a range of rates to ramp between, like C{30:10-100}.
+
+    @param spec: The C{str} profile to parse.
+    @raise ValueError: Raised if the profile is invalid.
+    @return: A C{list} of C{(duration, startRate, endRate)} 3-tuples.
+    """
+    profile = []
+    for stage in spec.split(','):
+        try:
+            duration, rates = stage.split(':')
+            if '-' in rates:
+                startRate, endRate = rates.split('-')
+            else:
+                startRate = endRate = rates
+            duration = float(duration)
+            startRate, endRate = float(startRate), float(endRate)
+        except ValueError:
+            raise ValueError('Invalid profile stage %r.' % stage)
+        if duration <= 0 or startRate < 0 or endRate < 0:
+            raise ValueError('Invalid profile stage %r.' % stage)
+        profile.append((duration, startRate, endRate))
+    return profile
+
+
+def getArrivalRate(profile, elapsed):
+    """Get the arrival rate at a point in a profile.
+
+    @param profile: A profile returned by L{parseProfile}.
+    @param elapsed: The C{float} number of seconds since the start of the
+        run.
+    @return: The C{float} number of requests per second, or C{None} if the
+        profile is over.
+    """
+    for duration, startRate, endRate in profile:
+        if elapsed < duration:
+            return startRate + (endRate - startRate) * elapsed / duration
+        elapsed -= duration
+    return None
+
+
+def parseMix(spec):
+    """Parse a workload mix.
+
+    @param spec: A C{str} with comma-separated C{operation=weight} pairs,
+        like L{DEFAULT_MIX}.  Operations must be in L{OPERATIONS}.
+    @raise ValueError: Raised if the mix is invalid.
+    @return: A C{list} of C{(operation, weight)} 2-tuples.
+    """
+    mix = []
+    for item in spec.split(','):
+        try:
+            name, weight = item.split('=')
+            weight = float(weight)
+        except ValueError:
+            raise ValueError('Invalid mix item %r.' % item)
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError('Unknown operation %r.' % name)
+        if weight < 0:
+            raise ValueError('Invalid mix item %r.' % item)
+        mix.append((name, weight))
+    if not sum(weight for name, weight in mix):
+        raise ValueError('The mix has no weight.')
+    return mix
+
+
+def chooseOperation(mix, random):
+    """Pick an operation from a workload mix, according to its weight.
+
+    @param mix: A mix returned by L{parseMix}.
+    @param random: The C{Random} instance to use.
+    @return: The name of the operation.
+    """
+    point = random.random() * sum(weight for name, weight in mix)
+    for name, weight in mix:
+        point -= weight
+        if point < 0:
+            return name
+    return mix[-1][0]
+
+
+class LoadWorkload(object):
+    """Builds the requests made for each operation in a workload mix.
+
+    Requests are made for a fixed set of objects, identified by about
+    values, and a single tag, so the data touched by a run doesn't grow
+    with its duration.
+
+    @param tag: The C{unicode} path of the tag to read and write.  The user
+        making the requests must have permission to do so.
+    @param objects: Optionally, the number of objects to use.  Default is
+        C{100}.
+    @param seed: Optionally, the seed for the random number generator used
+        to pick objects and values.
+    """
+
+    def __init__(self, tag, objects=100, seed=None):
+        self._tag = tag
+        self._random = Random(seed)
+        self._requestID = 0
+        self.abouts = [u'load test object %d' % index
+                       for index in xrange(objects)]
+
+    def getSetupRequests(self):
+        """Get the requests that create the values read by the workload.
+
+        @return: A C{list} of requests, like the ones returned by
+            L{getRequest}.
+        """
+        return [('PUT', quoteAboutPath(about, self._tag), None,
+                 self._random.randint(0, 1000), PRIMITIVE_CONTENT_TYPE)
+                for about in self.abouts]
+
+    def getRequest(self, name):
+        """Build a request for an operation.
+
+        @param name: The name of an operation in L{OPERATIONS}.
+        @return: A C{(method, path, arguments, payload, contentType)}
+            5-tuple, with the arguments for L{BenchmarkClient.request}.
+        """
+        about = self._random.choice(self.abouts)
+        if name == 'get-tag-value':
+            return ('GET', quoteAboutPath(about, self._tag), None, None,
+                    None)
+        elif name == 'put-tag-value':
+            return ('PUT', quoteAboutPath(about, self._tag), None,
+                    self._random.randint(0, 1000), PRIMITIVE_CONTENT_TYPE)
+        elif name == 'values-query':
+            query = u'fluiddb/about = "%s"' % about
+            return ('GET', quotePath(u'values'),
+                    [(u'query', query), (u'tag', self._tag)], None, None)
+        elif name == 'recent-activity':
+            return ('GET', '/recent' + quoteAboutPath(about), None, None,
+                    None)
+        elif name == 'comment-rpc':
+            self._requestID += 1
+            payload = {'jsonrpc': '2.0', 'id': self._requestID,
+                       'method': 'getForObject', 'params': {'about': about}}
+            return ('POST', '/jsonrpc', None, payload, 'application/json')
+        raise ValueError('Unknown operation %r.' % name)
+
+
+class TraceRequest(object):
+    """A request read from a trace log, to be replayed.
+
+    @param offset: The C{float} number of seconds between the first request
+        in the trace logs and this one.
+    @param method: The HTTP method of the request.
+    @param uri: The C{str} URI of the request, with its query string.
+    @param code: The HTTP status code of the response.
+    @param duration: The C{timedelta} the request took.
+    @param username: Optionally, the L{User.username} of the user that made
+        the request.
+    @param sampled: Optionally, C{False} if the request wasn't sampled by
+        the API service, and was only stored because it was slow or failed.
+        Default is C{True}.
+    """
+
+    def __init__(self, offset, method, uri, code, duration, username=None,
+                 sampled=True):
+        self.offset = offset
+        self.method = method
+        self.uri = uri
+        self.code = code
+        self.duration = duration
+        self.username = username
+        self.sampled = sampled
+        self.endpoint = getEndpointName(method, uri)
+
+
+def _getTraceDate(value):
+    """Get a date from a trace log entry loaded with L{decodeObject}.
+
+    @param value: The C{datetime} decoded from the entry, or a bare
+        C{YYYY-mm-dd HH:MM:SS.ffffff} string, as written by older versions
+        of L{Session.dumps}.
+    @return: A C{datetime}.
+    """
+    if isinstance(value, datetime):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
+
+
+def loadTraceRequests(path, start=None, stop=None):
+    """Load the requests in trace logs, sorted by start date.
+
+    @param path: The path of a trace log file, or of a directory with trace
+        log files.  Slow request logs in a directory are skipped.
+    @param start: Optionally, the UTC C{datetime} to only load requests
+        started at or after.
+    @param stop: Optionally, the UTC C{datetime} to only load requests
+        started before.
+    @return: A C{list} of L{TraceRequest}s.
+    """
+    paths = getTraceLogPaths(path)
+    traces = []
+    for filename in paths:
+        with open(filename, 'r') as stream:
+            for line in stream:
+                if not line.strip():
+                    continue
+                trace = loads(line, object_hook=decodeObject)
+                http = trace.get('http')
+                if not http or not http.get('method'):
+                    continue
+                startDate = _getTraceDate(trace['startDate'])
+                if start is not None and startDate < start:
+                    continue
+                if stop is not None and startDate >= stop:
+                    continue
+                stopDate = _getTraceDate(trace['stopDate'])
+                username = (trace.get('auth') or {}).get('username')
+                traces.append((startDate, stopDate, http, username,
+                               trace.get('sampled', True)))
+    traces.sort(key=lambda trace: trace[0])
+    requests = []
+    for startDate, stopDate, http, username, sampled in traces:
+        offset = startDate - traces[0][0]
+        offset = offset.days * 86400 + offset.seconds + (
+            offset.microseconds / 1000000.0)
+        requests.append(TraceRequest(offset, str(http['method']),
+                                     str(http['uri']), http.get('code'),
+                                     stopDate - startDate, username, sampled))
+    return requests
+
+
+def getTraceResults(requests):
+    """Get the latency of the requests in trace logs, by endpoint.
+
+    Only requests that can be replayed are included, so the results can be
+    compared with the results of L{LoadGenerator.replay}.  Durations are
+    measured by the API service, so they don't include the time spent in
+    the network.  Requests that weren't sampled are left out too: they were
+    only stored because they were slow or failed, and would skew the
+    latency of a deployment with a C{trace-sample-rate} below C{1}.
+
+    @param requests: A sequence of L{TraceRequest}s.
+    @return: A C{dict} like the ones returned by L{BenchmarkResults.dumps},
+        without throughputs.
+    """
+    results = BenchmarkResults()
+    for request in requests:
+        if request.method not in REPLAYABLE_METHODS or not request.sampled:
+            continue
+        if request.code >= 400:
+            results.recordError(request.endpoint, str(request.code))
+        else:
+            results.record(request.endpoint, request.duration)
+    return results.dumps()
+
+
+def loadPasswords(path):
+    """Load the passwords of the users whose requests are replayed.
+
+    @param path: The path of a file with a C{username password} pair on
+        each line.  Empty lines and lines starting with C{#} are ignored.
+    @return: A C{dict} mapping C{unicode} usernames to C{str} passwords.
+    """
+    passwords = {}
+    with open(path, 'r') as stream:
+        for line in stream:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            username, password = line.split(None, 1)
+            passwords[username.decode('utf-8')] = password
+    return passwords
+
+
+class ReplayClients(object):
+    """Rewrites the credentials of the requests replayed from trace logs.
+
+    Trace logs don't include credentials, so requests are replayed as the
+    user that made them if their password is known, or as a default user
+    otherwise.  Anonymous requests are replayed anonymously.
+
+    @param endpoint: The URL of the API service to make requests to.
+    @param username: The username to replay requests as when the password
+        of the original user isn't known.
+    @param password: The password of the default user.
+    @param passwords: Optionally, a C{dict} mapping usernames to the
+        passwords they have in the target deployment.
+    @param agent: Optionally, the C{Agent} instance to make requests with.
+    """
+
+    def __init__(self, endpoint, username, password, passwords=None,
+                 agent=None):
+        self._endpoint = endpoint
+        self._username = username
+        self._password = password
+        self._passwords = passwords or {}
+        self._agent = agent
+        self._clients = {}
+
+    def getCredentials(self, request):
+        """Get the credentials to replay a request with.
+
+        @param request: The L{TraceRequest} to replay.
+        @return: A C{(username, password)} 2-tuple, or C{(None, None)} for
+            anonymous requests.
+        """
+        if request.username in (None, u'anon'):
+            return None, None
+        if request.username in self._passwords:
+            return (request.username.encode('utf-8'),
+                    self._passwords[request.username])
+        return self._username, self._password
+
+    def getClient(self, request):
+        """Get the client to replay a request with.
+
+        @param request: The L{TraceRequest} to replay.
+        @return: A L{BenchmarkClient} that authenticates with the rewritten
+            credentials.
+        """
+        credentials = self.getCredentials(request)
+        client = self._clients.get(credentials)
+        if client is None:
+            username, password = credentials
+            client = BenchmarkClient(self._endpoint, username, password,
+                                     agent=self._agent)
+            self._clients[credentials] = client
+        return client
+
+
+def isJSONRPCError(body):
+    """Determine if a JSON-RPC response reports an error.
+
+    The JSON-RPC endpoint uses a C{200} status code for errors, so the body
+    of the response has to be checked.
+
+    @param body: The C{str} body of the response.
+    @return: C{True} if the response isn't valid JSON or has an C{error}
+        member, otherwise C{False}.
+    """
+    try:
+        return 'error' in loads(body)
+    except ValueError:
+        return True
+
+
+class LoadGenerator(object):
+    """Makes requests at a given arrival rate, whatever the response time.
+
+    Unlike L{generateLoad}, which waits for a response before making the
+    next request, requests are made on a schedule, so a slow server faces a
+    growing number of concurrent requests, like it would in production.
+    Latency is measured from the time a request was scheduled to be made,
+    so delays in making requests are included in the results.
+
+    @param client: The L{BenchmarkClient} to make requests with.
+    @param maxInFlight: Optionally, the maximum number of requests waiting
+        for a response.  Requests scheduled while the limit is reached are
+        recorded as C{dropped} errors.  Default is C{1000}.
+    @param poisson: Optionally, a flag indicating whether the intervals
+        between requests are random, following a Poisson process, or
+        uniform.  Default is C{True}.
+    @param clock: Optionally, the C{IReactorTime} provider to schedule
+        requests with.  Default is the global reactor.
+    @param seed: Optionally, the seed for the random number generator used
+        to pick operations and intervals.
+    """
+
+    def __init__(self, client, maxInFlight=1000, poisson=True, clock=None,
+                 seed=None):
+        self._client = client
+        self._maxInFlight = maxInFlight
+        self._poisson = poisson
+        self._clock = clock or reactor
+        self._random = Random(seed)
+        self._pending = set()
+        self.results = BenchmarkResults(utcnow=self._utcnow)
+
+    def _utcnow(self):
+        """Get the current time from the clock, as a C{datetime}."""
+        return datetime.utcfromtimestamp(self._clock.seconds())
+
+    def send(self, name, intended, request, client=None):
+        """Make a request and record its result.
+
+        @param name: The name to record the result under.
+        @param intended: The time, in seconds since the epoch, the request
+            was scheduled to be made at.
+        @param request: A C{(method, path, arguments, payload, contentType)}
+            5-tuple, with the arguments for L{BenchmarkClient.request}.
+        @param client: Optionally, the L{BenchmarkClient} to make the request
+            with, instead of the default one.
+        """
+        if len(self._pending) >= self._maxInFlight:
+            self.results.recordError(name, 'dropped')
+            return
+        method, path, arguments, payload, contentType = request
+        client = client or self._client
+        deferred = maybeDeferred(client.request, method, path,
+                                 arguments, payload,
+                                 contentType or 'application/json')
+        self._pending.add(deferred)
+
+        def recordResponse((code, body)):
+            if code >= 400:
+                self.results.recordError(name, str(code))
+            elif path == '/jsonrpc' and isJSONRPCError(body):
+                self.results.recordError(name, 'jsonrpc-error')
+            else:
+                duration = self._clock.seconds() - intended
+                self.results.record(name, timedelta(seconds=duration))
+
+        def recordFailure(failure):
+            self.results.recordError(name, failure.type.__name__)
+
+        def finish(result):
+            self._pending.discard(deferred)
+
+        deferred.addCallbacks(recordResponse, recordFailure)
+        deferred.addBoth(finish)
+
+    def _complete(self, deferred):
+        """Stop the run and wait for the requests that are still pending.
+
+        @param deferred: The C{Deferred} to fire with the results.
+        """
+        self.results.stop()
+
+        def report(result):
+            data = self.results.dumps()
+            data['histograms'] = dict(
+                (name, operation.latency.getDistribution())
+                for name, operation in self.results.operations.iteritems())
+            deferred.callback(data)
+
+        DeferredList(list(self._pending)).addCallback(report)
+
+    def run(self, profile, mix, workload):
+        """Make requests following an arrival rate profile.
+
+        @param profile: A profile returned by L{parseProfile}.
+        @param mix: A mix returned by L{parseMix}.
+        @param workload: The L{LoadWorkload} to build requests with.
+        @return: A C{Deferred} that fires, once the profile is over and every
+            request got a response, with a C{dict} like the ones returned by
+            L{BenchmarkResults.dumps}, with the latency distribution of each
+            operation in C{histograms}.
+        """
+        deferred = Deferred()
+        start = self._clock.seconds()
+
+        def schedule(previous):
+            rate = getArrivalRate(profile, previous - start)
+            if rate:
+                interval = (self._random.expovariate(rate)
+                            if self._poisson else 1.0 / rate)
+            else:
+                # Wait for the rate to pick up in a ramp from zero.
+                interval = 0.1
+            intended = previous + interval
+            if rate is None or getArrivalRate(profile,
+                                              intended - start) is None:
+                self._complete(deferred)
+                return
+            delay = max(0, intended - self._clock.seconds())
+            self._clock.callLater(delay, fire, intended, bool(rate))
+
+        def fire(intended, makeRequest):
+            if makeRequest:
+                name = chooseOperation(mix, self._random)
+                self.send(name, intended, workload.getRequest(name))
+            schedule(intended)
+
+        self.results.start()
+        schedule(start)
+        return deferred
+
+    def replay(self, requests, speed=1.0, clients=None):
+        """Replay requests loaded from trace logs.
+
+        Requests are made at the same offsets from the start of the run as
+        they had in the trace logs, divided by C{speed}.  Requests with a
+        method not in L{REPLAYABLE_METHODS} are skipped.
+
+        @param requests: A sequence of L{TraceRequest}s, sorted by offset.
+        @param speed: Optionally, the factor to speed the requests up by.
+            Default is C{1.0}.
+        @param clients: Optionally, the L{ReplayClients} to get the client
+            for each request from.  Default is to make every request with
+            the client passed to the constructor.
+        @return: A C{Deferred} that fires with the results, like L{run}'s,
+            with the number of skipped requests in C{skipped}.
+        """
+        deferred = Deferred()
+        start = self._clock.seconds()
+        requests = iter(requests)
+        skipped = [0]
+
+        def scheduleNext():
+            for request in requests:
+                if request.method not in REPLAYABLE_METHODS:
+                    skipped[0] += 1
+                    continue
+                intended = start + request.offset / speed
+                delay = max(0, intended - self._clock.seconds())
+                self._clock.callLater(delay, fire, request, intended)
+                return
+            self._complete(deferred)
+
+        def fire(request, intended):
+            client = clients.getClient(request) if clients else None
+            self.send(request.endpoint, intended,
+                      (request.method, request.uri, None, None, None),
+                      client)
+            scheduleNext()
+
+        def addSkipped(data):
+            data['skipped'] = skipped[0]
+            return data
+
+        self.results.start()
+        scheduleNext()
+        return deferred.addCallback(addSkipped)
+
+
+def setupWorkload(client, workload):
+    """Create the values read by a workload.
+
+    @param client: The L{BenchmarkClient} to make requests with.
+    @param workload: The L{LoadWorkload} to set up.
+    @return: A C{Deferred} that fires when every value has been set.
+    """
+    deferreds = [client.request(*request)
+                 for request in workload.getSetupRequests()]
+    return DeferredList(deferreds, fireOnOneErrback=True, consumeErrors=True)
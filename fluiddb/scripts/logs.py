@@ -1,40 +1,146 @@
 """Logic for parsing log files generated by the Fluidinfo API service."""
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from json import loads
+import os
 
 from storm.expr import Alias
+from storm.info import get_cls_info
 from storm.locals import Count, Desc, DateTime, TimeDelta, Int, Unicode
 
+from fluiddb.data.store import getRawCursor
+from fluiddb.util.metrics import Histogram, getMilliseconds
+from fluiddb.util.session import decodeObject
 
-def loadLogs(path, store):
+
+# The number of rows inserted in each transaction by the loaders.
+BATCH_SIZE = 10000
+
+# The prefix of the names of slow request log files, which are written to
+# the trace log directory.
+SLOW_REQUEST_LOG_PREFIX = 'fluidinfo-api-slow-'
+
+
+def getTraceLogPaths(path):
+    """Get the paths of the trace log files to load.
+
+    Slow requests are always written to the trace log too, so slow request
+    logs in a directory are skipped, to avoid loading those requests twice.
+    A slow request log can still be loaded by passing its own path.
+
+    @param path: The path of a trace log file, or of a directory with trace
+        log files.
+    @return: A sorted C{list} of file paths.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    return [os.path.join(path, filename)
+            for filename in sorted(os.listdir(path))
+            if not filename.startswith(SLOW_REQUEST_LOG_PREFIX)]
+
+
+def loadLogs(path, store, batchSize=BATCH_SIZE):
     """Load log data from a file and store it in a SQLite database.
 
     @param path: The path of the log file to parse.
     @param store: The SQLite database to store parsed results in.
+    @param batchSize: Optionally, the number of rows to insert in each
+        transaction.
     """
     parser = LogParser()
-    for i, item in enumerate(parser.parse(path)):
-        store.add(item)
-        if i % 100 == 0:
-            store.commit()
-    store.commit()
-
-
-def loadTraceLogs(path, store, oldFormat=None):
+    statusLines = BulkInserter(store, StatusLine, batchSize)
+    errorLines = BulkInserter(store, ErrorLine, batchSize)
+    for item in parser.parse(path):
+        if isinstance(item, StatusLine):
+            statusLines.add(item)
+        else:
+            errorLines.add(item)
+    statusLines.flush()
+    errorLines.flush()
+
+
+def loadTraceLogs(path, store, oldFormat=None, batchSize=BATCH_SIZE):
     """Load trace logs from a directory and store them in a SQLite database.
 
-    @param path: The path of the log file to parse.
+    Files are parsed one line at a time, so memory use doesn't depend on
+    the size of the logs.
+
+    @param path: The path of the log file to parse, or of a directory with
+        log files.  Slow request logs in a directory are skipped.
     @param store: The SQLite database to store parsed results in.
     @param oldFormat: Optionally indicates if the old format should be used.
+    @param batchSize: Optionally, the number of rows to insert in each
+        transaction.
     """
     parser = TraceLogParser()
     parseMethod = parser.parseOldFormat if oldFormat else parser.parse
-    for i, traceLog in enumerate(parseMethod(path)):
-        store.add(traceLog)
-        if i % 100 == 0:
-            store.commit()
-    store.commit()
+    paths = getTraceLogPaths(path)
+    traceLogs = BulkInserter(store, TraceLog, batchSize)
+    for filename in paths:
+        for traceLog in parseMethod(filename):
+            traceLogs.add(traceLog)
+    traceLogs.flush()
+
+
+class BulkInserter(object):
+    """Inserts rows in a SQLite database in large transactions.
+
+    Adding objects to a C{Store} one at a time is slow, because Storm keeps
+    track of every object and makes a query for each one.  Instead, the
+    values of the objects are collected and inserted with C{executemany},
+    using the raw database connection in the C{Store}'s own transaction.
+
+    @param store: The C{Store} for the SQLite database.
+    @param cls: The Storm class of the objects to insert.
+    @param batchSize: The number of rows to insert in each transaction.
+    """
+
+    def __init__(self, store, cls, batchSize):
+        self._store = store
+        self._batchSize = batchSize
+        self._attributes = [
+            (name, column)
+            for name, column in sorted(get_cls_info(cls).attributes.items())
+            if not column.primary]
+        self._statement = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            cls.__storm_table__,
+            ', '.join(column.name for name, column in self._attributes),
+            ', '.join('?' for name, column in self._attributes))
+        self._rows = []
+
+    def add(self, item):
+        """Queue an object to be inserted.
+
+        @param item: An instance of the Storm class of this inserter.  It
+            isn't added to the C{Store}.
+        """
+        row = []
+        for name, column in self._attributes:
+            value = getattr(item, name)
+            if isinstance(value, (datetime, timedelta)):
+                value = str(value)
+            row.append(value)
+        self._rows.append(row)
+        if len(self._rows) >= self._batchSize:
+            self.flush()
+
+    def flush(self):
+        """Insert the queued rows in a single transaction."""
+        if not self._rows:
+            return
+        # Finish the current transaction, if Storm started one, so that the
+        # rows are inserted in a transaction of their own.
+        self._store.commit()
+        cursor = getRawCursor(self._store)
+        try:
+            cursor.executemany(self._statement, self._rows)
+        except:
+            self._store.rollback()
+            raise
+        finally:
+            cursor.close()
+        self._store.commit()
+        self._rows = []
 
 
 def reportErrorSummary(store):
@@ -69,23 +175,96 @@ def reportErrorTracebacks(store):
 
 
 def reportTraceLogSummary(store, limit, endpoint=None):
-    """Generator yields the slowest requests from the last 50000 requests.
+    """Generator yields the slowest requests, with details about each one.
 
     @param store: The C{Store} to fetch data from.
-    @return: A sequence of C{(duration, endpoint, filename)} 3-tuples.
+    @param limit: The number of requests to yield.
+    @param endpoint: Optionally, only yield requests for this endpoint, like
+        C{/objects}.
+    @return: A sequence of C{(duration, start-time, method, uri, code,
+        statements, statement-rows, statement-duration, session-id)}
+        9-tuples of C{str}s.  Details that weren't loaded are empty.
     """
-    result = store.find(TraceLog)
-    result = result.order_by(Desc(TraceLog.duration))
-    result = result.config(limit=50000)
-    subselect = result.get_select_expr(TraceLog.id)
-
-    result = store.find(TraceLog, TraceLog.id.is_in(subselect))
+    where = [] if endpoint is None else [TraceLog.endpoint == endpoint]
+    result = store.find(TraceLog, *where)
     result = result.order_by(Desc(TraceLog.duration))
     result = result.config(limit=limit)
-    result = result.values(TraceLog.duration, TraceLog.endpoint,
-                           TraceLog.sessionID)
-    for duration, endpoint, sessionID in result:
-        yield str(duration), endpoint, sessionID
+    result = result.values(TraceLog.duration, TraceLog.startTime,
+                           TraceLog.method, TraceLog.uri, TraceLog.code,
+                           TraceLog.statements, TraceLog.statementRows,
+                           TraceLog.statementDuration, TraceLog.sessionID)
+    for row in result:
+        (duration, startTime, method, uri, code, statements, statementRows,
+         statementDuration, sessionID) = row
+        yield (str(duration), _formatOptional(startTime),
+               _formatOptional(method), _formatOptional(uri),
+               _formatOptional(code), _formatOptional(statements),
+               _formatOptional(statementRows),
+               _formatOptional(statementDuration), sessionID)
+
+
+def reportTraceLogPercentiles(store, bucketSize=None):
+    """Get the latency percentiles of requests, by endpoint.
+
+    Durations are counted in L{Histogram}s while the trace logs are read,
+    so the rows don't need to be sorted or kept in memory.
+
+    @param store: The C{Store} to fetch data from.
+    @param bucketSize: Optionally, a C{timedelta} to group requests by the
+        time they started at, in buckets of this size.  Requests without a
+        start time are ignored in this case.
+    @return: A sorted C{list} of C{(bucket, endpoint, count, p50, p90, p99,
+        max)} 7-tuples of C{str}s, with durations in milliseconds.  The
+        bucket is the start time of the bucket, or empty if C{bucketSize}
+        is C{None}.
+    """
+    histograms = {}
+    result = store.find(TraceLog).values(TraceLog.startTime, TraceLog.method,
+                                         TraceLog.endpoint, TraceLog.duration)
+    for startTime, method, endpoint, duration in result:
+        if bucketSize is None:
+            bucket = ''
+        elif startTime is None:
+            continue
+        else:
+            bucket = str(_getBucket(startTime, bucketSize))
+        if method is not None:
+            endpoint = u'%s %s' % (method, endpoint)
+        histogram = histograms.get((bucket, endpoint))
+        if histogram is None:
+            histogram = histograms[(bucket, endpoint)] = Histogram()
+        histogram.add(getMilliseconds(duration))
+
+    rows = []
+    for (bucket, endpoint), histogram in sorted(histograms.iteritems()):
+        summary = histogram.dumps()
+        rows.append((bucket, endpoint, str(summary['count'])) +
+                    tuple('%.1f' % summary[key]
+                          for key in ('p50', 'p90', 'p99', 'max')))
+    return rows
+
+
+def _getBucket(time, bucketSize):
+    """Get the start of the time bucket a time falls in.
+
+    @param time: A C{datetime}.
+    @param bucketSize: The C{timedelta} size of the buckets.
+    @return: A C{datetime} for the start of the bucket.
+    """
+    size = getMilliseconds(bucketSize)
+    offset = getMilliseconds(time - datetime(time.year, time.month,
+                                             time.day))
+    return (datetime(time.year, time.month, time.day) +
+            timedelta(milliseconds=offset - offset % size))
+
+
+def _formatOptional(value):
+    """Format a value for a report.
+
+    @param value: The value to format, or C{None}.
+    @return: A C{str}, empty if the value is C{None}.
+    """
+    return '' if value is None else str(value)
 
 
 class LogParser(object):
@@ -268,23 +447,67 @@ class TraceLogParser(object):
     def _parse(self, data):
         """Parse a single trace log file.
 
+        Statements are read from the C{transactions} written by
+        L{TransactPlugin.dumps}, or from the single C{statements} list
+        written by older versions.
+
         @param data: JSON data representing a L{Session}.
         @return: A L{TraceLog} instance.
         """
-        trace = loads(data)
+        trace = loads(data, object_hook=decodeObject)
         sessionID = trace['id']
-        startDate = datetime.strptime(trace['startDate'],
-                                      '%Y-%m-%d %H:%M:%S.%f')
-        stopDate = datetime.strptime(trace['stopDate'],
-                                     '%Y-%m-%d %H:%M:%S.%f')
+        startDate = self._parseDate(trace['startDate'])
+        stopDate = self._parseDate(trace['stopDate'])
         duration = stopDate - startDate
-        endpoint = trace['http']['path']
+        http = trace['http']
+        endpoint = http['path']
         endpoint = '/' + endpoint.split('/', 2)[1]
-        return TraceLog(duration, endpoint, sessionID)
+        transact = trace.get('transact') or {}
+        if 'transactions' in transact:
+            statements = [statement
+                          for transaction in transact['transactions']
+                          for statement in transaction.get('statements', [])]
+        else:
+            statements = transact.get('statements') or []
+        statementDuration = timedelta(0)
+        statementRows = None
+        for statement in statements:
+            if 'duration' in statement:
+                statementDuration += statement['duration']
+            elif 'stopTime' in statement:
+                statementDuration += (
+                    self._parseDate(statement['stopTime']) -
+                    self._parseDate(statement['startTime']))
+            rows = statement.get('rows')
+            if rows is not None and rows >= 0:
+                statementRows = (statementRows or 0) + rows
+        return TraceLog(duration, endpoint, sessionID, startTime=startDate,
+                        method=http.get('method'), uri=http.get('uri'),
+                        code=http.get('code'), statements=len(statements),
+                        statementDuration=statementDuration,
+                        statementRows=statementRows)
+
+    def _parseDate(self, value):
+        """Parse a date from a trace log.
+
+        @param value: The C{datetime} decoded from a C{datetime(...)}
+            string written by L{Session.dumps}, or a bare C{str} date, as
+            written by older versions.
+        @return: A C{datetime} instance.
+        """
+        if isinstance(value, datetime):
+            return value
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
 
 
 class TraceLog(object):
-    """A representation of a trace log file."""
+    """A representation of a trace log file.
+
+    The start time, method, URI, status code and SQL statement totals are
+    C{None} for trace logs loaded before they were stored.  The number of
+    rows returned by SQL statements is also C{None} for trace logs written
+    before it was recorded.
+    """
 
     __storm_table__ = 'trace_logs'
 
@@ -292,8 +515,24 @@ class TraceLog(object):
     duration = TimeDelta(allow_none=False)
     endpoint = Unicode(allow_none=False)
     sessionID = Unicode('session_id', allow_none=False)
-
-    def __init__(self, duration, endpoint, sessionID):
+    startTime = DateTime('start_time')
+    method = Unicode()
+    uri = Unicode()
+    code = Int()
+    statements = Int()
+    statementDuration = TimeDelta('statement_duration')
+    statementRows = Int('statement_rows')
+
+    def __init__(self, duration, endpoint, sessionID, startTime=None,
+                 method=None, uri=None, code=None, statements=None,
+                 statementDuration=None, statementRows=None):
         self.duration = duration
         self.endpoint = endpoint
         self.sessionID = sessionID
+        self.startTime = startTime
+        self.method = None if method is None else unicode(method)
+        self.uri = None if uri is None else unicode(uri)
+        self.code = code
+        self.statements = statements
+        self.statementDuration = statementDuration
+        self.statementRows = statementRows
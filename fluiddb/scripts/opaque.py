@@ -0,0 +1,47 @@
+from hashlib import sha256
+import logging
+
+from storm.expr import Ne
+import transaction
+
+from fluiddb.data.store import getMainStore
+from fluiddb.data.value import OpaqueValue
+
+
+def migrateOpaqueValues(blobStore, batchSize=None):
+    """Move the contents of L{OpaqueValue}s from the database to a blob store.
+
+    Values are migrated in batches and the transaction is committed after
+    each one, so the migration can be interrupted and run again.  Values
+    whose content doesn't match their file ID are left in the database.
+
+    @param blobStore: The L{FileSystemBlobStore} to move contents to.
+    @param batchSize: Optionally, the number of values to migrate in each
+        transaction.  Default is 100.
+    @return: The number of migrated values.
+    """
+    if batchSize is None:
+        batchSize = 100
+    store = getMainStore()
+    lastFileID = ''
+    migrated = 0
+    while True:
+        result = store.find(OpaqueValue.fileID,
+                            Ne(OpaqueValue.content, None),
+                            OpaqueValue.fileID > lastFileID)
+        fileIDs = list(result.order_by(OpaqueValue.fileID)[:batchSize])
+        if not fileIDs:
+            break
+        for fileID in fileIDs:
+            opaque = store.get(OpaqueValue, fileID)
+            if sha256(opaque.content).hexdigest() != fileID:
+                logging.error('Content of opaque value %s does not match '
+                              'its file ID.' % fileID)
+                continue
+            blobStore.put(fileID, opaque.content)
+            opaque.content = None
+            migrated += 1
+        transaction.commit()
+        lastFileID = fileIDs[-1]
+        logging.info('Migrated %d opaque values.' % migrated)
+    return migrated
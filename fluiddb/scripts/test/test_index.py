@@ -11,7 +11,8 @@ from fluiddb.data.user import createUser
 from fluiddb.data.value import createTagValue, getTagValues, TagValue
 from fluiddb.model.object import ObjectIndex
 from fluiddb.scripts.index import (
-    buildIndex, deleteIndex, updateIndex, batchIndex)
+    BatchThrottle, buildIndex, deleteIndex, updateIndex, batchIndex,
+    readCheckpoint, writeCheckpoint)
 from fluiddb.testing.basic import FluidinfoTestCase
 from fluiddb.testing.resources import (
     ConfigResource, DatabaseResource, IndexResource, LoggingResource)
@@ -146,6 +147,8 @@ class BatchIndexTest(FluidinfoTestCase):
         super(BatchIndexTest, self).tearDown()
         if os.path.exists(self.objectsFilename):
             os.remove(self.objectsFilename)
+        if os.path.exists(self.objectsFilename + '.checkpoint'):
+            os.remove(self.objectsFilename + '.checkpoint')
 
     def createObjectsFile(self):
         """Helper function to create a file with a list of all object IDs."""
@@ -203,3 +206,134 @@ class BatchIndexTest(FluidinfoTestCase):
         touchedObjects = set(getDirtyObjects().values(DirtyObject.objectID))
         self.assertEqual(allObjects, touchedObjects)
         self.assertIn("Invalid objectID: 'wrong-id'", self.log.getvalue())
+
+    def testBatchIndexWritesCheckpointAfterEachBatch(self):
+        """
+        C{batchIndex} stores the offset of the last committed batch in a
+        checkpoint file.
+        """
+        objectID1 = uuid4()
+        objectID2 = uuid4()
+        with open(self.objectsFilename, 'w') as objectsFile:
+            objectsFile.write('%s\n%s\n' % (objectID1, objectID2))
+        checkpointFilename = self.objectsFilename + '.checkpoint'
+        offsets = []
+
+        def fakeSleep(seconds):
+            offsets.append(readCheckpoint(checkpointFilename))
+
+        batchIndex(self.objectsFilename, 0, 1, sleepFunction=fakeSleep)
+        self.assertEqual([37, 74], offsets)
+
+    def testBatchIndexRemovesCheckpointWhenDone(self):
+        """
+        C{batchIndex} removes the checkpoint file after all objects have been
+        processed.
+        """
+        createTagValue(self.userID, self.tagID, uuid4(), 10)
+        self.createObjectsFile()
+        batchIndex(self.objectsFilename, 0, 10)
+        self.assertFalse(
+            os.path.exists(self.objectsFilename + '.checkpoint'))
+
+    def testBatchIndexResumesFromCheckpoint(self):
+        """
+        C{batchIndex} skips the objects before the offset stored in an
+        existing checkpoint file.
+        """
+        objectID1 = uuid4()
+        objectID2 = uuid4()
+        with open(self.objectsFilename, 'w') as objectsFile:
+            objectsFile.write('%s\n%s\n' % (objectID1, objectID2))
+        writeCheckpoint(self.objectsFilename + '.checkpoint', 37)
+        batchIndex(self.objectsFilename, 0, 10)
+        touchedObjects = list(getDirtyObjects().values(DirtyObject.objectID))
+        self.assertEqual([objectID2], touchedObjects)
+        self.assertIn('Resuming from offset 37.', self.log.getvalue())
+
+    def testBatchIndexSlowsDownWhenBacklogIsTooLarge(self):
+        """
+        C{batchIndex} reduces the batch size and increases the delay between
+        batches when the C{dirty_objects} backlog exceeds C{maxBacklog}.
+        """
+        for value in range(4):
+            createTagValue(self.userID, self.tagID, uuid4(), value)
+        self.createObjectsFile()
+        delays = []
+        batchIndex(self.objectsFilename, 1, 2, sleepFunction=delays.append,
+                   maxBacklog=1)
+        self.assertEqual([120, 240, 480, 960], delays)
+        self.assertEqual(4, getDirtyObjects().count())
+
+
+class BatchThrottleTest(FluidinfoTestCase):
+
+    resources = [('log', LoggingResource(format='%(message)s'))]
+
+    def testUpdateWithoutLimits(self):
+        """
+        L{BatchThrottle.update} keeps the maximum batch size and the minimum
+        interval when no limits are configured.
+        """
+        throttle = BatchThrottle(100, 60)
+        throttle.update()
+        self.assertEqual(100, throttle.batchSize)
+        self.assertEqual(60, throttle.interval)
+
+    def testUpdateWithReplicationLag(self):
+        """
+        L{BatchThrottle.update} halves the batch size and doubles the interval
+        when the replication lag exceeds the limit.
+        """
+        throttle = BatchThrottle(100, 60, maxLag=5, getLag=lambda: 10.0)
+        throttle.update()
+        self.assertEqual(50, throttle.batchSize)
+        self.assertEqual(120, throttle.interval)
+        self.assertIn('Replication lag is 10.0 seconds.', self.log.getvalue())
+
+    def testUpdateWithUnknownReplicationLag(self):
+        """
+        L{BatchThrottle.update} ignores the replication lag if it can't be
+        measured.
+        """
+        throttle = BatchThrottle(100, 60, maxLag=5, getLag=lambda: None)
+        throttle.update()
+        self.assertEqual(100, throttle.batchSize)
+        self.assertEqual(60, throttle.interval)
+
+    def testUpdateWithBacklog(self):
+        """
+        L{BatchThrottle.update} halves the batch size and doubles the interval
+        when the C{dirty_objects} backlog exceeds the limit.
+        """
+        throttle = BatchThrottle(100, 60, maxBacklog=1000,
+                                 getBacklog=lambda: 5000)
+        throttle.update()
+        self.assertEqual(50, throttle.batchSize)
+        self.assertEqual(120, throttle.interval)
+
+    def testUpdateLimitsBackoff(self):
+        """
+        The interval calculated by L{BatchThrottle.update} never exceeds
+        L{BatchThrottle.MAX_BACKOFF} times the minimum interval and the batch
+        size is never smaller than one.
+        """
+        throttle = BatchThrottle(4, 1, maxBacklog=0, getBacklog=lambda: 1)
+        for i in range(10):
+            throttle.update()
+        self.assertEqual(1, throttle.batchSize)
+        self.assertEqual(BatchThrottle.MAX_BACKOFF, throttle.interval)
+
+    def testUpdateRecovers(self):
+        """
+        L{BatchThrottle.update} grows the batch size and shrinks the interval
+        back to their limits once the load goes away.
+        """
+        backlog = [5000]
+        throttle = BatchThrottle(100, 60, maxBacklog=1000,
+                                 getBacklog=lambda: backlog[0])
+        throttle.update()
+        backlog[0] = 0
+        throttle.update()
+        self.assertEqual(60, throttle.batchSize)
+        self.assertEqual(60, throttle.interval)
@@ -0,0 +1,501 @@
+from datetime import datetime, timedelta
+from json import dumps
+import os
+from random import Random
+from uuid import uuid4
+
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Clock
+from twisted.python.util import sibpath
+
+from fluiddb.application import AuthenticationPlugin
+from fluiddb.scripts.load import (
+    LoadGenerator, LoadWorkload, OPERATIONS, ReplayClients, TraceRequest,
+    chooseOperation, getArrivalRate, getTraceResults, loadPasswords,
+    loadTraceRequests, parseMix, parseProfile)
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.doubles import FakeRequest
+from fluiddb.testing.resources import TemporaryDirectoryResource
+from fluiddb.util.session import HTTPPlugin, Session
+
+
+class FakeClient(object):
+    """A fake L{BenchmarkClient} that answers requests after a delay.
+
+    @param clock: The C{Clock} to delay responses with.
+    @param delay: Optionally, the number of seconds each response takes.
+    @param responses: Optionally, a C{dict} mapping paths to the C{(code,
+        body)} 2-tuple or the exception to answer requests with.
+    """
+
+    def __init__(self, clock, delay=0, responses=None):
+        self.clock = clock
+        self.delay = delay
+        self.responses = responses or {}
+        self.requests = []
+
+    def request(self, method, path, arguments=None, payload=None,
+                contentType='application/json'):
+        self.requests.append((method, path, arguments, payload, contentType))
+        response = self.responses.get(path, (200, ''))
+        if isinstance(response, Exception):
+            return fail(response)
+        if not self.delay:
+            return succeed(response)
+        deferred = Deferred()
+        self.clock.callLater(self.delay, deferred.callback, response)
+        return deferred
+
+
+class ParseProfileTest(FluidinfoTestCase):
+
+    def testParseProfile(self):
+        """
+        L{parseProfile} parses stages with a constant rate and stages that
+        ramp between two rates.
+        """
+        self.assertEqual([(60.0, 100.0, 100.0), (30.0, 10.0, 100.0)],
+                         parseProfile('60:100,30:10-100'))
+
+    def testParseProfileWithInvalidStage(self):
+        """L{parseProfile} raises C{ValueError} if a stage is invalid."""
+        self.assertRaises(ValueError, parseProfile, '60')
+        self.assertRaises(ValueError, parseProfile, '60:fast')
+        self.assertRaises(ValueError, parseProfile, '0:10')
+
+    def testGetArrivalRate(self):
+        """
+        L{getArrivalRate} interpolates the rate in ramps and returns
+        C{None} once the profile is over.
+        """
+        profile = parseProfile('10:0-100,10:50')
+        self.assertEqual(0, getArrivalRate(profile, 0))
+        self.assertEqual(50, getArrivalRate(profile, 5))
+        self.assertEqual(50, getArrivalRate(profile, 15))
+        self.assertIdentical(None, getArrivalRate(profile, 20))
+
+
+class ParseMixTest(FluidinfoTestCase):
+
+    def testParseMix(self):
+        """L{parseMix} returns the weight of each operation."""
+        self.assertEqual([('get-tag-value', 3.0), ('comment-rpc', 1.0)],
+                         parseMix('get-tag-value=3, comment-rpc=1'))
+
+    def testParseMixWithUnknownOperation(self):
+        """
+        L{parseMix} raises C{ValueError} if an operation isn't in
+        L{OPERATIONS}.
+        """
+        self.assertRaises(ValueError, parseMix, 'delete-everything=1')
+
+    def testParseMixWithoutWeight(self):
+        """L{parseMix} raises C{ValueError} if the weights add up to zero."""
+        self.assertRaises(ValueError, parseMix, 'get-tag-value=0')
+
+    def testChooseOperation(self):
+        """L{chooseOperation} picks operations according to their weight."""
+        random = Random(0)
+        mix = parseMix('get-tag-value=1,put-tag-value=0')
+        self.assertEqual(set(['get-tag-value']),
+                         set(chooseOperation(mix, random)
+                             for _ in xrange(100)))
+
+
+class LoadWorkloadTest(FluidinfoTestCase):
+
+    def testGetRequest(self):
+        """
+        L{LoadWorkload.getRequest} builds a request for every operation in
+        L{OPERATIONS}.
+        """
+        workload = LoadWorkload(u'username/tag', objects=1)
+        requests = dict((name, workload.getRequest(name))
+                        for name in OPERATIONS)
+        self.assertEqual(
+            ('GET', '/about/load%20test%20object%200/username/tag', None,
+             None, None),
+            requests['get-tag-value'])
+        self.assertEqual('PUT', requests['put-tag-value'][0])
+        self.assertEqual(
+            ('GET', '/values',
+             [(u'query', u'fluiddb/about = "load test object 0"'),
+              (u'tag', u'username/tag')], None, None),
+            requests['values-query'])
+        self.assertEqual('/recent/about/load%20test%20object%200',
+                         requests['recent-activity'][1])
+        method, path, arguments, payload, contentType = (
+            requests['comment-rpc'])
+        self.assertEqual(('POST', '/jsonrpc'), (method, path))
+        self.assertEqual('getForObject', payload['method'])
+        self.assertEqual({'about': u'load test object 0'}, payload['params'])
+
+    def testGetSetupRequests(self):
+        """
+        L{LoadWorkload.getSetupRequests} returns a request to set the tag
+        on each object.
+        """
+        workload = LoadWorkload(u'username/tag', objects=3)
+        requests = workload.getSetupRequests()
+        self.assertEqual(3, len(requests))
+        self.assertEqual(set(['PUT']),
+                         set(request[0] for request in requests))
+
+
+def dumpTrace(startDate, method, uri, code=200, duration=timedelta(),
+              username=None):
+    """Dump a L{Session} for a request, as it's written to trace logs.
+
+    @param startDate: The C{datetime} the request started at.
+    @param method: The HTTP method of the request.
+    @param uri: The URI of the request.
+    @param code: Optionally, the HTTP status code of the response.
+    @param duration: Optionally, the C{timedelta} the request took.
+    @param username: Optionally, the L{User.username} the request was
+        authenticated as.  Default is to not authenticate the request.
+    @return: The JSON written by L{Session.dumps}.
+    """
+    request = FakeRequest(method=method, uri=uri, path=uri.split('?')[0])
+    request.setResponseCode(code)
+    session = Session('id', {'auth': AuthenticationPlugin(),
+                             'http': HTTPPlugin()})
+    session.start()
+    if username is not None:
+        session.auth.login(username, uuid4())
+    session.http.trace(request)
+    session.stop()
+    session.startDate = startDate
+    session.stopDate = startDate + duration
+    session.duration = duration
+    return session.dumps()
+
+
+class LoadTraceRequestsTest(FluidinfoTestCase):
+
+    resources = [('fs', TemporaryDirectoryResource())]
+
+    def testLoadTraceRequests(self):
+        """
+        L{loadTraceRequests} loads the requests in the trace logs in a
+        directory.
+        """
+        path = sibpath(__file__, 'query-string-trace-logs')
+        [request] = loadTraceRequests(path)
+        self.assertEqual(0, request.offset)
+        self.assertEqual('DELETE', request.method)
+        self.assertTrue(request.uri.startswith('/values?'))
+        self.assertEqual('DELETE /values', request.endpoint)
+        self.assertTrue(isinstance(request.duration, timedelta))
+        self.assertEqual(u'fluiddb', request.username)
+
+    def testLoadTraceRequestsWrittenBySession(self):
+        """
+        L{loadTraceRequests} loads trace log entries written by
+        L{Session.dumps}.
+        """
+        startDate = datetime(2012, 1, 1, 12, 30, 15, 250000)
+        line = dumpTrace(startDate, 'GET', '/objects/id/test/tag', code=404,
+                         duration=timedelta(milliseconds=25))
+        path = self.fs.makePath(line + '\n')
+        [request] = loadTraceRequests(path)
+        self.assertEqual(0, request.offset)
+        self.assertEqual('GET', request.method)
+        self.assertEqual('/objects/id/test/tag', request.uri)
+        self.assertEqual(404, request.code)
+        self.assertEqual(timedelta(milliseconds=25), request.duration)
+
+    def testLoadTraceRequestsSkipsSlowRequestLogs(self):
+        """
+        L{loadTraceRequests} skips slow request logs in a directory, so
+        requests that are in the trace log too aren't replayed twice.
+        """
+        path = self.fs.makeDir()
+        line = dumpTrace(datetime(2012, 1, 1), 'GET', '/users/alice')
+        self.fs.makePath(line + '\n',
+                         os.path.join(path, 'fluidinfo-api-trace-9000.log'))
+        self.fs.makePath(line + '\n',
+                         os.path.join(path, 'fluidinfo-api-slow-9000.log'))
+        [request] = loadTraceRequests(path)
+        self.assertEqual('/users/alice', request.uri)
+
+    def testLoadTraceRequestsWithUnsampledRequests(self):
+        """
+        L{loadTraceRequests} loads whether the API service sampled each
+        request.
+        """
+        session = Session('id', {'http': HTTPPlugin()})
+        session.start()
+        session.http.trace(FakeRequest(method='GET', uri='/users/a',
+                                       path='/users/a'))
+        session.stop()
+        session.sampled = False
+        lines = [dumpTrace(datetime(2012, 1, 1), 'GET', '/users/b'),
+                 session.dumps()]
+        path = self.fs.makePath('\n'.join(lines))
+        requests = loadTraceRequests(path)
+        self.assertEqual([('/users/b', True), ('/users/a', False)],
+                         [(request.uri, request.sampled)
+                          for request in requests])
+
+
+        """
+        L{loadTraceRequests} loads the username requests were authenticated
+        as, or C{None} if they weren't.
+        """
+        lines = [
+            dumpTrace(datetime(2012, 1, 1), 'GET', '/users/alice',
+                      username=u'alice'),
+            dumpTrace(datetime(2012, 1, 1, 0, 0, 1), 'GET', '/users/bob',
+                      username=u'bob'),
+            dumpTrace(datetime(2012, 1, 1, 0, 0, 2), 'GET', '/users/anon')]
+        path = self.fs.makePath('\n'.join(lines))
+        alice, bob, anonymous = loadTraceRequests(path)
+        self.assertEqual(u'alice', alice.username)
+        self.assertEqual(u'bob', bob.username)
+        self.assertIdentical(None, anonymous.username)
+        clients = ReplayClients('http://localhost', 'fluiddb', 'secret',
+                                passwords={u'alice': 'password'})
+        self.assertEqual(('alice', 'password'), clients.getCredentials(alice))
+        self.assertEqual(('fluiddb', 'secret'), clients.getCredentials(bob))
+        self.assertEqual((None, None), clients.getCredentials(anonymous))
+
+    def testLoadTraceRequestsSortsByStartDate(self):
+        """
+        L{loadTraceRequests} sorts requests by start date and calculates
+        their offset from the first one.
+        """
+        lines = [
+            dumpTrace(datetime(2012, 1, 1, 0, 0, 1, 500000), 'GET',
+                      '/users/b'),
+            dumpTrace(datetime(2012, 1, 1), 'GET', '/users/a')]
+        path = self.fs.makePath('\n'.join(lines))
+        requests = loadTraceRequests(path)
+        self.assertEqual([(0, '/users/a'), (1.5, '/users/b')],
+                         [(request.offset, request.uri)
+                          for request in requests])
+
+    def testLoadTraceRequestsInWindow(self):
+        """
+        L{loadTraceRequests} only loads the requests that started in the
+        window given by C{start} and C{stop}, if they're given.
+        """
+        lines = [dumpTrace(datetime(2012, 1, 1, 0, 0, second), 'GET',
+                           '/users/%d' % second)
+                 for second in range(4)]
+        path = self.fs.makePath('\n'.join(lines))
+        requests = loadTraceRequests(path, datetime(2012, 1, 1, 0, 0, 1),
+                                     datetime(2012, 1, 1, 0, 0, 3))
+        self.assertEqual([(0, '/users/1'), (1, '/users/2')],
+                         [(request.offset, request.uri)
+                          for request in requests])
+
+
+class GetTraceResultsTest(FluidinfoTestCase):
+
+    def testGetTraceResults(self):
+        """
+        L{getTraceResults} returns the latency and errors of the requests
+        that can be replayed, by endpoint.
+        """
+        requests = [
+            TraceRequest(0, 'GET', '/users/a', 200,
+                         timedelta(milliseconds=5)),
+            TraceRequest(1, 'GET', '/users/b', 404,
+                         timedelta(milliseconds=1)),
+            TraceRequest(2, 'POST', '/objects', 201,
+                         timedelta(milliseconds=9))]
+        data = getTraceResults(requests)
+        self.assertEqual(['GET /users'], data['operations'].keys())
+        operation = data['operations']['GET /users']
+        self.assertEqual(2, operation['count'])
+        self.assertEqual({'404': 1}, operation['errors'])
+        self.assertEqual(5, operation['p50'])
+
+    def testGetTraceResultsIgnoresUnsampledRequests(self):
+        """
+        L{getTraceResults} ignores requests that weren't sampled, since they
+        were only stored because they were slow or failed.
+        """
+        requests = [
+            TraceRequest(0, 'GET', '/users/a', 200,
+                         timedelta(milliseconds=5)),
+            TraceRequest(1, 'GET', '/users/b', 200,
+                         timedelta(seconds=5), sampled=False)]
+        data = getTraceResults(requests)
+        operation = data['operations']['GET /users']
+        self.assertEqual(1, operation['count'])
+        self.assertEqual(5, operation['p50'])
+
+
+class ReplayClientsTest(FluidinfoTestCase):
+
+    resources = [('fs', TemporaryDirectoryResource())]
+
+    def testLoadPasswords(self):
+        """
+        L{loadPasswords} loads usernames and passwords, ignoring empty lines
+        and comments.
+        """
+        path = self.fs.makePath('# Test users\n\nalice secret\nbob pa ss\n')
+        self.assertEqual({u'alice': 'secret', u'bob': 'pa ss'},
+                         loadPasswords(path))
+
+    def testGetCredentials(self):
+        """
+        L{ReplayClients.getCredentials} uses the password of the original
+        user if it's known, or the default credentials otherwise.
+        """
+        clients = ReplayClients('http://localhost', 'fluiddb', 'secret',
+                                passwords={u'alice': 'password'})
+        alice = TraceRequest(0, 'GET', '/', 200, timedelta(0), u'alice')
+        bob = TraceRequest(0, 'GET', '/', 200, timedelta(0), u'bob')
+        self.assertEqual(('alice', 'password'), clients.getCredentials(alice))
+        self.assertEqual(('fluiddb', 'secret'), clients.getCredentials(bob))
+
+    def testGetCredentialsForAnonymousRequest(self):
+        """
+        L{ReplayClients.getCredentials} doesn't use credentials for
+        anonymous requests.
+        """
+        clients = ReplayClients('http://localhost', 'fluiddb', 'secret')
+        request = TraceRequest(0, 'GET', '/', 200, timedelta(0), u'anon')
+        self.assertEqual((None, None), clients.getCredentials(request))
+
+    def testGetClient(self):
+        """
+        L{ReplayClients.getClient} reuses clients for requests with the same
+        credentials.
+        """
+        clients = ReplayClients('http://localhost', 'fluiddb', 'secret')
+        first = TraceRequest(0, 'GET', '/', 200, timedelta(0), u'alice')
+        second = TraceRequest(0, 'GET', '/', 200, timedelta(0), u'bob')
+        self.assertIdentical(clients.getClient(first),
+                             clients.getClient(second))
+
+
+class LoadGeneratorTest(FluidinfoTestCase):
+
+    def setUp(self):
+        super(LoadGeneratorTest, self).setUp()
+        self.clock = Clock()
+
+    def getResults(self, deferred):
+        """Get the results a L{Deferred} has fired with."""
+        results = []
+        deferred.addCallback(results.append)
+        return results
+
+    def testRun(self):
+        """
+        L{LoadGenerator.run} makes requests at the rate in the profile and
+        reports the latency distribution of each operation.
+        """
+        client = FakeClient(self.clock, delay=0.5)
+        generator = LoadGenerator(client, poisson=False, clock=self.clock)
+        deferred = generator.run(parseProfile('10:2'),
+                                 parseMix('get-tag-value=1'),
+                                 LoadWorkload(u'username/tag'))
+        self.clock.pump([0.1] * 110)
+        [data] = self.getResults(deferred)
+        self.assertEqual(19, len(client.requests))
+        operation = data['operations']['get-tag-value']
+        self.assertEqual(19, operation['count'])
+        self.assertEqual(0, data['errors'])
+        distribution = data['histograms']['get-tag-value']
+        self.assertEqual(100, distribution[-1][1])
+        self.assertEqual(19, sum(count for _, _, count in distribution))
+
+    def testRunMeasuresFromIntendedTime(self):
+        """
+        L{LoadGenerator.run} measures latency from the time a request was
+        scheduled, so requests that are made late are reported as slow.
+        """
+        client = FakeClient(self.clock)
+        generator = LoadGenerator(client, poisson=False, clock=self.clock)
+        deferred = generator.run(parseProfile('1:10'),
+                                 parseMix('get-tag-value=1'),
+                                 LoadWorkload(u'username/tag'))
+        self.clock.advance(2)
+        [data] = self.getResults(deferred)
+        self.assertTrue(data['operations']['get-tag-value']['max'] > 1000)
+
+    def testRunWithTooManyRequestsInFlight(self):
+        """
+        L{LoadGenerator.run} records requests scheduled while too many
+        requests are waiting for a response as dropped.
+        """
+        client = FakeClient(self.clock, delay=10)
+        generator = LoadGenerator(client, maxInFlight=2, poisson=False,
+                                  clock=self.clock)
+        deferred = generator.run(parseProfile('5:1'),
+                                 parseMix('get-tag-value=1'),
+                                 LoadWorkload(u'username/tag'))
+        self.clock.pump([1] * 20)
+        [data] = self.getResults(deferred)
+        self.assertEqual(2, len(client.requests))
+        self.assertEqual({'dropped': 2},
+                         data['operations']['get-tag-value']['errors'])
+
+    def testSendWithErrors(self):
+        """
+        L{LoadGenerator.send} records HTTP errors, JSON-RPC errors and
+        exceptions raised by the client.
+        """
+        client = FakeClient(self.clock, responses={
+            '/missing': (404, ''),
+            '/jsonrpc': (200, dumps({'error': {'code': -1}})),
+            '/broken': RuntimeError()})
+        generator = LoadGenerator(client, clock=self.clock)
+        for path in ('/missing', '/jsonrpc', '/broken'):
+            generator.send(path, 0, ('GET', path, None, None, None))
+        self.assertEqual({'404': 1},
+                         generator.results.operations['/missing'].errors)
+        self.assertEqual({'jsonrpc-error': 1},
+                         generator.results.operations['/jsonrpc'].errors)
+        self.assertEqual({'RuntimeError': 1},
+                         generator.results.operations['/broken'].errors)
+
+    def testReplay(self):
+        """
+        L{LoadGenerator.replay} makes requests at their offsets divided by
+        the speed, and skips requests that can't be replayed.
+        """
+        client = FakeClient(self.clock)
+        generator = LoadGenerator(client, clock=self.clock)
+        requests = [
+            TraceRequest(0, 'GET', '/users/a', 200, timedelta(0)),
+            TraceRequest(1, 'POST', '/objects', 201, timedelta(0)),
+            TraceRequest(4, 'GET', '/values?tag=a', 200, timedelta(0))]
+        deferred = generator.replay(requests, speed=2)
+        self.clock.advance(0)
+        self.assertEqual(1, len(client.requests))
+        self.clock.advance(1.9)
+        self.assertEqual(1, len(client.requests))
+        self.clock.advance(0.1)
+        [data] = self.getResults(deferred)
+        self.assertEqual(['/users/a', '/values?tag=a'],
+                         [request[1] for request in client.requests])
+        self.assertEqual(1, data['skipped'])
+        self.assertEqual(1, data['operations']['GET /users']['count'])
+        self.assertEqual(1, data['operations']['GET /values']['count'])
+
+    def testReplayWithClients(self):
+        """
+        L{LoadGenerator.replay} makes each request with the client returned
+        by L{ReplayClients.getClient}, if one is given.
+        """
+        default = FakeClient(self.clock)
+        client = FakeClient(self.clock)
+
+        class FakeReplayClients(object):
+            def getClient(self, request):
+                return client
+
+        generator = LoadGenerator(default, clock=self.clock)
+        requests = [TraceRequest(0, 'GET', '/users/a', 200, timedelta(0),
+                                 u'alice')]
+        generator.replay(requests, clients=FakeReplayClients())
+        self.clock.advance(0)
+        self.assertEqual([], default.requests)
+        self.assertEqual(['/users/a'],
+                         [request[1] for request in client.requests])
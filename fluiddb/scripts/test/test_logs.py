@@ -1,14 +1,20 @@
 from datetime import datetime, timedelta
 import os
 
+from storm.tracer import get_tracers
+from twisted.internet.defer import succeed
 from twisted.python.util import sibpath
 
 from fluiddb.scripts.logs import (
-    LogParser, TraceLogParser, ErrorLine, StatusLine, TraceLog, loadLogs,
-    loadTraceLogs)
+    BulkInserter, LogParser, TraceLogParser, ErrorLine, StatusLine, TraceLog,
+    loadLogs, loadTraceLogs, reportTraceLogPercentiles, reportTraceLogSummary)
 from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.doubles import FakeRequest
 from fluiddb.testing.resources import (
     LogsDatabaseResource, TemporaryDirectoryResource)
+from fluiddb.util.session import (
+    BufferedSessionStorage, HTTPPlugin, Session, SlowRequestLog,
+    TransactPlugin)
 
 
 class LogParserTest(FluidinfoTestCase):
@@ -180,6 +186,93 @@ class LoadLogsTest(FluidinfoTestCase):
         self.assertEqual(131, status.contentLength)
 
 
+class BulkInserterTest(FluidinfoTestCase):
+
+    resources = [('store', LogsDatabaseResource())]
+
+    def testFlush(self):
+        """
+        L{BulkInserter.flush} inserts the queued rows and commits them in
+        the C{Store}'s transaction.
+        """
+        inserter = BulkInserter(self.store, StatusLine, 10)
+        inserter.add(StatusLine(datetime(2011, 6, 14, 6, 36, 47), 201,
+                                'POST', '/objects', 131, 'fom/0.9.2'))
+        inserter.add(StatusLine(datetime(2011, 6, 14, 6, 36, 48), 200,
+                                'GET', '/objects', 42, 'fom/0.9.2'))
+        inserter.flush()
+        self.store.rollback()
+        result = self.store.find(StatusLine).order_by(StatusLine.time)
+        self.assertEqual([201, 200], [status.code for status in result])
+
+    def testAddFlushesFullBatches(self):
+        """
+        L{BulkInserter.add} inserts the queued rows once there are
+        C{batchSize} of them.
+        """
+        inserter = BulkInserter(self.store, StatusLine, 1)
+        inserter.add(StatusLine(datetime(2011, 6, 14, 6, 36, 47), 201,
+                                'POST', '/objects', 131, 'fom/0.9.2'))
+        self.store.rollback()
+        self.assertEqual(1, self.store.find(StatusLine).count())
+
+
+class FakeTransact(object):
+    """A fake L{Transact} that runs functions in the current thread."""
+
+    def run(self, function, *args, **kwargs):
+        return succeed(function(*args, **kwargs))
+
+
+class FakeConnection(object):
+    """A fake Storm C{Connection} for tracers."""
+
+
+class FakeCursor(object):
+    """A fake database cursor that returns C{rowcount} rows."""
+
+    def __init__(self, rowcount):
+        self.rowcount = rowcount
+
+    def execute(self, statement):
+        pass
+
+
+def dumpSession(id, path, rows, recordStatements=True):
+    """Dump a L{Session} for a request, as it's written to trace logs.
+
+    @param id: The ID of the session.
+    @param path: The path of the request.
+    @param rows: A sequence with the number of rows returned by each SQL
+        statement the request runs.
+    @param recordStatements: Optionally, C{False} to only record the text
+        and timing of statements, like sessions that aren't sampled do.
+        Default is C{True}.
+    @return: The L{Session} and the JSON written by L{Session.dumps}.
+    """
+
+    def run():
+        [tracer] = get_tracers()
+        connection = FakeConnection()
+        for rowcount in rows:
+            cursor = FakeCursor(rowcount)
+            tracer.connection_raw_execute(connection, cursor, 'SELECT 1',
+                                          [])
+            tracer.connection_raw_execute_success(connection, cursor,
+                                                  'SELECT 1', [])
+
+    plugin = TransactPlugin(FakeTransact(), 60, recordStatements)
+    session = Session(id, {'http': HTTPPlugin(), 'transact': plugin})
+    session.start()
+    request = FakeRequest(method='GET', uri=path + '?showAbout=True',
+                          path=path)
+    request.setResponseCode(200)
+    session.http.trace(request)
+    session.transact.run(run)
+    session.stop()
+    return session, session.dumps()
+
+
 class TraceLogParserTest(FluidinfoTestCase):
 
     resources = [('fs', TemporaryDirectoryResource())]
@@ -201,6 +294,47 @@ class TraceLogParserTest(FluidinfoTestCase):
         self.assertTrue(isinstance(trace.duration, timedelta))
         self.assertEqual('/objects', trace.endpoint)
 
+    def testParseWithDetails(self):
+        """
+        L{TraceLogParser.parse} stores the start time, method, URI and
+        status code of the request, and the number and total duration of
+        the SQL statements it ran.
+        """
+        path = sibpath(__file__, 'simple-trace-logs')
+        filename = os.path.join(path, 'API-9000-20110630-165151-000901')
+        [trace] = list(self.parser.parse(filename))
+        self.assertEqual(datetime(2011, 6, 30, 16, 51, 51, 177323),
+                         trace.startTime)
+        self.assertEqual(u'GET', trace.method)
+        self.assertEqual(u'/objects/3c254c46-18a3-4c38-bcff-ebef171d146e/'
+                         u'fluiddb/testing/test1', trace.uri)
+        self.assertEqual(200, trace.code)
+        self.assertEqual(4, trace.statements)
+        self.assertEqual(timedelta(microseconds=4117),
+                         trace.statementDuration)
+        self.assertIdentical(None, trace.statementRows)
+
+    def testParseSessionDumps(self):
+        """
+        L{TraceLogParser.parse} reads trace logs written by L{Session.dumps},
+        with the statements of every transaction and the number of rows they
+        returned.
+        """
+        session, data = dumpSession('API-9000-1', '/objects/id', [3, 2])
+        path = self.fs.makePath(data + '\n')
+        [trace] = list(self.parser.parse(path))
+        self.assertEqual('API-9000-1', trace.sessionID)
+        self.assertEqual('/objects', trace.endpoint)
+        self.assertEqual(session.startDate, trace.startTime)
+        self.assertEqual(session.duration, trace.duration)
+        self.assertEqual(u'GET', trace.method)
+        self.assertEqual(u'/objects/id?showAbout=True', trace.uri)
+        self.assertEqual(200, trace.code)
+        self.assertEqual(2, trace.statements)
+        self.assertEqual(5, trace.statementRows)
+        self.assertEqual(session.transact.totalStatementDuration,
+                         trace.statementDuration)
+
     def testParseWithURIAndQueryString(self):
         """
         L{TraceLogParser.parse} gets the root endpoint and stores it.  A query
@@ -233,3 +367,156 @@ class LoadTraceLogsTest(FluidinfoTestCase):
         self.assertEqual('API-9000-20110630-165151-000901', trace.sessionID)
         self.assertTrue(isinstance(trace.duration, timedelta))
         self.assertEqual('/objects', trace.endpoint)
+
+    def testLoadWithDirectory(self):
+        """
+        L{loadTraceLogs} loads trace logs from every file in a directory.
+        """
+        path = sibpath(__file__, 'simple-trace-logs')
+        loadTraceLogs(path, self.store)
+        trace = self.store.find(TraceLog).one()
+        self.assertEqual('API-9000-20110630-165151-000901', trace.sessionID)
+        self.assertEqual(u'GET', trace.method)
+        self.assertEqual(4, trace.statements)
+
+    def testLoadWithDirectorySkipsSlowRequestLogs(self):
+        """
+        L{loadTraceLogs} skips slow request logs in a directory, because the
+        requests in them are in the trace logs too.
+        """
+        path = self.fs.makeDir()
+        line = dumpSession('API-9000-1', '/objects/id', [1])[1]
+        self.fs.makePath(line + '\n',
+                         os.path.join(path, 'fluidinfo-api-trace-9000.log'))
+        self.fs.makePath(line + '\n',
+                         os.path.join(path, 'fluidinfo-api-slow-9000.log'))
+        self.fs.makePath(line + '\n',
+                         os.path.join(path, 'fluidinfo-api-slow-9000.log.1'))
+        loadTraceLogs(path, self.store)
+        self.assertEqual([u'API-9000-1'],
+                         list(self.store.find(TraceLog).values(
+                             TraceLog.sessionID)))
+
+    def testLoadSessionDumps(self):
+        """
+        L{loadTraceLogs} loads trace logs written by L{Session.dumps}.
+        """
+        lines = [dumpSession('API-9000-1', '/objects/id', [1])[1],
+                 dumpSession('API-9000-2', '/values', [4, 0])[1]]
+        path = self.fs.makePath('\n'.join(lines))
+        loadTraceLogs(path, self.store)
+        result = self.store.find(TraceLog).order_by(TraceLog.sessionID)
+        self.assertEqual(
+            [(u'API-9000-1', u'/objects', 1, 1),
+             (u'API-9000-2', u'/values', 2, 4)],
+            [(trace.sessionID, trace.endpoint, trace.statements,
+              trace.statementRows) for trace in result])
+
+    def testLoadSlowRequestLog(self):
+        """
+        L{loadTraceLogs} loads the slow request log written by
+        L{SlowRequestLog}, including the sessions that weren't sampled.
+        """
+        path = self.fs.makePath()
+        log = SlowRequestLog(BufferedSessionStorage(path), 0)
+        sampled = dumpSession('API-9000-1', '/objects/id', [1])[0]
+        unsampled = dumpSession('API-9000-2', '/values', [4, 0],
+                                recordStatements=False)[0]
+        self.assertTrue(log.record(sampled))
+        self.assertTrue(log.record(unsampled))
+        loadTraceLogs(path, self.store)
+        result = self.store.find(TraceLog).order_by(TraceLog.sessionID)
+        self.assertEqual(
+            [(u'API-9000-1', u'/objects', 1, 1),
+             (u'API-9000-2', u'/values', 2, 4)],
+            [(trace.sessionID, trace.endpoint, trace.statements,
+              trace.statementRows) for trace in result])
+        trace = self.store.find(TraceLog,
+                                TraceLog.sessionID == u'API-9000-2').one()
+        self.assertEqual(unsampled.startDate, trace.startTime)
+        self.assertEqual(unsampled.duration, trace.duration)
+
+    def testLoadInBatches(self):
+        """
+        L{loadTraceLogs} inserts trace logs in batches of the requested
+        size.
+        """
+        path = sibpath(__file__, 'simple-trace-logs')
+        filename = os.path.join(path, 'API-9000-20110630-165151-000901')
+        with open(filename, 'r') as stream:
+            line = stream.read().strip()
+        path = self.fs.makePath('\n'.join([line] * 5))
+        loadTraceLogs(path, self.store, batchSize=2)
+        self.assertEqual(5, self.store.find(TraceLog).count())
+
+
+class ReportTraceLogTest(FluidinfoTestCase):
+
+    resources = [('store', LogsDatabaseResource())]
+
+    def createTraceLog(self, milliseconds, endpoint=u'/objects',
+                       method=u'GET', startTime=None, sessionID=None):
+        """Add a L{TraceLog} to the database."""
+        traceLog = TraceLog(timedelta(milliseconds=milliseconds), endpoint,
+                            sessionID or u'session-%d' % milliseconds,
+                            startTime=startTime, method=method)
+        return self.store.add(traceLog)
+
+    def testReportTraceLogSummary(self):
+        """
+        L{reportTraceLogSummary} yields the slowest requests, slowest
+        first.
+        """
+        self.createTraceLog(5)
+        self.createTraceLog(20, endpoint=u'/values')
+        self.createTraceLog(10)
+        rows = list(reportTraceLogSummary(self.store, 2))
+        self.assertEqual(
+            [('0:00:00.020000', '', 'GET', '', '', '', '', '', 'session-20'),
+             ('0:00:00.010000', '', 'GET', '', '', '', '', '', 'session-10')],
+            rows)
+
+    def testReportTraceLogSummaryWithEndpoint(self):
+        """
+        L{reportTraceLogSummary} only yields requests for the endpoint it's
+        given, if one is given.
+        """
+        self.createTraceLog(5)
+        self.createTraceLog(20, endpoint=u'/values')
+        rows = list(reportTraceLogSummary(self.store, 10, u'/objects'))
+        self.assertEqual(['session-5'], [row[-1] for row in rows])
+
+    def testReportTraceLogPercentiles(self):
+        """
+        L{reportTraceLogPercentiles} returns the number of requests and the
+        latency percentiles for each endpoint.
+        """
+        for milliseconds in range(1, 101):
+            self.createTraceLog(milliseconds)
+        self.createTraceLog(3, endpoint=u'/values', method=None)
+        rows = reportTraceLogPercentiles(self.store)
+        self.assertEqual(2, len(rows))
+        bucket, endpoint, count, p50, p90, p99, maximum = rows[0]
+        self.assertEqual(('', u'/values', '1'), (bucket, endpoint, count))
+        bucket, endpoint, count, p50, p90, p99, maximum = rows[1]
+        self.assertEqual(('', u'GET /objects', '100'),
+                         (bucket, endpoint, count))
+        self.assertTrue(45 <= float(p50) <= 55)
+        self.assertTrue(90 <= float(p99) <= 100)
+        self.assertEqual('100.0', maximum)
+
+    def testReportTraceLogPercentilesWithBuckets(self):
+        """
+        L{reportTraceLogPercentiles} groups requests in time buckets, if a
+        bucket size is given, and ignores requests without a start time.
+        """
+        self.createTraceLog(5, startTime=datetime(2012, 1, 1, 10, 5))
+        self.createTraceLog(7, startTime=datetime(2012, 1, 1, 10, 55))
+        self.createTraceLog(9, startTime=datetime(2012, 1, 1, 11, 15))
+        self.createTraceLog(11)
+        rows = reportTraceLogPercentiles(self.store,
+                                         bucketSize=timedelta(hours=1))
+        self.assertEqual(
+            [('2012-01-01 10:00:00', u'GET /objects', '2'),
+             ('2012-01-01 11:00:00', u'GET /objects', '1')],
+            [row[:3] for row in rows])
@@ -0,0 +1,60 @@
+from hashlib import sha256
+
+from fluiddb.data.blob import FileSystemBlobStore
+from fluiddb.data.value import OpaqueValue
+from fluiddb.scripts.opaque import migrateOpaqueValues
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.resources import (
+    DatabaseResource, LoggingResource, TemporaryDirectoryResource)
+
+
+class MigrateOpaqueValuesTest(FluidinfoTestCase):
+
+    resources = [('fs', TemporaryDirectoryResource()),
+                 ('log', LoggingResource()),
+                 ('store', DatabaseResource())]
+
+    def setUp(self):
+        super(MigrateOpaqueValuesTest, self).setUp()
+        self.blobStore = FileSystemBlobStore(self.fs.path)
+
+    def testMigrateOpaqueValues(self):
+        """
+        L{migrateOpaqueValues} writes the contents of L{OpaqueValue}s to the
+        blob store and removes them from the database.
+        """
+        fileIDs = []
+        for i in range(5):
+            content = 'content%d' % i
+            fileIDs.append(sha256(content).hexdigest())
+            self.store.add(OpaqueValue(fileIDs[-1], content))
+        self.assertEqual(5, migrateOpaqueValues(self.blobStore, batchSize=2))
+        for i, fileID in enumerate(fileIDs):
+            opaque = self.store.get(OpaqueValue, fileID)
+            self.assertIdentical(None, opaque.content)
+            with self.blobStore.open(fileID) as blobFile:
+                self.assertEqual('content%d' % i, blobFile.read())
+
+    def testMigrateOpaqueValuesSkipsMigratedValues(self):
+        """
+        L{migrateOpaqueValues} ignores L{OpaqueValue}s that have already been
+        migrated, so it can be run again after being interrupted.
+        """
+        fileID = sha256('content').hexdigest()
+        self.store.add(OpaqueValue(fileID, 'content'))
+        self.assertEqual(1, migrateOpaqueValues(self.blobStore))
+        self.assertEqual(0, migrateOpaqueValues(self.blobStore))
+
+    def testMigrateOpaqueValuesWithMismatchedContent(self):
+        """
+        L{migrateOpaqueValues} leaves L{OpaqueValue}s whose content doesn't
+        match their file ID in the database and logs an error.
+        """
+        fileID = sha256('content').hexdigest()
+        self.store.add(OpaqueValue(fileID, 'corrupted'))
+        self.assertEqual(0, migrateOpaqueValues(self.blobStore))
+        self.assertEqual('corrupted',
+                         self.store.get(OpaqueValue, fileID).content)
+        self.assertFalse(self.blobStore.has(fileID))
+        self.assertIn('Content of opaque value %s does not match its file '
+                      'ID.' % fileID, self.log.getvalue())
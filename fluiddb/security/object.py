@@ -30,6 +30,18 @@ class SecureObjectAPI(object):
             raise PermissionDeniedError(self._user.username, deniedOperations)
         return self._api.create(value)
 
+    def createMany(self, values):
+        """See L{ObjectAPI.createMany}.
+
+        @raises PermissionDeniedError: Raised if the user is not authorized to
+            create objects.
+        """
+        pathsAndOperations = [(None, Operation.CREATE_OBJECT)]
+        deniedOperations = checkPermissions(self._user, pathsAndOperations)
+        if deniedOperations:
+            raise PermissionDeniedError(self._user.username, deniedOperations)
+        return self._api.createMany(values)
+
     def get(self, values):
         """See L{ObjectAPI.get}."""
         return self._api.get(values)
@@ -101,7 +113,7 @@ class SecureObjectAPI(object):
             for path in query.getPaths():
                 paths.add(path)
         actions = [(path, Operation.READ_TAG_VALUE) for path in paths]
-        if aboutValues:
+        if implicitCreate and aboutValues:
             # TODO: this can be optimized because we repeat the query in
             # model.ObjectAPI.
             existingValues = self.get([value for value in aboutValues
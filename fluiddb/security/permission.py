@@ -88,15 +88,45 @@ def checkPermissions(user, values):
     """
     if not values:
         return []
+    return _getPermissionChecker(user).check(values)
 
+
+def checkBatchPermissions(user, values):
+    """Check permissions for a batch of path-operation pairs.
+
+    Unlike L{checkPermissions}, unknown paths don't raise an
+    L{UnknownPathError}.  They're returned with the denied operations, so
+    that the operations in a batch that can't run are all found in a single
+    check.
+
+    @param user: The user to check the permissions for.
+    @param values: A sequence of C{(path, Operation)} 2-tuples
+        representing the actions to check.
+    @raise FeatureError: Raised if one of the given actions is invalid.
+    @raise UnknownUserError: Raised if a user don't exist for user
+        operations.
+    @return: A C{(deniedOperations, unknownPaths)} 2-tuple with a C{list} of
+        C{(path, Operation)} 2-tuples that represent denied actions and a
+        C{set} of the paths that don't exist.
+    """
+    if not values:
+        return [], set()
+    return _getPermissionChecker(user).checkBatch(values)
+
+
+def _getPermissionChecker(user):
+    """Get the permission checker for a L{User}.
+
+    @param user: The L{User} to check permissions for.
+    @return: A L{PermissionCheckerBase} instance for the user's role.
+    """
     api = CachingPermissionCheckerAPI()
     if user.isSuperuser():
-        checker = SuperuserPermissionChecker(api)
+        return SuperuserPermissionChecker(api)
     elif user.isAnonymous():
-        checker = AnonymousPermissionChecker(api, user)
+        return AnonymousPermissionChecker(api, user)
     else:
-        checker = UserPermissionChecker(api, user)
-    return checker.check(values)
+        return UserPermissionChecker(api, user)
 
 
 class PermissionCheckerBase(object):
@@ -105,6 +135,21 @@ class PermissionCheckerBase(object):
     PASSTHROUGH_OPERATIONS = [Operation.WRITE_TAG_VALUE,
                               Operation.CREATE_NAMESPACE]
 
+    def check(self, values):
+        """Check permissions for a sequence of path-operation pairs.
+
+        @param values: A sequence of C{(path, Operation)} 2-tuples
+            representing actions that should be checked.
+        @raise UnknownPathError: Raised if any of the given paths doesn't
+            exist (and the L{User} doesn't have permission to create them).
+        @return: A C{list} of C{(path, Operation)} 2-tuples representing
+            actions that are denied.
+        """
+        deniedOperations, unknownPaths = self.checkBatch(values)
+        if unknownPaths:
+            raise UnknownPathError(unknownPaths)
+        return deniedOperations
+
     def _getDeniedOperations(self, values):
         """Get information about denied permissions.
 
@@ -132,10 +177,11 @@ class PermissionCheckerBase(object):
 
         @param values: A sequence of C{(path, Operation)} 2-tuples
             representing actions that should be checked.
-        @raise UnknownPathError: Raised if any of the given paths doesn't
-            exist (and the L{User} doesn't have permission to create them).
-        @return: A C{list} of C{(path, Operation)} 2-tuples that represent
-            denied actions.
+        @return: A C{(deniedOperations, unknownPaths)} 2-tuple with a
+            C{list} of C{(path, Operation)} 2-tuples that represent denied
+            actions and a C{set} of the paths that don't exist (and the
+            L{User} doesn't have permission to create).  Operations on
+            unknown paths are not included in the denied actions.
         """
         deniedTagOperations = set()
         deniedNamespaceOperations = set()
@@ -156,13 +202,14 @@ class PermissionCheckerBase(object):
                 deniedNamespaceOperations.add((path, operation))
             elif path not in unknownPaths:
                 deniedTagOperations.add((path, operation))
-        if remainingUnknownPaths:
-            raise UnknownPathError(remainingUnknownPaths)
+        deniedNamespaceOperations = set(
+            (path, operation) for path, operation in deniedNamespaceOperations
+            if path not in remainingUnknownPaths)
 
         deniedTagOperations = self._getDeniedTagOperations(deniedTagOperations)
         deniedTagOperations.update(
             self._getDeniedNamespaceOperations(deniedNamespaceOperations))
-        return list(deniedTagOperations)
+        return list(deniedTagOperations), remainingUnknownPaths
 
     def _getDeniedNamespaceOperations(self, values):
         """Determine whether L{Namespace} L{Operation}s are allowed.
@@ -225,23 +272,21 @@ class SuperuserPermissionChecker(PermissionCheckerBase):
     def __init__(self, api):
         self._api = api
 
-    def check(self, values):
+    def checkBatch(self, values):
         """Check permissions for a L{User} with the L{Role.SUPERUSER} role.
 
         @param values: A sequence of C{(path, Operation)} 2-tuples
             representing actions that should be checked.
         @raise UnknownUserError: Raised if a user don't exist for user
             operations.
-        @return: A C{list} of C{(path, Operation)} 2-tuples representing
-            actions that are denied.
+        @return: A C{(deniedOperations, unknownPaths)} 2-tuple.  No actions
+            are ever denied, so the C{list} of denied actions is always
+            empty.
         """
         # Check paths for tag or namespace related operations.
         pathsAndOperations = [(path, operation) for path, operation in values
                               if operation in Operation.PATH_OPERATIONS]
-        unknownPaths = self._api.getUnknownPaths(pathsAndOperations)
-        if unknownPaths:
-            raise UnknownPathError(unknownPaths)
-        return []
+        return [], self._api.getUnknownPaths(pathsAndOperations)
 
 
 class AnonymousPermissionChecker(PermissionCheckerBase):
@@ -261,13 +306,14 @@ class AnonymousPermissionChecker(PermissionCheckerBase):
         self._api = api
         self._user = user
 
-    def check(self, values):
+    def checkBatch(self, values):
         """Check permissions for a L{User} with the L{Role.ANONYMOUS} role.
 
         @param values: A sequence of C{(path, Operation)} 2-tuples
             representing actions that should be checked.
-        @return: A C{list} of C{(path, Operation)} 2-tuples representing
-            actions that are denied.
+        @return: A C{(deniedOperations, unknownPaths)} 2-tuple with a
+            C{list} of C{(path, Operation)} 2-tuples representing actions
+            that are denied and a C{set} of the paths that don't exist.
         """
         deniedOperations = []
         storedOperations = set()
@@ -279,9 +325,11 @@ class AnonymousPermissionChecker(PermissionCheckerBase):
                 storedOperations.add((path, operation))
 
         if not storedOperations:
-            return deniedOperations
+            return deniedOperations, set()
 
-        return deniedOperations + self._getDeniedOperations(storedOperations)
+        storedDeniedOperations, unknownPaths = self._getDeniedOperations(
+            storedOperations)
+        return deniedOperations + storedDeniedOperations, unknownPaths
 
 
 class UserPermissionChecker(PermissionCheckerBase):
@@ -301,15 +349,16 @@ class UserPermissionChecker(PermissionCheckerBase):
         self._api = api
         self._user = user
 
-    def check(self, values):
+    def checkBatch(self, values):
         """Check permissions for a L{User} with the L{Role.USER} role.
 
         @param values: A sequence of C{(path, Operation)} 2-tuples
             representing actions that should be checked.
         @raise UnknownUserError: Raised if a user don't exist for user
             operations.
-        @return: A C{list} of C{(path, Operation)} 2-tuples representing
-            actions that are denied.
+        @return: A C{(deniedOperations, unknownPaths)} 2-tuple with a
+            C{list} of C{(path, Operation)} 2-tuples representing actions
+            that are denied and a C{set} of the paths that don't exist.
         """
         deniedOperations = []
         storedOperations = set()
@@ -343,6 +392,8 @@ class UserPermissionChecker(PermissionCheckerBase):
                 storedOperations.add((path, operation))
 
         if not storedOperations:
-            return deniedOperations
+            return deniedOperations, set()
 
-        return deniedOperations + self._getDeniedOperations(storedOperations)
+        storedDeniedOperations, unknownPaths = self._getDeniedOperations(
+            storedOperations)
+        return deniedOperations + storedDeniedOperations, unknownPaths
@@ -100,6 +100,18 @@ class SecureObjectAPIWithAnonymousRoleTest(FluidinfoTestCase):
         self.assertEqual([(None, Operation.CREATE_OBJECT)],
                          error.pathsAndOperations)
 
+    def testCreateManyIsDenied(self):
+        """
+        L{SecureObjectAPI.createMany} raises a L{PermissionDeniedError} if
+        it's invoked by a L{User} with the L{Role.ANONYMOUS}.
+        """
+        objects = SecureObjectAPI(self.anon)
+        error = self.assertRaises(PermissionDeniedError, objects.createMany,
+                                  [u'about'])
+        self.assertEqual(self.anon.username, error.username)
+        self.assertEqual([(None, Operation.CREATE_OBJECT)],
+                         error.pathsAndOperations)
+
     def testGetTagsByObjectsPathIsAllowed(self):
         """
         L{SecureObjectAPI.getTagsByObjects} will return all the tags for
@@ -239,6 +251,18 @@ class SecureObjectAPIWithAnonymousRoleTest(FluidinfoTestCase):
         result = yield result.get()
         self.assertEqual({query: set()}, result)
 
+    @inlineCallbacks
+    def testSearchWithoutImplicitObjectCreation(self):
+        """
+        L{SecureObjectAPI.search} doesn't check for
+        C{Operation.CREATE_OBJECT} permissions if C{implicitCreate} is
+        C{False}, since no objects will be created.
+        """
+        query = parseQuery(u'fluiddb/about = "TestObject"')
+        result = self.objects.search([query], False)
+        result = yield result.get()
+        self.assertEqual({query: set()}, result)
+
 
 class SecureObjectAPIWithUserRoleTest(FluidinfoTestCase):
 
@@ -10,7 +10,8 @@ from fluiddb.model.tag import TagAPI
 from fluiddb.model.test.test_permission import PermissionAPITestMixin
 from fluiddb.model.user import UserAPI, getUser
 from fluiddb.security.exceptions import PermissionDeniedError
-from fluiddb.security.permission import SecurePermissionAPI, checkPermissions
+from fluiddb.security.permission import (
+    SecurePermissionAPI, checkBatchPermissions, checkPermissions)
 from fluiddb.testing.basic import FluidinfoTestCase
 from fluiddb.testing.resources import (
     BrokenCacheResource, CacheResource, ConfigResource, DatabaseResource,
@@ -726,6 +727,49 @@ class UserPermissionCheckerTest(CheckPermissionsTestMixin, FluidinfoTestCase):
         self.assertEqual([], deniedOperations)
 
 
+    def testCheckBatchPermissions(self):
+        """
+        L{checkBatchPermissions} returns the denied operations and the
+        unknown paths together, instead of raising an L{UnknownPathError}.
+        """
+        TagAPI(self.user).create([(u'username/open', u'description'),
+                                  (u'username/closed', u'description')])
+        self.permissions.set([(u'username/closed', Operation.READ_TAG_VALUE,
+                               Policy.CLOSED, [])])
+        values = [(u'username/open', Operation.READ_TAG_VALUE),
+                  (u'username/closed', Operation.READ_TAG_VALUE),
+                  (u'username/unknown', Operation.READ_TAG_VALUE),
+                  (u'unknown/tag', Operation.WRITE_TAG_VALUE)]
+        deniedOperations, unknownPaths = checkBatchPermissions(self.user,
+                                                               values)
+        self.assertEqual([(u'username/closed', Operation.READ_TAG_VALUE)],
+                         deniedOperations)
+        self.assertEqual(set([u'username/unknown', u'unknown/tag']),
+                         unknownPaths)
+
+    def testCheckBatchPermissionsWithImplicitPath(self):
+        """
+        L{checkBatchPermissions} doesn't return unknown paths for values
+        that can be set if the user can create them in their nearest parent
+        L{Namespace}.  The L{Operation.CREATE_NAMESPACE} permission of the
+        parent is checked instead.
+        """
+        self.permissions.set([(u'username', Operation.CREATE_NAMESPACE,
+                               Policy.CLOSED, [])])
+        values = [(u'username/unknown', Operation.WRITE_TAG_VALUE)]
+        deniedOperations, unknownPaths = checkBatchPermissions(self.user,
+                                                               values)
+        self.assertEqual([(u'username', Operation.CREATE_NAMESPACE)],
+                         deniedOperations)
+        self.assertEqual(set(), unknownPaths)
+
+    def testCheckBatchPermissionsWithEmptyValues(self):
+        """
+        L{checkBatchPermissions} returns no denied operations and no unknown
+        paths if the list of values is empty.
+        """
+        self.assertEqual(([], set()), checkBatchPermissions(self.user, []))
+
 class AnonymousPermissionCheckerTest(CheckPermissionsTestMixin,
                                      FluidinfoTestCase):
 
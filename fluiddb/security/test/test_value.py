@@ -8,6 +8,7 @@ from fluiddb.model.exceptions import UnknownPathError
 from fluiddb.model.tag import TagAPI
 from fluiddb.model.test.test_value import TagValueAPITestMixin
 from fluiddb.model.user import UserAPI, getUser
+from fluiddb.model.value import TagValueAPI
 from fluiddb.security.exceptions import PermissionDeniedError
 from fluiddb.security.value import SecureTagValueAPI
 from fluiddb.testing.basic import FluidinfoTestCase
@@ -273,6 +274,45 @@ class SecureTagValueAPIWithUserRoleTest(FluidinfoTestCase):
         self.assertEqual([(u'username/tag', Operation.DELETE_TAG_VALUE)],
                          error.pathsAndOperations)
 
+    def testBatchIsAllowed(self):
+        """
+        L{SecureTagAPI.batch} is allowed if the user has permission for all
+        the operations.
+        """
+        objectID = uuid4()
+        self.tagValues.set({objectID: {u'username/tag': 16}})
+        result = self.tagValues.batch(
+            reads=[(objectID, u'username/tag')],
+            values={objectID: {u'username/tag': 17}})
+        self.assertEqual(16, result[objectID][u'username/tag'].value)
+        result = self.tagValues.get(objectIDs=[objectID],
+                                    paths=[u'username/tag'])
+        self.assertEqual(17, result[objectID][u'username/tag'].value)
+
+    def testBatchIsDenied(self):
+        """
+        L{SecureTagAPI.batch} raises L{PermissionDeniedError} with all the
+        denied operations if the user doesn't have permission for some of
+        them, and doesn't change any values.
+        """
+        objectID = uuid4()
+        self.tagValues.set({objectID: {u'username/tag': 16}})
+        self.permissions.set([(u'username/tag', Operation.READ_TAG_VALUE,
+                               Policy.CLOSED, []),
+                              (u'username/tag', Operation.DELETE_TAG_VALUE,
+                               Policy.CLOSED, [])])
+        error = self.assertRaises(
+            PermissionDeniedError, self.tagValues.batch,
+            reads=[(objectID, u'username/tag')],
+            values={uuid4(): {u'username/tag': 17}},
+            deletes=[(objectID, u'username/tag')])
+        self.assertEqual(
+            sorted([(u'username/tag', Operation.READ_TAG_VALUE),
+                    (u'username/tag', Operation.DELETE_TAG_VALUE)]),
+            sorted(error.pathsAndOperations))
+        result = TagValueAPI(self.user).get([objectID], [u'username/tag'])
+        self.assertEqual(16, result[objectID][u'username/tag'].value)
+
 
 class SecureTagValueAPIWithSuperuserRoleTest(FluidinfoTestCase):
 
@@ -17,7 +17,8 @@ class SecureTagValueAPI(object):
         self._user = user
         self._api = CachingTagValueAPI(user)
 
-    def get(self, objectIDs, paths=None):
+    def get(self, objectIDs, paths=None, openContents=False,
+            withContents=True):
         """See L{TagValueAPI.get}.
 
         @raise PermissionDeniedError: Raised if the user is not authorized to
@@ -32,7 +33,8 @@ class SecureTagValueAPI(object):
                                             deniedOperations)
         else:
             paths = SecureObjectAPI(self._user).getTagsForObjects(objectIDs)
-        return self._api.get(objectIDs, paths)
+        return self._api.get(objectIDs, paths, openContents=openContents,
+                             withContents=withContents)
 
     def set(self, values):
         """See L{TagValueAPI.set}.
@@ -64,3 +66,27 @@ class SecureTagValueAPI(object):
         if deniedOperations:
             raise PermissionDeniedError(self._user.username, deniedOperations)
         return self._api.delete(values)
+
+    def batch(self, reads=None, values=None, deletes=None):
+        """See L{TagValueAPI.batch}.
+
+        Permissions for all the reads, writes and deletes are checked
+        together, before anything is changed.
+
+        @raise PermissionDeniedError: Raised if the user is not authorized to
+            perform any of the operations.  All the denied operations are
+            included in the exception.
+        """
+        reads = list(reads or [])
+        deletes = list(deletes or [])
+        pathsAndOperations = set((path, Operation.READ_TAG_VALUE)
+                                 for _, path in reads)
+        for tagValues in (values or {}).itervalues():
+            pathsAndOperations.update((path, Operation.WRITE_TAG_VALUE)
+                                      for path in tagValues.iterkeys())
+        pathsAndOperations.update((path, Operation.DELETE_TAG_VALUE)
+                                  for _, path in deletes)
+        deniedOperations = checkPermissions(self._user, pathsAndOperations)
+        if deniedOperations:
+            raise PermissionDeniedError(self._user.username, deniedOperations)
+        return self._api.batch(reads, values, deletes)
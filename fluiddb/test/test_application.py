@@ -1,21 +1,35 @@
 from ConfigParser import RawConfigParser
 from cStringIO import StringIO
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 import os
 from textwrap import dedent
 from uuid import uuid4
 
+from twisted.application.service import Application, IServiceCollection
+from zope.component import getGlobalSiteManager, queryUtility
+
 from fluiddb.application import (
     APIServiceOptions, FluidinfoSessionFactory, FluidinfoSession, setupConfig,
     setupOptions, setupLogging, setupStore, setupFacade, setupRootResource,
-    getConfig, getDevelopmentMode, setupCache, getCacheConnectionPool)
+    setupRegistry, setupSite, getConfig, getDevelopmentMode, setupCache,
+    getCacheConnectionPool, getSamplingPolicy, getSlowRequestLogPath,
+    getTraceLogPath, setupMetrics, setupSessionStorage, setupSlowRequestLog)
+from fluiddb.data.blob import IBlobStore
 from fluiddb.data.system import createSystemData
 from fluiddb.model.user import UserAPI
 from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.doubles import FakeThreadPool
 from fluiddb.testing.resources import (
     ConfigResource, DatabaseResource, TemporaryDirectoryResource,
     ThreadPoolResource)
+from fluiddb.util.metrics import getMetrics, setMetrics
+from fluiddb.util.profiler import getSQLProfiler, setSQLProfiler
+from fluiddb.util.session import (
+    CachePlugin, IndexPlugin, LoggingPlugin, NullLoggingPlugin,
+    NullTimerPlugin, SamplingPolicy, SlowRequestLog, TimerPlugin,
+    getSessionStorage, getSlowRequestLog, setSessionStorage,
+    setSlowRequestLog)
 from fluiddb.util.transact import Transact
 
 
@@ -373,6 +387,183 @@ class SetupStoreTest(FluidinfoTestCase):
             for name, store in zstorm.iterstores():
                 zstorm.remove(store)
 
+    def testSetupStoreWithReplicas(self):
+        """
+        L{setupStore} configures a store for each of the read replica URIs
+        defined in the configuration file.
+        """
+        config = RawConfigParser()
+        config.add_section('store')
+        config.set('store', 'main-uri', 'sqlite:')
+        config.set('store', 'replica-uris', 'sqlite:, sqlite:')
+        try:
+            zstorm = setupStore(config)
+            self.assertEqual(
+                {'main': 'sqlite:', 'replica-1': 'sqlite:',
+                 'replica-2': 'sqlite:'},
+                zstorm.get_default_uris())
+        finally:
+            for name, store in zstorm.iterstores():
+                zstorm.remove(store)
+
+    def testSetupStoreWithBlobPath(self):
+        """
+        L{setupStore} registers an L{IBlobStore} utility for the directory
+        defined in the configuration file.
+        """
+        config = RawConfigParser()
+        config.add_section('store')
+        config.set('store', 'main-uri', 'sqlite:')
+        config.set('store', 'blob-path', '/tmp/blobs')
+        self.addCleanup(getGlobalSiteManager().unregisterUtility,
+                        provided=IBlobStore)
+        try:
+            zstorm = setupStore(config)
+            self.assertEqual('/tmp/blobs', queryUtility(IBlobStore).path)
+        finally:
+            for name, store in zstorm.iterstores():
+                zstorm.remove(store)
+
+
+class SetupSessionStorageTest(FluidinfoTestCase):
+
+    def tearDown(self):
+        setSessionStorage(None)
+        super(SetupSessionStorageTest, self).tearDown()
+
+    def testGetTraceLogPath(self):
+        """
+        L{getTraceLogPath} returns the path of the trace log file for the
+        port of the API service instance.
+        """
+        config = setupConfig(None, port=9001)
+        self.assertEqual(
+            os.path.join(config.get('service', 'trace-path'),
+                         'fluidinfo-api-trace-9001.log'),
+            getTraceLogPath(config))
+
+    def testSetupSessionStorage(self):
+        """
+        L{setupSessionStorage} creates and registers a
+        L{BufferedSessionStorage} for the trace log file.
+        """
+        config = setupConfig(None)
+        storage = setupSessionStorage(config)
+        self.assertIdentical(storage, getSessionStorage())
+        self.assertEqual(getTraceLogPath(config), storage.path)
+        self.assertEqual(65536, storage.bufferSize)
+        self.assertIdentical(None, storage.maxFileSize)
+
+    def testSetupSessionStorageWithOptions(self):
+        """
+        L{setupSessionStorage} loads the buffering and rotation settings
+        from the configuration.
+        """
+        config = setupConfig(None)
+        config.set('service', 'trace-buffer-size', '100')
+        config.set('service', 'trace-flush-interval', '0.5')
+        config.set('service', 'trace-max-pending-size', '1000')
+        config.set('service', 'trace-max-file-size', '10000')
+        config.set('service', 'trace-backup-count', '2')
+        storage = setupSessionStorage(config)
+        self.assertEqual(100, storage.bufferSize)
+        self.assertEqual(0.5, storage.flushInterval)
+        self.assertEqual(1000, storage.maxPendingSize)
+        self.assertEqual(10000, storage.maxFileSize)
+        self.assertEqual(2, storage.backupCount)
+
+
+class SetupSlowRequestLogTest(FluidinfoTestCase):
+
+    def tearDown(self):
+        setSlowRequestLog(None)
+        super(SetupSlowRequestLogTest, self).tearDown()
+
+    def testGetSlowRequestLogPath(self):
+        """
+        L{getSlowRequestLogPath} returns the path of the slow request log
+        file for the port of the API service instance.
+        """
+        config = setupConfig(None, port=9001)
+        self.assertEqual(
+            os.path.join(config.get('service', 'trace-path'),
+                         'fluidinfo-api-slow-9001.log'),
+            getSlowRequestLogPath(config))
+
+    def testSetupSlowRequestLog(self):
+        """
+        L{setupSlowRequestLog} creates and registers a L{SlowRequestLog}
+        with the C{slow-request-threshold} from the configuration.
+        """
+        config = setupConfig(None)
+        config.set('service', 'slow-request-threshold', '2.5')
+        config.set('service', 'trace-max-file-size', '10000')
+        log = setupSlowRequestLog(config)
+        self.assertIdentical(log, getSlowRequestLog())
+        self.assertEqual(timedelta(seconds=2.5), log.threshold)
+        self.assertEqual(getSlowRequestLogPath(config), log.storage.path)
+        self.assertEqual(10000, log.storage.maxFileSize)
+
+    def testSetupSlowRequestLogWithoutThreshold(self):
+        """
+        L{setupSlowRequestLog} doesn't log slow requests if there's no
+        C{slow-request-threshold} in the configuration.
+        """
+        config = setupConfig(None)
+        self.assertIdentical(None, setupSlowRequestLog(config))
+        self.assertIdentical(None, getSlowRequestLog())
+
+
+class SetupMetricsTest(FluidinfoTestCase):
+
+    def tearDown(self):
+        setMetrics(None)
+        setSQLProfiler(None)
+        super(SetupMetricsTest, self).tearDown()
+
+    def testSetupMetrics(self):
+        """
+        L{setupMetrics} registers L{Metrics} and L{SQLProfiler} instances and
+        serves them on the loopback interface, on the API service port plus
+        200.
+        """
+        config = setupConfig(None, port=9001)
+        application = Application('fluidinfo-api')
+        metrics, profiler = setupMetrics(application, config)
+        self.assertIdentical(metrics, getMetrics())
+        self.assertIdentical(profiler, getSQLProfiler())
+        [service] = list(IServiceCollection(application))
+        port, site = service.args
+        self.assertEqual(9201, port)
+        self.assertEqual({'interface': '127.0.0.1'}, service.kwargs)
+        self.assertEqual(['metrics', 'sql'],
+                         sorted(site.resource.children.keys()))
+
+    def testSetupMetricsWithPort(self):
+        """
+        L{setupMetrics} uses the C{metrics-port} option in the
+        configuration, if it's available.
+        """
+        config = setupConfig(None)
+        config.set('service', 'metrics-port', '9999')
+        application = Application('fluidinfo-api')
+        setupMetrics(application, config)
+        [service] = list(IServiceCollection(application))
+        self.assertEqual(9999, service.args[0])
+
+    def testSetupMetricsWithTransact(self):
+        """
+        L{setupMetrics} serves stack profiles on the admin port if a
+        L{Transact} instance is provided.
+        """
+        config = setupConfig(None)
+        application = Application('fluidinfo-api')
+        setupMetrics(application, config, Transact(FakeThreadPool()))
+        [service] = list(IServiceCollection(application))
+        port, site = service.args
+        self.assertEqual(['metrics', 'profile', 'sql'],
+                         sorted(site.resource.children.keys()))
+
 
 class SetupFacadeTest(FluidinfoTestCase):
 
@@ -388,7 +579,29 @@ class SetupFacadeTest(FluidinfoTestCase):
         config.set('service', 'port', '9000')
         facade = setupFacade(config)
         self.assertEqual(3, facade._transact._threadPool.max)
+        self.assertEqual('transact', facade._transact._threadPool.name)
         self.assertEqual('API-9000', facade._factory._prefix)
+        self.assertIdentical(None, facade._transact._router)
+
+    def testSetupFacadeWithReplicas(self):
+        """
+        L{setupFacade} configures the L{Transact} instance with a
+        L{ReplicaRouter} if read replicas are defined in the configuration
+        file.
+        """
+        config = RawConfigParser()
+        config.add_section('service')
+        config.set('service', 'max-threads', '3')
+        config.set('service', 'port', '9000')
+        config.add_section('store')
+        config.set('store', 'replica-uris', 'sqlite:')
+        config.set('store', 'replica-max-lag', '2.5')
+        config.set('store', 'replica-pin-duration', '30')
+        facade = setupFacade(config)
+        router = facade._transact._router
+        self.assertEqual(['replica-1'], router.names)
+        self.assertEqual(2.5, router.maxLag)
+        self.assertEqual(30, router.pinDuration)
 
 
 class SetupRootResourceTest(FluidinfoTestCase):
@@ -407,6 +620,49 @@ class SetupRootResourceTest(FluidinfoTestCase):
         self.assertIdentical(facade, resource._portal.realm.facadeClient)
 
 
+class SetupSiteTest(FluidinfoTestCase):
+
+    def testSetupSite(self):
+        """
+        L{setupSite} creates a C{Site} that uses L{FluidinfoRequest}s, which
+        spool large request bodies to disk.
+        """
+        from fluiddb.web.request import FluidinfoRequest
+
+        root = object()
+        site = setupSite(root)
+        self.assertIdentical(root, site.resource)
+        self.assertIdentical(FluidinfoRequest, site.requestFactory)
+
+
+class SetupRegistryTest(FluidinfoTestCase):
+
+    def setUp(self):
+        super(SetupRegistryTest, self).setUp()
+        from fluiddb.doc.api.http.registry import registry
+
+        self.addCleanup(setattr, registry, 'responseValidationRate',
+                        registry.responseValidationRate)
+
+    def testSetupRegistry(self):
+        """
+        L{setupRegistry} compiles the HTTP API registry, which validates all
+        responses by default.
+        """
+        registry = setupRegistry(setupConfig(None))
+        self.assertEqual(1.0, registry.responseValidationRate)
+
+    def testSetupRegistryWithResponseValidationRate(self):
+        """
+        L{setupRegistry} uses the C{response-validation-rate} option to
+        sample the responses that are validated.
+        """
+        config = setupConfig(None)
+        config.set('service', 'response-validation-rate', '0.25')
+        registry = setupRegistry(config)
+        self.assertEqual(0.25, registry.responseValidationRate)
+
+
 class GetDevelopmentModeTest(FluidinfoTestCase):
 
     resources = [('config', ConfigResource())]
@@ -494,6 +750,61 @@ class FluidinfoSessionTest(FluidinfoTestCase):
         self.assertEqual(session.auth.username, loadedSession.auth.username)
         self.assertEqual(session.auth.objectID, loadedSession.auth.objectID)
 
+    def testSampled(self):
+        """
+        A L{FluidinfoSession} is traced in detail if there's no
+        L{SamplingPolicy} or the policy samples it.
+        """
+        self.assertTrue(FluidinfoSession('id', self.transact).sampled)
+        session = FluidinfoSession('id', self.transact, SamplingPolicy())
+        self.assertTrue(session.sampled)
+        self.assertTrue(isinstance(session.log, LoggingPlugin))
+        self.assertTrue(isinstance(session.timer, TimerPlugin))
+        self.assertTrue(session.transact.recordStatements)
+
+    def testNotSampled(self):
+        """
+        A L{FluidinfoSession} that isn't sampled uses plugins that don't
+        capture log messages, timers or the text and parameters of
+        statements.  Solr queries and cache lookups are still captured.
+        """
+        policy = SamplingPolicy(rate=0)
+        session = FluidinfoSession('id', self.transact, policy)
+        self.assertFalse(session.sampled)
+        self.assertIdentical(policy, session.policy)
+        self.assertTrue(isinstance(session.log, NullLoggingPlugin))
+        self.assertTrue(isinstance(session.timer, NullTimerPlugin))
+        self.assertFalse(session.transact.recordStatements)
+        self.assertFalse(session.transact.recordText)
+        self.assertTrue(isinstance(session.index, IndexPlugin))
+        self.assertTrue(isinstance(session.cache, CachePlugin))
+
+    def testNotSampledDumpsAndLoads(self):
+        """
+        A L{FluidinfoSession} that isn't sampled is marked as such when it's
+        dumped, so tools reading the trace log can tell it apart.
+        """
+        session = FluidinfoSession('id', self.transact, SamplingPolicy(rate=0))
+        session.start()
+        session.stop()
+        data = session.dumps()
+        loadedSession = FluidinfoSession('another-id', self.transact)
+        self.assertTrue(loadedSession.sampled)
+        loadedSession.loads(data)
+        self.assertFalse(loadedSession.sampled)
+
+    def testNotSampledWithSlowRequestLog(self):
+        """
+        A L{FluidinfoSession} that isn't sampled captures the text of its
+        statements if a L{SlowRequestLog} is set, so it can be logged if the
+        request is slow.
+        """
+        setSlowRequestLog(SlowRequestLog(None, 1))
+        self.addCleanup(setSlowRequestLog, None)
+        session = FluidinfoSession('id', self.transact, SamplingPolicy(rate=0))
+        self.assertFalse(session.transact.recordStatements)
+        self.assertTrue(session.transact.recordText)
+
 
 class FluidinfoSessionFactoryTest(FluidinfoTestCase):
 
@@ -522,3 +833,38 @@ class FluidinfoSessionFactoryTest(FluidinfoTestCase):
         session = factory.create(self.transact)
         expectedDate = now.strftime('%Y%m%d-%H%M%S')
         self.assertEqual('API-9001-%s-000002' % expectedDate, session.id)
+
+    def testCreateWithPolicy(self):
+        """
+        L{SessionFactory.create} uses the L{SamplingPolicy} to decide whether
+        a new session is sampled.
+        """
+        policy = SamplingPolicy(rate=0)
+        factory = FluidinfoSessionFactory('API-9001', policy=policy)
+        session = factory.create(self.transact)
+        self.assertFalse(session.sampled)
+        self.assertIdentical(policy, session.policy)
+
+
+class GetSamplingPolicyTest(FluidinfoTestCase):
+
+    def testGetSamplingPolicy(self):
+        """
+        L{getSamplingPolicy} samples every session if the configuration
+        doesn't have any sampling options.
+        """
+        policy = getSamplingPolicy(setupConfig(None))
+        self.assertEqual(1.0, policy.rate)
+        self.assertEqual(timedelta(seconds=1), policy.slowThreshold)
+
+    def testGetSamplingPolicyWithOptions(self):
+        """
+        L{getSamplingPolicy} loads the sampling rate and the slow request
+        threshold from the configuration.
+        """
+        config = setupConfig(None)
+        config.set('service', 'trace-sample-rate', '0.05')
+        config.set('service', 'trace-slow-threshold', '2.5')
+        policy = getSamplingPolicy(config)
+        self.assertEqual(0.05, policy.rate)
+        self.assertEqual(timedelta(seconds=2.5), policy.slowThreshold)
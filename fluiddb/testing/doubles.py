@@ -42,6 +42,7 @@ class FakeRequest(object):
                  uri=None, method='GET', headers=None, body=''):
         self.args = {} if args is None else args
         self.written = StringIO()
+        self.startedWriting = False
         self.finished = False
         self.code = None
         self.method = method
@@ -62,6 +63,7 @@ class FakeRequest(object):
         """
         if not isinstance(content, str):
             raise RuntimeError('Only strings can be written.')
+        self.startedWriting = True
         self.written.write(content)
 
     def finish(self):
@@ -70,6 +72,25 @@ class FakeRequest(object):
             self.code = 200
         self.finished = True
 
+    def registerProducer(self, producer, streaming):
+        """Register a producer to write the response body.
+
+        Pull producers are asked to produce data until they unregister
+        themselves, so the whole body is written synchronously.
+
+        @param producer: The producer to register.
+        @param streaming: C{True} for a push producer, C{False} for a pull
+            producer.
+        """
+        self.producer = producer
+        if not streaming:
+            while self.producer is not None:
+                producer.resumeProducing()
+
+    def unregisterProducer(self):
+        """Unregister the producer registered with L{registerProducer}."""
+        self.producer = None
+
     def setResponseCode(self, code):
         """Set the HTTP response code.
 
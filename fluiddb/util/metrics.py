@@ -0,0 +1,250 @@
+"""Aggregated metrics about the requests handled by the API service."""
+
+from bisect import bisect_left
+from datetime import datetime
+
+
+# The upper bounds, in milliseconds, of the buckets used by L{Histogram}s.
+# Each bucket is about 19% wider than the previous one, so percentiles are
+# accurate to within 10%, from 0.1ms up to about 9 minutes.
+BUCKET_BOUNDS = tuple(0.1 * 2 ** (index / 4.0) for index in range(90))
+
+
+class Histogram(object):
+    """A histogram of values, with logarithmic buckets.
+
+    Values are counted in buckets instead of being stored, so a histogram
+    uses a fixed amount of memory, however many values are added.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = None
+
+    def add(self, value):
+        """Add a value to the histogram.
+
+        @param value: The C{int} or C{float} value to add.
+        """
+        self.counts[bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def percentile(self, percent):
+        """Get an estimate of a percentile of the values in the histogram.
+
+        @param percent: The percentile to get, from C{0} to C{100}.
+        @return: The upper bound of the bucket the percentile falls in, or
+            C{None} if the histogram is empty.
+        """
+        if not self.count:
+            return None
+        rank = max(1, percent / 100.0 * self.count)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if index < len(BUCKET_BOUNDS):
+                    return min(BUCKET_BOUNDS[index], self.maximum)
+                return self.maximum
+        return self.maximum
+
+    def getDistribution(self):
+        """Get the cumulative distribution of the values in the histogram.
+
+        This is the percentile distribution reported by tools like
+        HdrHistogram, which shows the whole shape of the latency curve
+        rather than a few percentiles.
+
+        @return: A C{list} of C{(value, percentile, count)} 3-tuples, one for
+            each non-empty bucket.  C{value} is the upper bound of the
+            bucket, C{percentile} the percentage of values smaller than or
+            equal to it and C{count} the number of values in the bucket.
+        """
+        distribution = []
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            seen += count
+            if index < len(BUCKET_BOUNDS):
+                value = min(BUCKET_BOUNDS[index], self.maximum)
+            else:
+                value = self.maximum
+            distribution.append((value, seen * 100.0 / self.count, count))
+        return distribution
+
+    def dumps(self):
+        """Write a summary of the histogram to a C{dict}.
+
+        @return: A C{dict} with the number of values, their mean and
+            maximum, and the 50th, 90th and 99th percentiles.
+        """
+        mean = self.total / self.count if self.count else None
+        return {'count': self.count,
+                'mean': mean,
+                'max': self.maximum,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99)}
+
+
+class EndpointMetrics(object):
+    """Metrics about the requests made to an endpoint.
+
+    @ivar codes: A C{dict} mapping HTTP status codes to the number of
+        responses sent with them.
+    @ivar duration: A L{Histogram} of request durations, in milliseconds.
+    @ivar transactionDuration: A L{Histogram} of transaction durations, in
+        milliseconds.
+    @ivar statementCount: A L{Histogram} of the number of SQL statements run
+        by each request.
+    @ivar statementDuration: A L{Histogram} of the total time, in
+        milliseconds, each request spent running SQL statements.
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.duration = Histogram()
+        self.transactionDuration = Histogram()
+        self.statementCount = Histogram()
+        self.statementDuration = Histogram()
+
+    def dumps(self):
+        """Write the metrics to a C{dict}.
+
+        @return: A C{dict} with the status code counts and summaries of the
+            histograms.
+        """
+        return {'codes': dict((str(code), count)
+                              for code, count in self.codes.iteritems()),
+                'duration': self.duration.dumps(),
+                'transaction-duration': self.transactionDuration.dumps(),
+                'statement-count': self.statementCount.dumps(),
+                'statement-duration': self.statementDuration.dumps()}
+
+
+class Metrics(object):
+    """Aggregates information about finished L{Session}s.
+
+    Request durations, status codes, transaction durations and SQL
+    statement counts are aggregated for each endpoint, identified by the
+    HTTP method and the first segment of the path, like C{GET /objects}.
+    Timer events are aggregated by name.
+
+    @param utcnow: For testing purposes, the implementation of
+        C{datetime.utcnow} to use when calculating the time.
+    @ivar endpoints: A C{dict} mapping endpoint names to
+        L{EndpointMetrics}.
+    @ivar events: A C{dict} mapping timer event names to L{Histogram}s of
+        their durations, in milliseconds.  Events are recorded for all
+        sessions, whether they're sampled or not.
+    """
+
+    def __init__(self, utcnow=None):
+        self._utcnow = utcnow or datetime.utcnow
+        self.startDate = self._utcnow()
+        self.endpoints = {}
+        self.events = {}
+
+    def record(self, session):
+        """Add the details of a L{Session} that has finished.
+
+        @param session: The L{Session} to record.
+        """
+        http = getattr(session, 'http', None)
+        name = getEndpointName(getattr(http, 'method', None),
+                               getattr(http, 'path', None))
+        endpoint = self.endpoints.get(name)
+        if endpoint is None:
+            endpoint = self.endpoints[name] = EndpointMetrics()
+
+        code = getattr(http, 'code', None)
+        endpoint.codes[code] = endpoint.codes.get(code, 0) + 1
+        if session.duration is not None:
+            endpoint.duration.add(getMilliseconds(session.duration))
+
+        transact = getattr(session, 'transact', None)
+        if transact is not None:
+            statementCount = 0
+            for transaction in transact.transactions:
+                statementCount += len(transaction['statements'])
+                if 'duration' in transaction:
+                    endpoint.transactionDuration.add(
+                        getMilliseconds(transaction['duration']))
+            endpoint.statementCount.add(statementCount)
+            endpoint.statementDuration.add(
+                getMilliseconds(transact.totalStatementDuration))
+
+        timer = getattr(session, 'timer', None)
+        if timer is not None:
+            for eventName, events in timer.events.iteritems():
+                histogram = self.events.get(eventName)
+                if histogram is None:
+                    histogram = self.events[eventName] = Histogram()
+                for event in events:
+                    histogram.add(getMilliseconds(event['duration']))
+
+    def dumps(self):
+        """Write the metrics to a C{dict}.
+
+        @return: A C{dict} with the time the metrics have been collected
+            for, the metrics for each endpoint and the timer events.
+        """
+        uptime = getMilliseconds(self._utcnow() - self.startDate) / 1000.0
+        return {'uptime': uptime,
+                'endpoints': dict((name, endpoint.dumps())
+                                  for name, endpoint
+                                  in self.endpoints.iteritems()),
+                'events': dict((name, histogram.dumps())
+                               for name, histogram in self.events.iteritems())}
+
+
+def getEndpointName(method, path):
+    """Get the name of the endpoint a request was made to.
+
+    Only the first segment of the path is used, so that the number of
+    endpoints doesn't grow with the number of objects, tags and users.
+
+    @param method: The HTTP method of the request.
+    @param path: The path of the request.
+    @return: A name like C{GET /objects}.
+    """
+    if path is None:
+        return '%s ?' % method
+    segments = path.split('?', 1)[0].split('/')
+    return '%s /%s' % (method, segments[1] if len(segments) > 1 else '')
+
+
+def getMilliseconds(duration):
+    """Convert a C{timedelta} to a number of milliseconds.
+
+    @param duration: The C{timedelta} to convert.
+    @return: The C{float} number of milliseconds.
+    """
+    return duration.total_seconds() * 1000
+
+
+_metrics = None
+
+
+def getMetrics():
+    """Get the L{Metrics} that finished sessions are recorded in.
+
+    @return: A L{Metrics} instance or C{None} if one hasn't been registered.
+    """
+    return _metrics
+
+
+def setMetrics(metrics):
+    """Set the L{Metrics} that finished sessions are recorded in.
+
+    @param metrics: A L{Metrics} instance, or C{None} to not record
+        sessions.
+    """
+    global _metrics
+    _metrics = metrics
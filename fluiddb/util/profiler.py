@@ -0,0 +1,237 @@
+"""Profiling of the SQL statements run by the API service."""
+
+import re
+from threading import Lock
+
+
+# The fingerprint used for statements once the profiler has seen too many
+# different ones.
+OTHER_FINGERPRINT = '<other>'
+
+# The columns a profile report can be sorted by.
+SORT_KEYS = ('total', 'count', 'mean', 'max', 'rows')
+
+_stringPattern = re.compile(r"[EeBbXx]?'(?:[^']|'')*'")
+_numberPattern = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b')
+_placeholderPattern = re.compile(r'%s|\$\d+')
+_listPattern = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_rowsPattern = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_whitespacePattern = re.compile(r'\s+')
+
+
+def getFingerprint(statement):
+    """Normalize an SQL statement, so that similar statements are grouped.
+
+    String and number literals and parameter placeholders are replaced with
+    a C{?}, lists of them with C{(...)} and whitespace is collapsed, so
+    C{SELECT * FROM tags WHERE id IN (%s, %s)} and C{SELECT * FROM tags
+    WHERE id IN (42)} both have the same fingerprint.
+
+    @param statement: The C{str} SQL statement.
+    @return: The C{str} fingerprint of the statement.
+    """
+    fingerprint = _stringPattern.sub('?', statement)
+    fingerprint = _placeholderPattern.sub('?', fingerprint)
+    fingerprint = _numberPattern.sub('?', fingerprint)
+    fingerprint = _listPattern.sub('(...)', fingerprint)
+    fingerprint = _rowsPattern.sub('(...), ...', fingerprint)
+    return _whitespacePattern.sub(' ', fingerprint).strip()
+
+
+class StatementProfile(object):
+    """Aggregated information about statements with the same fingerprint.
+
+    @param fingerprint: The fingerprint of the statements.
+    @ivar count: The number of times the statements were run.
+    @ivar totalTime: The total time, in milliseconds, spent running them.
+    @ivar maxTime: The longest time, in milliseconds, one of them took.
+    @ivar rows: The total number of rows returned or changed by them.
+    """
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.count = 0
+        self.totalTime = 0.0
+        self.maxTime = 0.0
+        self.rows = 0
+
+    def add(self, milliseconds, rows):
+        """Add a statement that was run.
+
+        @param milliseconds: The time it took to run the statement.
+        @param rows: The number of rows returned or changed by it.
+        """
+        self.count += 1
+        self.totalTime += milliseconds
+        if milliseconds > self.maxTime:
+            self.maxTime = milliseconds
+        if rows > 0:
+            self.rows += rows
+
+    def dumps(self):
+        """Write the profile to a C{dict}.
+
+        @return: A C{dict} with the fingerprint, the number of statements,
+            their total, mean and maximum times and the number of rows.
+        """
+        return {'fingerprint': self.fingerprint,
+                'count': self.count,
+                'total': self.totalTime,
+                'mean': self.totalTime / self.count if self.count else 0.0,
+                'max': self.maxTime,
+                'rows': self.rows}
+
+
+class SQLProfiler(object):
+    """Aggregates the SQL statements run by the API service by fingerprint.
+
+    Statements are aggregated for the whole service and for each endpoint,
+    so that patterns like one query per object in a request stand out as a
+    fingerprint with a high count.  Statements are recorded in the threads
+    transactions run in, so the profiler is thread-safe.
+
+    @param maxFingerprints: Optionally, the maximum number of different
+        fingerprints to keep.  Further statements are aggregated as
+        C{<other>}.  Default is C{1000}.
+    """
+
+    def __init__(self, maxFingerprints=1000):
+        self.maxFingerprints = maxFingerprints
+        self._lock = Lock()
+        self._fingerprints = {}
+        self.statements = {}
+        self.endpoints = {}
+
+    def record(self, endpoint, statement, duration, rows):
+        """Record a statement that was run.
+
+        @param endpoint: The name of the endpoint the statement was run for,
+            or C{None} if it's not known.
+        @param statement: The C{str} SQL statement.
+        @param duration: The C{timedelta} it took to run the statement.
+        @param rows: The number of rows returned or changed by it, or C{-1}
+            if it's not known.
+        """
+        milliseconds = duration.total_seconds() * 1000
+        with self._lock:
+            fingerprint = self._fingerprints.get(statement)
+            if fingerprint is None:
+                fingerprint = getFingerprint(statement)
+                if len(self._fingerprints) >= self.maxFingerprints * 10:
+                    self._fingerprints.clear()
+                self._fingerprints[statement] = fingerprint
+            if (fingerprint not in self.statements
+                    and len(self.statements) >= self.maxFingerprints):
+                fingerprint = OTHER_FINGERPRINT
+            self._getProfile(self.statements, fingerprint).add(
+                milliseconds, rows)
+            if endpoint is not None:
+                profiles = self.endpoints.setdefault(endpoint, {})
+                self._getProfile(profiles, fingerprint).add(
+                    milliseconds, rows)
+
+    def _getProfile(self, profiles, fingerprint):
+        """Get or create the L{StatementProfile} for a fingerprint.
+
+        @param profiles: The C{dict} of L{StatementProfile}s to look in.
+        @param fingerprint: The fingerprint of the statement.
+        @return: A L{StatementProfile} instance.
+        """
+        profile = profiles.get(fingerprint)
+        if profile is None:
+            profile = profiles[fingerprint] = StatementProfile(fingerprint)
+        return profile
+
+    def reset(self):
+        """Forget all the statements that have been recorded."""
+        with self._lock:
+            self.statements = {}
+            self.endpoints = {}
+
+    def dumps(self):
+        """Write the profile to a C{dict}.
+
+        @return: A C{dict} with a C{statements} list of profiles for the
+            whole service and an C{endpoints} C{dict} mapping endpoint names
+            to lists of profiles.
+        """
+        with self._lock:
+            return {
+                'statements': [profile.dumps()
+                               for profile in self.statements.itervalues()],
+                'endpoints': dict(
+                    (endpoint, [profile.dumps()
+                                for profile in profiles.itervalues()])
+                    for endpoint, profiles in self.endpoints.iteritems())}
+
+    def report(self, limit=20, sortBy='total', endpoint=None):
+        """Get a report of the most expensive statements.
+
+        @param limit: Optionally, the number of fingerprints to include.
+        @param sortBy: Optionally, the column to sort by.
+        @param endpoint: Optionally, the name of an endpoint, like
+            C{GET /objects}, to only report the statements run for it.
+        @return: A C{str} table with a row for each fingerprint.
+        """
+        rows = getProfileRows(self.dumps(), limit, sortBy, endpoint)
+        widths = [max(len(row[index]) for row in rows)
+                  for index in range(len(rows[0]) - 1)]
+        lines = []
+        for row in rows:
+            columns = [value.rjust(width)
+                       for value, width in zip(row, widths)]
+            lines.append('  '.join(columns + [row[-1]]))
+        return '\n'.join(lines)
+
+
+def getProfileRows(data, limit=20, sortBy='total', endpoint=None):
+    """Get the rows of a report of the most expensive statements.
+
+    @param data: A C{dict} returned by L{SQLProfiler.dumps}.
+    @param limit: Optionally, the number of fingerprints to include.
+    @param sortBy: Optionally, the column to sort by, one of L{SORT_KEYS}.
+    @param endpoint: Optionally, the name of an endpoint to only report the
+        statements run for it.
+    @raise ValueError: Raised if C{sortBy} isn't a valid column.
+    @return: A C{list} of C{(count, total, mean, max, rows, fingerprint)}
+        C{str} tuples, starting with a header row.
+    """
+    if sortBy not in SORT_KEYS:
+        raise ValueError('Invalid sort key: %r.' % sortBy)
+    if endpoint is None:
+        profiles = data['statements']
+    else:
+        profiles = data['endpoints'].get(endpoint, [])
+    profiles = sorted(profiles, key=lambda profile: profile[sortBy],
+                      reverse=True)
+    rows = [('count', 'total ms', 'mean ms', 'max ms', 'rows', 'statement')]
+    for profile in profiles[:limit]:
+        rows.append((str(profile['count']),
+                     '%.1f' % profile['total'],
+                     '%.2f' % profile['mean'],
+                     '%.1f' % profile['max'],
+                     str(profile['rows']),
+                     profile['fingerprint']))
+    return rows
+
+
+_profiler = None
+
+
+def getSQLProfiler():
+    """Get the L{SQLProfiler} that statements are recorded in.
+
+    @return: An L{SQLProfiler} instance or C{None} if one hasn't been
+        registered.
+    """
+    return _profiler
+
+
+def setSQLProfiler(profiler):
+    """Set the L{SQLProfiler} that statements are recorded in.
+
+    @param profiler: An L{SQLProfiler} instance, or C{None} to not profile
+        statements.
+    """
+    global _profiler
+    _profiler = profiler
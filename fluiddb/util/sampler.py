@@ -0,0 +1,175 @@
+"""Sampling profiler for the threads of the API service."""
+
+import sys
+from threading import Event, Lock, Thread, enumerate as enumerateThreads
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThread
+
+
+# The prefix of the names of the threads in the pool used by L{Transact}.
+TRANSACT_THREAD_PREFIX = 'PoolThread-transact-'
+
+# The longest stack kept for a sample.  Deeper stacks are truncated at the
+# outermost frames, which are the same for every sample anyway.
+MAX_DEPTH = 100
+
+# The shortest and longest number of seconds allowed between samples.
+# Shorter intervals would make the sampling thread hog the GIL, and longer
+# ones would make stopping the sampler slow.
+MIN_INTERVAL = 0.001
+MAX_INTERVAL = 1.0
+
+
+def getThreadLabel(thread):
+    """Get the label to use for the samples taken from a thread.
+
+    @param thread: A C{threading.Thread} instance.
+    @return: C{reactor} for the main thread, which runs the reactor,
+        C{transact} for the threads in the pool used by L{Transact} or
+        C{None} if the thread shouldn't be sampled.
+    """
+    if thread.name == 'MainThread':
+        return 'reactor'
+    elif thread.name.startswith(TRANSACT_THREAD_PREFIX):
+        return 'transact'
+    return None
+
+
+def getFrameLabel(frame):
+    """Get the label to use for a frame in a collapsed stack.
+
+    @param frame: A Python frame object.
+    @return: A C{str} with the name of the function and the file and line
+        it's defined at, like C{get (fluiddb/model/tag.py:42)}.
+    """
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, code.co_filename,
+                           code.co_firstlineno)
+
+
+class StackSampler(object):
+    """Periodically samples the stacks of the threads of the API service.
+
+    Samples are taken from a separate daemon thread, with
+    C{sys._current_frames}, so the sampled threads don't need to cooperate
+    and only pay for the brief moments the sampling thread holds the GIL.
+    Samples are aggregated as collapsed stacks, the input format of
+    C{flamegraph.pl}.
+
+    @param interval: Optionally, the C{float} number of seconds between
+        samples, from L{MIN_INTERVAL} to L{MAX_INTERVAL}.  Default is
+        C{0.01}.
+    @param getLabel: Optionally, a function that takes a C{threading.Thread}
+        and returns a label for its samples or C{None} to skip it.  Default
+        is L{getThreadLabel}.
+    @raise ValueError: Raised if C{interval} is out of range.
+    @ivar samples: The number of times the threads were sampled.
+    @ivar stacks: A C{dict} mapping collapsed stacks, like
+        C{reactor;run (...);handle (...)}, to the number of samples they
+        were seen in.
+    """
+
+    def __init__(self, interval=0.01, getLabel=None):
+        if not MIN_INTERVAL <= interval <= MAX_INTERVAL:
+            raise ValueError('Interval must be between %s and %s seconds.'
+                             % (MIN_INTERVAL, MAX_INTERVAL))
+        self._interval = interval
+        self._getLabel = getLabel or getThreadLabel
+        self._lock = Lock()
+        self._thread = None
+        self._stopped = Event()
+        self.samples = 0
+        self.stacks = {}
+
+    def sample(self):
+        """Take a sample of the stacks of the labelled threads."""
+        frames = sys._current_frames()
+        stacks = []
+        for thread in enumerateThreads():
+            frame = frames.get(thread.ident)
+            if frame is None:
+                continue
+            label = self._getLabel(thread)
+            if label is None:
+                continue
+            names = []
+            while frame is not None and len(names) < MAX_DEPTH:
+                names.append(getFrameLabel(frame))
+                frame = frame.f_back
+            names.append(label)
+            names.reverse()
+            stacks.append(';'.join(names))
+        with self._lock:
+            self.samples += 1
+            for stack in stacks:
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def _run(self):
+        """Take samples until the sampler is stopped.
+
+        At least one sample is taken, even if the sampler is stopped right
+        after it's started.
+        """
+        while True:
+            self.sample()
+            if self._stopped.wait(self._interval):
+                break
+
+    def start(self):
+        """Start sampling in a new daemon thread."""
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name='StackSampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Tell the sampling thread to stop, without waiting for it."""
+        self._stopped.set()
+
+    def join(self):
+        """Wait for the sampling thread to finish, once it's been stopped."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def getCollapsedStacks(self):
+        """Get the samples as collapsed stacks.
+
+        @return: A C{str} with a C{<stack> <count>} line for each different
+            stack, sorted by stack.
+        """
+        with self._lock:
+            stacks = sorted(self.stacks.iteritems())
+        return ''.join('%s %d\n' % (stack, count) for stack, count in stacks)
+
+
+def sampleStacks(duration, interval=0.01, getLabel=None, clock=None):
+    """Sample the stacks of the threads of the API service for a while.
+
+    @param duration: The C{float} number of seconds to take samples for.
+    @param interval: Optionally, the C{float} number of seconds between
+        samples, as used by L{StackSampler}.  Default is C{0.01}.
+    @param getLabel: Optionally, the function to label threads with, as
+        used by L{StackSampler}.
+    @param clock: Optionally, the C{IReactorTime} provider to use to wait
+        for C{duration} seconds.  Default is the reactor.
+    @raise ValueError: Raised if C{interval} is out of range.
+    @return: A C{Deferred} that fires with the stopped L{StackSampler}.
+    """
+    clock = clock or reactor
+    sampler = StackSampler(interval, getLabel)
+    sampler.start()
+    deferred = Deferred()
+
+    def stop():
+        # The sampling thread is joined in a thread, so the reactor doesn't
+        # block while it takes its last sample.
+        sampler.stop()
+        joined = deferToThread(sampler.join)
+        joined.addCallback(lambda result: sampler)
+        joined.chainDeferred(deferred)
+
+    clock.callLater(duration, stop)
+    return deferred
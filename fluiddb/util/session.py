@@ -2,14 +2,42 @@
 
 from cStringIO import StringIO
 from datetime import datetime, timedelta
+from functools import partial
 import json
 import logging
+import os
+from random import random as randomFloat
+from threading import Condition, Thread, local
 
 from storm.databases.postgres import PostgresTimeoutTracer
 from storm.expr import Variable
 from storm.tracer import install_tracer, remove_all_tracers
 from twisted.web.http_headers import Headers
 
+from fluiddb.util.metrics import getEndpointName
+from fluiddb.util.profiler import getSQLProfiler
+
+
+def decodeObject(dictionary):
+    """Decode C{datetime} and C{timedelta} objects in JSON.
+
+    This is the C{object_hook} used to load the JSON written by
+    L{Session.dumps}, which is also the format of trace log entries.
+
+    @param dictionary: A C{dict} decoded from a JSON object.
+    @return: The C{dict} with its C{datetime(...)} and C{timedelta(...)}
+        strings replaced by C{datetime} and C{timedelta} objects.
+    """
+    for key, value in dictionary.items():
+        if isinstance(value, (str, unicode)):
+            if value.startswith('datetime('):
+                dictionary[key] = datetime.strptime(
+                    value[9:-1], '%Y-%m-%d %H:%M:%S.%f')
+            if value.startswith('timedelta('):
+                microseconds = int(value[10:-1])
+                dictionary[key] = timedelta(microseconds=microseconds)
+    return dictionary
+
 
 class Session(object):
     """A manifest that captures details about an API request."""
@@ -69,6 +97,10 @@ class Session(object):
                 'startDate': self.startDate,
                 'stopDate': self.stopDate,
                 'duration': self.duration}
+        if not getattr(self, 'sampled', True):
+            # Sessions that weren't sampled are only stored if they're slow
+            # or failed, so they don't represent all requests.
+            data['sampled'] = False
 
         for name, plugin in self._plugins.iteritems():
             data[name] = plugin.dumps()
@@ -80,24 +112,13 @@ class Session(object):
 
         @param data: A JSON representation of a session.
         """
-
-        def decodeObject(dictionary):
-            """Decodes C{datetime} and C{timedelta} objects in JSON"""
-            for key, value in dictionary.items():
-                if isinstance(value, (str, unicode)):
-                    if value.startswith('datetime('):
-                        dictionary[key] = datetime.strptime(
-                            value[9:-1], '%Y-%m-%d %H:%M:%S.%f')
-                    if value.startswith('timedelta('):
-                        microseconds = int(value[10:-1])
-                        dictionary[key] = timedelta(microseconds=microseconds)
-            return dictionary
-
         data = json.loads(data, object_hook=decodeObject)
         self.id = data['id']
         self.startDate = data['startDate']
         self.stopDate = data['stopDate']
         self.duration = data['duration']
+        if 'sampled' in data:
+            self.sampled = data['sampled']
         for name, plugin in self._plugins.iteritems():
             plugin.loads(data[name])
 
@@ -115,6 +136,279 @@ class SessionStorage(object):
             stream.write(session.dumps() + '\n')
 
 
+class BufferedSessionStorage(object):
+    """Writer that buffers L{Session}s and appends them to a log file.
+
+    Serialized sessions are kept in memory and written by a background
+    thread, with a single write for each flush, so requests don't wait for
+    the disk.  The buffer is flushed when it reaches C{bufferSize} bytes or
+    after C{flushInterval} seconds.  If the disk can't keep up and more than
+    C{maxPendingSize} bytes are waiting to be written, new sessions are
+    dropped instead of using more memory.
+
+    @param path: The path to the log file.
+    @param bufferSize: Optionally, the number of bytes to buffer before
+        waking up the writer.  Default is C{65536}.
+    @param flushInterval: Optionally, the maximum number of seconds a
+        session is buffered before it's written.  Default is C{1}.
+    @param maxPendingSize: Optionally, the maximum number of bytes that can
+        be waiting to be written before sessions are dropped.  Default is
+        C{16777216}.
+    @param maxFileSize: Optionally, the size, in bytes, at which the log
+        file is rotated, or C{None} to never rotate it.  Rotated files are
+        renamed with a C{.1}, C{.2}, etc. suffix, like the files of a
+        C{logging.handlers.RotatingFileHandler}.  Default is C{None}.
+    @param backupCount: Optionally, the number of rotated files to keep.
+        Default is C{5}.
+    @ivar dropped: The number of sessions that have been dropped.
+    """
+
+    def __init__(self, path, bufferSize=65536, flushInterval=1.0,
+                 maxPendingSize=16777216, maxFileSize=None, backupCount=5):
+        self.path = path
+        self.bufferSize = bufferSize
+        self.flushInterval = flushInterval
+        self.maxPendingSize = maxPendingSize
+        self.maxFileSize = maxFileSize
+        self.backupCount = backupCount
+        self.dropped = 0
+        self._condition = Condition()
+        self._buffer = []
+        self._bufferedSize = 0
+        self._writingSize = 0
+        self._reportedDropped = 0
+        self._thread = None
+        self._stopping = False
+
+    def start(self):
+        """Start the background thread that writes buffered sessions."""
+        self._stopping = False
+        self._thread = Thread(target=self._run,
+                              name='BufferedSessionStorage')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        """Write all buffered sessions and stop the background thread.
+
+        Sessions dumped after the storage is stopped are written
+        immediately.
+        """
+        if self._thread is None:
+            return
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+
+    def dump(self, session):
+        """Buffer a L{Session} to be written to the log file.
+
+        @param session: A L{Session} instance to persist.
+        """
+        line = session.dumps() + '\n'
+        if self._thread is None:
+            self._write([line])
+            return
+        with self._condition:
+            pendingSize = self._bufferedSize + self._writingSize
+            if pendingSize + len(line) > self.maxPendingSize:
+                self.dropped += 1
+                return
+            self._buffer.append(line)
+            self._bufferedSize += len(line)
+            if self._bufferedSize >= self.bufferSize:
+                self._condition.notify()
+
+    def _run(self):
+        """Write buffered sessions until the storage is stopped."""
+        while True:
+            with self._condition:
+                if not self._stopping and self._bufferedSize < self.bufferSize:
+                    self._condition.wait(self.flushInterval)
+                lines = self._buffer
+                self._buffer = []
+                self._writingSize = self._bufferedSize
+                self._bufferedSize = 0
+                stopping = self._stopping
+                dropped = self.dropped - self._reportedDropped
+                self._reportedDropped = self.dropped
+            if dropped:
+                logging.warning('Dropped %d sessions because the trace log '
+                                'writer fell behind.', dropped)
+            try:
+                if lines:
+                    self._write(lines)
+            except Exception:
+                logging.exception('Error writing sessions to %s.', self.path)
+            finally:
+                with self._condition:
+                    self._writingSize = 0
+            if stopping:
+                return
+
+    def _write(self, lines):
+        """Append serialized sessions to the log file, rotating it if needed.
+
+        @param lines: A C{list} of C{str} lines to write.
+        """
+        data = ''.join(lines)
+        if self.maxFileSize is not None and os.path.exists(self.path):
+            if os.path.getsize(self.path) + len(data) > self.maxFileSize:
+                self._rotate()
+        with open(self.path, 'a') as stream:
+            stream.write(data)
+
+    def _rotate(self):
+        """Rename the log file and its backups, dropping the oldest one."""
+        if self.backupCount < 1:
+            os.unlink(self.path)
+            return
+        for index in range(self.backupCount - 1, 0, -1):
+            source = '%s.%d' % (self.path, index)
+            if os.path.exists(source):
+                os.rename(source, '%s.%d' % (self.path, index + 1))
+        os.rename(self.path, self.path + '.1')
+
+
+_sessionStorage = None
+
+
+def getSessionStorage():
+    """Get the storage for L{Session}s that have finished.
+
+    @return: A L{BufferedSessionStorage} instance or C{None} if one hasn't
+        been registered.
+    """
+    return _sessionStorage
+
+
+def setSessionStorage(storage):
+    """Set the storage for L{Session}s that have finished.
+
+    @param storage: A L{BufferedSessionStorage} instance, or C{None} to
+        write each L{Session} with L{SessionStorage}.
+    """
+    global _sessionStorage
+    _sessionStorage = storage
+
+
+class SlowRequestLog(object):
+    """Writes the L{Session}s of slow requests to a dedicated log.
+
+    Slow sessions are written in full, with their database statements,
+    Solr queries and cache lookups, in the same format as the trace log, so
+    the log can be loaded for offline analysis with the trace log tools.
+
+    @param storage: The L{BufferedSessionStorage} to write sessions with.
+    @param threshold: The duration, in seconds, from which a request is
+        considered slow.
+    """
+
+    def __init__(self, storage, threshold):
+        self.storage = storage
+        self.threshold = timedelta(seconds=threshold)
+
+    def record(self, session):
+        """Write a L{Session} that has stopped to the log, if it was slow.
+
+        @param session: The L{Session} that has stopped.
+        @return: C{True} if the session was written, otherwise C{False}.
+        """
+        if session.duration < self.threshold:
+            return False
+        self.storage.dump(session)
+        return True
+
+
+_slowRequestLog = None
+
+
+def getSlowRequestLog():
+    """Get the log for the L{Session}s of slow requests.
+
+    @return: A L{SlowRequestLog} instance or C{None} if one hasn't been
+        registered.
+    """
+    return _slowRequestLog
+
+
+def setSlowRequestLog(log):
+    """Set the log for the L{Session}s of slow requests.
+
+    @param log: A L{SlowRequestLog} instance, or C{None} to not log slow
+        requests.
+    """
+    global _slowRequestLog
+    _slowRequestLog = log
+
+
+_current = local()
+
+
+def getCurrentSession():
+    """Get the L{Session} the transaction running in this thread is for.
+
+    @return: The L{Session} that started the transaction with its
+        L{TransactPlugin}, or C{None} if there isn't one.
+    """
+    return getattr(_current, 'session', None)
+
+
+def setCurrentSession(session):
+    """Set the L{Session} the transaction running in this thread is for.
+
+    @param session: The L{Session} instance, or C{None} to unset it.
+    """
+    _current.session = session
+
+
+class SamplingPolicy(object):
+    """Decides which L{Session}s are traced in detail and stored.
+
+    Tracing every request is expensive and only a small fraction of the
+    trace log is ever looked at.  A random sample of sessions is traced in
+    detail and the rest use cheap plugins that capture very little.  Slow
+    requests and requests that fail with a server error are always stored,
+    even if they weren't sampled, so they can still be investigated.
+
+    @param rate: Optionally, the fraction of sessions to trace in detail,
+        from C{0} to C{1}.  Default is C{1}, to trace all of them.
+    @param slowThreshold: Optionally, the duration, in seconds, from which
+        a request is considered slow.  Default is C{1}.
+    @param random: For testing purposes, the implementation of
+        C{random.random} to use when sampling sessions.
+    """
+
+    def __init__(self, rate=1.0, slowThreshold=1.0, random=None):
+        self.rate = rate
+        self.slowThreshold = timedelta(seconds=slowThreshold)
+        self._random = random or randomFloat
+
+    def sample(self):
+        """Decide whether a new session should be traced in detail.
+
+        @return: C{True} if the session is sampled, otherwise C{False}.
+        """
+        return self.rate >= 1 or self._random() < self.rate
+
+    def shouldStore(self, session):
+        """Decide whether a session that has stopped should be stored.
+
+        @param session: The L{Session} that has stopped.
+        @return: C{True} if the session was sampled, was slow or failed with
+            a server error, otherwise C{False}.
+        """
+        if getattr(session, 'sampled', True):
+            return True
+        if session.duration >= self.slowThreshold:
+            return True
+        http = getattr(session, 'http', None)
+        code = getattr(http, 'code', None)
+        return code is not None and code >= 500
+
+
 class LoggingPlugin(object):
     """A L{Session} plugin for capturing logs.
 
@@ -193,6 +487,74 @@ class LoggingPlugin(object):
         self.messages = data.get('messages')
 
 
+class NullLoggingPlugin(LoggingPlugin):
+    """A L{Session} plugin that only captures logs once something fails.
+
+    It's used by sessions that aren't sampled, to avoid creating a logger
+    for each request.  Log messages are written to the root logger and
+    aren't captured until the first error or exception, which creates the
+    logger, so sessions that fail with a server error are still stored with
+    their tracebacks.
+    """
+
+    def start(self, session):
+        """Start the logger for this session.
+
+        The logger itself isn't created until it's needed.
+
+        @param session: The L{Session} parent of this plugin.
+        """
+        self._session = session
+        self._logger = None
+
+    def stop(self):
+        """Stop the logger for this session, if it was created."""
+        if self._logger is not None:
+            super(NullLoggingPlugin, self).stop()
+
+    def _startLogger(self):
+        """Create the logger that captures messages, if it doesn't exist."""
+        if self._logger is None:
+            super(NullLoggingPlugin, self).start(self._session)
+
+    def info(self, message, *args, **kwargs):
+        """Write an C{INFO} level log message.
+
+        The message is only captured if an error has been logged already.
+
+        @param message: The message to write.
+        @param args: Positional arguments to use when interpolating the
+            message.
+        @param kwargs: Keyword arguments to use when interpolating the message.
+        """
+        if self._logger is None:
+            logging.info(message, *args, **kwargs)
+        else:
+            super(NullLoggingPlugin, self).info(message, *args, **kwargs)
+
+    def error(self, message, *args, **kwargs):
+        """Write and capture an C{ERROR} level log message.
+
+        @param message: The message to write.
+        @param args: Positional arguments to use when interpolating the
+            message.
+        @param kwargs: Keyword arguments to use when interpolating the message.
+        """
+        self._startLogger()
+        super(NullLoggingPlugin, self).error(message, *args, **kwargs)
+
+    def exception(self, exception, *args, **kwargs):
+        """Write and capture an C{ERROR} level log message for an exception.
+
+        @param exception: The exception to write.
+        @param args: Positional arguments to use when interpolating the
+            message.
+        @param kwargs: Keyword arguments to use when interpolating the message.
+        """
+        self._startLogger()
+        super(NullLoggingPlugin, self).exception(exception, *args, **kwargs)
+
+
 class StatementTracer(PostgresTimeoutTracer):
     """A custom SQL statement tracer.
 
@@ -203,12 +565,27 @@ class StatementTracer(PostgresTimeoutTracer):
 
     @param timeout: The maximum amount of time that may be spent executing
         database statements, in seconds.
+    @param recordStatements: Optionally, C{False} to only record the text
+        and timing of statements, without their parameters.  Default is
+        C{True}.
+    @param profiler: Optionally, an L{SQLProfiler} to record the time taken
+        by successful statements and the number of rows they returned.
+    @param endpoint: Optionally, the name of the endpoint statements are run
+        for, used by the L{SQLProfiler}.
+    @param recordText: Optionally, C{False} to only record the timing of
+        statements, without their text either, when C{recordStatements} is
+        C{False}.  Default is C{True}.
     """
 
-    def __init__(self, timeout):
+    def __init__(self, timeout, recordStatements=True, profiler=None,
+                 endpoint=None, recordText=True):
         super(StatementTracer, self).__init__()
         self.statements = []
         self.timeout = timeout
+        self.recordStatements = recordStatements
+        self.recordText = recordText
+        self.profiler = profiler
+        self.endpoint = endpoint
         self._remainingTime = timedelta(seconds=timeout)
 
     def connection_raw_execute(self, connection, cursor, statement,
@@ -220,15 +597,23 @@ class StatementTracer(PostgresTimeoutTracer):
         @param statement: The SQL statement to execute.
         @param parameters: The parameters to use with C{statement}.
         """
-        rawParameters = []
-        for parameter in parameters:
-            if isinstance(parameter, Variable):
-                rawParameters.append(unicode(parameter.get()))
-            else:
-                rawParameters.append(unicode(parameter))
-        self.statements.append({'statement': statement.decode('utf-8'),
-                                'parameters': rawParameters,
-                                'startDate': datetime.utcnow()})
+        if not self.recordStatements:
+            trace = {'startDate': datetime.utcnow()}
+            if self.recordText:
+                # The text is only decoded if the session is written, by
+                # json.dumps.
+                trace['statement'] = statement
+            self.statements.append(trace)
+        else:
+            rawParameters = []
+            for parameter in parameters:
+                if isinstance(parameter, Variable):
+                    rawParameters.append(unicode(parameter.get()))
+                else:
+                    rawParameters.append(unicode(parameter))
+            self.statements.append({'statement': statement.decode('utf-8'),
+                                    'parameters': rawParameters,
+                                    'startDate': datetime.utcnow()})
         super(StatementTracer, self).connection_raw_execute(
             connection, cursor, statement, parameters)
 
@@ -262,6 +647,10 @@ class StatementTracer(PostgresTimeoutTracer):
         trace = self.statements[-1]
         trace['stopDate'] = datetime.utcnow()
         trace['duration'] = trace['stopDate'] - trace['startDate']
+        trace['rows'] = cursor.rowcount
+        if self.profiler is not None:
+            self.profiler.record(self.endpoint, statement, trace['duration'],
+                                 cursor.rowcount)
 
     def get_remaining_time(self):
         """
@@ -282,32 +671,51 @@ class TransactPlugin(object):
          'parameters': <parameters>,
          'startDate': <start-time>,
          'stoptime': <stop-time>,
-         'duration': <duration>}
+         'duration': <duration>,
+         'rows': <rows>}
 
     @ivar duration: The total time spent in the transaction thread.
     @ivar statementDuration: The total time spent running database statements.
+    @ivar queueWait: The time the transaction waited for a thread in the
+        L{Transact} thread pool.
+    @ivar totalQueueWait: The total time transactions waited for a thread.
     @param transact: The L{Transact} instance to use when running
         transactions.
+    @param recordStatements: Optionally, C{False} to only record the text
+        and timing of statements, which is cheaper.  Default is C{True}.
+    @param recordText: Optionally, C{False} to only record the timing of
+        statements, without their text either, when C{recordStatements} is
+        C{False}.  Default is C{True}.
     """
 
-    def __init__(self, transact, timeout):
+    _session = None
+
+    def __init__(self, transact, timeout, recordStatements=True,
+                 recordText=True):
         self._transact = transact
         self.timeout = timeout
+        self.recordStatements = recordStatements
+        self.recordText = recordText
         self.transactions = []
         self.totalStatementDuration = timedelta()
+        self.totalQueueWait = timedelta()
 
     def start(self, session):
         """Start the transaction manager for this session.
 
         @param session: The L{Session} parent of this plugin.
         """
-        pass
+        self._session = session
 
     def stop(self):
         """Stop the transaction manager."""
         for transaction in self.transactions:
             transaction['duration'] = (transaction['stopDate']
                                        - transaction['startDate'])
+            runDate = transaction.pop('runDate', None)
+            if runDate is not None:
+                transaction['queueWait'] = runDate - transaction['startDate']
+                self.totalQueueWait += transaction['queueWait']
             transaction['statementDuration'] = timedelta()
             for statement in transaction['statements']:
                 try:
@@ -320,16 +728,79 @@ class TransactPlugin(object):
             self.totalStatementDuration += transaction['statementDuration']
 
     def run(self, function, *args, **kwargs):
-        """Run C{function} in a transaction and log all statements."""
+        """Run C{function} in a transaction and log all statements.
+
+        The transaction runs against the C{main} store.  When it succeeds,
+        the user that was authenticated before it started is pinned to the
+        C{main} store for a while, so that subsequent read-only transactions
+        see what was written.  Transactions that authenticate the user don't
+        pin anyone.
+        """
+        key = self._getClientKey()
+        deferred = self._run(self._transact.run, function, *args, **kwargs)
+        if key is not None:
+
+            def pin(result):
+                self._transact.pin(key)
+                return result
+
+            deferred.addCallback(pin)
+        return deferred
+
+    def runReadOnly(self, function, *args, **kwargs):
+        """Run C{function} in a read-only transaction and log all statements.
+
+        The transaction may run against a replica of the C{main} store.
+        C{function} must not write to the database.
+        """
+        run = partial(self._transact.runReadOnly, self._getClientKey())
+        return self._run(run, function, *args, **kwargs)
+
+    def _getClientKey(self):
+        """Get the key identifying the client running transactions.
+
+        @return: The username of the authenticated user, or C{None} if it
+            isn't known.
+        """
+        auth = getattr(self._session, 'auth', None)
+        return getattr(auth, 'username', None)
+
+    def _getEndpointName(self):
+        """Get the name of the endpoint transactions are run for.
+
+        @return: A name like C{GET /objects}, or C{None} if the session
+            isn't tracing an HTTP request.
+        """
+        http = getattr(self._session, 'http', None)
+        request = getattr(http, '_request', None)
+        if request is None:
+            return None
+        return getEndpointName(request.method, request.path)
+
+    def _run(self, run, function, *args, **kwargs):
+        """Run C{function} in a transaction and log all statements.
+
+        @param run: The L{Transact} method to run the transaction with.
+        @param function: The function to run.
+        @param args: Positional arguments to pass to C{function}.
+        @param kwargs: Keyword arguments to pass to C{function}.
+        @return: A C{Deferred} that will fire with the function's result.
+        """
         transaction = {'statements': [], 'startDate': datetime.utcnow()}
+        profiler = getSQLProfiler()
+        endpoint = self._getEndpointName() if profiler is not None else None
 
         def runTransaction(function, *args, **kwargs):
-            tracer = StatementTracer(self.timeout)
+            transaction['runDate'] = datetime.utcnow()
+            tracer = StatementTracer(self.timeout, self.recordStatements,
+                                     profiler, endpoint, self.recordText)
             install_tracer(tracer)
+            setCurrentSession(self._session)
             try:
                 return function(*args, **kwargs)
             finally:
                 transaction['statements'] = tracer.statements
+                setCurrentSession(None)
                 remove_all_tracers()
 
         def endTransaction(value):
@@ -337,8 +808,7 @@ class TransactPlugin(object):
             self.transactions.append(transaction)
             return value
 
-        deferred = self._transact.run(runTransaction, function,
-                                      *args, **kwargs)
+        deferred = run(runTransaction, function, *args, **kwargs)
         return deferred.addBoth(endTransaction)
 
     def dumps(self):
@@ -347,6 +817,7 @@ class TransactPlugin(object):
         @return: A C{dict} with information about the HTTP request.
         """
         return {'totalStatementDuration': self.totalStatementDuration,
+                'totalQueueWait': self.totalQueueWait,
                 'transactions': self.transactions}
 
     def loads(self, data):
@@ -493,3 +964,148 @@ class TimerPlugin(object):
         @param data: The C{dict} to load information from.
         """
         self.events.update(data)
+
+
+class IndexPlugin(object):
+    """A L{Session} plugin for capturing the Solr queries run for a request.
+
+    @ivar queries: A C{list} of C{dict}s matching the following format::
+
+        {'query': <solr-query>,
+         'rows': <rows>,
+         'qtime': <milliseconds>,
+         'startDate': <start-time>,
+         'duration': <duration>}
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def start(self, session):
+        """Start the index tracer for this session.
+
+        @param session: The L{Session} parent of this plugin.
+        """
+        pass
+
+    def stop(self):
+        """Stop the index tracer."""
+        pass
+
+    def record(self, query, rows, qtime, startDate):
+        """Record a Solr query that has finished.
+
+        @param query: The C{unicode} Solr query.
+        @param rows: The number of documents Solr returned.
+        @param qtime: The C{QTime} Solr reported for the query, in
+            milliseconds, or C{None} if it wasn't reported.
+        @param startDate: The C{datetime} the query was sent.
+        """
+        self.queries.append({'query': query,
+                             'rows': rows,
+                             'qtime': qtime,
+                             'startDate': startDate,
+                             'duration': datetime.utcnow() - startDate})
+
+    def dumps(self):
+        """Write session data to a C{dict}.
+
+        @return: A C{dict} with the Solr queries.
+        """
+        return {'queries': self.queries}
+
+    def loads(self, data):
+        """Load session data from a C{dict}.
+
+        @param data: The C{dict} to load information from.
+        """
+        self.__dict__.update(data)
+
+
+class CachePlugin(object):
+    """A L{Session} plugin for counting cache lookups.
+
+    @ivar hits: A C{dict} mapping cache key prefixes to the number of values
+        found in the cache.
+    @ivar misses: A C{dict} mapping cache key prefixes to the number of
+        values that weren't found in the cache.
+    """
+
+    def __init__(self):
+        self.hits = {}
+        self.misses = {}
+
+    def start(self, session):
+        """Start the cache tracer for this session.
+
+        @param session: The L{Session} parent of this plugin.
+        """
+        pass
+
+    def stop(self):
+        """Stop the cache tracer."""
+        pass
+
+    def record(self, prefix, hits, misses):
+        """Record a cache lookup.
+
+        @param prefix: The prefix of the keys that were looked up, like
+            C{user:}.
+        @param hits: The number of values found in the cache.
+        @param misses: The number of values that weren't found.
+        """
+        self.hits[prefix] = self.hits.get(prefix, 0) + hits
+        self.misses[prefix] = self.misses.get(prefix, 0) + misses
+
+    def dumps(self):
+        """Write session data to a C{dict}.
+
+        @return: A C{dict} with the hits and misses for each key prefix.
+        """
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def loads(self, data):
+        """Load session data from a C{dict}.
+
+        @param data: The C{dict} to load information from.
+        """
+        self.__dict__.update(data)
+
+
+class DurationTimer(Timer):
+    """Context manager that only records how long the code in its scope runs.
+
+    @param name: The name of the timer.
+    @param events: The dictionary used to track events.
+    """
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Stop the timer."""
+        self.events[self.name].append(
+            {'duration': datetime.utcnow() - self.startDate})
+
+
+class NullTimerPlugin(TimerPlugin):
+    """
+    A L{Session} plugin that only captures the duration of events.  It's used
+    by sessions that aren't sampled, so that L{Metrics} still include their
+    events, but nothing is written to the trace log.
+    """
+
+    def track(self, name):
+        """Track the amount of time spent during an event.
+
+        @param name: The name of the event.
+        @return: A context manager that records the duration of the code
+            that runs in its scope.
+        """
+        if name not in self.events:
+            self.events[name] = []
+        return DurationTimer(name, self.events)
+
+    def dumps(self):
+        """Write session data to a C{dict}.
+
+        @return: An empty C{dict}, because only durations are captured.
+        """
+        return {}
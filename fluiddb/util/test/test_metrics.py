@@ -0,0 +1,234 @@
+from datetime import datetime, timedelta
+
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.util.metrics import (
+    BUCKET_BOUNDS, Histogram, Metrics, getEndpointName, getMetrics,
+    setMetrics)
+from fluiddb.util.session import (
+    HTTPPlugin, NullTimerPlugin, Session, TimerPlugin)
+
+
+class FakeTransactPlugin(object):
+    """A fake L{TransactPlugin} with transactions that have finished."""
+
+    def __init__(self, transactions):
+        self.transactions = transactions
+        self.totalStatementDuration = sum(
+            (statement['duration'] for transaction in transactions
+             for statement in transaction['statements']), timedelta())
+
+    def start(self, session):
+        pass
+
+    def stop(self):
+        pass
+
+
+class HistogramTest(FluidinfoTestCase):
+
+    def testEmpty(self):
+        """An empty L{Histogram} doesn't have any percentiles."""
+        histogram = Histogram()
+        self.assertIdentical(None, histogram.percentile(50))
+        self.assertEqual({'count': 0, 'mean': None, 'max': None,
+                          'p50': None, 'p90': None, 'p99': None},
+                         histogram.dumps())
+
+    def testAdd(self):
+        """L{Histogram.add} counts values and tracks their total and max."""
+        histogram = Histogram()
+        histogram.add(10)
+        histogram.add(30)
+        self.assertEqual(2, histogram.count)
+        self.assertEqual(40, histogram.total)
+        self.assertEqual(30, histogram.maximum)
+        self.assertEqual(20, histogram.dumps()['mean'])
+
+    def testPercentile(self):
+        """
+        L{Histogram.percentile} returns an estimate within the accuracy of
+        the buckets, which is never smaller than the real value.
+        """
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.add(value)
+        self.assertTrue(500 <= histogram.percentile(50) <= 600)
+        self.assertTrue(990 <= histogram.percentile(99) <= 1000)
+        self.assertEqual(1000, histogram.percentile(100))
+
+    def testPercentileIsNeverLargerThanMaximum(self):
+        """L{Histogram.percentile} doesn't exceed the largest value."""
+        histogram = Histogram()
+        histogram.add(5)
+        self.assertEqual(5, histogram.percentile(50))
+
+    def testValueLargerThanBuckets(self):
+        """
+        Values larger than the last bucket are counted and reported as the
+        maximum.
+        """
+        histogram = Histogram()
+        histogram.add(BUCKET_BOUNDS[-1] * 2)
+        self.assertEqual(BUCKET_BOUNDS[-1] * 2, histogram.percentile(99))
+
+    def testGetDistribution(self):
+        """
+        L{Histogram.getDistribution} returns the cumulative percentage of
+        values in each non-empty bucket.
+        """
+        histogram = Histogram()
+        for value in (1, 1, 1, 50):
+            histogram.add(value)
+        [(low, lowPercentile, lowCount),
+         (high, highPercentile, highCount)] = histogram.getDistribution()
+        self.assertTrue(1 <= low < 1.2)
+        self.assertEqual((75, 3), (lowPercentile, lowCount))
+        self.assertEqual((50, 100, 1), (high, highPercentile, highCount))
+
+    def testGetDistributionWhenEmpty(self):
+        """
+        L{Histogram.getDistribution} returns an empty list if the histogram
+        is empty.
+        """
+        self.assertEqual([], Histogram().getDistribution())
+
+
+class GetEndpointNameTest(FluidinfoTestCase):
+
+    def testGetEndpointName(self):
+        """
+        L{getEndpointName} uses the method and the first segment of the
+        path.
+        """
+        self.assertEqual('GET /objects',
+                         getEndpointName('GET', '/objects/1234/username/tag'))
+        self.assertEqual('PUT /values', getEndpointName('PUT', '/values'))
+
+    def testGetEndpointNameWithRoot(self):
+        """L{getEndpointName} handles requests for the root resource."""
+        self.assertEqual('GET /', getEndpointName('GET', '/'))
+
+    def testGetEndpointNameWithoutPath(self):
+        """L{getEndpointName} handles requests without a path."""
+        self.assertEqual('GET ?', getEndpointName('GET', None))
+
+
+class MetricsTest(FluidinfoTestCase):
+
+    def createSession(self, method='GET', path='/objects/1234', code=200,
+                      duration=timedelta(milliseconds=20), transactions=None,
+                      events=None):
+        """Create a L{Session} that has finished."""
+        timer = TimerPlugin()
+        timer.events.update(events or {})
+        plugins = {'http': HTTPPlugin(),
+                   'timer': timer,
+                   'transact': FakeTransactPlugin(transactions or [])}
+        session = Session('id', plugins)
+        session.http.method = method
+        session.http.path = path
+        session.http.code = code
+        session.duration = duration
+        return session
+
+    def testRecord(self):
+        """
+        L{Metrics.record} aggregates request durations and status codes for
+        each endpoint.
+        """
+        metrics = Metrics()
+        metrics.record(self.createSession())
+        metrics.record(self.createSession(code=404))
+        metrics.record(self.createSession(method='PUT', code=204))
+        self.assertEqual(['GET /objects', 'PUT /objects'],
+                         sorted(metrics.endpoints.keys()))
+        endpoint = metrics.endpoints['GET /objects']
+        self.assertEqual({200: 1, 404: 1}, endpoint.codes)
+        self.assertEqual(2, endpoint.duration.count)
+        self.assertEqual(40, endpoint.duration.total)
+
+    def testRecordTransactions(self):
+        """
+        L{Metrics.record} aggregates transaction durations and SQL statement
+        counts.
+        """
+        statement = {'duration': timedelta(milliseconds=2)}
+        transactions = [
+            {'duration': timedelta(milliseconds=5),
+             'statements': [statement, statement]},
+            {'duration': timedelta(milliseconds=3), 'statements': [statement]}]
+        metrics = Metrics()
+        metrics.record(self.createSession(transactions=transactions))
+        endpoint = metrics.endpoints['GET /objects']
+        self.assertEqual(2, endpoint.transactionDuration.count)
+        self.assertEqual(8, endpoint.transactionDuration.total)
+        self.assertEqual(3, endpoint.statementCount.total)
+        self.assertEqual(6, endpoint.statementDuration.total)
+
+    def testRecordEvents(self):
+        """L{Metrics.record} aggregates timer events by name."""
+        event = {'duration': timedelta(milliseconds=7)}
+        metrics = Metrics()
+        metrics.record(self.createSession(
+            events={'index-search': [event, event]}))
+        self.assertEqual(['index-search'], metrics.events.keys())
+        self.assertEqual(2, metrics.events['index-search'].count)
+        self.assertEqual(14, metrics.events['index-search'].total)
+
+    def testRecordEventsWithNullTimer(self):
+        """
+        L{Metrics.record} aggregates the timer events of sessions that aren't
+        sampled too, which only capture durations.
+        """
+        session = self.createSession()
+        session.timer = NullTimerPlugin()
+        with session.timer.track('index-search'):
+            pass
+        metrics = Metrics()
+        metrics.record(session)
+        self.assertEqual(1, metrics.events['index-search'].count)
+
+    def testRecordWithoutPlugins(self):
+        """
+        L{Metrics.record} only records the duration of sessions without
+        HTTP, timer or transaction plugins.
+        """
+        session = Session('id')
+        session.duration = timedelta(milliseconds=1)
+        metrics = Metrics()
+        metrics.record(session)
+        endpoint = metrics.endpoints['None ?']
+        self.assertEqual(1, endpoint.duration.count)
+        self.assertEqual(0, endpoint.statementCount.count)
+
+    def testDumps(self):
+        """
+        L{Metrics.dumps} returns the uptime and summaries of the endpoint
+        and event histograms.
+        """
+        now = datetime.utcnow()
+        dates = [now, now + timedelta(seconds=30)]
+        metrics = Metrics(utcnow=lambda: dates.pop(0))
+        metrics.record(self.createSession(
+            events={'index-search': [{'duration': timedelta(0, 1)}]}))
+        result = metrics.dumps()
+        self.assertEqual(30, result['uptime'])
+        endpoint = result['endpoints']['GET /objects']
+        self.assertEqual({'200': 1}, endpoint['codes'])
+        self.assertEqual(1, endpoint['duration']['count'])
+        self.assertEqual(20, endpoint['duration']['p50'])
+        self.assertEqual(1000, result['events']['index-search']['max'])
+
+
+class GetMetricsTest(FluidinfoTestCase):
+
+    def tearDown(self):
+        setMetrics(None)
+        super(GetMetricsTest, self).tearDown()
+
+    def testGetMetrics(self):
+        """L{getMetrics} returns the L{Metrics} set with L{setMetrics}."""
+        self.assertIdentical(None, getMetrics())
+        metrics = Metrics()
+        setMetrics(metrics)
+        self.assertIdentical(metrics, getMetrics())
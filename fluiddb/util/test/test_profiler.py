@@ -0,0 +1,215 @@
+from datetime import timedelta
+
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.util.profiler import (
+    OTHER_FINGERPRINT, SQLProfiler, getFingerprint, getProfileRows,
+    getSQLProfiler, setSQLProfiler)
+
+
+class GetFingerprintTest(FluidinfoTestCase):
+
+    def testPlaceholders(self):
+        """L{getFingerprint} replaces parameter placeholders with C{?}."""
+        self.assertEqual(
+            'SELECT id FROM tags WHERE path = ?',
+            getFingerprint('SELECT id FROM tags WHERE path = %s'))
+
+    def testLiterals(self):
+        """L{getFingerprint} replaces string and number literals."""
+        self.assertEqual(
+            'SELECT id FROM tags WHERE path = ? AND id > ? LIMIT ?',
+            getFingerprint("SELECT id FROM tags WHERE path = 'user''s/tag' "
+                           "AND id > -4.5 LIMIT 10"))
+
+    def testIdentifiersWithDigits(self):
+        """L{getFingerprint} doesn't change identifiers with digits."""
+        self.assertEqual('SELECT t1.id FROM tags AS t1',
+                         getFingerprint('SELECT t1.id FROM tags AS t1'))
+
+    def testLists(self):
+        """
+        L{getFingerprint} collapses lists of values, so statements with a
+        different number of values have the same fingerprint.
+        """
+        self.assertEqual(
+            'SELECT * FROM tag_values WHERE object_id IN (...)',
+            getFingerprint('SELECT * FROM tag_values '
+                           'WHERE object_id IN (%s, %s, %s)'))
+        self.assertEqual(
+            'SELECT * FROM tag_values WHERE object_id IN (...)',
+            getFingerprint('SELECT * FROM tag_values WHERE object_id IN (1)'))
+
+    def testRows(self):
+        """L{getFingerprint} collapses lists of rows."""
+        self.assertEqual(
+            'INSERT INTO tags (path, name) VALUES (...), ...',
+            getFingerprint('INSERT INTO tags (path, name) '
+                           'VALUES (%s, %s), (%s, %s), (%s, %s)'))
+
+    def testWhitespace(self):
+        """L{getFingerprint} collapses whitespace."""
+        self.assertEqual('SELECT ? FROM patch',
+                         getFingerprint('  SELECT 1\n    FROM   patch\n'))
+
+
+class SQLProfilerTest(FluidinfoTestCase):
+
+    def testRecord(self):
+        """
+        L{SQLProfiler.record} aggregates statements by fingerprint, for the
+        whole service and for each endpoint.
+        """
+        profiler = SQLProfiler()
+        profiler.record('GET /objects', 'SELECT * FROM tags WHERE id = 1',
+                        timedelta(milliseconds=2), 1)
+        profiler.record('GET /objects', 'SELECT * FROM tags WHERE id = 2',
+                        timedelta(milliseconds=4), 0)
+        profiler.record('GET /values', 'SELECT * FROM tags WHERE id = %s',
+                        timedelta(milliseconds=3), 1)
+        [profile] = profiler.statements.values()
+        self.assertEqual('SELECT * FROM tags WHERE id = ?',
+                         profile.fingerprint)
+        self.assertEqual(3, profile.count)
+        self.assertEqual(9, profile.totalTime)
+        self.assertEqual(4, profile.maxTime)
+        self.assertEqual(2, profile.rows)
+        [profile] = profiler.endpoints['GET /objects'].values()
+        self.assertEqual(2, profile.count)
+        self.assertEqual(6, profile.totalTime)
+
+    def testRecordWithoutEndpoint(self):
+        """
+        L{SQLProfiler.record} only aggregates statements for the whole
+        service if the endpoint isn't known.
+        """
+        profiler = SQLProfiler()
+        profiler.record(None, 'SELECT 1', timedelta(milliseconds=1), 1)
+        self.assertEqual(1, len(profiler.statements))
+        self.assertEqual({}, profiler.endpoints)
+
+    def testRecordWithUnknownRowCount(self):
+        """
+        L{SQLProfiler.record} doesn't count rows when the row count isn't
+        known.
+        """
+        profiler = SQLProfiler()
+        profiler.record(None, 'SELECT 1', timedelta(milliseconds=1), -1)
+        [profile] = profiler.statements.values()
+        self.assertEqual(0, profile.rows)
+
+    def testRecordTooManyFingerprints(self):
+        """
+        L{SQLProfiler.record} aggregates statements as C{<other>} once the
+        maximum number of fingerprints is reached.
+        """
+        profiler = SQLProfiler(maxFingerprints=1)
+        profiler.record(None, 'SELECT 1', timedelta(milliseconds=1), 1)
+        profiler.record(None, 'SELECT * FROM patch',
+                        timedelta(milliseconds=1), 1)
+        self.assertEqual(sorted(['SELECT ?', OTHER_FINGERPRINT]),
+                         sorted(profiler.statements.keys()))
+
+    def testReset(self):
+        """L{SQLProfiler.reset} forgets the statements recorded so far."""
+        profiler = SQLProfiler()
+        profiler.record('GET /objects', 'SELECT 1',
+                        timedelta(milliseconds=1), 1)
+        profiler.reset()
+        self.assertEqual({}, profiler.statements)
+        self.assertEqual({}, profiler.endpoints)
+
+    def testDumps(self):
+        """L{SQLProfiler.dumps} returns a summary of each fingerprint."""
+        profiler = SQLProfiler()
+        profiler.record('GET /objects', 'SELECT 1',
+                        timedelta(milliseconds=2), 1)
+        profiler.record('GET /objects', 'SELECT 2',
+                        timedelta(milliseconds=4), 1)
+        expected = {'fingerprint': 'SELECT ?', 'count': 2, 'total': 6.0,
+                    'mean': 3.0, 'max': 4.0, 'rows': 2}
+        self.assertEqual({'statements': [expected],
+                          'endpoints': {'GET /objects': [expected]}},
+                         profiler.dumps())
+
+    def testReport(self):
+        """
+        L{SQLProfiler.report} returns a table with the most expensive
+        statements.
+        """
+        profiler = SQLProfiler()
+        profiler.record(None, 'SELECT 1', timedelta(milliseconds=2), 1)
+        lines = profiler.report().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual(['count', 'total', 'ms', 'mean', 'ms', 'max', 'ms',
+                          'rows', 'statement'], lines[0].split())
+        self.assertEqual(['1', '2.0', '2.00', '2.0', '1', 'SELECT', '?'],
+                         lines[1].split())
+
+
+class GetProfileRowsTest(FluidinfoTestCase):
+
+    def setUp(self):
+        super(GetProfileRowsTest, self).setUp()
+        profiler = SQLProfiler()
+        for index in range(3):
+            profiler.record('GET /objects', 'SELECT * FROM tags',
+                            timedelta(milliseconds=1), 1)
+        profiler.record('GET /values', 'SELECT * FROM patch',
+                        timedelta(milliseconds=10), 1)
+        self.data = profiler.dumps()
+
+    def testGetProfileRows(self):
+        """
+        L{getProfileRows} returns a header and a row for each fingerprint,
+        sorted by total time.
+        """
+        rows = getProfileRows(self.data)
+        self.assertEqual(
+            [('count', 'total ms', 'mean ms', 'max ms', 'rows', 'statement'),
+             ('1', '10.0', '10.00', '10.0', '1', 'SELECT * FROM patch'),
+             ('3', '3.0', '1.00', '1.0', '3', 'SELECT * FROM tags')],
+            rows)
+
+    def testGetProfileRowsSortedByCount(self):
+        """L{getProfileRows} can sort fingerprints by another column."""
+        rows = getProfileRows(self.data, sortBy='count')
+        self.assertEqual(['SELECT * FROM tags', 'SELECT * FROM patch'],
+                         [row[-1] for row in rows[1:]])
+
+    def testGetProfileRowsWithLimit(self):
+        """L{getProfileRows} only returns the requested number of rows."""
+        rows = getProfileRows(self.data, limit=1)
+        self.assertEqual(2, len(rows))
+
+    def testGetProfileRowsForEndpoint(self):
+        """
+        L{getProfileRows} only returns the statements run for an endpoint,
+        if one is given.
+        """
+        rows = getProfileRows(self.data, endpoint='GET /objects')
+        self.assertEqual(['SELECT * FROM tags'],
+                         [row[-1] for row in rows[1:]])
+        rows = getProfileRows(self.data, endpoint='GET /unknown')
+        self.assertEqual(1, len(rows))
+
+    def testGetProfileRowsWithInvalidSortKey(self):
+        """L{getProfileRows} raises C{ValueError} for unknown columns."""
+        self.assertRaises(ValueError, getProfileRows, self.data,
+                          sortBy='unknown')
+
+
+class GetSQLProfilerTest(FluidinfoTestCase):
+
+    def tearDown(self):
+        setSQLProfiler(None)
+        super(GetSQLProfilerTest, self).tearDown()
+
+    def testGetSQLProfiler(self):
+        """
+        L{getSQLProfiler} returns the L{SQLProfiler} set with
+        L{setSQLProfiler}.
+        """
+        self.assertIdentical(None, getSQLProfiler())
+        profiler = SQLProfiler()
+        setSQLProfiler(profiler)
+        self.assertIdentical(profiler, getSQLProfiler())
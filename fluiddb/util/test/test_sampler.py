@@ -0,0 +1,184 @@
+import sys
+from threading import Event, Thread, currentThread
+import time
+
+from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import Clock
+
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.util.sampler import (
+    MAX_INTERVAL, MIN_INTERVAL, StackSampler, getFrameLabel, getThreadLabel,
+    sampleStacks)
+
+
+class FakeThread(object):
+    """A fake C{threading.Thread} with a name."""
+
+    def __init__(self, name):
+        self.name = name
+
+
+class GetThreadLabelTest(FluidinfoTestCase):
+
+    def testReactorThread(self):
+        """L{getThreadLabel} labels the main thread C{reactor}."""
+        self.assertEqual('reactor', getThreadLabel(FakeThread('MainThread')))
+
+    def testTransactThread(self):
+        """
+        L{getThreadLabel} labels the threads in the L{Transact} thread pool
+        C{transact}.
+        """
+        self.assertEqual(
+            'transact', getThreadLabel(FakeThread('PoolThread-transact-3')))
+
+    def testOtherThread(self):
+        """L{getThreadLabel} returns C{None} for other threads."""
+        self.assertIdentical(None, getThreadLabel(FakeThread('Thread-1')))
+        self.assertIdentical(
+            None, getThreadLabel(FakeThread('PoolThread-twisted-1')))
+
+
+class GetFrameLabelTest(FluidinfoTestCase):
+
+    def testGetFrameLabel(self):
+        """
+        L{getFrameLabel} returns the name of the function and the place it's
+        defined at.
+        """
+        frame = sys._getframe()
+        code = frame.f_code
+        self.assertEqual(
+            'testGetFrameLabel (%s:%d)' % (code.co_filename,
+                                           code.co_firstlineno),
+            getFrameLabel(frame))
+
+
+class StackSamplerTest(FluidinfoTestCase):
+
+    def startThread(self, name):
+        """Start a thread that waits until the test finishes.
+
+        @param name: The name of the thread.
+        """
+        started = Event()
+        finished = Event()
+
+        def wait():
+            started.set()
+            finished.wait()
+
+        thread = Thread(target=wait, name=name)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(finished.set)
+        started.wait()
+
+    def testSample(self):
+        """
+        L{StackSampler.sample} records a collapsed stack for each labelled
+        thread, starting with the label and ending with the innermost frame.
+        """
+        self.startThread('PoolThread-transact-1')
+        self.startThread('Thread-other')
+        sampler = StackSampler()
+        sampler.sample()
+        self.assertEqual(1, sampler.samples)
+        stacks = sorted(sampler.stacks)
+        self.assertEqual(2, len(stacks))
+        reactorStack, transactStack = stacks
+        self.assertTrue(reactorStack.startswith('reactor;'))
+        self.assertIn(';testSample (', reactorStack)
+        self.assertTrue(reactorStack.split(';')[-1].startswith('sample ('))
+        self.assertTrue(transactStack.startswith('transact;'))
+        self.assertIn(';wait (', transactStack)
+
+    def testSampleCountsStacks(self):
+        """
+        L{StackSampler.sample} counts the number of times a stack is seen.
+        """
+        current = currentThread()
+        sampler = StackSampler(
+            getLabel=lambda thread: 'test' if thread is current else None)
+        for _ in range(3):
+            sampler.sample()
+        self.assertEqual(3, sampler.samples)
+        [(stack, count)] = sampler.stacks.items()
+        self.assertTrue(stack.startswith('test;'))
+        self.assertEqual(3, count)
+
+    def testGetCollapsedStacks(self):
+        """
+        L{StackSampler.getCollapsedStacks} returns a line with the count of
+        each stack, sorted by stack.
+        """
+        sampler = StackSampler()
+        sampler.stacks = {'reactor;run (a.py:1)': 3,
+                          'reactor;run (a.py:1);handle (b.py:2)': 1,
+                          'transact;run (c.py:3)': 2}
+        self.assertEqual('reactor;run (a.py:1) 3\n'
+                         'reactor;run (a.py:1);handle (b.py:2) 1\n'
+                         'transact;run (c.py:3) 2\n',
+                         sampler.getCollapsedStacks())
+
+    def testWithInvalidInterval(self):
+        """
+        L{StackSampler} raises C{ValueError} if the interval between samples
+        is shorter than L{MIN_INTERVAL} or longer than L{MAX_INTERVAL}.
+        """
+        self.assertRaises(ValueError, StackSampler, MIN_INTERVAL / 10)
+        self.assertRaises(ValueError, StackSampler, MAX_INTERVAL * 10)
+
+    def testStartAndStop(self):
+        """
+        L{StackSampler.start} takes samples in a thread until
+        L{StackSampler.stop} is called, and at least one sample is taken.
+        L{StackSampler.join} waits for the thread to finish.
+        """
+        sampler = StackSampler(interval=0.001)
+        sampler.start()
+        sampler.stop()
+        sampler.join()
+        self.assertTrue(sampler.samples >= 1)
+        self.assertTrue(
+            any(stack.startswith('reactor;') for stack in sampler.stacks))
+
+    def testStopDoesNotWaitForInterval(self):
+        """
+        L{StackSampler.stop} wakes up the sampling thread, so it finishes
+        without waiting for the rest of the interval between samples.
+        """
+        sampler = StackSampler(interval=MAX_INTERVAL)
+        sampler.start()
+        sampler.stop()
+        start = time.time()
+        sampler.join()
+        self.assertTrue(time.time() - start < MAX_INTERVAL)
+
+
+class SampleStacksTest(FluidinfoTestCase):
+
+    @inlineCallbacks
+    def testSampleStacks(self):
+        """
+        L{sampleStacks} takes samples for the given number of seconds and
+        fires the C{Deferred} it returns with the stopped L{StackSampler},
+        once its thread has been joined without blocking the reactor.
+        """
+        clock = Clock()
+        results = []
+        deferred = sampleStacks(5, interval=0.001, clock=clock)
+        deferred.addCallback(results.append)
+        clock.advance(4)
+        self.assertEqual([], results)
+        clock.advance(1)
+        yield deferred
+        [sampler] = results
+        self.assertTrue(sampler.samples >= 1)
+        self.assertIdentical(None, sampler._thread)
+
+    def testSampleStacksWithInvalidInterval(self):
+        """
+        L{sampleStacks} raises C{ValueError} if the interval is out of range.
+        """
+        self.assertRaises(ValueError, sampleStacks, 1, interval=300)
@@ -1,19 +1,28 @@
 from datetime import datetime, timedelta
+import json
+import os
+import time
+from uuid import uuid4
 
 from psycopg2 import ProgrammingError
 from twisted.internet.defer import inlineCallbacks
 from twisted.web.http import FORBIDDEN
 from twisted.web.http_headers import Headers
 
-from fluiddb.data.store import getMainStore
+from fluiddb.application import FluidinfoSession
+from fluiddb.data.store import ReplicaRouter, getMainStore
 from fluiddb.testing.basic import FluidinfoTestCase
 from fluiddb.testing.doubles import FakeRequest
 from fluiddb.testing.resources import (
     DatabaseResource, LoggingResource, TemporaryDirectoryResource,
     ThreadPoolResource)
+from fluiddb.util.profiler import SQLProfiler, setSQLProfiler
 from fluiddb.util.session import (
-    Session, SessionStorage, HTTPPlugin, LoggingPlugin, TimerPlugin,
-    TransactPlugin)
+    BufferedSessionStorage, CachePlugin, IndexPlugin, Session,
+    SessionStorage, HTTPPlugin, LoggingPlugin, NullLoggingPlugin,
+    NullTimerPlugin, SamplingPolicy, SlowRequestLog, StatementTracer,
+    TimerPlugin, TransactPlugin, getCurrentSession, getSlowRequestLog,
+    setCurrentSession, setSlowRequestLog)
 from fluiddb.util.transact import Transact
 
 
@@ -89,6 +98,176 @@ class SessionStorageTest(FluidinfoTestCase):
             self.assertEqual(data, session.dumps() + '\n')
 
 
+class BufferedSessionStorageTest(FluidinfoTestCase):
+
+    resources = [('fs', TemporaryDirectoryResource()),
+                 ('log', LoggingResource())]
+
+    def createSession(self, id='id'):
+        """Create a L{Session} that has finished."""
+        session = Session(id)
+        session.start()
+        session.stop()
+        return session
+
+    def read(self, path):
+        """Read the contents of a log file."""
+        with open(path, 'r') as stream:
+            return stream.read()
+
+    def testDumpWithoutStarting(self):
+        """
+        L{BufferedSessionStorage.dump} writes sessions immediately if the
+        storage hasn't been started.
+        """
+        path = self.fs.makePath()
+        session = self.createSession()
+        BufferedSessionStorage(path).dump(session)
+        self.assertEqual(session.dumps() + '\n', self.read(path))
+
+    def testStopWritesBufferedSessions(self):
+        """
+        L{BufferedSessionStorage.dump} buffers sessions, which are written
+        when the storage is stopped.
+        """
+        path = self.fs.makePath()
+        storage = BufferedSessionStorage(path, flushInterval=60)
+        storage.start()
+        session1 = self.createSession('id1')
+        session2 = self.createSession('id2')
+        try:
+            storage.dump(session1)
+            storage.dump(session2)
+            self.assertFalse(os.path.exists(path))
+        finally:
+            storage.stop()
+        self.assertEqual(session1.dumps() + '\n' + session2.dumps() + '\n',
+                         self.read(path))
+
+    def testFlushWhenBufferIsFull(self):
+        """
+        L{BufferedSessionStorage} writes buffered sessions as soon as the
+        buffer size is reached.
+        """
+        path = self.fs.makePath()
+        storage = BufferedSessionStorage(path, bufferSize=1,
+                                         flushInterval=60)
+        storage.start()
+        session = self.createSession()
+        try:
+            storage.dump(session)
+            deadline = time.time() + 5
+            while not os.path.exists(path) and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(os.path.exists(path))
+        finally:
+            storage.stop()
+        self.assertEqual(session.dumps() + '\n', self.read(path))
+
+    def testDumpDropsSessionsWhenBackedUp(self):
+        """
+        L{BufferedSessionStorage.dump} drops sessions, instead of buffering
+        them, if too much data is waiting to be written.
+        """
+        path = self.fs.makePath()
+        storage = BufferedSessionStorage(path, flushInterval=60,
+                                         maxPendingSize=10)
+        storage.start()
+        try:
+            storage.dump(self.createSession())
+        finally:
+            storage.stop()
+        self.assertEqual(1, storage.dropped)
+        self.assertFalse(os.path.exists(path))
+
+    def testRotate(self):
+        """
+        L{BufferedSessionStorage} renames the log file before it grows past
+        the maximum file size.
+        """
+        path = self.fs.makePath()
+        session = self.createSession()
+        line = session.dumps() + '\n'
+        storage = BufferedSessionStorage(path, maxFileSize=len(line) + 1)
+        storage.dump(session)
+        storage.dump(session)
+        self.assertEqual(line, self.read(path))
+        self.assertEqual(line, self.read(path + '.1'))
+
+    def testRotateKeepsBackupCount(self):
+        """
+        L{BufferedSessionStorage} only keeps the configured number of
+        rotated log files.
+        """
+        path = self.fs.makePath()
+        storage = BufferedSessionStorage(path, maxFileSize=1, backupCount=2)
+        for id in ['id1', 'id2', 'id3', 'id4']:
+            storage.dump(self.createSession(id))
+        self.assertEqual('id4', json.loads(self.read(path))['id'])
+        self.assertEqual('id3', json.loads(self.read(path + '.1'))['id'])
+        self.assertEqual('id2', json.loads(self.read(path + '.2'))['id'])
+        self.assertFalse(os.path.exists(path + '.3'))
+
+
+class SamplingPolicyTest(FluidinfoTestCase):
+
+    def createSession(self, duration=timedelta(), code=200, sampled=False):
+        """Create a L{Session} that has finished."""
+        session = Session('id', {'http': HTTPPlugin()})
+        session.duration = duration
+        session.http.code = code
+        session.sampled = sampled
+        return session
+
+    def testSample(self):
+        """L{SamplingPolicy.sample} samples every session by default."""
+        policy = SamplingPolicy(random=lambda: 0.99)
+        self.assertTrue(policy.sample())
+
+    def testSampleWithRate(self):
+        """
+        L{SamplingPolicy.sample} samples a fraction of sessions given by the
+        rate.
+        """
+        values = [0.05, 0.5]
+        policy = SamplingPolicy(rate=0.1, random=lambda: values.pop(0))
+        self.assertTrue(policy.sample())
+        self.assertFalse(policy.sample())
+
+    def testSampleWithZeroRate(self):
+        """L{SamplingPolicy.sample} never samples with a rate of C{0}."""
+        policy = SamplingPolicy(rate=0, random=lambda: 0.0)
+        self.assertFalse(policy.sample())
+
+    def testShouldStoreSampledSession(self):
+        """L{SamplingPolicy.shouldStore} stores sampled sessions."""
+        policy = SamplingPolicy(rate=0)
+        self.assertTrue(policy.shouldStore(self.createSession(sampled=True)))
+
+    def testShouldStoreUnsampledSession(self):
+        """
+        L{SamplingPolicy.shouldStore} doesn't store fast and successful
+        sessions that weren't sampled.
+        """
+        policy = SamplingPolicy(rate=0)
+        self.assertFalse(policy.shouldStore(self.createSession()))
+        self.assertFalse(policy.shouldStore(self.createSession(code=404)))
+
+    def testShouldStoreSlowSession(self):
+        """L{SamplingPolicy.shouldStore} always stores slow sessions."""
+        policy = SamplingPolicy(rate=0, slowThreshold=0.5)
+        session = self.createSession(duration=timedelta(seconds=0.5))
+        self.assertTrue(policy.shouldStore(session))
+
+    def testShouldStoreServerError(self):
+        """
+        L{SamplingPolicy.shouldStore} always stores sessions for requests
+        that failed with a server error.
+        """
+        policy = SamplingPolicy(rate=0)
+        self.assertTrue(policy.shouldStore(self.createSession(code=500)))
+
+
 class LoggingPluginTest(FluidinfoTestCase):
 
     resources = [('log', LoggingResource()),
@@ -155,6 +334,163 @@ class LoggingPluginTest(FluidinfoTestCase):
         self.assertEqual(session.log.messages, loadedSession.log.messages)
 
 
+class NullLoggingPluginTest(FluidinfoTestCase):
+
+    resources = [('log', LoggingResource())]
+
+    def testMessagesAreNotCaptured(self):
+        """
+        L{NullLoggingPlugin} writes messages to the root logger without
+        capturing them in the session.
+        """
+        session = Session('id', {'log': NullLoggingPlugin()})
+        session.start()
+        try:
+            session.log.info('Hello, world!')
+        finally:
+            session.stop()
+        self.assertIdentical(None, session.log.messages)
+        self.assertIn('Hello, world!', self.log.getvalue())
+
+    def testErrorsAreCaptured(self):
+        """
+        L{NullLoggingPlugin} captures errors, and the messages written
+        after them, so they're stored with the session.
+        """
+        session = Session('id', {'log': NullLoggingPlugin()})
+        session.start()
+        try:
+            session.log.info('Hello, world!')
+            session.log.error('Something bad happened.')
+            session.log.info('Goodbye, world!')
+        finally:
+            session.stop()
+        self.assertNotIn('Hello, world!', session.log.messages)
+        self.assertIn('Something bad happened.', session.log.messages)
+        self.assertIn('Goodbye, world!', session.log.messages)
+        self.assertIn('Something bad happened.', self.log.getvalue())
+
+    def testExceptionsAreCaptured(self):
+        """
+        L{NullLoggingPlugin} captures exceptions with their tracebacks, so
+        the sessions of unsampled requests that fail can be investigated.
+        """
+        session = Session('id', {'log': NullLoggingPlugin()})
+        session.start()
+        try:
+            try:
+                raise RuntimeError('Something bad happened.')
+            except RuntimeError as error:
+                session.log.exception(error)
+        finally:
+            session.stop()
+        self.assertIn('Traceback', session.log.messages)
+        self.assertIn('RuntimeError: Something bad happened.',
+                      session.log.messages)
+
+    def testDumps(self):
+        """
+        L{NullLoggingPlugin.dumps} doesn't include any messages if nothing
+        failed.
+        """
+        session = Session('id', {'log': NullLoggingPlugin()})
+        session.start()
+        session.stop()
+        self.assertEqual({'messages': None}, session.log.dumps())
+
+
+class FakeConnection(object):
+    """A fake Storm C{Connection} for testing tracers."""
+
+
+class FakeCursor(object):
+    """A fake database cursor that returns C{rowcount} rows."""
+
+    def __init__(self, rowcount):
+        self.rowcount = rowcount
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(statement)
+
+
+class StatementTracerTest(FluidinfoTestCase):
+
+    def tearDown(self):
+        setSQLProfiler(None)
+        super(StatementTracerTest, self).tearDown()
+
+    def traceStatement(self, tracer, statement, rowcount=1):
+        """Trace a statement that succeeds."""
+        connection = FakeConnection()
+        cursor = FakeCursor(rowcount)
+        tracer.connection_raw_execute(connection, cursor, statement, [])
+        tracer.connection_raw_execute_success(connection, cursor, statement,
+                                              [])
+
+    def testProfiler(self):
+        """
+        L{StatementTracer} records successful statements in its
+        L{SQLProfiler}, with the number of rows they returned.
+        """
+        profiler = SQLProfiler()
+        tracer = StatementTracer(60, profiler=profiler,
+                                 endpoint='GET /objects')
+        self.traceStatement(tracer, 'SELECT * FROM tags WHERE id = 1', 3)
+        self.traceStatement(tracer, 'SELECT * FROM tags WHERE id = 2', 1)
+        [profile] = profiler.endpoints['GET /objects'].values()
+        self.assertEqual('SELECT * FROM tags WHERE id = ?',
+                         profile.fingerprint)
+        self.assertEqual(2, profile.count)
+        self.assertEqual(4, profile.rows)
+
+    def testProfilerWithoutRecordingStatements(self):
+        """
+        L{StatementTracer} profiles statements even if it doesn't record
+        their text in the session.
+        """
+        profiler = SQLProfiler()
+        tracer = StatementTracer(60, recordStatements=False,
+                                 profiler=profiler)
+        self.traceStatement(tracer, 'SELECT 1')
+        self.assertEqual(['SELECT ?'], profiler.statements.keys())
+        self.assertNotIn('parameters', tracer.statements[0])
+
+    def testRows(self):
+        """
+        L{StatementTracer} records the number of rows returned or changed by
+        successful statements.
+        """
+        tracer = StatementTracer(60)
+        self.traceStatement(tracer, 'SELECT * FROM tags', 7)
+        [trace] = tracer.statements
+        self.assertEqual(u'SELECT * FROM tags', trace['statement'])
+        self.assertEqual(7, trace['rows'])
+
+    def testWithoutRecordingStatements(self):
+        """
+        L{StatementTracer} records the text of statements, but not their
+        parameters, if it doesn't record statements.
+        """
+        tracer = StatementTracer(60, recordStatements=False)
+        self.traceStatement(tracer, 'SELECT * FROM tags', 2)
+        [trace] = tracer.statements
+        self.assertEqual(['duration', 'rows', 'startDate', 'statement',
+                          'stopDate'], sorted(trace.keys()))
+        self.assertEqual(u'SELECT * FROM tags', trace['statement'])
+
+    def testWithoutRecordingText(self):
+        """
+        L{StatementTracer} only records the timing and rows of statements if
+        it records neither statements nor their text.
+        """
+        tracer = StatementTracer(60, recordStatements=False, recordText=False)
+        self.traceStatement(tracer, 'SELECT * FROM tags', 2)
+        [trace] = tracer.statements
+        self.assertEqual(['duration', 'rows', 'startDate', 'stopDate'],
+                         sorted(trace.keys()))
+
+
 class TransactPluginTest(FluidinfoTestCase):
 
     resources = [('log', LoggingResource()),
@@ -206,6 +542,118 @@ class TransactPluginTest(FluidinfoTestCase):
         self.assertIn('stopDate', trace)
         self.assertIn('duration', trace)
 
+    def testGetEndpointName(self):
+        """
+        L{TransactPlugin._getEndpointName} returns the endpoint of the HTTP
+        request traced by the session.
+        """
+        session = SampleSession('id', self.transact)
+        session.start()
+        try:
+            session.http.trace(FakeRequest(method='PUT', path='/values'))
+            self.assertEqual('PUT /values',
+                             session.transact._getEndpointName())
+        finally:
+            session.stop()
+
+    def testGetEndpointNameWithoutRequest(self):
+        """
+        L{TransactPlugin._getEndpointName} returns C{None} if the session
+        isn't tracing an HTTP request.
+        """
+        session = SampleSession('id', self.transact)
+        session.start()
+        try:
+            self.assertIdentical(None, session.transact._getEndpointName())
+        finally:
+            session.stop()
+
+    @inlineCallbacks
+    def testRunWithoutRecordingStatements(self):
+        """
+        Only the text, timing and rows of statements are captured if the
+        plugin doesn't record statements.
+        """
+
+        def run():
+            store = getMainStore()
+            store.execute('SELECT 1 FROM patch WHERE 1=2')
+
+        plugin = TransactPlugin(self.transact, 60, recordStatements=False)
+        session = Session('id', {'transact': plugin})
+        session.start()
+        try:
+            yield session.transact.run(run)
+        finally:
+            session.stop()
+
+        [transaction] = session.transact.transactions
+        [trace] = transaction['statements']
+        self.assertEqual(['duration', 'rows', 'startDate', 'statement',
+                          'stopDate'], sorted(trace.keys()))
+
+    @inlineCallbacks
+    def testRunWithoutRecordingText(self):
+        """
+        Only the timing and rows of statements are captured if the plugin
+        records neither statements nor their text.
+        """
+
+        def run():
+            store = getMainStore()
+            store.execute('SELECT 1 FROM patch WHERE 1=2')
+
+        plugin = TransactPlugin(self.transact, 60, recordStatements=False,
+                                recordText=False)
+        session = Session('id', {'transact': plugin})
+        session.start()
+        try:
+            yield session.transact.run(run)
+        finally:
+            session.stop()
+
+        [transaction] = session.transact.transactions
+        [trace] = transaction['statements']
+        self.assertEqual(['duration', 'rows', 'startDate', 'stopDate'],
+                         sorted(trace.keys()))
+
+    @inlineCallbacks
+    def testRunRecordsQueueWait(self):
+        """
+        The time a transaction waited for a thread in the L{Transact} thread
+        pool is captured.
+        """
+        session = SampleSession('id', self.transact)
+        session.start()
+        try:
+            yield session.transact.run(lambda: None)
+        finally:
+            session.stop()
+
+        [transaction] = session.transact.transactions
+        self.assertNotIn('runDate', transaction)
+        self.assertTrue(isinstance(transaction['queueWait'], timedelta))
+        self.assertTrue(transaction['queueWait'] <= transaction['duration'])
+        self.assertEqual(transaction['queueWait'],
+                         session.transact.totalQueueWait)
+
+    @inlineCallbacks
+    def testRunSetsCurrentSession(self):
+        """
+        The session is the current session of the thread running the
+        transaction, until the transaction finishes.
+        """
+        session = SampleSession('id', self.transact)
+        session.start()
+        try:
+            result = yield session.transact.run(getCurrentSession)
+        finally:
+            session.stop()
+
+        self.assertIdentical(session, result)
+        currentSession = yield self.transact.run(getCurrentSession)
+        self.assertIdentical(None, currentSession)
+
     @inlineCallbacks
     def testRunTwoTransactions(self):
         """Statements run in two or more transactions are captured."""
@@ -240,6 +688,58 @@ class TransactPluginTest(FluidinfoTestCase):
         self.assertIn('stopDate', trace)
         self.assertIn('duration', trace)
 
+    @inlineCallbacks
+    def testRunReadOnly(self):
+        """Statements run in a read-only transaction are captured."""
+
+        def run():
+            store = getMainStore()
+            store.execute('SELECT 1 FROM patch WHERE 1=2')
+
+        session = SampleSession('id', self.transact)
+        session.start()
+        try:
+            yield session.transact.runReadOnly(run)
+        finally:
+            session.stop()
+
+        [transaction] = session.transact.transactions
+        [trace] = transaction['statements']
+        self.assertEqual('SELECT 1 FROM patch WHERE 1=2', trace['statement'])
+
+    @inlineCallbacks
+    def testRunPinsAuthenticatedUser(self):
+        """
+        A successful transaction run with L{TransactPlugin.run} pins the
+        authenticated user to the C{main} store.
+        """
+        router = ReplicaRouter(['replica-1'], 5, 10, getLag=lambda name: 0.0)
+        transact = Transact(self.threadPool, router=router)
+        session = FluidinfoSession('id', transact)
+        session.start()
+        try:
+            session.auth.login(u'user', uuid4())
+            yield session.transact.run(lambda: None)
+        finally:
+            session.stop()
+        self.assertTrue(router.isPinned(u'user'))
+
+    @inlineCallbacks
+    def testRunDoesNotPinUserAuthenticatedInTransaction(self):
+        """
+        A transaction run with L{TransactPlugin.run} that authenticates the
+        user doesn't pin them to the C{main} store.
+        """
+        router = ReplicaRouter(['replica-1'], 5, 10, getLag=lambda name: 0.0)
+        transact = Transact(self.threadPool, router=router)
+        session = FluidinfoSession('id', transact)
+        session.start()
+        try:
+            yield session.transact.run(session.auth.login, u'user', uuid4())
+        finally:
+            session.stop()
+        self.assertFalse(router.isPinned(u'user'))
+
     @inlineCallbacks
     def testDumpsAndLoads(self):
         """
@@ -446,3 +946,161 @@ class TimerPluginTest(FluidinfoTestCase):
         loadedSession = SampleSession('another-id', self.transact)
         loadedSession.loads(data)
         self.assertEqual(session.timer.events, loadedSession.timer.events)
+
+
+class IndexPluginTest(FluidinfoTestCase):
+
+    def testRecord(self):
+        """
+        L{IndexPlugin.record} captures a Solr query with the number of
+        documents it returned, its C{QTime} and its duration.
+        """
+        plugin = IndexPlugin()
+        startDate = datetime.utcnow()
+        plugin.record(u'paths:"user/tag"', 3, 12, startDate)
+        [query] = plugin.queries
+        self.assertEqual(u'paths:"user/tag"', query['query'])
+        self.assertEqual(3, query['rows'])
+        self.assertEqual(12, query['qtime'])
+        self.assertEqual(startDate, query['startDate'])
+        self.assertTrue(isinstance(query['duration'], timedelta))
+
+    def testDumpsAndLoads(self):
+        """
+        Data stored by an L{IndexPlugin} can be dumped to and loaded from
+        JSON.
+        """
+        session = Session('id', {'index': IndexPlugin()})
+        session.start()
+        session.index.record(u'paths:"user/tag"', 3, 12, datetime.utcnow())
+        session.stop()
+        loadedSession = Session('id', {'index': IndexPlugin()})
+        loadedSession.loads(session.dumps())
+        self.assertEqual(session.index.queries, loadedSession.index.queries)
+
+
+class CachePluginTest(FluidinfoTestCase):
+
+    def testRecord(self):
+        """
+        L{CachePlugin.record} counts cache hits and misses for each key
+        prefix.
+        """
+        plugin = CachePlugin()
+        plugin.record(u'user:', 1, 0)
+        plugin.record(u'user:', 0, 1)
+        plugin.record(u'about:', 2, 3)
+        self.assertEqual({u'user:': 1, u'about:': 2}, plugin.hits)
+        self.assertEqual({u'user:': 1, u'about:': 3}, plugin.misses)
+
+    def testDumpsAndLoads(self):
+        """
+        Data stored by a L{CachePlugin} can be dumped to and loaded from
+        JSON.
+        """
+        session = Session('id', {'cache': CachePlugin()})
+        session.start()
+        session.cache.record(u'user:', 1, 2)
+        session.stop()
+        loadedSession = Session('id', {'cache': CachePlugin()})
+        loadedSession.loads(session.dumps())
+        self.assertEqual({u'user:': 1}, loadedSession.cache.hits)
+        self.assertEqual({u'user:': 2}, loadedSession.cache.misses)
+
+
+class FakeSessionStorage(object):
+    """A fake L{BufferedSessionStorage} that keeps sessions in a list."""
+
+    def __init__(self):
+        self.sessions = []
+
+    def dump(self, session):
+        """Keep a L{Session}."""
+        self.sessions.append(session)
+
+
+class SlowRequestLogTest(FluidinfoTestCase):
+
+    def createSession(self, seconds):
+        """Create a L{Session} that took C{seconds} seconds."""
+        session = Session('id')
+        session.duration = timedelta(seconds=seconds)
+        return session
+
+    def testRecord(self):
+        """
+        L{SlowRequestLog.record} writes sessions that took at least the
+        threshold to its storage.
+        """
+        storage = FakeSessionStorage()
+        log = SlowRequestLog(storage, 2.5)
+        session = self.createSession(2.5)
+        self.assertTrue(log.record(session))
+        self.assertEqual([session], storage.sessions)
+
+    def testRecordWithFastSession(self):
+        """
+        L{SlowRequestLog.record} ignores sessions that took less than the
+        threshold.
+        """
+        storage = FakeSessionStorage()
+        log = SlowRequestLog(storage, 2.5)
+        self.assertFalse(log.record(self.createSession(2)))
+        self.assertEqual([], storage.sessions)
+
+    def testGetAndSetSlowRequestLog(self):
+        """
+        L{setSlowRequestLog} registers the L{SlowRequestLog} returned by
+        L{getSlowRequestLog}.
+        """
+        log = SlowRequestLog(FakeSessionStorage(), 1)
+        setSlowRequestLog(log)
+        self.addCleanup(setSlowRequestLog, None)
+        self.assertIdentical(log, getSlowRequestLog())
+
+
+class CurrentSessionTest(FluidinfoTestCase):
+
+    def testGetCurrentSession(self):
+        """
+        L{getCurrentSession} returns the L{Session} set for the thread with
+        L{setCurrentSession}.
+        """
+        self.assertIdentical(None, getCurrentSession())
+        session = Session('id')
+        setCurrentSession(session)
+        self.addCleanup(setCurrentSession, None)
+        self.assertIdentical(session, getCurrentSession())
+
+
+class NullTimerPluginTest(FluidinfoTestCase):
+
+    def testTrack(self):
+        """
+        L{NullTimerPlugin.track} returns a context manager that only records
+        the duration of the event, so that it can be included in metrics.
+        """
+        session = Session('id', {'timer': NullTimerPlugin()})
+        session.start()
+        try:
+            with session.timer.track('test'):
+                pass
+        finally:
+            session.stop()
+        [event] = session.timer.events['test']
+        self.assertEqual(['duration'], event.keys())
+        self.assertTrue(isinstance(event['duration'], timedelta))
+
+    def testDumps(self):
+        """
+        L{NullTimerPlugin.dumps} returns an empty C{dict}, so the durations
+        it captures aren't written to the trace log.
+        """
+        session = Session('id', {'timer': NullTimerPlugin()})
+        session.start()
+        try:
+            with session.timer.track('test'):
+                pass
+        finally:
+            session.stop()
+        self.assertEqual({}, session.timer.dumps())
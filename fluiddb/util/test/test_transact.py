@@ -3,6 +3,7 @@ from storm.exceptions import DisconnectionError
 import transaction
 from twisted.internet.defer import inlineCallbacks
 
+from fluiddb.data.store import ReplicaRouter, getStoreName
 from fluiddb.testing.basic import FluidinfoTestCase
 from fluiddb.testing.doubles import FakeThreadPool
 from fluiddb.testing.resources import LoggingResource
@@ -202,3 +203,75 @@ class TransactTest(FluidinfoTestCase):
         """
         transact = Transact(FakeThreadPool())
         self.assertIdentical(transaction, transact._transaction)
+
+
+class FakeTransactionManager(object):
+
+    def commit(self):
+        self.committed = True
+
+    def abort(self):
+        self.aborted = True
+
+
+class TransactReadOnlyTest(FluidinfoTestCase):
+
+    def setUp(self):
+        super(TransactReadOnlyTest, self).setUp()
+        self.router = ReplicaRouter(['replica-1'], 5, 10,
+                                    getLag=lambda name: 0.0)
+
+    @inlineCallbacks
+    def testRunReadOnly(self):
+        """
+        L{Transact.runReadOnly} runs a function against the store chosen by
+        its L{ReplicaRouter} and restores the default store afterwards.
+        """
+        manager = FakeTransactionManager()
+        transact = Transact(FakeThreadPool(), manager, router=self.router)
+        result = yield transact.runReadOnly(u'user', getStoreName)
+        self.assertEqual('replica-1', result)
+        self.assertEqual('main', getStoreName())
+        self.assertTrue(manager.committed)
+
+    @inlineCallbacks
+    def testRunReadOnlyWithPinnedClient(self):
+        """
+        L{Transact.runReadOnly} runs a function against the C{main} store if
+        the client has been pinned with L{Transact.pin}.
+        """
+        transact = Transact(FakeThreadPool(), FakeTransactionManager(),
+                            router=self.router)
+        transact.pin(u'user')
+        result = yield transact.runReadOnly(u'user', getStoreName)
+        self.assertEqual('main', result)
+        result = yield transact.runReadOnly(u'other', getStoreName)
+        self.assertEqual('replica-1', result)
+
+    @inlineCallbacks
+    def testRunReadOnlyWithoutRouter(self):
+        """
+        L{Transact.runReadOnly} runs a function against the C{main} store if
+        no L{ReplicaRouter} is configured.
+        """
+        transact = Transact(FakeThreadPool(), FakeTransactionManager())
+        transact.pin(u'user')
+        result = yield transact.runReadOnly(u'user', getStoreName)
+        self.assertEqual('main', result)
+
+    @inlineCallbacks
+    def testRunReadOnlyRestoresStoreNameOnFailure(self):
+        """
+        L{Transact.runReadOnly} restores the default store if the function
+        raises an exception.
+        """
+        manager = FakeTransactionManager()
+        transact = Transact(FakeThreadPool(), manager, router=self.router)
+
+        def function():
+            raise RuntimeError('Failed.')
+
+        yield self.assertFailure(transact.runReadOnly(u'user', function),
+                                 RuntimeError)
+        self.assertEqual('main', getStoreName())
+        self.assertTrue(manager.aborted)
@@ -10,6 +10,8 @@ from txsolr.errors import HTTPRequestError, HTTPWrongStatus
 from twisted.internet import reactor
 from twisted.internet.threads import deferToThreadPool
 
+from fluiddb.data.store import getStoreName, setStoreName
+
 
 MAX_RETRIES = 3
 
@@ -23,12 +25,17 @@ class Transact(object):
 
     @param threadPool: The C{ThreadPool} to get threads from.
     @param _transaction: The C{TransactionManager} to use, for test cases only.
+    @param router: Optionally, the L{ReplicaRouter} to use to choose a store
+        for read-only transactions.  Default is to always use the C{main}
+        store.
     """
 
-    def __init__(self, threadPool, _transaction=None, sleep=None):
+    def __init__(self, threadPool, _transaction=None, sleep=None,
+                 router=None):
         self._threadPool = threadPool
         self._transaction = _transaction or transaction
         self._sleep = sleep or time.sleep
+        self._router = router
 
     def run(self, function, *args, **kwargs):
         """Run C{function} in a thread.
@@ -45,6 +52,52 @@ class Transact(object):
         return deferToThreadPool(reactor, self._threadPool, self._transact,
                                  function, *args, **kwargs)
 
+    def runReadOnly(self, key, function, *args, **kwargs):
+        """Run C{function} in a thread, possibly against a replica.
+
+        This is like L{Transact.run}, but C{function} must not write to the
+        database.  Its transaction is run against the store chosen by the
+        L{ReplicaRouter}, if one is configured.
+
+        @param key: The key identifying the client running the transaction,
+            which may be pinned to the C{main} store, or C{None}.
+        @param function: The function to run.
+        @param args: Positional arguments to pass to C{function}.
+        @param kwargs: Keyword arguments to pass to C{function}.
+        @return: A C{Deferred} that will fire after the function has been run.
+        """
+        return deferToThreadPool(reactor, self._threadPool,
+                                 self._transactReadOnly, key, function,
+                                 *args, **kwargs)
+
+    def pin(self, key):
+        """Pin a client that has just written to the C{main} store.
+
+        @param key: The key identifying the client.
+        """
+        if self._router is not None:
+            self._router.pin(key)
+
+    def _transactReadOnly(self, key, function, *args, **kwargs):
+        """
+        Run C{function} against the store chosen by the L{ReplicaRouter} and
+        commit or abort the transaction, depending on the outcome.
+
+        @param key: The key identifying the client running the transaction.
+        @param function: The function to run.
+        @param args: Positional arguments to pass to C{function}.
+        @param kwargs: Keyword arguments to pass to C{function}.
+        @return: The result of invoking C{function}.
+        """
+        if self._router is None:
+            return self._transact(function, *args, **kwargs)
+        previousName = getStoreName()
+        setStoreName(self._router.getStoreName(key))
+        try:
+            return self._transact(function, *args, **kwargs)
+        finally:
+            setStoreName(previousName)
+
     def _transact(self, function, *args, **kwargs):
         """
         Run C{function} and commit or abort the transaction, depending on the
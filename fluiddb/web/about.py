@@ -5,9 +5,11 @@ from twisted.web import http
 from twisted.internet import defer
 # from twisted.python import log
 
+from fluiddb.application import getConfig
 from fluiddb.common import error, defaults
 from fluiddb.common import paths
 from fluiddb.web import util, payloads, mimeparse
+from fluiddb.web.compression import CompressionOptions
 from fluiddb.web.query import (
     guessValue, createThriftValue, createBinaryThriftValue)
 from fluiddb.web.resource import (
@@ -106,16 +108,27 @@ class AboutTagInstanceResource(WSFEResource):
 
         # This will raise TNoInstanceOnObject if there's no instance,
         # and that will return a 404 (see util.py).
+        # HEAD requests only need the metadata of binary values, so their
+        # contents are never loaded.
         tvalue, tagValue = yield self.facadeClient.getTagInstance(
-            self.session, self.path, self.objectId)
+            self.session, self.path, self.objectId,
+            withContents=(verb == 'GET'))
         value = guessValue(tvalue)
         accept = request.getHeader('accept') or '*/*'
 
         if tvalue.valueType == ThriftValueType.BINARY_TYPE:
             contentType = tvalue.binaryKeyMimeType
             if mimeparse.best_match([contentType], accept) == '':
+                util.dropBody(value)
                 raise error.NotAcceptable()
+            # The body is an open file, which is streamed to the client, or
+            # None for HEAD requests.
             body = value
+            contentLength = tagValue.value['size']
+            # Binary values are streamed without being compressed, so the
+            # file ID identifies the only representation that's sent.
+            etag = '"%s"' % tagValue.fileID
+            request.setHeader('Content-type', contentType)
             # Mark this value as unwrappable for JSON
             request._fluiddb_jsonp_unwrappable = None
         else:
@@ -128,19 +141,21 @@ class AboutTagInstanceResource(WSFEResource):
             except KeyError:
                 raise TInternalError('No serializer for %r.' % contentType)
             else:
-                body = serializer(value)
+                options = CompressionOptions.fromConfig(getConfig())
+                body, etag = util.getPrimitiveValueBody(
+                    request, serializer(value), contentType, options)
+                contentLength = len(body)
 
             typeValue = self._getTypeHeader(tvalue.valueType)
             request.setHeader(util.buildHeader('Type'), typeValue)
 
-        request.setHeader('Content-length', str(len(body)))
-        request.setHeader('Content-type', contentType)
-        # setting the Last-Modified header for fluiddb/id makes no sense
+        lastModified = None
         if tagValue and tagValue.creationTime:
-            request.setHeader(
-                'Last-modified',
-                tagValue.creationTime.strftime('%a, %d %b %Y %H:%M:%S'))
-        request.setResponseCode(usage.successCode)
+            lastModified = tagValue.creationTime
+        body = util.getTagValueResponse(
+            request, body, contentLength, etag, lastModified,
+            usage.successCode,
+            acceptRanges=(tvalue.valueType == ThriftValueType.BINARY_TYPE))
         defer.returnValue(body)
 
     def deferred_render_GET(self, request):
@@ -172,7 +187,7 @@ class AboutTagInstanceResource(WSFEResource):
                  response is always empty) once the request has completed.
         """
         d = self._GET_HEAD_common(request, 'HEAD')
-        d.addCallback(lambda _: '')
+        d.addCallback(util.dropBody)
         return d
 
     @defer.inlineCallbacks
@@ -578,6 +593,8 @@ usage.addReturn(Return(
     'If you do not specify an ' + apiDoc.ACCEPT + """ header value that
     allows the tag value to be returned."""))
 
+apiDoc.addConditionalGet(usage)
+
 usage.addReturn(Return(
     apiDoc.httpCode(usage.successCode),
     'If the object has an instance of the tag and the requesting user has ' +
@@ -692,6 +709,7 @@ usage = HTTPUsage(
 usage.resourceClass = AboutTagInstanceResource
 usage.successCode = http.NO_CONTENT
 usage.unformattedPayloadPermitted = True
+usage.spooledPayloadPermitted = True
 topLevel.addUsage(usage)
 
 usage.addReturn(Return(
@@ -704,6 +722,10 @@ usage.addReturn(Return(
 
 apiDoc.addBadRequestPayload(usage)
 
+usage.addReturn(Return(
+    apiDoc.REQUEST_ENTITY_TOO_LARGE,
+    'If the payload is larger than the maximum size of a tag value.'))
+
 usage.addReturn(Return(
     apiDoc.httpCode(usage.successCode),
     'If the tag is successfully created / updated on the object.'))
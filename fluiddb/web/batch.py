@@ -0,0 +1,243 @@
+import types
+from uuid import UUID
+
+from twisted.internet import defer
+from twisted.web import http
+
+from fluiddb.api.value import TagValueOperation
+from fluiddb.common import error
+from fluiddb.common.util import thriftExceptions
+from fluiddb.doc.api.http import apiDoc
+from fluiddb.doc.api.http.registry import (
+    registry, HTTPTopLevel, HTTPUsage, JSONPayload, PayloadField, Note,
+    Return, HTTPExample)
+from fluiddb.web import payloads
+from fluiddb.web.resource import WSFEResource, _thriftExceptionToHTTPCode
+
+httpBatchCategoryName = 'batch'
+operationsArg = 'operations'
+resultsKey = 'results'
+
+# The HTTP status of a successful operation, for each method.
+_successCodes = {'GET': http.OK,
+                 'PUT': http.NO_CONTENT,
+                 'DELETE': http.NO_CONTENT}
+
+
+class BatchResource(WSFEResource):
+    """Handler for the C{/batch} API endpoint.
+
+    Many GET, PUT and DELETE operations on tag instances are run in a single
+    request and transaction, instead of one request for each.
+    """
+
+    allowedMethods = ('POST', 'OPTIONS')
+    isLeaf = True
+
+    @defer.inlineCallbacks
+    def deferred_render_POST(self, request):
+        """Run a batch of tag instance operations given in a JSON payload.
+
+        @param request: The incoming C{twisted.web.server.Request} request.
+        @return: A C{Deferred} that will fire with the JSON response, which
+            has the status of each operation, in the same order as the
+            operations in the request.
+        """
+        usage = registry.findUsage(httpBatchCategoryName, 'POST',
+                                   BatchResource)
+        dictionary = registry.checkRequest(usage, request)
+        responseType = usage.getResponsePayloadTypeFromAcceptHeader(request)
+        operations = [parseOperation(operation)
+                      for operation in dictionary[operationsArg]]
+        if not operations:
+            raise error.MalformedPayload('Batch was empty.')
+
+        results = yield self.facadeClient.runBatch(self.session, operations)
+
+        responseDict = {resultsKey: [
+            formatResult(operation, result)
+            for operation, result in zip(operations, results)]}
+        registry.checkResponse(responseType, responseDict, usage, request)
+        body = payloads.buildPayload(responseType, responseDict)
+        request.setHeader('Content-length', str(len(body)))
+        request.setHeader('Content-type', responseType)
+        request.setResponseCode(usage.successCode)
+        defer.returnValue(body)
+
+
+def parseOperation(operation):
+    """Get a L{TagValueOperation} from an operation in a batch payload.
+
+    @param operation: A C{dict} with the C{method}, C{path}, either C{id} or
+        C{about} and, for C{PUT}, the C{value} of an operation.
+    @raise MalformedPayload: Raised if the operation isn't valid.
+    @return: A L{TagValueOperation}.
+    """
+    method = operation.get('method')
+    if method not in _successCodes:
+        raise error.MalformedPayload(
+            'Operation method must be GET, PUT or DELETE.')
+    path = operation.get('path')
+    if not isinstance(path, unicode):
+        raise error.MalformedPayload('Operation path must be a string.')
+
+    objectId = operation.get('id')
+    about = operation.get('about')
+    if (objectId is None) == (about is None):
+        raise error.MalformedPayload(
+            'Operation must have either an id or an about value.')
+    if objectId is not None:
+        try:
+            objectId = str(UUID(objectId))
+        except (AttributeError, TypeError, ValueError):
+            raise error.MalformedPayload('Operation id is not a valid UUID.')
+    elif isinstance(about, unicode):
+        about = about.encode('utf-8')
+    else:
+        raise error.MalformedPayload('Operation about must be a string.')
+
+    value = None
+    if method == 'PUT':
+        if 'value' not in operation:
+            raise error.MalformedPayload('PUT operation must have a value.')
+        value = operation['value']
+        if isinstance(value, list):
+            if not all(isinstance(item, unicode) for item in value):
+                raise error.MalformedPayload(
+                    'Operation value list must only contain strings.')
+            value = [item.encode('utf-8') for item in value]
+        elif type(value) not in (bool, int, float, unicode, types.NoneType):
+            raise error.UnsupportedJSONType()
+
+    return TagValueOperation(method, path.encode('utf-8'), objectId=objectId,
+                             about=about, value=value)
+
+
+def formatResult(operation, result):
+    """Get the status of an operation in a batch, for the response.
+
+    @param operation: The L{TagValueOperation} that was run.
+    @param result: The C{dict} with the value that was read, C{None} or
+        Thrift exception returned for the operation by
+        L{FacadeTagValueMixin.runBatch}.
+    @return: A C{dict} with the HTTP C{status} of the operation and either
+        the value that was read or details of the error.
+    """
+    if isinstance(result, Exception):
+        status = _thriftExceptionToHTTPCode.get(result.__class__,
+                                                http.INTERNAL_SERVER_ERROR)
+        formatted = {'status': status,
+                     'error-class': result.__class__.__name__}
+        for tag in thriftExceptions.get(result.__class__, ()):
+            value = getattr(result, tag)
+            if value is not None:
+                formatted[tag] = value
+        return formatted
+
+    formatted = {'status': _successCodes[operation.method]}
+    if result is not None:
+        value = result['value']
+        if isinstance(value, dict):
+            formatted['value-type'] = value['mime-type']
+            formatted['size'] = value['size']
+        elif isinstance(value, UUID):
+            formatted['value'] = str(value)
+        else:
+            formatted['value'] = value
+        formatted['updated-at'] = result['updated-at'].isoformat()
+        formatted['username'] = result['username']
+    return formatted
+
+
+# ------------------------------ Batch POST -----------------------------
+topLevel = HTTPTopLevel(httpBatchCategoryName, 'POST')
+topLevel.description = """The POST method on batch runs many operations on
+    tag values in a single request."""
+registry.register(topLevel)
+
+# --- POST /batch -------------------------------------------------------
+
+usage = HTTPUsage('', """Get, set and delete the values of tags on objects,
+    given by their ids or about values, in a single request.  All the
+    operations run in the same transaction.""")
+usage.resourceClass = BatchResource
+usage.successCode = http.OK
+topLevel.addUsage(usage)
+
+apiDoc.addBadRequestPayload(usage)
+
+apiDoc.addCannotRespondWithPayload(usage)
+
+usage.addReturn(Return(
+    apiDoc.BAD_REQUEST,
+    'If the list of operations is empty or an operation is malformed.'))
+
+usage.addReturn(Return(
+    apiDoc.httpCode(usage.successCode),
+    """The operations were run.  The status of each operation is given in
+    the response payload."""))
+
+requestPayload = JSONPayload()
+requestPayload.addField(PayloadField(
+    operationsArg, list,
+    """A list of operations.  Each one is a dictionary with a method of
+    GET, PUT or DELETE, the path of a tag, the id or the about value of an
+    object and, for PUT, the primitive value to set.""",
+    listType=dict))
+usage.addRequestPayload(requestPayload)
+
+responsePayload = JSONPayload()
+responsePayload.addField(PayloadField(
+    resultsKey, list,
+    """A list with the result of each operation, in the same order as the
+    operations in the request.  Each result has the HTTP status the
+    operation would have had as a separate request.  GET results also
+    have the value that was read and failed operations have the class of
+    the error.""",
+    listType=dict))
+usage.addResponsePayload(responsePayload)
+
+usage.addNote(Note(
+    """Permissions for all the operations are checked together.  An
+    operation that fails doesn't stop the others from running."""))
+
+usage.addNote(Note(
+    """Values are read before any are changed.  If more than one
+    operation sets or deletes the same tag on the same object, the last one
+    wins."""))
+
+usage.addNote(Note(
+    """Objects are created for unknown about values in PUT operations.
+    Binary values can't be set in a batch and only the type and size of
+    binary values are returned by GET operations."""))
+
+request = '''POST /batch HTTP/1.1
+Authorization: Basic XXXXXXXX
+Content-Length: XXXXXXXX
+Content-Type: application/json
+
+{
+  "operations": [
+    {"method": "PUT", "about": "book:Dune", "path": "ntoll/rating",
+     "value": 9},
+    {"method": "GET", "id": "9c8e4b12-4b7d-40d2-865b-d5b1945350b1",
+     "path": "ntoll/seen"},
+    {"method": "DELETE", "id": "9c8e4b12-4b7d-40d2-865b-d5b1945350b1",
+     "path": "ntoll/opinion"}
+  ]
+}'''
+response = '''HTTP/1.1 200 OK
+Content-Length: XXXXXXXX
+Date: Mon, 02 Aug 2010 13:00:29 GMT
+Content-Type: application/json
+
+{"results": [
+  {"status": 204},
+  {"status": 200, "value": true, "username": "ntoll",
+   "updated-at": "2012-06-21T14:32:03.571429"},
+  {"status": 401, "error-class": "TPathPermissionDenied",
+   "category": "tag-values", "action": "delete", "path": "ntoll/opinion"}
+]}'''
+description = """Rate the book 'Dune', read a tag from another object and
+try to delete a tag value without permission."""
+usage.addExample(HTTPExample(request, response, description))
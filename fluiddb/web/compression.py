@@ -0,0 +1,233 @@
+"""Compression of response bodies, negotiated with C{Accept-Encoding}."""
+
+import zlib
+
+from twisted.internet.defer import succeed
+from twisted.internet.threads import deferToThread
+
+
+# Bodies smaller than this, in bytes, aren't worth compressing.
+DEFAULT_MIN_SIZE = 1024
+
+# The zlib compression level, from 1 (fastest) to 9 (smallest).
+DEFAULT_LEVEL = 6
+
+# Bodies larger than this, in bytes, are compressed in a thread, so the
+# reactor isn't blocked.
+DEFAULT_THREAD_SIZE = 262144
+
+# The window size that makes zlib write a gzip header and trailer.
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+SUPPORTED_ENCODINGS = ('gzip', 'deflate')
+
+
+class CompressionOptions(object):
+    """Settings for compressing response bodies.
+
+    @param minSize: The size, in bytes, of the smallest body to compress.
+    @param level: The zlib compression level.
+    @param threadSize: The size, in bytes, above which bodies are compressed
+        in a thread.
+    """
+
+    def __init__(self, minSize=DEFAULT_MIN_SIZE, level=DEFAULT_LEVEL,
+                 threadSize=DEFAULT_THREAD_SIZE):
+        self.minSize = minSize
+        self.level = level
+        self.threadSize = threadSize
+
+    @classmethod
+    def fromConfig(cls, config):
+        """Load settings from the C{service} section of a configuration.
+
+        The C{compression-min-size}, C{compression-level} and
+        C{compression-thread-size} options are all optional.
+
+        @param config: The configuration instance, or C{None} to use the
+            defaults.
+        @return: A L{CompressionOptions} instance.
+        """
+        options = cls()
+        if config is None:
+            return options
+        if config.has_option('service', 'compression-min-size'):
+            options.minSize = config.getint('service', 'compression-min-size')
+        if config.has_option('service', 'compression-level'):
+            options.level = config.getint('service', 'compression-level')
+        if config.has_option('service', 'compression-thread-size'):
+            options.threadSize = config.getint('service',
+                                               'compression-thread-size')
+        return options
+
+
+def getContentEncoding(request):
+    """Choose a content coding for a response from C{Accept-Encoding}.
+
+    C{gzip} is preferred over C{deflate} when the client accepts both
+    equally.
+
+    @param request: The HTTP request.
+    @return: C{'gzip'}, C{'deflate'} or C{None} if the response shouldn't be
+        compressed.
+    """
+    header = request.getHeader('accept-encoding')
+    if not header:
+        return None
+    qualities = {}
+    for item in header.split(','):
+        name, _, parameters = item.partition(';')
+        quality = 1.0
+        for parameter in parameters.split(';'):
+            key, _, value = parameter.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    bestEncoding = None
+    bestQuality = 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > bestQuality:
+            bestEncoding, bestQuality = encoding, quality
+    return bestEncoding
+
+
+def isCompressible(contentType):
+    """Determine whether a content type is worth compressing.
+
+    Textual types, such as JSON and JavaScript, compress well.  Binary tag
+    values, such as images, are usually compressed already.
+
+    @param contentType: The value of the C{Content-Type} header, or C{None}.
+    @return: C{True} if the content type should be compressed.
+    """
+    if contentType is None:
+        return False
+    mimeType = contentType.split(';')[0].strip().lower()
+    return (mimeType.startswith('text/') or mimeType.endswith('json') or
+            mimeType.endswith('javascript') or mimeType.endswith('xml'))
+
+
+def getResponseEncoding(request, contentType, size, options):
+    """Get the content coding L{compressResponse} will use for a body.
+
+    @param request: The HTTP request.
+    @param contentType: The value of the C{Content-Type} header, or C{None}.
+    @param size: The size of the uncompressed body in bytes.
+    @param options: The L{CompressionOptions} to use.
+    @return: C{'gzip'}, C{'deflate'} or C{None} if the body will be sent
+        uncompressed.
+    """
+    if size < options.minSize or not isCompressible(contentType):
+        return None
+    return getContentEncoding(request)
+
+
+def getEntityTag(request, tag, contentType, size, options):
+    """Build a strong entity tag for the representation of a body.
+
+    A strong entity tag must differ for each content coding of a body, as
+    described in RFC 2616 section 13.3.3, so the coding the body will be
+    compressed with, if any, is added to the tag.
+
+    @param request: The HTTP request.
+    @param tag: The C{str} that identifies the uncompressed body.
+    @param contentType: The value of the C{Content-Type} header, or C{None}.
+    @param size: The size of the uncompressed body in bytes.
+    @param options: The L{CompressionOptions} to use.
+    @return: The quoted entity tag, like C{"<tag>"} or C{"<tag>-gzip"}.
+    """
+    encoding = getResponseEncoding(request, contentType, size, options)
+    if encoding is None:
+        return '"%s"' % tag
+    return '"%s-%s"' % (tag, encoding)
+
+
+def _createCompressor(encoding, level):
+    """Create a zlib compressor for a content coding.
+
+    @param encoding: C{'gzip'} or C{'deflate'}.
+    @param level: The zlib compression level.
+    @return: A zlib compression object.
+    """
+    wbits = GZIP_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+
+def compress(data, encoding, level=DEFAULT_LEVEL):
+    """Compress a complete response body.
+
+    @param data: The C{str} body to compress.
+    @param encoding: C{'gzip'} or C{'deflate'}.
+    @param level: Optionally, the zlib compression level.
+    @return: The compressed C{str}.
+    """
+    compressor = _createCompressor(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+class StreamCompressor(object):
+    """Compress a response body that's written in chunks.
+
+    Each chunk is flushed, so the client can decode it as soon as it
+    arrives.
+
+    @param encoding: C{'gzip'} or C{'deflate'}.
+    @param level: Optionally, the zlib compression level.
+    """
+
+    def __init__(self, encoding, level=DEFAULT_LEVEL):
+        self._compressor = _createCompressor(encoding, level)
+
+    def compress(self, data):
+        """Compress a chunk of the body.
+
+        @param data: The C{str} chunk to compress.
+        @return: The compressed C{str}.
+        """
+        return (self._compressor.compress(data) +
+                self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def flush(self):
+        """Finish the compressed stream.
+
+        @return: The C{str} with the end of the compressed stream.
+        """
+        return self._compressor.flush()
+
+
+def compressResponse(request, body, options):
+    """Compress a response body, if the client accepts a compressed one.
+
+    The body must be complete, so this is done after any JSONP C{callback}
+    wrapping.  The C{Content-Encoding}, C{Content-Length} and C{Vary}
+    headers are updated to match.
+
+    @param request: The HTTP request.
+    @param body: The C{str} body of the response.
+    @param options: The L{CompressionOptions} to use.
+    @return: A C{Deferred} that fires with the body to send.
+    """
+    contentType = request.responseHeaders.getRawHeaders('content-type',
+                                                        [None])[-1]
+    if len(body) < options.minSize or not isCompressible(contentType):
+        return succeed(body)
+    request.setHeader('Vary', 'Accept-Encoding')
+    encoding = getContentEncoding(request)
+    if encoding is None:
+        return succeed(body)
+
+    def setHeaders(compressed):
+        request.setHeader('Content-Encoding', encoding)
+        request.setHeader('Content-Length', str(len(compressed)))
+        return compressed
+
+    if len(body) > options.threadSize:
+        deferred = deferToThread(compress, body, encoding, options.level)
+    else:
+        deferred = succeed(compress(body, encoding, options.level))
+    return deferred.addCallback(setHeaders)
@@ -1,9 +1,10 @@
 from json import dumps
 import logging
 
-from twisted.internet.defer import succeed
+from twisted.internet.defer import gatherResults, maybeDeferred, succeed
 from twisted.web.http import BAD_REQUEST, OK, UNAUTHORIZED
 
+from fluiddb.application import getConfig
 from fluiddb.common import error, defaults
 from fluiddb.security.exceptions import PermissionDeniedError
 from fluiddb.web.payloads import (
@@ -18,6 +19,23 @@ JSONRPC_INVALID_PARAMS = -32602
 JSONRPC_INTERNAL_ERROR = -32603
 JSONRPC_PARSE_ERROR = -32700
 
+# The largest number of calls accepted in a batch, unless the
+# jsonrpc-max-batch-size option is set.
+DEFAULT_MAX_BATCH_SIZE = 100
+
+
+def getMaxBatchSize(config):
+    """Get the maximum number of calls in a batch.
+
+    @param config: The configuration instance, or C{None} to use the
+        default.
+    @return: The maximum number of calls in a batch.
+    """
+    if (config is not None and
+            config.has_option('service', 'jsonrpc-max-batch-size')):
+        return config.getint('service', 'jsonrpc-max-batch-size')
+    return DEFAULT_MAX_BATCH_SIZE
+
 
 class JSONRPCError(Exception):
     """Raised to indicate an expected error from a JSON-RPC method."""
@@ -44,6 +62,12 @@ class JSONRPCResource(WSFEResource):
         http://www.simple-is-better.org/json-rpc/jsonrpc20.html
         Error codes are taken from the specification.
 
+        A batch of calls can be sent as a JSON array of request objects.  The
+        calls are run concurrently, with the session authenticated for the
+        HTTP request, and their responses are returned in a JSON array in
+        the same order.  Batches with more calls than the
+        C{jsonrpc-max-batch-size} are rejected with a single error.
+
         @param request: A C{twisted.web.server.Request} specifying
             meta-information about the request.
         @return: A C{Deferred} that will fire with the body of the
@@ -77,9 +101,17 @@ class JSONRPCResource(WSFEResource):
                                   ' ... <payload truncated for logging>')
             logging.info('JSON RPC error. Request payload: %s. '
                          'Response payload: %s' % (requestPayload, body))
+            request.setHeader(errorHeader, request._fluidDB_reqid)
+            return body
+
+        def _sendResponse(body):
+            """Set the headers to send a response.
+
+            @param body: The C{str} body of the response.
+            @return: The C{str} body of the response.
+            """
             request.setHeader('Content-length', str(len(body)))
             request.setHeader('Content-type', 'application/json')
-            request.setHeader(errorHeader, request._fluidDB_reqid)
             request.setResponseCode(OK)
             return body
 
@@ -97,7 +129,7 @@ class JSONRPCResource(WSFEResource):
             """
             body = _prepareErrorResponse(requestID, code, message,
                                          requestPayload)
-            return succeed(body)
+            return succeed(_sendResponse(body))
 
         # Fail if the content-type header isn't correct.
         contentType = request.getHeader('content-type')
@@ -140,49 +172,104 @@ class JSONRPCResource(WSFEResource):
                                      'Payload was not valid JSON.',
                                      requestPayload=rawPayload)
 
+        if isinstance(payload, list):
+            # Fail if the batch is empty. See JSONRPC spec.
+            if not payload:
+                return _synchronousError(None, JSONRPC_INVALID_REQUEST,
+                                         'Batch was empty.',
+                                         requestPayload=rawPayload)
+            # Fail if the batch is too large, so a single request can't
+            # start an unbounded number of concurrent calls.
+            maxBatchSize = getMaxBatchSize(getConfig())
+            if len(payload) > maxBatchSize:
+                return _synchronousError(
+                    None, JSONRPC_INVALID_REQUEST,
+                    'Batch has more than %d calls.' % maxBatchSize,
+                    requestPayload=rawPayload)
+            deferreds = []
+            for call in payload:
+                if isinstance(call, dict):
+                    deferred = self._call(request, call, dumps(call),
+                                          _prepareErrorResponse)
+                else:
+                    # Fail: each call in a batch must be an object. See
+                    # JSONRPC spec.
+                    deferred = succeed(_prepareErrorResponse(
+                        None, JSONRPC_INVALID_REQUEST,
+                        'Request was not a JSON object.',
+                        requestPayload=dumps(call)))
+                deferreds.append(deferred)
+            deferred = gatherResults(deferreds)
+            deferred.addCallback(lambda bodies: '[%s]' % ', '.join(bodies))
+            return deferred.addCallback(_sendResponse)
+
         # Fail if the payload was not a dict (i.e., a JSON object).
         if not isinstance(payload, dict):
             return _synchronousError(None, JSONRPC_PARSE_ERROR,
                                      'Payload was not a JSON object.',
                                      requestPayload=rawPayload)
 
+        deferred = self._call(request, payload, rawPayload,
+                              _prepareErrorResponse)
+        return deferred.addCallback(_sendResponse)
+
+    def _call(self, request, payload, rawPayload, prepareErrorResponse):
+        """Run a single JSON RPC call.
+
+        @param request: The C{twisted.web.server.Request} for the call.
+        @param payload: The C{dict} with the JSON RPC request.
+        @param rawPayload: The C{str} request payload, for logging.
+        @param prepareErrorResponse: A function that logs an error and
+            returns the C{str} body of a JSON RPC error response.
+        @return: A C{Deferred} that fires with the C{str} body of the JSON
+            RPC response.  It never fails.
+        """
+
+        def _synchronousError(requestID, code, message):
+            """Handle a synchronous error in the call.
+
+            @param requestID: Either the request id from the incoming
+                request or C{None} if the request had no id.
+            @param code: An C{int} error code.
+            @param message: A C{str} error message.
+            @return: a C{Deferred} that has already been fired with
+                a serialized JSON RPC error response string.
+            """
+            return succeed(prepareErrorResponse(requestID, code, message,
+                                                requestPayload=rawPayload))
+
         requestID = payload.get('id')
 
         # Fail if the request had no id. See JSONRPC spec.
         if requestID is None:
             return _synchronousError(None, JSONRPC_INVALID_REQUEST,
-                                     "Request had no 'id' argument.",
-                                     requestPayload=rawPayload)
+                                     "Request had no 'id' argument.")
 
         version = payload.get('jsonrpc')
 
         # Fail if the request had no JSON RPC version. See JSONRPC spec.
         if version is None:
             return _synchronousError(requestID, JSONRPC_INVALID_REQUEST,
-                                     "Request had no 'jsonrpc' argument.",
-                                     requestPayload=rawPayload)
+                                     "Request had no 'jsonrpc' argument.")
 
         # Fail if the jsonrpc version is not supported.
         if version != '2.0':
             return _synchronousError(
                 requestID, JSONRPC_INVALID_REQUEST,
-                "Only JSON RPC version 2.0 is supported.",
-                requestPayload=rawPayload)
+                "Only JSON RPC version 2.0 is supported.")
 
         methodName = payload.get('method')
 
         # Fail if the request has no method name. See JSONRPC spec.
         if methodName is None:
             return _synchronousError(requestID, JSONRPC_INVALID_REQUEST,
-                                     "Request had no 'method' argument.",
-                                     requestPayload=rawPayload)
+                                     "Request had no 'method' argument.")
 
         method = getattr(self, 'jsonrpc_' + methodName, None)
         # Fail if we don't have a method by that name. See JSONRPC spec.
         if method is None:
             return _synchronousError(requestID, JSONRPC_METHOD_NOT_FOUND,
-                                     "Unknown method %r." % methodName,
-                                     requestPayload=rawPayload)
+                                     "Unknown method %r." % methodName)
 
         # Parameters (optional) for the call can either be a dict or a list.
         # See which one we got (if any).
@@ -202,8 +289,7 @@ class JSONRPCResource(WSFEResource):
             # Fail: the parameters are neither a dict nor a list.
             # See JSONRPC spec.
             return _synchronousError(requestID, JSONRPC_INVALID_PARAMS,
-                                     'Params not an object or a list.',
-                                     requestPayload=rawPayload)
+                                     'Params not an object or a list.')
 
         # Define call/errbacks to handle processing the method call.
 
@@ -227,9 +313,8 @@ class JSONRPCResource(WSFEResource):
                 message = 'Internal error.'
                 logging.error('JSON RPC internal error: %s' %
                               failure.getTraceback())
-            body = _prepareErrorResponse(requestID, code, message,
-                                         requestPayload=rawPayload)
-            return body
+            return prepareErrorResponse(requestID, code, message,
+                                        requestPayload=rawPayload)
 
         def _success(result, requestID):
             """Finishing handling a successful request.
@@ -238,15 +323,11 @@ class JSONRPCResource(WSFEResource):
             @param result: a C{dict} containing the result, as specified
                 in http://www.simple-is-better.org/json-rpc/jsonrpc20.html
             """
-            body = dumps({
+            return dumps({
                 'id': requestID,
                 'jsonrpc': '2.0',
                 'result': result
             })
-            request.setHeader('Content-length', str(len(body)))
-            request.setHeader('Content-type', 'application/json')
-            request.setResponseCode(OK)
-            return body
 
         def _internalError(failure, requestID):
             """Handle a failure caused by one of our callbacks.
@@ -262,15 +343,14 @@ class JSONRPCResource(WSFEResource):
             logging.error('Internal error processing JSON RPC call. '
                           'Request id %s' % request._fluidDB_reqid)
             logging.exception(failure.value)
-            body = _prepareErrorResponse(requestID, JSONRPC_INTERNAL_ERROR,
-                                         'Error processing deferred callback.',
-                                         requestPayload=rawPayload)
-            return body
+            return prepareErrorResponse(requestID, JSONRPC_INTERNAL_ERROR,
+                                        'Error processing deferred callback.',
+                                        requestPayload=rawPayload)
 
         # Call the method, passing the session and the parameters we
         # received.  Arrange to process the result.
 
-        deferred = method(self.session, *args, **kwargs)
+        deferred = maybeDeferred(method, self.session, *args, **kwargs)
         deferred.addCallbacks(_success, _failure,
                               callbackArgs=(requestID,),
                               errbackArgs=(requestID,))
@@ -0,0 +1,244 @@
+from base64 import b64decode
+import binascii
+from functools import partial
+import json
+import logging
+
+from twisted.web import http
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
+
+from fluiddb.data.exceptions import UnknownUserError
+from fluiddb.security.authentication import (
+    AuthenticationError, authenticate)
+from fluiddb.util.sampler import MAX_INTERVAL, MIN_INTERVAL, sampleStacks
+
+
+# The longest time, in seconds, stacks can be sampled for in a single
+# request to the C{/profile} endpoint.
+MAX_PROFILE_DURATION = 300
+
+
+class MetricsResource(Resource):
+    """Handler for the C{/metrics} endpoint on the admin port.
+
+    The response is a JSON object with latency histograms and status code
+    counts for each endpoint of the API service, and histograms of the
+    timer events recorded by sessions.
+
+    @param metrics: The L{Metrics} instance to report.
+    """
+
+    isLeaf = True
+
+    def __init__(self, metrics):
+        Resource.__init__(self)
+        self._metrics = metrics
+
+    def render_GET(self, request):
+        """Get the metrics collected since the API service started.
+
+        @param request: The incoming C{twisted.web.server.Request} request.
+        @return: The metrics as a JSON object.
+        """
+        body = json.dumps(self._metrics.dumps(), sort_keys=True)
+        request.setHeader('Content-Type', 'application/json')
+        request.setHeader('Content-Length', str(len(body)))
+        return body
+
+
+class SQLProfileResource(Resource):
+    """Handler for the C{/sql} endpoint on the admin port.
+
+    The response is a JSON object with the statements run by the API
+    service, aggregated by fingerprint for the whole service and for each
+    endpoint.
+
+    @param profiler: The L{SQLProfiler} instance to report.
+    """
+
+    isLeaf = True
+
+    def __init__(self, profiler):
+        Resource.__init__(self)
+        self._profiler = profiler
+
+    def render_GET(self, request):
+        """Get the statements profiled since the profile was last reset.
+
+        @param request: The incoming C{twisted.web.server.Request} request.
+        @return: The profile as a JSON object.
+        """
+        body = json.dumps(self._profiler.dumps(), sort_keys=True)
+        request.setHeader('Content-Type', 'application/json')
+        request.setHeader('Content-Length', str(len(body)))
+        return body
+
+    def render_DELETE(self, request):
+        """Reset the profile.
+
+        @param request: The incoming C{twisted.web.server.Request} request.
+        @return: An empty response.
+        """
+        self._profiler.reset()
+        request.setResponseCode(http.NO_CONTENT)
+        return ''
+
+
+def checkSuperuser(username, password):
+    """Check that credentials belong to a superuser.
+
+    This function must be run in a transaction.
+
+    @param username: The C{unicode} username of the L{User}.
+    @param password: The C{unicode} plaintext password of the L{User}.
+    @return: C{True} if the credentials are valid and the L{User} is a
+        superuser, otherwise C{False}.
+    """
+    try:
+        user = authenticate(username, password)
+    except (AuthenticationError, UnknownUserError):
+        return False
+    return user.isSuperuser()
+
+
+def getBasicCredentials(request):
+    """Get the credentials sent with HTTP basic authentication.
+
+    @param request: The incoming C{twisted.web.server.Request} request.
+    @return: A C{(username, password)} 2-tuple of C{unicode} values, or
+        C{None} if the request doesn't have valid basic credentials.
+    """
+    header = request.getHeader('Authorization')
+    if header is None:
+        return None
+    parts = header.split(' ', 1)
+    if len(parts) != 2 or parts[0].lower() != 'basic':
+        return None
+    try:
+        credentials = b64decode(parts[1]).decode('utf-8')
+    except (binascii.Error, TypeError, UnicodeDecodeError):
+        return None
+    if u':' not in credentials:
+        return None
+    return tuple(credentials.split(u':', 1))
+
+
+class StackProfileResource(Resource):
+    """Handler for the C{/profile} endpoint on the admin port.
+
+    A C{GET} request samples the stacks of the reactor thread and the
+    threads running transactions, for the number of seconds given in the
+    C{seconds} argument, and returns them as collapsed stacks that can be
+    fed to C{flamegraph.pl}.  An optional C{interval} argument sets the
+    number of seconds between samples, from L{MIN_INTERVAL} to
+    L{MAX_INTERVAL}.  Only one profile can be taken at a
+    time, and only by a superuser, with HTTP basic authentication.
+
+    @param checkCredentials: A function that takes a username and a
+        password and returns a C{Deferred} that fires with C{True} if they
+        belong to a superuser.
+    @param clock: Optionally, the C{IReactorTime} provider to use to wait
+        while samples are taken.  Default is the reactor.
+    @param getLabel: Optionally, the function to label threads with, as
+        used by L{StackSampler}.
+    """
+
+    isLeaf = True
+
+    def __init__(self, checkCredentials, clock=None, getLabel=None):
+        Resource.__init__(self)
+        self._checkCredentials = checkCredentials
+        self._clock = clock
+        self._getLabel = getLabel
+        self._sampling = False
+
+    def render_GET(self, request):
+        """Sample stacks and return them once sampling finishes.
+
+        @param request: The incoming C{twisted.web.server.Request} request.
+        @return: C{NOT_DONE_YET}, or an error message if the request is
+            invalid.
+        """
+        try:
+            seconds = float(request.args.get('seconds', ['10'])[0])
+            interval = float(request.args.get('interval', ['0.01'])[0])
+        except ValueError:
+            request.setResponseCode(http.BAD_REQUEST)
+            return 'Invalid seconds or interval.'
+        if (not 0 < seconds <= MAX_PROFILE_DURATION or
+                not MIN_INTERVAL <= interval <= MAX_INTERVAL):
+            request.setResponseCode(http.BAD_REQUEST)
+            return ('Seconds must be between 0 and %d and interval must be '
+                    'between %s and %s.' % (MAX_PROFILE_DURATION,
+                                            MIN_INTERVAL, MAX_INTERVAL))
+        credentials = getBasicCredentials(request)
+        if credentials is None:
+            return self._unauthorized(request)
+
+        def checked(allowed):
+            if not allowed:
+                request.write(self._unauthorized(request))
+                request.finish()
+                return
+            if self._sampling:
+                request.setResponseCode(http.CONFLICT)
+                request.write('A profile is already being taken.')
+                request.finish()
+                return
+            self._sampling = True
+            deferred = sampleStacks(seconds, interval, self._getLabel,
+                                    self._clock)
+            return deferred.addBoth(done).addCallback(sampled)
+
+        def sampled(sampler):
+            body = sampler.getCollapsedStacks()
+            request.setHeader('Content-Type', 'text/plain')
+            request.setHeader('Content-Length', str(len(body)))
+            request.write(body)
+            request.finish()
+
+        def done(result):
+            self._sampling = False
+            return result
+
+        def failed(failure):
+            logging.error('Error taking a stack profile.')
+            logging.exception(failure.value)
+            if not request.finished:
+                request.setResponseCode(http.INTERNAL_SERVER_ERROR)
+                request.finish()
+
+        deferred = self._checkCredentials(*credentials)
+        deferred.addCallback(checked)
+        deferred.addErrback(failed)
+        return NOT_DONE_YET
+
+    def _unauthorized(self, request):
+        """Ask the client to authenticate.
+
+        @param request: The incoming C{twisted.web.server.Request} request.
+        @return: An error message.
+        """
+        request.setResponseCode(http.UNAUTHORIZED)
+        request.setHeader('WWW-Authenticate', 'Basic realm="fluidinfo"')
+        return 'Only superusers can take profiles.'
+
+
+def createAdminResource(metrics, profiler, transact=None):
+    """Create the root resource of the admin port.
+
+    @param metrics: The L{Metrics} instance to serve on C{/metrics}.
+    @param profiler: The L{SQLProfiler} instance to serve on C{/sql}.
+    @param transact: Optionally, the L{Transact} instance to check the
+        credentials of superusers with.  If it's provided, stack profiles
+        are served on C{/profile}.
+    @return: A C{Resource} instance.
+    """
+    root = Resource()
+    root.putChild('metrics', MetricsResource(metrics))
+    root.putChild('sql', SQLProfileResource(profiler))
+    if transact is not None:
+        checkCredentials = partial(transact.run, checkSuperuser)
+        root.putChild('profile', StackProfileResource(checkCredentials))
+    return root
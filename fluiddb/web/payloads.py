@@ -8,30 +8,53 @@ import base64
 from twisted.python import log
 
 from fluiddb.common import error, defaults
+from fluiddb.data.blob import SpooledFile
 
 CONTENT_TYPE_RE = re.compile(
     '\s*([\w\d-]+/[\w\d-]+)\s*(?:;?\s*charset=([\w\d-]+);?)?', re.UNICODE)
 
 
 def checkPayloadFieldType(value, field, strCountsAsUnicode=False):
-    if field.mayBeNone and value is None:
-        return True
+    return compileFieldChecker(field, strCountsAsUnicode)(value)
+
+
+def compileFieldChecker(field, strCountsAsUnicode=False):
+    """Build a function that checks the type of a payload field's value.
+
+    The decisions that only depend on the field are made once, so the
+    returned function only has to look at the value.
+
+    @param field: The L{PayloadField} to check values for.
+    @param strCountsAsUnicode: Optionally, a flag indicating whether C{str}
+        values are accepted for C{unicode} fields.  Default is C{False}.
+    @return: A function that takes a value and returns C{True} if it has the
+        right type for the field, otherwise C{False}.
+    """
     ft = field.type
-    vt = type(value)
     if ft in (bool, int, float, types.NoneType):
-        return vt is ft
+        check = lambda value: type(value) is ft
     elif ft is unicode:
-        return (vt is unicode or
-                (strCountsAsUnicode and vt is str) or
-                (value is None and field.mayBeNone))
+        if strCountsAsUnicode:
+            check = lambda value: type(value) in (unicode, str)
+        else:
+            check = lambda value: type(value) is unicode
     elif ft is list:
-        if vt is not list:
-            return False
-        if field.listType is unicode and strCountsAsUnicode:
-            return all([isinstance(x, basestring) for x in value])
+        listType = field.listType
+        if listType is unicode and strCountsAsUnicode:
+            check = lambda value: (
+                type(value) is list and
+                all(isinstance(x, basestring) for x in value))
         else:
-            return all([type(x) is field.listType for x in value])
-    return False
+            check = lambda value: (
+                type(value) is list and
+                all(type(x) is listType for x in value))
+    else:
+        # Some fields only have a type name for documentation.
+        check = lambda value: False
+
+    if field.mayBeNone:
+        return lambda value: value is None or check(value)
+    return check
 
 
 def identityPayloadDecoder(data):
@@ -55,7 +78,40 @@ class PayloadDecoder(object):
         return decoder(data)
 
 
-def extractPayload(request):
+def _extractSpooledPayload(request):
+    """
+    Check the payload of an HTTP request that was spooled to disk and return
+    it without reading it into memory.
+
+    @param request: The request instance, whose content is a
+        L{SpooledFile}.
+    @return: The L{SpooledFile}, positioned at its start, C{''} if it's
+        empty or C{None} if the request doesn't have a payload.
+    """
+    content = request.content
+    contentLength = request.getHeader('content-length')
+    if contentLength is None:
+        if content.size:
+            raise error.ContentLengthMismatch()
+        return None
+    if int(contentLength) != content.size:
+        raise error.ContentLengthMismatch()
+    if content.size == 0:
+        return ''
+
+    contentMD5 = request.getHeader('content-md5')
+    if contentMD5:
+        dataDigest = md5()
+        for chunk in iter(lambda: content.read(65536), ''):
+            dataDigest.update(chunk)
+        content.seek(0, 0)
+        encodedDigest = base64.standard_b64encode(dataDigest.digest())
+        if encodedDigest != contentMD5:
+            raise error.ContentChecksumMismatch()
+    return content
+
+
+def extractPayload(request, spooled=False):
     """
     Extract and return the payload from an HTTP request, checking for
     content-length header errors along the way. If the payload is encoded
@@ -63,7 +119,13 @@ def extractPayload(request):
     it is decoded before being returned.
 
     @param request: The request instance containing the payload.
+    @param spooled: Optionally, a flag indicating whether a payload that
+        was spooled to disk can be returned as an open L{SpooledFile},
+        instead of a C{str}.  Default is C{False}.
     """
+    if getattr(request.content, 'tooLarge', False):
+        raise error.RequestEntityTooLarge()
+
     try:
         # If we can't seek in the content, the only explanation (that we
         # know of so far) is that client has gone away.
@@ -73,6 +135,10 @@ def extractPayload(request):
                 request._fluidDB_reqid)
         raise error.ContentSeekError()
 
+    if (spooled and isinstance(request.content, SpooledFile) and
+            request.getHeader('content-encoding') is None):
+        return _extractSpooledPayload(request)
+
     data = request.content.read()
     contentLength = request.getHeader('content-length')
 
@@ -111,6 +177,8 @@ def extractPayload(request):
 
 def parseJSONPayload(data, charset=defaults.charset):
     # TODO: add support for different charsets
+    if isinstance(data, SpooledFile):
+        data = data.read()
     try:
         return json.loads(data.decode(charset))
     except ValueError:
@@ -0,0 +1,72 @@
+from twisted.web.server import Request
+
+from fluiddb.application import getConfig
+from fluiddb.data.blob import SpooledFile
+
+
+# Request bodies smaller than this are kept in memory, as Twisted does.
+SPOOL_THRESHOLD = 100000
+
+
+class DiscardedContent(object):
+    """The body of a request that is larger than the maximum upload size.
+
+    Data is thrown away as it arrives, so the request can be rejected
+    without storing its body.
+    """
+
+    tooLarge = True
+
+    def write(self, data):
+        """Discard data."""
+
+    def read(self, size=-1):
+        """Return an empty C{str}."""
+        return ''
+
+    def seek(self, offset, whence=0):
+        """Do nothing."""
+
+    def close(self):
+        """Do nothing."""
+
+
+def getMaxUploadSize(config):
+    """Get the maximum size of a request body.
+
+    @param config: The configuration instance.
+    @return: The maximum size in bytes or C{None} if there is no limit.
+    """
+    if config.has_option('service', 'max-upload-size'):
+        return config.getint('service', 'max-upload-size')
+
+
+class FluidinfoRequest(Request):
+    """A request that hashes and spools large bodies to disk as they arrive.
+
+    Bodies that are larger than C{SPOOL_THRESHOLD} bytes, or don't have a
+    C{Content-Length}, are written to a L{SpooledFile} in the C{temp-path}
+    directory, so binary tag values can be moved into the blob store without
+    being loaded into memory.  Bodies larger than the C{max-upload-size}
+    option are discarded as soon as that's known, from the C{Content-Length}
+    header or as data arrives, and the request fails with C{413 Request
+    Entity Too Large}.
+    """
+
+    def gotLength(self, length):
+        """Create the file-like object to store the request body in.
+
+        @param length: The length of the request body, as indicated by the
+            request headers, or C{None} if it isn't known.
+        """
+        config = getConfig()
+        if config is None:
+            return Request.gotLength(self, length)
+        maxSize = getMaxUploadSize(config)
+        if length is not None and maxSize is not None and length > maxSize:
+            self.content = DiscardedContent()
+        elif length is not None and length < SPOOL_THRESHOLD:
+            Request.gotLength(self, length)
+        else:
+            directory = config.get('service', 'temp-path')
+            self.content = SpooledFile(directory, maxSize)
@@ -1,21 +1,25 @@
 from cStringIO import StringIO
 import logging
-import os
 
 from twisted.web import resource, http, server
 from twisted.web.error import ErrorPage as TwistedErrorPage
+from twisted.web.static import (
+    NoRangeStaticProducer, SingleRangeStaticProducer)
 from twisted.internet import defer
 from twisted.internet.defer import CancelledError
 from twisted.python import log
 
-from fluiddb.application import getConfig
-from fluiddb.common import defaults, error
+from fluiddb.application import getConfig, getTraceLogPath
+from fluiddb.common import error
 from fluiddb.common.error import ContentSeekError, UnwrappableBlob
 from fluiddb.common.types_thrift import ttypes
 from fluiddb.common.types_thrift.ttypes import ThriftValueType
 from fluiddb.common.util import thriftExceptions, dictSubset
-from fluiddb.util.session import SessionStorage
-from fluiddb.web.util import buildHeader
+from fluiddb.util.metrics import getMetrics
+from fluiddb.util.session import (
+    SessionStorage, getSessionStorage, getSlowRequestLog)
+from fluiddb.web.compression import CompressionOptions, compressResponse
+from fluiddb.web.util import FileRange, buildHeader, wrapWithCallback
 
 # The following Thrift exceptions will result in the given HTTP error
 # codes.  Furthermore, the contents of their Thrift struct will be sent
@@ -68,6 +72,8 @@ _exceptionToHTTPCode = {
     error.NoSuchObject: http.NOT_FOUND,
     error.NotAcceptable: http.NOT_ACCEPTABLE,
     error.PayloadFieldMissing: http.BAD_REQUEST,
+    error.RangeNotSatisfiable: http.REQUESTED_RANGE_NOT_SATISFIABLE,
+    error.RequestEntityTooLarge: http.REQUEST_ENTITY_TOO_LARGE,
     error.UnexpectedContentLengthHeader: http.BAD_REQUEST,
     error.UnknownAcceptType: http.BAD_REQUEST,
     error.UnknownArgument: http.BAD_REQUEST,
@@ -274,15 +280,23 @@ class WSFEResource(resource.Resource):
             return result
 
         self.session.stop()
+        metrics = getMetrics()
+        if metrics is not None:
+            metrics.record(self.session)
         config = getConfig()
         # FIXME This is a hack to avoid breaking old tests.
         if config:
-            tracePath = config.get('service', 'trace-path')
-            port = config.get('service', 'port')
-            logPath = os.path.join(tracePath,
-                                   'fluidinfo-api-trace-%s.log' % port)
-            storage = SessionStorage()
-            storage.dump(self.session, logPath)
+            policy = getattr(self.session, 'policy', None)
+            if policy is None or policy.shouldStore(self.session):
+                storage = getSessionStorage()
+                if storage is not None:
+                    storage.dump(self.session)
+                else:
+                    SessionStorage().dump(self.session,
+                                          getTraceLogPath(config))
+            slowRequestLog = getSlowRequestLog()
+            if slowRequestLog is not None:
+                slowRequestLog.record(self.session)
             if self.session.duration.seconds > 0:
                 logging.warning('Long request: %s. Time: %s.',
                                 self.session.id, self.session.duration)
@@ -348,26 +362,38 @@ class WSFEResource(resource.Resource):
         # arg can be used with any format, not just JSON
         if hasattr(request, '_fluiddb_jsonp_unwrappable'):
             raise UnwrappableBlob('Tag value is not wrappable.')
-        callback = request.args.get('callback')[0]
-        contentType = request.responseHeaders.getRawHeaders('Content-Type')
-
-        if value is None or contentType is None:
-            value = '%s()' % callback
-        elif contentType[0] in ('application/json',
-                                defaults.contentTypeForPrimitiveJSON):
-            value = '%s(%s)' % (callback, value)
-        else:
-            raise error.InternalError('Content type not properly set.')
-
-        request.setHeader('Content-Length', str(len(value)))
-        request.setHeader('Content-Type', 'text/javascript')
-        return value
+        # Tag values are wrapped before their entity tag is computed.
+        if hasattr(request, '_fluiddb_jsonp_wrapped'):
+            return value
+        return wrapWithCallback(request, value)
 
     def _finish(self, value, request):
         # No responses may be cached. To be refined later.
         request.setHeader('Cache-Control', 'no-cache')
-        if value is not None:
-            request.write(value)
+        if isinstance(value, FileRange):
+            SingleRangeStaticProducer(request, value.file, value.offset,
+                                      value.length).start()
+            return
+        if hasattr(value, 'read'):
+            # File-like bodies, such as the contents of binary tag values,
+            # are streamed in chunks instead of being loaded into memory.
+            # The producer finishes the request when it's done.
+            NoRangeStaticProducer(request, value).start()
+            return
+        if not value:
+            request.finish()
+            return
+        options = CompressionOptions.fromConfig(getConfig())
+        deferred = compressResponse(request, value, options)
+        return deferred.addCallback(self._write, request)
+
+    def _write(self, body, request):
+        """Write a complete response body and finish the request.
+
+        @param body: The C{str} body of the response.
+        @param request: The HTTP request.
+        """
+        request.write(body)
         request.finish()
 
 
@@ -499,6 +525,13 @@ def handleRequestError(fail, request, resourceClass):
     if fail.check(defer.CancelledError, ContentSeekError):
         log.msg('Request %s: Not calling request.finish. Client '
                 'apparently disconnected.' % request._fluidDB_reqid)
+    elif request.startedWriting:
+        # Part of a streamed response has already been sent with a success
+        # status.  Drop the connection so the client sees an incomplete
+        # response instead of one that looks complete.
+        log.msg('Request %s: Dropping connection after an error in a '
+                'streamed response.' % request._fluidDB_reqid)
+        request.transport.loseConnection()
     else:
         request.finish()
 
@@ -15,6 +15,7 @@ from fluiddb.web.users import UsersResource
 from fluiddb.web.namespaces import NamespacesResource
 from fluiddb.web.permissions import PermissionsResource
 from fluiddb.web.about import AboutResource
+from fluiddb.web.batch import BatchResource
 from fluiddb.web.values import ValuesResource
 from fluiddb.web.resource import (
     WSFEResource, NoResource, WSFEUnauthorizedResource)
@@ -77,6 +78,7 @@ class RootResource(WSFEResource):
         defaults.httpAboutCategoryName: AboutResource,
         defaults.httpValueCategoryName: ValuesResource,
         defaults.httpCrossdomainName: CrossdomainResource,
+        'batch': BatchResource,
         'jsonrpc': CommentResource,
         'recent': RecentActivityResource,
     }
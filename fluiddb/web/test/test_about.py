@@ -1,5 +1,7 @@
 import cStringIO as StringIO
 from collections import defaultdict
+from datetime import datetime
+from hashlib import sha256
 import json
 
 from twisted.web import http
@@ -11,13 +13,15 @@ from fluiddb.common import error, util
 from fluiddb.common.defaults import sep, contentTypeForPrimitiveJSON
 from fluiddb.common import paths
 from fluiddb.common.types_thrift.ttypes import (
-    TObjectInfo, TNoInstanceOnObject)
-from fluiddb.web.query import createThriftValue, guessValue
+    TObjectInfo, TNoInstanceOnObject, ThriftValueType)
+from fluiddb.web.query import (
+    createBinaryThriftValue, createThriftValue, guessValue)
 from fluiddb.web import objects
 from fluiddb.web.about import (
     AboutResource, AboutObjectResource, AboutTagInstanceResource)
 from fluiddb.web.resource import ErrorResource
-from fluiddb.web.test.test_objects import FakeFacade as SimpleFakeFacade
+from fluiddb.web.test.test_objects import (
+    FakeFacade as SimpleFakeFacade, FakeTagValue)
 from fluiddb.testing.doubles import FakeSession
 from fluiddb.web.util import buildHeader
 from fluiddb.testing.basic import FluidinfoTestCase
@@ -34,6 +38,7 @@ class FakeRequest(object):
     """
 
     _fluidDB_reqid = None
+    startedWriting = False
     body = ''
 
     def __init__(self, method, d=None, headers=None, hostname=None):
@@ -85,8 +90,33 @@ class FakeRequest(object):
 
         @return: C{None}.
         """
+        self.startedWriting = True
         self.body += data
 
+    def registerProducer(self, producer, streaming):
+        """
+        Register a producer to write the response body. Pull producers are
+        asked to produce data until they unregister themselves.
+
+        @param producer: The producer to register.
+        @param streaming: C{True} for a push producer, C{False} for a pull
+            producer.
+
+        @return: C{None}.
+        """
+        self.producer = producer
+        if not streaming:
+            while self.producer is not None:
+                producer.resumeProducing()
+
+    def unregisterProducer(self):
+        """
+        Unregister the producer registered with L{registerProducer}.
+
+        @return: C{None}.
+        """
+        self.producer = None
+
     def getHeader(self, key):
         """
         Get a header from the request. This is copied from Twisted's
@@ -182,13 +212,15 @@ class FakeTagsClient(object):
         """
         self.values = defaultdict(dict)
 
-    def getTagInstance(self, session, path, objectId):
+    def getTagInstance(self, session, path, objectId, withContents=True):
         """
         Get a tag instance from an object.
 
         @param session: a L{FakeSession} instance.
         @param path: the C{str} path to the tag.
         @param objectId: the id of the object in question.
+        @param withContents: a flag indicating whether the contents of a
+            binary value should be returned.
 
         @return: A C{Deferred} that fires with the value of the tag on the
                  object on an object, if known. If we don't have a value for
@@ -196,10 +228,20 @@ class FakeTagsClient(object):
                  TNoInstanceOnObject failure.
         """
         try:
-            return defer.succeed((self.values[path][objectId], None))
+            tvalue = self.values[path][objectId]
         except KeyError:
             fail = TNoInstanceOnObject(path, objectId)
             return defer.fail(fail)
+        if tvalue.valueType == ThriftValueType.BINARY_TYPE:
+            contents = tvalue.binaryKey
+            key = StringIO.StringIO(contents) if withContents else None
+            tvalue = createBinaryThriftValue(key, tvalue.binaryKeyMimeType)
+            tagValue = FakeTagValue({'mime-type': tvalue.binaryKeyMimeType,
+                                     'size': len(contents)},
+                                    datetime(2012, 1, 2, 3, 4, 5),
+                                    sha256(contents).hexdigest())
+            return defer.succeed((tvalue, tagValue))
+        return defer.succeed((tvalue, None))
 
     def setTagInstance(self, session, path, objectId, value):
         """
@@ -0,0 +1,221 @@
+from datetime import datetime
+from json import dumps, loads
+from uuid import uuid4
+
+from twisted.internet.defer import inlineCallbacks
+from twisted.web import http
+from twisted.web.http_headers import Headers
+
+from fluiddb.api.facade import Facade
+from fluiddb.api.value import TagValueOperation
+from fluiddb.application import FluidinfoSessionFactory
+from fluiddb.common.error import MalformedPayload, UnsupportedJSONType
+from fluiddb.common.types_thrift.ttypes import (
+    TNoInstanceOnObject, TPathPermissionDenied)
+from fluiddb.data.system import createSystemData
+from fluiddb.model.user import UserAPI, getUser
+from fluiddb.model.value import TagValueAPI
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.doubles import FakeRequest
+from fluiddb.testing.resources import (
+    CacheResource, ConfigResource, DatabaseResource, LoggingResource,
+    ThreadPoolResource)
+from fluiddb.testing.session import login
+from fluiddb.util.transact import Transact
+from fluiddb.web.batch import BatchResource, formatResult, parseOperation
+from fluiddb.web.query import guessValue
+
+
+class ParseOperationTest(FluidinfoTestCase):
+
+    def testParseOperation(self):
+        """
+        L{parseOperation} creates a L{TagValueOperation} with UTF-8 encoded
+        paths and about values.
+        """
+        about = u'\N{HIRAGANA LETTER A}'
+        operation = parseOperation({'method': 'PUT', 'about': about,
+                                    'path': u'username/tag', 'value': 42})
+        self.assertEqual('PUT', operation.method)
+        self.assertEqual('username/tag', operation.path)
+        self.assertEqual(about.encode('utf-8'), operation.about)
+        self.assertIdentical(None, operation.objectId)
+        self.assertEqual(42, guessValue(operation.value))
+
+    def testParseOperationWithObjectID(self):
+        """L{parseOperation} accepts an object ID instead of an about value."""
+        objectID = uuid4()
+        operation = parseOperation({'method': 'GET', 'id': unicode(objectID),
+                                    'path': u'username/tag'})
+        self.assertEqual(str(objectID), operation.objectId)
+        self.assertIdentical(None, operation.about)
+
+    def testParseOperationWithUnknownMethod(self):
+        """
+        L{parseOperation} raises L{MalformedPayload} if the method isn't
+        C{GET}, C{PUT} or C{DELETE}.
+        """
+        self.assertRaises(MalformedPayload, parseOperation,
+                          {'method': 'POST', 'id': unicode(uuid4()),
+                           'path': u'username/tag'})
+
+    def testParseOperationWithoutObject(self):
+        """
+        L{parseOperation} raises L{MalformedPayload} unless exactly one of
+        an object ID and an about value is given.
+        """
+        self.assertRaises(MalformedPayload, parseOperation,
+                          {'method': 'GET', 'path': u'username/tag'})
+        self.assertRaises(MalformedPayload, parseOperation,
+                          {'method': 'GET', 'path': u'username/tag',
+                           'id': unicode(uuid4()), 'about': u'about'})
+
+    def testParseOperationWithInvalidObjectID(self):
+        """
+        L{parseOperation} raises L{MalformedPayload} if the object ID isn't a
+        valid UUID.
+        """
+        self.assertRaises(MalformedPayload, parseOperation,
+                          {'method': 'GET', 'id': u'invalid',
+                           'path': u'username/tag'})
+
+    def testParseOperationWithoutValue(self):
+        """
+        L{parseOperation} raises L{MalformedPayload} if a C{PUT} operation
+        doesn't have a value.
+        """
+        self.assertRaises(MalformedPayload, parseOperation,
+                          {'method': 'PUT', 'id': unicode(uuid4()),
+                           'path': u'username/tag'})
+
+    def testParseOperationWithUnsupportedValue(self):
+        """
+        L{parseOperation} raises L{UnsupportedJSONType} if the value isn't a
+        primitive value.
+        """
+        self.assertRaises(UnsupportedJSONType, parseOperation,
+                          {'method': 'PUT', 'id': unicode(uuid4()),
+                           'path': u'username/tag', 'value': {}})
+
+
+class FormatResultTest(FluidinfoTestCase):
+
+    def testFormatValue(self):
+        """
+        L{formatResult} includes the value, its creator and its creation
+        time in the result of a successful C{GET} operation.
+        """
+        objectID = uuid4()
+        creationTime = datetime.utcnow()
+        tagValue = {'value': 42, 'updated-at': creationTime,
+                    'username': u'fluiddb'}
+        operation = TagValueOperation('GET', 'username/tag', str(objectID))
+        self.assertEqual({'status': http.OK, 'value': 42,
+                          'updated-at': creationTime.isoformat(),
+                          'username': u'fluiddb'},
+                         formatResult(operation, tagValue))
+
+    def testFormatBinaryValue(self):
+        """
+        L{formatResult} only includes the type and the size of a binary
+        value.
+        """
+        objectID = uuid4()
+        tagValue = {'value': {'mime-type': 'text/plain', 'size': 5},
+                    'updated-at': datetime.utcnow(), 'username': u'fluiddb'}
+        operation = TagValueOperation('GET', 'username/tag', str(objectID))
+        result = formatResult(operation, tagValue)
+        self.assertEqual('text/plain', result['value-type'])
+        self.assertEqual(5, result['size'])
+        self.assertNotIn('value', result)
+
+    def testFormatChange(self):
+        """
+        L{formatResult} returns a C{NO_CONTENT} status for successful C{PUT}
+        and C{DELETE} operations.
+        """
+        operation = TagValueOperation('DELETE', 'username/tag',
+                                      str(uuid4()))
+        self.assertEqual({'status': http.NO_CONTENT},
+                         formatResult(operation, None))
+
+    def testFormatError(self):
+        """
+        L{formatResult} returns the HTTP status, the class and the details
+        of an error.
+        """
+        operation = TagValueOperation('PUT', 'username/tag', str(uuid4()))
+        error = TPathPermissionDenied('tag-values', 'write', 'username/tag')
+        self.assertEqual({'status': http.UNAUTHORIZED,
+                          'error-class': 'TPathPermissionDenied',
+                          'category': 'tag-values', 'action': 'write',
+                          'path': 'username/tag'},
+                         formatResult(operation, error))
+
+
+class BatchResourceTest(FluidinfoTestCase):
+
+    resources = [('cache', CacheResource()),
+                 ('config', ConfigResource()),
+                 ('log', LoggingResource()),
+                 ('store', DatabaseResource()),
+                 ('threadPool', ThreadPoolResource())]
+
+    def setUp(self):
+        super(BatchResourceTest, self).setUp()
+        createSystemData()
+        UserAPI().create([(u'username', u'password', u'User',
+                           u'user@example.com')])
+        self.user = getUser(u'username')
+        factory = FluidinfoSessionFactory('API-9000')
+        self.transact = Transact(self.threadPool)
+        self.facade = Facade(self.transact, factory)
+
+    def createRequest(self, operations):
+        """Create a C{POST} request with a batch of operations."""
+        body = dumps({'operations': operations})
+        headers = Headers({'Content-Length': [str(len(body))],
+                           'Content-Type': ['application/json']})
+        return FakeRequest(method='POST', headers=headers, body=body)
+
+    @inlineCallbacks
+    def testRenderPOST(self):
+        """
+        L{BatchResource.deferred_render_POST} runs a batch of operations and
+        returns the status of each one, in order.
+        """
+        objectID = uuid4()
+        TagValueAPI(self.user).set({objectID: {u'username/tag': 42}})
+        self.store.commit()
+        request = self.createRequest([
+            {'method': 'GET', 'id': str(objectID), 'path': u'username/tag'},
+            {'method': 'PUT', 'id': str(objectID), 'path': u'username/tag',
+             'value': 43},
+            {'method': 'GET', 'id': str(uuid4()), 'path': u'username/tag'}])
+        with login(u'username', self.user.objectID, self.transact) as session:
+            resource = BatchResource(self.facade, session)
+            body = yield resource.deferred_render_POST(request)
+
+        self.assertEqual(http.OK, request.code)
+        results = loads(body)['results']
+        self.assertEqual([http.OK, http.NO_CONTENT, http.NOT_FOUND],
+                         [result['status'] for result in results])
+        self.assertEqual(42, results[0]['value'])
+        self.assertEqual(u'username', results[0]['username'])
+        self.assertIn('updated-at', results[0])
+        self.assertEqual(TNoInstanceOnObject.__name__,
+                         results[2]['error-class'])
+        self.store.rollback()
+        result = TagValueAPI(self.user).get([objectID], [u'username/tag'])
+        self.assertEqual(43, result[objectID][u'username/tag'].value)
+
+    def testRenderPOSTWithEmptyBatch(self):
+        """
+        L{BatchResource.deferred_render_POST} raises L{MalformedPayload} if
+        there aren't any operations.
+        """
+        request = self.createRequest([])
+        with login(u'username', self.user.objectID, self.transact) as session:
+            resource = BatchResource(self.facade, session)
+            deferred = resource.deferred_render_POST(request)
+            return self.assertFailure(deferred, MalformedPayload)
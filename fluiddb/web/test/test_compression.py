@@ -0,0 +1,288 @@
+import gzip
+from StringIO import StringIO
+import zlib
+
+from twisted.internet.defer import inlineCallbacks
+from twisted.web.http_headers import Headers
+
+from fluiddb.application import setupConfig
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.doubles import FakeRequest
+from fluiddb.web.compression import (
+    CompressionOptions, StreamCompressor, compress, compressResponse,
+    getContentEncoding, getEntityTag, getResponseEncoding, isCompressible)
+
+
+class CompressionOptionsTest(FluidinfoTestCase):
+
+    def testFromConfigWithoutOptions(self):
+        """
+        L{CompressionOptions.fromConfig} uses default settings if the
+        configuration doesn't have any compression options.
+        """
+        options = CompressionOptions.fromConfig(setupConfig(None))
+        self.assertEqual(1024, options.minSize)
+        self.assertEqual(6, options.level)
+        self.assertEqual(262144, options.threadSize)
+
+    def testFromConfigWithoutConfig(self):
+        """
+        L{CompressionOptions.fromConfig} uses default settings if there is
+        no configuration.
+        """
+        options = CompressionOptions.fromConfig(None)
+        self.assertEqual(1024, options.minSize)
+
+    def testFromConfig(self):
+        """
+        L{CompressionOptions.fromConfig} loads settings from the C{service}
+        section of the configuration.
+        """
+        config = setupConfig(None)
+        config.set('service', 'compression-min-size', '10')
+        config.set('service', 'compression-level', '9')
+        config.set('service', 'compression-thread-size', '100')
+        options = CompressionOptions.fromConfig(config)
+        self.assertEqual(10, options.minSize)
+        self.assertEqual(9, options.level)
+        self.assertEqual(100, options.threadSize)
+
+
+class GetContentEncodingTest(FluidinfoTestCase):
+
+    def getContentEncoding(self, header):
+        """Negotiate a content coding for an C{Accept-Encoding} header."""
+        headers = Headers()
+        if header is not None:
+            headers.setRawHeaders('Accept-Encoding', [header])
+        return getContentEncoding(FakeRequest(headers=headers))
+
+    def testWithoutAcceptEncoding(self):
+        """
+        L{getContentEncoding} returns C{None} if the request doesn't have an
+        C{Accept-Encoding} header.
+        """
+        self.assertIdentical(None, self.getContentEncoding(None))
+
+    def testGzip(self):
+        """L{getContentEncoding} prefers C{gzip} to C{deflate}."""
+        self.assertEqual('gzip', self.getContentEncoding('deflate, gzip'))
+
+    def testDeflate(self):
+        """L{getContentEncoding} returns C{deflate} if it's accepted."""
+        self.assertEqual('deflate', self.getContentEncoding('deflate'))
+
+    def testQuality(self):
+        """L{getContentEncoding} prefers codings with a higher quality."""
+        self.assertEqual('deflate',
+                         self.getContentEncoding('gzip;q=0.5, deflate'))
+
+    def testRefused(self):
+        """
+        L{getContentEncoding} doesn't use a coding with a quality of C{0}.
+        """
+        self.assertIdentical(None, self.getContentEncoding('gzip;q=0'))
+
+    def testWildcard(self):
+        """L{getContentEncoding} accepts a C{*} wildcard."""
+        self.assertEqual('gzip', self.getContentEncoding('*'))
+
+    def testUnsupported(self):
+        """
+        L{getContentEncoding} returns C{None} if only unsupported codings are
+        accepted.
+        """
+        self.assertIdentical(None, self.getContentEncoding('br, identity'))
+
+
+class IsCompressibleTest(FluidinfoTestCase):
+
+    def testTextualTypes(self):
+        """L{isCompressible} returns C{True} for JSON and other text."""
+        self.assertTrue(isCompressible('application/json'))
+        self.assertTrue(isCompressible('application/vnd.fluiddb.value+json'))
+        self.assertTrue(isCompressible('text/javascript'))
+        self.assertTrue(isCompressible('text/html; charset=utf-8'))
+
+    def testBinaryTypes(self):
+        """L{isCompressible} returns C{False} for other types."""
+        self.assertFalse(isCompressible('image/png'))
+        self.assertFalse(isCompressible('application/octet-stream'))
+        self.assertFalse(isCompressible(None))
+
+
+class GetResponseEncodingTest(FluidinfoTestCase):
+
+    def createRequest(self, acceptEncoding='gzip'):
+        """Create a request with an C{Accept-Encoding} header."""
+        return FakeRequest(
+            headers=Headers({'Accept-Encoding': [acceptEncoding]}))
+
+    def testCompressedBody(self):
+        """
+        L{getResponseEncoding} returns the coding a large textual body will
+        be compressed with.
+        """
+        self.assertEqual(
+            'deflate',
+            getResponseEncoding(self.createRequest('deflate'),
+                                'application/json', 2048,
+                                CompressionOptions()))
+
+    def testSmallBody(self):
+        """L{getResponseEncoding} returns C{None} for small bodies."""
+        self.assertIdentical(
+            None, getResponseEncoding(self.createRequest(),
+                                      'application/json', 10,
+                                      CompressionOptions()))
+
+    def testBinaryBody(self):
+        """
+        L{getResponseEncoding} returns C{None} for binary content types.
+        """
+        self.assertIdentical(
+            None, getResponseEncoding(self.createRequest(), 'image/png',
+                                      2048, CompressionOptions()))
+
+
+class GetEntityTagTest(FluidinfoTestCase):
+
+    def testUncompressed(self):
+        """
+        L{getEntityTag} returns the quoted tag for a body that's sent
+        uncompressed.
+        """
+        request = FakeRequest(headers=Headers({'Accept-Encoding': ['gzip']}))
+        self.assertEqual(
+            '"abc"', getEntityTag(request, 'abc', 'application/json', 10,
+                                  CompressionOptions()))
+
+    def testCompressed(self):
+        """
+        L{getEntityTag} adds the content coding to the tag of a body that's
+        sent compressed, so each coding has a different strong validator.
+        """
+        options = CompressionOptions()
+        gzipRequest = FakeRequest(
+            headers=Headers({'Accept-Encoding': ['gzip']}))
+        deflateRequest = FakeRequest(
+            headers=Headers({'Accept-Encoding': ['deflate']}))
+        self.assertEqual(
+            '"abc-gzip"', getEntityTag(gzipRequest, 'abc',
+                                       'application/json', 2048, options))
+        self.assertEqual(
+            '"abc-deflate"', getEntityTag(deflateRequest, 'abc',
+                                          'application/json', 2048,
+                                          options))
+        self.assertEqual(
+            '"abc"', getEntityTag(FakeRequest(), 'abc', 'application/json',
+                                  2048, options))
+
+
+class CompressTest(FluidinfoTestCase):
+
+    def testGzip(self):
+        """L{compress} writes a gzip stream for the C{gzip} coding."""
+        data = compress('Hello, world!' * 100, 'gzip')
+        self.assertEqual('Hello, world!' * 100,
+                         gzip.GzipFile(fileobj=StringIO(data)).read())
+
+    def testDeflate(self):
+        """L{compress} writes a zlib stream for the C{deflate} coding."""
+        data = compress('Hello, world!' * 100, 'deflate')
+        self.assertEqual('Hello, world!' * 100, zlib.decompress(data))
+
+    def testStreamCompressor(self):
+        """
+        L{StreamCompressor} compresses chunks that can be decoded as soon as
+        they arrive.
+        """
+        compressor = StreamCompressor('deflate')
+        decompressor = zlib.decompressobj()
+        self.assertEqual(
+            'Hello', decompressor.decompress(compressor.compress('Hello')))
+        self.assertEqual(
+            ', world!',
+            decompressor.decompress(compressor.compress(', world!')))
+        decompressor.decompress(compressor.flush())
+        self.assertEqual('', decompressor.unused_data)
+
+
+class CompressResponseTest(FluidinfoTestCase):
+
+    def createRequest(self, contentType='application/json',
+                      acceptEncoding='gzip'):
+        """Create a request for a response to compress."""
+        headers = Headers({'Accept-Encoding': [acceptEncoding]})
+        request = FakeRequest(headers=headers)
+        request.setHeader('Content-Type', contentType)
+        return request
+
+    @inlineCallbacks
+    def testCompress(self):
+        """
+        L{compressResponse} compresses a body and sets the
+        C{Content-Encoding}, C{Content-Length} and C{Vary} headers.
+        """
+        request = self.createRequest()
+        body = '{"results": []}' * 100
+        result = yield compressResponse(request, body, CompressionOptions())
+        self.assertEqual(body, gzip.GzipFile(fileobj=StringIO(result)).read())
+        headers = request.responseHeaders
+        self.assertEqual(['gzip'], headers.getRawHeaders('Content-Encoding'))
+        self.assertEqual([str(len(result))],
+                         headers.getRawHeaders('Content-Length'))
+        self.assertEqual(['Accept-Encoding'], headers.getRawHeaders('Vary'))
+
+    @inlineCallbacks
+    def testCompressInThread(self):
+        """
+        L{compressResponse} compresses bodies larger than the thread size in
+        a thread.
+        """
+        request = self.createRequest()
+        body = '{"results": []}' * 100
+        options = CompressionOptions(threadSize=10)
+        result = yield compressResponse(request, body, options)
+        self.assertEqual(body, gzip.GzipFile(fileobj=StringIO(result)).read())
+
+    @inlineCallbacks
+    def testSmallBody(self):
+        """L{compressResponse} doesn't compress small bodies."""
+        request = self.createRequest()
+        result = yield compressResponse(request, '{}', CompressionOptions())
+        self.assertEqual('{}', result)
+        self.assertFalse(
+            request.responseHeaders.hasHeader('Content-Encoding'))
+
+    @inlineCallbacks
+    def testJSONPCallback(self):
+        """L{compressResponse} compresses JSONP responses."""
+        request = self.createRequest(contentType='text/javascript')
+        body = 'callback(%s)' % ('[1, 2, 3]' * 200)
+        result = yield compressResponse(request, body, CompressionOptions())
+        self.assertEqual(body, gzip.GzipFile(fileobj=StringIO(result)).read())
+
+    @inlineCallbacks
+    def testBinaryBody(self):
+        """L{compressResponse} doesn't compress binary content types."""
+        request = self.createRequest(contentType='image/png')
+        body = '\x89PNG' * 1000
+        result = yield compressResponse(request, body, CompressionOptions())
+        self.assertEqual(body, result)
+        self.assertFalse(request.responseHeaders.hasHeader('Vary'))
+
+    @inlineCallbacks
+    def testNotAccepted(self):
+        """
+        L{compressResponse} doesn't compress the body if the client doesn't
+        accept a supported coding, but still sets the C{Vary} header.
+        """
+        request = self.createRequest(acceptEncoding='identity')
+        body = '{"results": []}' * 100
+        result = yield compressResponse(request, body, CompressionOptions())
+        self.assertEqual(body, result)
+        self.assertFalse(
+            request.responseHeaders.hasHeader('Content-Encoding'))
+        self.assertEqual(['Accept-Encoding'],
+                         request.responseHeaders.getRawHeaders('Vary'))
@@ -1,14 +1,15 @@
 from json import dumps, loads
 
-from twisted.internet.defer import succeed, fail, inlineCallbacks
+from twisted.internet.defer import Deferred, succeed, fail, inlineCallbacks
 from twisted.web.http_headers import Headers
 
 from fluiddb.testing.basic import FluidinfoTestCase
 from fluiddb.testing.doubles import FakeRequest
-from fluiddb.testing.resources import LoggingResource
+from fluiddb.testing.resources import ConfigResource, LoggingResource
 from fluiddb.web.jsonrpc import (
-    JSONRPCResource, JSONRPC_PARSE_ERROR, JSONRPC_INVALID_REQUEST,
-    JSONRPC_INTERNAL_ERROR, JSONRPC_METHOD_NOT_FOUND, JSONRPC_INVALID_PARAMS)
+    DEFAULT_MAX_BATCH_SIZE, JSONRPCResource, JSONRPC_PARSE_ERROR,
+    JSONRPC_INVALID_REQUEST, JSONRPC_INTERNAL_ERROR, JSONRPC_METHOD_NOT_FOUND,
+    JSONRPC_INVALID_PARAMS, getMaxBatchSize)
 
 
 class TestResource(JSONRPCResource):
@@ -19,10 +20,16 @@ class TestResource(JSONRPCResource):
     def jsonrpc_fail(self, session, *args, **kwargs):
         return fail(RuntimeError())
 
+    def jsonrpc_wait(self, session, name):
+        deferred = Deferred()
+        self.waiting[name] = deferred
+        return deferred
+
 
 class JSONRPCResourceTest(FluidinfoTestCase):
 
-    resources = [('log', LoggingResource())]
+    resources = [('config', ConfigResource()),
+                 ('log', LoggingResource())]
 
     @inlineCallbacks
     def testIncorrectContentLength(self):
@@ -478,3 +485,158 @@ class JSONRPCResourceTest(FluidinfoTestCase):
                           'message': 'Internal error.'},
                          response['error'])
         self.assertIn('exceptions.RuntimeError', self.log.getvalue())
+
+    def createRequest(self, payload):
+        """Create a request with a JSON payload.
+
+        @param payload: The payload to serialize.
+        @return: A L{FakeRequest} instance.
+        """
+        body = dumps(payload)
+        headers = Headers({'Content-Length': [str(len(body))],
+                           'Content-Type': ['application/json']})
+        return FakeRequest(headers=headers, body=body)
+
+    @inlineCallbacks
+    def testBatch(self):
+        """
+        A batch of calls returns a JSON array with a response for each call,
+        in the same order.
+        """
+        request = self.createRequest([
+            {'id': 1, 'jsonrpc': '2.0', 'method': 'pass', 'params': [39]},
+            {'id': 2, 'jsonrpc': '2.0', 'method': 'pass',
+             'params': {'steps': 39}}])
+        resource = TestResource(None, None)
+        result = yield resource.deferred_render_POST(request)
+        self.assertEqual(
+            [{'id': 1, 'jsonrpc': '2.0',
+              'result': {'args': [39], 'kwargs': {}}},
+             {'id': 2, 'jsonrpc': '2.0',
+              'result': {'args': [], 'kwargs': {'steps': 39}}}],
+            loads(result))
+        self.assertEqual(
+            str(len(result)),
+            request.responseHeaders.getRawHeaders('Content-Length')[0])
+
+    @inlineCallbacks
+    def testBatchWithFailingCall(self):
+        """
+        A failing call in a batch returns an error response without
+        affecting the other calls.
+        """
+        request = self.createRequest([
+            {'id': 1, 'jsonrpc': '2.0', 'method': 'fail'},
+            {'id': 2, 'jsonrpc': '2.0', 'method': 'pass'}])
+        resource = TestResource(None, None)
+        result = yield resource.deferred_render_POST(request)
+        response = loads(result)
+        self.assertEqual({'code': JSONRPC_INTERNAL_ERROR,
+                          'message': 'Internal error.'},
+                         response[0]['error'])
+        self.assertEqual({'args': [], 'kwargs': {}}, response[1]['result'])
+
+    @inlineCallbacks
+    def testBatchWithInvalidCall(self):
+        """
+        An invalid call in a batch returns a C{JSONRPC_INVALID_REQUEST}
+        error response.
+        """
+        request = self.createRequest([
+            {'id': 1, 'jsonrpc': '2.0', 'method': 'pass'}, 'Not a dict'])
+        resource = TestResource(None, None)
+        result = yield resource.deferred_render_POST(request)
+        response = loads(result)
+        self.assertEqual({'args': [], 'kwargs': {}}, response[0]['result'])
+        self.assertEqual(None, response[1]['id'])
+        self.assertEqual({'code': JSONRPC_INVALID_REQUEST,
+                          'message': 'Request was not a JSON object.'},
+                         response[1]['error'])
+
+    @inlineCallbacks
+    def testEmptyBatch(self):
+        """
+        An empty batch causes a single C{JSONRPC_INVALID_REQUEST} error.
+        """
+        request = self.createRequest([])
+        resource = TestResource(None, None)
+        result = yield resource.deferred_render_POST(request)
+        response = loads(result)
+        self.assertEqual({'code': JSONRPC_INVALID_REQUEST,
+                          'message': 'Batch was empty.'},
+                         response['error'])
+
+    @inlineCallbacks
+    def testBatchTooLarge(self):
+        """
+        A batch with more calls than the C{jsonrpc-max-batch-size} causes a
+        single C{JSONRPC_INVALID_REQUEST} error, without running any of the
+        calls.
+        """
+        self.config.set('service', 'jsonrpc-max-batch-size', '2')
+        request = self.createRequest([
+            {'id': i, 'jsonrpc': '2.0', 'method': 'wait', 'params': [i]}
+            for i in range(3)])
+        resource = TestResource(None, None)
+        resource.waiting = {}
+        result = yield resource.deferred_render_POST(request)
+        response = loads(result)
+        self.assertEqual({'code': JSONRPC_INVALID_REQUEST,
+                          'message': 'Batch has more than 2 calls.'},
+                         response['error'])
+        self.assertEqual({}, resource.waiting)
+
+    @inlineCallbacks
+    def testBatchWithMaximumSize(self):
+        """
+        A batch with as many calls as the C{jsonrpc-max-batch-size} is run.
+        """
+        self.config.set('service', 'jsonrpc-max-batch-size', '2')
+        request = self.createRequest([
+            {'id': 1, 'jsonrpc': '2.0', 'method': 'pass'},
+            {'id': 2, 'jsonrpc': '2.0', 'method': 'pass'}])
+        resource = TestResource(None, None)
+        result = yield resource.deferred_render_POST(request)
+        self.assertEqual(2, len(loads(result)))
+
+    def testBatchRunsCallsConcurrently(self):
+        """
+        The calls in a batch are all started before any of them has
+        finished.
+        """
+        request = self.createRequest([
+            {'id': 1, 'jsonrpc': '2.0', 'method': 'wait', 'params': ['a']},
+            {'id': 2, 'jsonrpc': '2.0', 'method': 'wait', 'params': ['b']}])
+        resource = TestResource(None, None)
+        resource.waiting = {}
+        results = []
+        deferred = resource.deferred_render_POST(request)
+        deferred.addCallback(results.append)
+        self.assertEqual(['a', 'b'], sorted(resource.waiting))
+        resource.waiting['b'].callback('second')
+        self.assertEqual([], results)
+        resource.waiting['a'].callback('first')
+        responses = loads(results[0])
+        self.assertEqual(['first', 'second'],
+                         [response['result'] for response in responses])
+
+
+class GetMaxBatchSizeTest(FluidinfoTestCase):
+
+    resources = [('config', ConfigResource())]
+
+    def testDefault(self):
+        """
+        L{getMaxBatchSize} returns L{DEFAULT_MAX_BATCH_SIZE} if the
+        C{jsonrpc-max-batch-size} option isn't set.
+        """
+        self.assertEqual(DEFAULT_MAX_BATCH_SIZE, getMaxBatchSize(self.config))
+        self.assertEqual(DEFAULT_MAX_BATCH_SIZE, getMaxBatchSize(None))
+
+    def testGetMaxBatchSize(self):
+        """
+        L{getMaxBatchSize} returns the value of the C{jsonrpc-max-batch-size}
+        option.
+        """
+        self.config.set('service', 'jsonrpc-max-batch-size', '10')
+        self.assertEqual(10, getMaxBatchSize(self.config))
@@ -0,0 +1,306 @@
+from base64 import b64encode
+from datetime import timedelta
+from json import loads
+
+from twisted.internet.defer import Deferred, inlineCallbacks, succeed
+from twisted.internet.task import Clock
+from twisted.web import http
+from twisted.web.http_headers import Headers
+from twisted.web.server import NOT_DONE_YET
+
+from fluiddb.data.system import createSystemData
+from fluiddb.model.user import UserAPI
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.doubles import FakeRequest, FakeThreadPool
+from fluiddb.testing.resources import (
+    CacheResource, ConfigResource, DatabaseResource)
+from fluiddb.util.metrics import Metrics
+from fluiddb.util.profiler import SQLProfiler
+from fluiddb.util.session import HTTPPlugin, Session
+from fluiddb.util.transact import Transact
+from fluiddb.web.metrics import (
+    MetricsResource, SQLProfileResource, StackProfileResource,
+    checkSuperuser, createAdminResource, getBasicCredentials)
+
+
+class MetricsResourceTest(FluidinfoTestCase):
+
+    def testRenderGET(self):
+        """
+        L{MetricsResource.render_GET} returns the metrics as a JSON object.
+        """
+        session = Session('id', {'http': HTTPPlugin()})
+        session.http.method = 'GET'
+        session.http.path = '/about/foo'
+        session.http.code = 200
+        session.duration = timedelta(milliseconds=12)
+        metrics = Metrics()
+        metrics.record(session)
+        request = FakeRequest()
+        body = MetricsResource(metrics).render_GET(request)
+        self.assertEqual(['application/json'],
+                         request.responseHeaders.getRawHeaders('Content-Type'))
+        result = loads(body)
+        endpoint = result['endpoints']['GET /about']
+        self.assertEqual({'200': 1}, endpoint['codes'])
+        self.assertEqual(12, endpoint['duration']['max'])
+
+
+class SQLProfileResourceTest(FluidinfoTestCase):
+
+    def testRenderGET(self):
+        """
+        L{SQLProfileResource.render_GET} returns the SQL profile as a JSON
+        object.
+        """
+        profiler = SQLProfiler()
+        profiler.record('GET /objects', 'SELECT 1', timedelta(0, 1), 1)
+        request = FakeRequest()
+        body = SQLProfileResource(profiler).render_GET(request)
+        self.assertEqual(['application/json'],
+                         request.responseHeaders.getRawHeaders('Content-Type'))
+        result = loads(body)
+        [profile] = result['endpoints']['GET /objects']
+        self.assertEqual('SELECT ?', profile['fingerprint'])
+        self.assertEqual(1000, profile['total'])
+
+    def testRenderDELETE(self):
+        """L{SQLProfileResource.render_DELETE} resets the SQL profile."""
+        profiler = SQLProfiler()
+        profiler.record('GET /objects', 'SELECT 1', timedelta(0, 1), 1)
+        request = FakeRequest(method='DELETE')
+        resource = SQLProfileResource(profiler)
+        self.assertEqual('', resource.render_DELETE(request))
+        self.assertEqual(http.NO_CONTENT, request.code)
+        self.assertEqual({}, profiler.statements)
+
+
+class CreateAdminResourceTest(FluidinfoTestCase):
+
+    def testCreateAdminResource(self):
+        """
+        L{createAdminResource} serves the metrics on C{/metrics} and the SQL
+        profile on C{/sql}.
+        """
+        root = createAdminResource(Metrics(), SQLProfiler())
+        self.assertTrue(isinstance(root.children['metrics'], MetricsResource))
+        self.assertTrue(isinstance(root.children['sql'], SQLProfileResource))
+        self.assertNotIn('profile', root.children)
+
+    def testCreateAdminResourceWithTransact(self):
+        """
+        L{createAdminResource} serves stack profiles on C{/profile} if a
+        L{Transact} instance is provided.
+        """
+        root = createAdminResource(Metrics(), SQLProfiler(),
+                                   Transact(FakeThreadPool()))
+        self.assertTrue(isinstance(root.children['profile'],
+                                   StackProfileResource))
+
+
+def createAuthorizedRequest(username, password, args=None):
+    """Create a L{FakeRequest} with HTTP basic authentication credentials.
+
+    @param username: The C{str} username to send.
+    @param password: The C{str} password to send.
+    @param args: Optionally, the arguments of the request.
+    @return: A L{FakeRequest} instance.
+    """
+    credentials = b64encode('%s:%s' % (username, password))
+    headers = Headers({'Authorization': ['Basic %s' % credentials]})
+    return FakeRequest(args=args, headers=headers)
+
+
+def notifyFinished(request):
+    """Get a C{Deferred} that fires when a L{FakeRequest} is finished.
+
+    @param request: The L{FakeRequest} to wait for.
+    @return: A C{Deferred} that fires with C{None}.
+    """
+    deferred = Deferred()
+    finish = request.finish
+
+    def finished():
+        finish()
+        deferred.callback(None)
+
+    request.finish = finished
+    return deferred
+
+
+class GetBasicCredentialsTest(FluidinfoTestCase):
+
+    def testGetBasicCredentials(self):
+        """
+        L{getBasicCredentials} returns the username and password sent with
+        HTTP basic authentication.
+        """
+        request = createAuthorizedRequest('user', 'pass:word')
+        self.assertEqual((u'user', u'pass:word'),
+                         getBasicCredentials(request))
+
+    def testGetBasicCredentialsWithoutHeader(self):
+        """
+        L{getBasicCredentials} returns C{None} if the request doesn't have
+        an C{Authorization} header.
+        """
+        self.assertIdentical(None, getBasicCredentials(FakeRequest()))
+
+    def testGetBasicCredentialsWithInvalidHeader(self):
+        """
+        L{getBasicCredentials} returns C{None} if the C{Authorization} header
+        doesn't have valid basic credentials.
+        """
+        for value in ['OAuth abc', 'Basic !!!', 'Basic %s' % b64encode('x')]:
+            headers = Headers({'Authorization': [value]})
+            request = FakeRequest(headers=headers)
+            self.assertIdentical(None, getBasicCredentials(request))
+
+
+class CheckSuperuserTest(FluidinfoTestCase):
+
+    resources = [('cache', CacheResource()),
+                 ('config', ConfigResource()),
+                 ('store', DatabaseResource())]
+
+    def setUp(self):
+        super(CheckSuperuserTest, self).setUp()
+        createSystemData()
+
+    def testCheckSuperuser(self):
+        """
+        L{checkSuperuser} returns C{True} for the credentials of a
+        superuser.
+        """
+        self.assertTrue(checkSuperuser(u'fluiddb', u'secret'))
+
+    def testCheckSuperuserWithWrongPassword(self):
+        """L{checkSuperuser} returns C{False} if the password is wrong."""
+        self.assertFalse(checkSuperuser(u'fluiddb', u'wrong'))
+
+    def testCheckSuperuserWithUnknownUser(self):
+        """L{checkSuperuser} returns C{False} for unknown users."""
+        self.assertFalse(checkSuperuser(u'unknown', u'secret'))
+
+    def testCheckSuperuserWithRegularUser(self):
+        """
+        L{checkSuperuser} returns C{False} for users that aren't superusers.
+        """
+        UserAPI().create([(u'user', u'secret', u'User', u'user@example.com')])
+        self.assertFalse(checkSuperuser(u'user', u'secret'))
+
+
+class StackProfileResourceTest(FluidinfoTestCase):
+
+    def setUp(self):
+        super(StackProfileResourceTest, self).setUp()
+        self.clock = Clock()
+        self.credentials = []
+
+    def checkCredentials(self, username, password):
+        """Accept the C{admin} user with the C{secret} password."""
+        self.credentials.append((username, password))
+        return succeed((username, password) == (u'admin', u'secret'))
+
+    def createResource(self):
+        """Create a L{StackProfileResource} that samples the test thread."""
+        return StackProfileResource(
+            self.checkCredentials, clock=self.clock,
+            getLabel=lambda thread: 'reactor')
+
+    @inlineCallbacks
+    def testRenderGET(self):
+        """
+        L{StackProfileResource.render_GET} samples stacks for the requested
+        number of seconds and returns them as collapsed stacks.
+        """
+        request = createAuthorizedRequest('admin', 'secret',
+                                          {'seconds': ['2']})
+        finished = notifyFinished(request)
+        resource = self.createResource()
+        self.assertEqual(NOT_DONE_YET, resource.render_GET(request))
+        self.assertEqual([(u'admin', u'secret')], self.credentials)
+        self.clock.advance(1)
+        self.assertFalse(request.finished)
+        self.clock.advance(1)
+        yield finished
+        self.assertEqual(200, request.code)
+        self.assertEqual(['text/plain'],
+                         request.responseHeaders.getRawHeaders('Content-Type'))
+        for line in request.response.splitlines():
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(stack.startswith('reactor;'))
+            self.assertTrue(int(count) >= 1)
+        self.assertNotEqual('', request.response)
+
+    def testRenderGETWithoutCredentials(self):
+        """
+        L{StackProfileResource.render_GET} asks for credentials if they
+        weren't sent.
+        """
+        request = FakeRequest()
+        body = self.createResource().render_GET(request)
+        self.assertEqual(http.UNAUTHORIZED, request.code)
+        self.assertEqual('Basic realm="fluidinfo"',
+                         request.getResponseHeader('WWW-Authenticate'))
+        self.assertIn('superusers', body)
+
+    def testRenderGETWithInvalidCredentials(self):
+        """
+        L{StackProfileResource.render_GET} returns an C{UNAUTHORIZED} error
+        if the credentials don't belong to a superuser.
+        """
+        request = createAuthorizedRequest('admin', 'wrong')
+        self.assertEqual(NOT_DONE_YET,
+                         self.createResource().render_GET(request))
+        self.assertTrue(request.finished)
+        self.assertEqual(http.UNAUTHORIZED, request.code)
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def testRenderGETWithInvalidSeconds(self):
+        """
+        L{StackProfileResource.render_GET} returns a C{BAD_REQUEST} error if
+        the number of seconds is invalid or too large.
+        """
+        for seconds in ['abc', '0', '301']:
+            request = createAuthorizedRequest('admin', 'secret',
+                                              {'seconds': [seconds]})
+            self.createResource().render_GET(request)
+            self.assertEqual(http.BAD_REQUEST, request.code)
+        self.assertEqual([], self.credentials)
+
+    def testRenderGETWithInvalidInterval(self):
+        """
+        L{StackProfileResource.render_GET} returns a C{BAD_REQUEST} error if
+        the interval between samples is invalid, too short or too long.
+        """
+        for interval in ['abc', '0', '0.000001', '300']:
+            request = createAuthorizedRequest('admin', 'secret',
+                                              {'interval': [interval]})
+            self.createResource().render_GET(request)
+            self.assertEqual(http.BAD_REQUEST, request.code)
+        self.assertEqual([], self.credentials)
+
+    @inlineCallbacks
+    def testRenderGETWhileSampling(self):
+        """
+        L{StackProfileResource.render_GET} returns a C{CONFLICT} error if a
+        profile is already being taken.
+        """
+        resource = self.createResource()
+        first = createAuthorizedRequest('admin', 'secret')
+        finished = notifyFinished(first)
+        resource.render_GET(first)
+        second = createAuthorizedRequest('admin', 'secret')
+        resource.render_GET(second)
+        self.assertTrue(second.finished)
+        self.assertEqual(http.CONFLICT, second.code)
+        self.clock.advance(10)
+        yield finished
+        self.assertEqual(200, first.code)
+        third = createAuthorizedRequest('admin', 'secret', {'seconds': ['1']})
+        finished = notifyFinished(third)
+        resource.render_GET(third)
+        self.clock.advance(1)
+        yield finished
+        self.assertEqual(200, third.code)
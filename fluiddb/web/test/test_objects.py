@@ -1,14 +1,28 @@
+from cStringIO import StringIO
+from datetime import datetime
+from hashlib import sha256
 import json
 
 from twisted.internet import defer
+from twisted.web import http
+from twisted.web.http_headers import Headers
 
 from fluiddb.testing.basic import FluidinfoTestCase
 from fluiddb.testing.doubles import FakeRequest, FakeSession
-from fluiddb.web.query import createThriftValue
+from fluiddb.web.query import createBinaryThriftValue, createThriftValue
 from fluiddb.web.objects import TagInstanceResource
 from fluiddb.web.util import buildHeader
 
 
+class FakeTagValue(object):
+    """A fake L{TagValue} for binary values."""
+
+    def __init__(self, value, creationTime, fileID=None):
+        self.value = value
+        self.creationTime = creationTime
+        self.fileID = fileID
+
+
 class FakeFacade(object):
     """
     Simple dummy version of the L{FacadeHandler}. It implements only one
@@ -18,11 +32,24 @@ class FakeFacade(object):
     def __init__(self):
         self.values = {}
 
-    def getTagInstance(self, session, path, objectId):
-        """
-        Returns an object previously stored in C{values}.
-        """
-        tvalue = createThriftValue(self.values[objectId][path])
+    def getTagInstance(self, session, path, objectId, withContents=True):
+        """
+        Returns an object previously stored in C{values}.  Binary values are
+        stored as C{{'mime-type': <mime-type>, 'contents': <contents>}}
+        dicts and returned with an open file for their contents, or C{None}
+        if C{withContents} is C{False}.
+        """
+        value = self.values[objectId][path]
+        if isinstance(value, dict):
+            contents = value['contents']
+            key = StringIO(contents) if withContents else None
+            tvalue = createBinaryThriftValue(key, value['mime-type'])
+            tagValue = FakeTagValue({'mime-type': value['mime-type'],
+                                     'size': len(contents)},
+                                    datetime(2012, 1, 2, 3, 4, 5),
+                                    sha256(contents).hexdigest())
+            return defer.succeed((tvalue, tagValue))
+        tvalue = createThriftValue(value)
         return defer.succeed((tvalue, None))
 
     def resolveQuery(self, session, query):
@@ -90,6 +117,250 @@ class TagInstanceResourceTest(FluidinfoTestCase):
         value = json.loads(body)
         self.assertEqual(['x', 'y', 'z', 'a', 'b', 'c'], value)
 
+    @defer.inlineCallbacks
+    def testGETBinaryValue(self):
+        """
+        The contents of a binary value are streamed to the client with a
+        C{Content-Length} taken from the stored size.
+        """
+        facadeClient = FakeFacade()
+        facadeClient.values = {
+            'fe2f50c8-997f-4049-a180-9a37543d001d': {
+                'tag/test': {'mime-type': 'text/plain',
+                             'contents': 'Hello, world!' * 10000}}}
+        resource = TagInstanceResource(facadeClient, FakeSession(),
+                                       'fe2f50c8-997f-4049-a180-9a37543d001d',
+                                       'tag/test')
+        request = FakeRequest(method='GET')
+        yield resource.render_GET(request)
+        self.assertTrue(request.finished)
+        self.assertEqual('Hello, world!' * 10000, request.response)
+        self.assertEqual('130000', request.getResponseHeader('Content-Length'))
+        self.assertEqual('text/plain',
+                         request.getResponseHeader('Content-Type'))
+
+    def testGETBinaryValueWithMatchingETag(self):
+        """
+        A C{GET} request with an C{If-None-Match} header matching the
+        C{ETag} of a binary value, derived from its file ID, returns a
+        C{304 Not Modified} response without a body.
+        """
+        contents = 'Hello, world!'
+        facadeClient = FakeFacade()
+        facadeClient.values = {
+            'fe2f50c8-997f-4049-a180-9a37543d001d': {
+                'tag/test': {'mime-type': 'text/plain',
+                             'contents': contents}}}
+        resource = TagInstanceResource(facadeClient, FakeSession(),
+                                       'fe2f50c8-997f-4049-a180-9a37543d001d',
+                                       'tag/test')
+        etag = '"%s"' % sha256(contents).hexdigest()
+        headers = Headers({'If-None-Match': [etag]})
+        request = FakeRequest(method='GET', headers=headers)
+        resource.render_GET(request)
+        self.assertTrue(request.finished)
+        self.assertEqual(http.NOT_MODIFIED, request.code)
+        self.assertEqual('', request.response)
+        self.assertEqual(etag, request.getResponseHeader('ETag'))
+
+    def testGETBinaryValueIfModifiedSince(self):
+        """
+        A C{GET} request with an C{If-Modified-Since} header returns a
+        C{304 Not Modified} response if the value hasn't changed since then,
+        and the value otherwise.
+        """
+        facadeClient = FakeFacade()
+        facadeClient.values = {
+            'fe2f50c8-997f-4049-a180-9a37543d001d': {
+                'tag/test': {'mime-type': 'text/plain',
+                             'contents': 'Hello, world!'}}}
+        resource = TagInstanceResource(facadeClient, FakeSession(),
+                                       'fe2f50c8-997f-4049-a180-9a37543d001d',
+                                       'tag/test')
+        headers = Headers({'If-Modified-Since':
+                           ['Mon, 02 Jan 2012 03:04:05 GMT']})
+        request = FakeRequest(method='GET', headers=headers)
+        resource.render_GET(request)
+        self.assertEqual(http.NOT_MODIFIED, request.code)
+
+        headers = Headers({'If-Modified-Since':
+                           ['Sun, 01 Jan 2012 03:04:05 GMT']})
+        request = FakeRequest(method='GET', headers=headers)
+        resource.render_GET(request)
+        self.assertEqual(http.OK, request.code)
+        self.assertEqual('Hello, world!', request.response)
+
+    def testGETBinaryValueWithRange(self):
+        """
+        A C{GET} request with a C{Range} header for a binary value returns a
+        C{206 Partial Content} response with the requested bytes.
+        """
+        facadeClient = FakeFacade()
+        facadeClient.values = {
+            'fe2f50c8-997f-4049-a180-9a37543d001d': {
+                'tag/test': {'mime-type': 'text/plain',
+                             'contents': 'Hello, world!'}}}
+        resource = TagInstanceResource(facadeClient, FakeSession(),
+                                       'fe2f50c8-997f-4049-a180-9a37543d001d',
+                                       'tag/test')
+        headers = Headers({'Range': ['bytes=7-11']})
+        request = FakeRequest(method='GET', headers=headers)
+        resource.render_GET(request)
+        self.assertTrue(request.finished)
+        self.assertEqual(http.PARTIAL_CONTENT, request.code)
+        self.assertEqual('world', request.response)
+        self.assertEqual('5', request.getResponseHeader('Content-Length'))
+        self.assertEqual('bytes 7-11/13',
+                         request.getResponseHeader('Content-Range'))
+        self.assertEqual('bytes', request.getResponseHeader('Accept-Ranges'))
+
+    def testGETBinaryValueWithUnsatisfiableRange(self):
+        """
+        A C{GET} request with a C{Range} header that starts after the end of a
+        binary value returns a C{416 Requested Range Not Satisfiable}
+        response.
+        """
+        facadeClient = FakeFacade()
+        facadeClient.values = {
+            'fe2f50c8-997f-4049-a180-9a37543d001d': {
+                'tag/test': {'mime-type': 'text/plain',
+                             'contents': 'Hello, world!'}}}
+        resource = TagInstanceResource(facadeClient, FakeSession(),
+                                       'fe2f50c8-997f-4049-a180-9a37543d001d',
+                                       'tag/test')
+        headers = Headers({'Range': ['bytes=13-']})
+        request = FakeRequest(method='GET', headers=headers)
+        resource.render_GET(request)
+        self.assertTrue(request.finished)
+        self.assertEqual(http.REQUESTED_RANGE_NOT_SATISFIABLE, request.code)
+        self.assertEqual('bytes */13',
+                         request.getResponseHeader('Content-Range'))
+
+    @defer.inlineCallbacks
+    def testGETPrimitiveValueWithMatchingETag(self):
+        """
+        A C{GET} request with an C{If-None-Match} header matching the
+        C{ETag} of a primitive value returns a C{304 Not Modified} response.
+        """
+        facadeClient = FakeFacade()
+        facadeClient.values = {
+            'fe2f50c8-997f-4049-a180-9a37543d001d': {'tag/test': 42}}
+        resource = TagInstanceResource(facadeClient, FakeSession(),
+                                       'fe2f50c8-997f-4049-a180-9a37543d001d',
+                                       'tag/test')
+        request = FakeRequest(method='GET')
+        yield resource.deferred_render_GET(request)
+        etag = request.getResponseHeader('ETag')
+        self.assertEqual('"%s"' % sha256('42').hexdigest(), etag)
+
+        headers = Headers({'If-None-Match': [etag]})
+        request = FakeRequest(method='GET', headers=headers)
+        body = yield resource.deferred_render_GET(request)
+        self.assertEqual(http.NOT_MODIFIED, request.code)
+        self.assertEqual('', body)
+
+    @defer.inlineCallbacks
+    def testGETPrimitiveValueWithCallbackETag(self):
+        """
+        The C{ETag} of a primitive value requested with a JSONP C{callback}
+        is built from the wrapped body that's sent.
+        """
+        facadeClient = FakeFacade()
+        facadeClient.values = {
+            'fe2f50c8-997f-4049-a180-9a37543d001d': {'tag/test': 42}}
+        resource = TagInstanceResource(facadeClient, FakeSession(),
+                                       'fe2f50c8-997f-4049-a180-9a37543d001d',
+                                       'tag/test')
+        request = FakeRequest(method='GET', args={'callback': ['foo']})
+        body = yield resource.deferred_render_GET(request)
+        self.assertEqual('foo(42)', body)
+        self.assertEqual('"%s"' % sha256('foo(42)').hexdigest(),
+                         request.getResponseHeader('ETag'))
+        self.assertEqual(str(len(body)),
+                         request.getResponseHeader('Content-Length'))
+
+    @defer.inlineCallbacks
+    def testGETCompressedPrimitiveValueETag(self):
+        """
+        The C{ETag} of a primitive value that will be compressed includes
+        the content coding, so it differs from the C{ETag} of the
+        uncompressed value.  A matching C{If-None-Match} header returns a
+        C{304 Not Modified} response.
+        """
+        value = 'Hello, world!' * 1000
+        facadeClient = FakeFacade()
+        facadeClient.values = {
+            'fe2f50c8-997f-4049-a180-9a37543d001d': {'tag/test': value}}
+        resource = TagInstanceResource(facadeClient, FakeSession(),
+                                       'fe2f50c8-997f-4049-a180-9a37543d001d',
+                                       'tag/test')
+        request = FakeRequest(method='GET')
+        body = yield resource.deferred_render_GET(request)
+        identityETag = request.getResponseHeader('ETag')
+        self.assertEqual('"%s"' % sha256(body).hexdigest(), identityETag)
+
+        headers = Headers({'Accept-Encoding': ['gzip']})
+        request = FakeRequest(method='GET', headers=headers)
+        yield resource.deferred_render_GET(request)
+        gzipETag = request.getResponseHeader('ETag')
+        self.assertEqual('"%s-gzip"' % sha256(body).hexdigest(), gzipETag)
+
+        headers = Headers({'Accept-Encoding': ['gzip'],
+                           'If-None-Match': [gzipETag]})
+        request = FakeRequest(method='GET', headers=headers)
+        body = yield resource.deferred_render_GET(request)
+        self.assertEqual(http.NOT_MODIFIED, request.code)
+
+        headers = Headers({'If-None-Match': [gzipETag]})
+        request = FakeRequest(method='GET', headers=headers)
+        body = yield resource.deferred_render_GET(request)
+        self.assertEqual(http.OK, request.code)
+        self.assertEqual(value, json.loads(body))
+
+    def testGETBinaryValueETagWithAcceptEncoding(self):
+        """
+        Binary values are sent uncompressed, even if the client accepts a
+        compressed response, so their C{ETag} is always derived from their
+        file ID alone.
+        """
+        contents = 'Hello, world!' * 1000
+        facadeClient = FakeFacade()
+        facadeClient.values = {
+            'fe2f50c8-997f-4049-a180-9a37543d001d': {
+                'tag/test': {'mime-type': 'text/plain',
+                             'contents': contents}}}
+        resource = TagInstanceResource(facadeClient, FakeSession(),
+                                       'fe2f50c8-997f-4049-a180-9a37543d001d',
+                                       'tag/test')
+        headers = Headers({'Accept-Encoding': ['gzip']})
+        request = FakeRequest(method='GET', headers=headers)
+        resource.render_GET(request)
+        self.assertTrue(request.finished)
+        self.assertEqual(contents, request.response)
+        self.assertIdentical(None,
+                             request.getResponseHeader('Content-Encoding'))
+        self.assertEqual('"%s"' % sha256(contents).hexdigest(),
+                         request.getResponseHeader('ETag'))
+
+    @defer.inlineCallbacks
+    def testHEADBinaryValue(self):
+        """
+        A C{HEAD} request for a binary value has a C{Content-Length} header
+        but no body.
+        """
+        facadeClient = FakeFacade()
+        facadeClient.values = {
+            'fe2f50c8-997f-4049-a180-9a37543d001d': {
+                'tag/test': {'mime-type': 'text/plain',
+                             'contents': 'Hello, world!'}}}
+        resource = TagInstanceResource(facadeClient, FakeSession(),
+                                       'fe2f50c8-997f-4049-a180-9a37543d001d',
+                                       'tag/test')
+        request = FakeRequest(method='HEAD')
+        body = yield resource.deferred_render_HEAD(request)
+        self.assertEqual('', body)
+        self.assertEqual('13', request.getResponseHeader('Content-Length'))
+
     def testRequestReturnsTypeHeaderFloat(self):
         """
         L{TagInstanceResource.render_HEAD} should put an X-FluidDB-Type header
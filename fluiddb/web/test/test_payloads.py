@@ -12,8 +12,11 @@ from twisted.web import http
 from twisted.web.http_headers import Headers
 
 from fluiddb.common import error
+from fluiddb.data.blob import SpooledFile
 from fluiddb.testing.doubles import FakeSession
 from fluiddb.web.namespaces import NamespacesResource
+from fluiddb.web.payloads import extractPayload
+from fluiddb.web.request import DiscardedContent
 
 
 class NoContent(object):
@@ -46,6 +49,7 @@ class FakeRequest(object):
     """
 
     content = None
+    startedWriting = False
 
     def __init__(self, method, uri, headers=None, args=None):
         self.method = method
@@ -250,3 +254,73 @@ class TestPayloads(unittest.TestCase):
         resource = NamespacesResource(FakeFacadeClient(), FakeSession())
         resource.render(request)
         self.assertEqual(request.code, http.PRECONDITION_FAILED)
+
+
+class ExtractPayloadTest(unittest.TestCase):
+
+    def createRequest(self, content, headers):
+        """Create a request with a spooled body.
+
+        @param content: The C{str} body of the request.
+        @param headers: A C{dict} with the request headers.
+        @return: An C{http.Request} whose content is a L{SpooledFile}.
+        """
+        request = http.Request(DummyChannel(), False)
+        request._fluidDB_reqid = 'xxx'
+        for name, value in headers.iteritems():
+            request.requestHeaders.setRawHeaders(name, [value])
+        request.content = SpooledFile()
+        self.addCleanup(request.content.close)
+        request.content.write(content)
+        return request
+
+    def testTooLarge(self):
+        """
+        L{extractPayload} raises L{RequestEntityTooLarge} if the body of the
+        request was discarded because it's too large.
+        """
+        request = http.Request(DummyChannel(), False)
+        request.content = DiscardedContent()
+        self.assertRaises(error.RequestEntityTooLarge, extractPayload, request)
+
+    def testSpooledPayload(self):
+        """
+        L{extractPayload} returns a L{SpooledFile} body without reading it if
+        C{spooled} is C{True}.
+        """
+        request = self.createRequest('content', {'Content-Length': '7'})
+        payload = extractPayload(request, spooled=True)
+        self.assertIdentical(request.content, payload)
+        self.assertEqual('content', payload.read())
+
+    def testSpooledPayloadNotPermitted(self):
+        """
+        L{extractPayload} reads a L{SpooledFile} body into memory if
+        C{spooled} is C{False}.
+        """
+        request = self.createRequest('content', {'Content-Length': '7'})
+        self.assertEqual('content', extractPayload(request))
+
+    def testSpooledPayloadLengthMismatch(self):
+        """
+        L{extractPayload} raises L{ContentLengthMismatch} if the size of a
+        spooled body doesn't match the C{Content-Length} header.
+        """
+        request = self.createRequest('content', {'Content-Length': '8'})
+        self.assertRaises(error.ContentLengthMismatch, extractPayload,
+                          request, spooled=True)
+
+    def testSpooledPayloadContentMD5(self):
+        """
+        L{extractPayload} checks the C{Content-MD5} header of a spooled body.
+        """
+        digest = base64.standard_b64encode(md5('content').digest())
+        request = self.createRequest('content', {'Content-Length': '7',
+                                                 'Content-MD5': digest})
+        payload = extractPayload(request, spooled=True)
+        self.assertEqual('content', payload.read())
+
+        request = self.createRequest('content', {'Content-Length': '7',
+                                                 'Content-MD5': 'bad-md5'})
+        self.assertRaises(error.ContentChecksumMismatch, extractPayload,
+                          request, spooled=True)
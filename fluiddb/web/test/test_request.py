@@ -0,0 +1,73 @@
+from cStringIO import StringIO
+
+from fluiddb.data.blob import SpooledFile
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.resources import (
+    ConfigResource, TemporaryDirectoryResource)
+from fluiddb.web.request import (
+    DiscardedContent, FluidinfoRequest, SPOOL_THRESHOLD)
+from fluiddb.web.test.test_headers import DummyChannel
+
+
+class FluidinfoRequestTest(FluidinfoTestCase):
+
+    resources = [('config', ConfigResource()),
+                 ('fs', TemporaryDirectoryResource())]
+
+    def setUp(self):
+        super(FluidinfoRequestTest, self).setUp()
+        self.config.set('service', 'temp-path', self.fs.path)
+
+    def createRequest(self, length):
+        """Create a L{FluidinfoRequest} that has received its headers.
+
+        @param length: The length of the request body, or C{None} if it isn't
+            known.
+        @return: A L{FluidinfoRequest} instance.
+        """
+        request = FluidinfoRequest(DummyChannel(), False)
+        request.gotLength(length)
+        self.addCleanup(request.content.close)
+        return request
+
+    def testSmallBody(self):
+        """Small request bodies are kept in memory."""
+        request = self.createRequest(100)
+        self.assertIsInstance(request.content, type(StringIO()))
+
+    def testLargeBody(self):
+        """
+        Large request bodies are spooled to a L{SpooledFile} in the
+        C{temp-path} directory.
+        """
+        request = self.createRequest(SPOOL_THRESHOLD)
+        self.assertIsInstance(request.content, SpooledFile)
+        self.assertTrue(request.content.name.startswith(self.fs.path))
+
+    def testBodyWithoutLength(self):
+        """Request bodies without a known length are spooled."""
+        request = self.createRequest(None)
+        self.assertIsInstance(request.content, SpooledFile)
+
+    def testBodyTooLarge(self):
+        """
+        Request bodies with a C{Content-Length} larger than the
+        C{max-upload-size} option are discarded.
+        """
+        self.config.set('service', 'max-upload-size', '1000')
+        self.addCleanup(self.config.remove_option, 'service',
+                        'max-upload-size')
+        request = self.createRequest(1001)
+        self.assertIsInstance(request.content, DiscardedContent)
+
+    def testBodyWithoutLengthTooLarge(self):
+        """
+        Request bodies without a known length are discarded once they grow
+        larger than the C{max-upload-size} option.
+        """
+        self.config.set('service', 'max-upload-size', '10')
+        self.addCleanup(self.config.remove_option, 'service',
+                        'max-upload-size')
+        request = self.createRequest(None)
+        request.handleContentChunk('Hello, world!')
+        self.assertTrue(request.content.tooLarge)
@@ -21,6 +21,7 @@ class FakeRequest(object):
         self.requestHeaders = Headers()
         self.responseHeaders = Headers()
         self._fluidDB_reqid = 'xxx'
+        self.startedWriting = False
         self.finished = False
 
     def finish(self):
@@ -59,6 +60,16 @@ class FakeRequest(object):
         self.status = code
 
 
+class FakeTransport(object):
+    """A fake transport that records when its connection is dropped."""
+
+    disconnected = False
+
+    def loseConnection(self):
+        """Drop the connection."""
+        self.disconnected = True
+
+
 class HandleRequestErrorTest(TestCase):
 
     def setUp(self):
@@ -101,6 +112,20 @@ class HandleRequestErrorTest(TestCase):
         handleRequestError(failure, self.request, self.resource)
         self.assertTrue(self.request.finished)
 
+    def testFailureAfterStartedWritingDropsConnection(self):
+        """
+        If part of a streamed response has already been written when a
+        failure occurs, the connection is dropped instead of finishing the
+        request, so the client doesn't see a truncated response as a
+        complete one.
+        """
+        self.request.startedWriting = True
+        self.request.transport = FakeTransport()
+        failure = Failure(Exception("Failure while streaming."))
+        handleRequestError(failure, self.request, self.resource)
+        self.assertFalse(self.request.finished)
+        self.assertTrue(self.request.transport.disconnected)
+
     def testFailureReportsRequestID(self):
         """
         The unique request ID is included in HTTP response headers when a
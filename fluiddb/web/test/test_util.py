@@ -0,0 +1,250 @@
+from datetime import datetime
+from hashlib import sha256
+from StringIO import StringIO
+
+from twisted.web import http
+from twisted.web.http_headers import Headers
+
+from fluiddb.common.defaults import contentTypeForPrimitiveJSON
+from fluiddb.common.error import RangeNotSatisfiable
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.doubles import FakeRequest
+from fluiddb.web.compression import CompressionOptions
+from fluiddb.web.util import (
+    FileRange, getByteRange, getPrimitiveValueBody, getTagValueResponse,
+    isNotModified)
+
+
+class IsNotModifiedTest(FluidinfoTestCase):
+
+    def testWithoutConditionalHeaders(self):
+        """
+        L{isNotModified} returns C{False} if the request doesn't have any
+        conditional headers.
+        """
+        request = FakeRequest()
+        self.assertFalse(isNotModified(request, '"abc"',
+                                       datetime(2012, 1, 2, 3, 4, 5)))
+
+    def testIfNoneMatch(self):
+        """
+        L{isNotModified} returns C{True} if any of the entity tags in the
+        C{If-None-Match} header matches the current one.
+        """
+        headers = Headers({'If-None-Match': ['"xyz", "abc"']})
+        request = FakeRequest(headers=headers)
+        self.assertTrue(isNotModified(request, '"abc"'))
+
+    def testIfNoneMatchWithWeakTag(self):
+        """L{isNotModified} uses weak comparison for entity tags."""
+        headers = Headers({'If-None-Match': ['W/"abc"']})
+        request = FakeRequest(headers=headers)
+        self.assertTrue(isNotModified(request, '"abc"'))
+
+    def testIfNoneMatchWithWildcard(self):
+        """
+        L{isNotModified} returns C{True} if the C{If-None-Match} header is
+        C{*}.
+        """
+        headers = Headers({'If-None-Match': ['*']})
+        request = FakeRequest(headers=headers)
+        self.assertTrue(isNotModified(request, '"abc"'))
+
+    def testIfNoneMatchTakesPrecedence(self):
+        """
+        L{isNotModified} ignores the C{If-Modified-Since} header if an
+        C{If-None-Match} header is present.
+        """
+        headers = Headers({'If-None-Match': ['"xyz"'],
+                           'If-Modified-Since':
+                           ['Mon, 02 Jan 2012 03:04:05 GMT']})
+        request = FakeRequest(headers=headers)
+        self.assertFalse(isNotModified(request, '"abc"',
+                                       datetime(2012, 1, 2, 3, 4, 5)))
+
+    def testIfModifiedSince(self):
+        """
+        L{isNotModified} returns C{True} if the resource hasn't changed since
+        the time in the C{If-Modified-Since} header, ignoring fractions of a
+        second.
+        """
+        headers = Headers({'If-Modified-Since':
+                           ['Mon, 02 Jan 2012 03:04:05 GMT']})
+        request = FakeRequest(headers=headers)
+        self.assertTrue(isNotModified(request, '"abc"',
+                                      datetime(2012, 1, 2, 3, 4, 5, 999)))
+        self.assertFalse(isNotModified(request, '"abc"',
+                                       datetime(2012, 1, 2, 3, 4, 6)))
+
+    def testIfModifiedSinceWithInvalidDate(self):
+        """
+        L{isNotModified} returns C{False} if the C{If-Modified-Since} header
+        can't be parsed.
+        """
+        headers = Headers({'If-Modified-Since': ['yesterday']})
+        request = FakeRequest(headers=headers)
+        self.assertFalse(isNotModified(request, '"abc"',
+                                       datetime(2012, 1, 2, 3, 4, 5)))
+
+
+class GetByteRangeTest(FluidinfoTestCase):
+
+    def getByteRange(self, header, etag='"abc"', size=100, ifRange=None):
+        """Get the byte range for a request with the given C{Range} header.
+
+        @param header: The value of the C{Range} header.
+        @param etag: Optionally, the current entity tag.
+        @param size: Optionally, the size of the body.
+        @param ifRange: Optionally, the value of the C{If-Range} header.
+        @return: The result of L{getByteRange}.
+        """
+        headers = Headers({'Range': [header]})
+        if ifRange is not None:
+            headers.setRawHeaders('If-Range', [ifRange])
+        return getByteRange(FakeRequest(headers=headers), etag, size)
+
+    def testWithoutRange(self):
+        """
+        L{getByteRange} returns C{None} if the request doesn't have a
+        C{Range} header.
+        """
+        self.assertIdentical(None, getByteRange(FakeRequest(), '"abc"', 100))
+
+    def testRange(self):
+        """
+        L{getByteRange} returns the offset and length of the requested range.
+        """
+        self.assertEqual((10, 11), self.getByteRange('bytes=10-20'))
+
+    def testOpenEndedRange(self):
+        """
+        L{getByteRange} returns the rest of the body if the range doesn't
+        have a last byte.
+        """
+        self.assertEqual((10, 90), self.getByteRange('bytes=10-'))
+
+    def testRangePastEnd(self):
+        """
+        L{getByteRange} truncates ranges that end past the end of the body.
+        """
+        self.assertEqual((90, 10), self.getByteRange('bytes=90-200'))
+
+    def testSuffixRange(self):
+        """L{getByteRange} returns the last bytes for a suffix range."""
+        self.assertEqual((80, 20), self.getByteRange('bytes=-20'))
+        self.assertEqual((0, 100), self.getByteRange('bytes=-200'))
+
+    def testUnsatisfiableRange(self):
+        """
+        L{getByteRange} raises L{RangeNotSatisfiable} if the range starts
+        after the end of the body.
+        """
+        self.assertRaises(RangeNotSatisfiable, self.getByteRange,
+                          'bytes=100-')
+
+    def testIgnoredRanges(self):
+        """
+        L{getByteRange} returns C{None} for multiple ranges, other units and
+        malformed headers.
+        """
+        for header in ['bytes=0-1,5-6', 'items=0-1', 'bytes=5', 'bytes=a-b',
+                       'bytes=20-10']:
+            self.assertIdentical(None, self.getByteRange(header))
+
+    def testIfRange(self):
+        """
+        L{getByteRange} honours the C{Range} header if the C{If-Range} header
+        matches the current entity tag, and ignores it otherwise.
+        """
+        self.assertEqual((0, 10),
+                         self.getByteRange('bytes=0-9', ifRange='"abc"'))
+        self.assertIdentical(None,
+                             self.getByteRange('bytes=0-9', ifRange='"xyz"'))
+
+
+class GetPrimitiveValueBodyTest(FluidinfoTestCase):
+
+    def testGetPrimitiveValueBody(self):
+        """
+        L{getPrimitiveValueBody} returns the body and an entity tag built
+        from its hash, and sets the C{Content-Type} header.
+        """
+        request = FakeRequest()
+        body, etag = getPrimitiveValueBody(
+            request, '42', contentTypeForPrimitiveJSON, CompressionOptions())
+        self.assertEqual('42', body)
+        self.assertEqual('"%s"' % sha256('42').hexdigest(), etag)
+        self.assertEqual(contentTypeForPrimitiveJSON,
+                         request.getResponseHeader('Content-Type'))
+
+    def testGetPrimitiveValueBodyWithCallback(self):
+        """
+        L{getPrimitiveValueBody} wraps the body with a JSONP C{callback} and
+        builds the entity tag from the wrapped body, so it differs for each
+        callback.
+        """
+        request = FakeRequest(args={'callback': ['foo']})
+        body, etag = getPrimitiveValueBody(
+            request, '42', contentTypeForPrimitiveJSON, CompressionOptions())
+        self.assertEqual('foo(42)', body)
+        self.assertEqual('"%s"' % sha256('foo(42)').hexdigest(), etag)
+        self.assertEqual('text/javascript',
+                         request.getResponseHeader('Content-Type'))
+
+
+class GetTagValueResponseTest(FluidinfoTestCase):
+
+    def testGetTagValueResponse(self):
+        """
+        L{getTagValueResponse} sets the C{ETag}, C{Last-Modified} and
+        C{Content-Length} headers and returns the body.
+        """
+        request = FakeRequest()
+        body = getTagValueResponse(request, '42', 2, '"abc"',
+                                   datetime(2012, 3, 14, 16, 34, 16), http.OK)
+        self.assertEqual('42', body)
+        self.assertEqual(http.OK, request.code)
+        self.assertEqual('"abc"', request.getResponseHeader('ETag'))
+        self.assertEqual('Wed, 14 Mar 2012 16:34:16',
+                         request.getResponseHeader('Last-Modified'))
+        self.assertEqual('2', request.getResponseHeader('Content-Length'))
+
+    def testGetTagValueResponseNotModified(self):
+        """
+        L{getTagValueResponse} returns an empty body with a C{304 Not
+        Modified} code if the client's copy is still valid.
+        """
+        headers = Headers({'If-None-Match': ['"abc"']})
+        request = FakeRequest(headers=headers)
+        body = getTagValueResponse(request, '42', 2, '"abc"', None, http.OK)
+        self.assertEqual('', body)
+        self.assertEqual(http.NOT_MODIFIED, request.code)
+
+    def testGetTagValueResponseWithRange(self):
+        """
+        L{getTagValueResponse} returns a L{FileRange} with a C{206 Partial
+        Content} code for a C{Range} request, if ranges are accepted.
+        """
+        headers = Headers({'Range': ['bytes=2-4']})
+        request = FakeRequest(headers=headers)
+        body = getTagValueResponse(request, StringIO('content'), 7, '"abc"',
+                                   None, http.OK, acceptRanges=True)
+        self.assertTrue(isinstance(body, FileRange))
+        self.assertEqual((2, 3), (body.offset, body.length))
+        self.assertEqual(http.PARTIAL_CONTENT, request.code)
+        self.assertEqual('bytes', request.getResponseHeader('Accept-Ranges'))
+        self.assertEqual('bytes 2-4/7',
+                         request.getResponseHeader('Content-Range'))
+        self.assertEqual('3', request.getResponseHeader('Content-Length'))
+
+    def testGetTagValueResponseIgnoresRangeForHEAD(self):
+        """
+        L{getTagValueResponse} ignores C{Range} headers for C{HEAD} requests.
+        """
+        headers = Headers({'Range': ['bytes=2-4']})
+        request = FakeRequest(method='HEAD', headers=headers)
+        body = getTagValueResponse(request, None, 7, '"abc"', None, http.OK,
+                                   acceptRanges=True)
+        self.assertIdentical(None, body)
+        self.assertEqual(http.OK, request.code)
+        self.assertEqual('7', request.getResponseHeader('Content-Length'))
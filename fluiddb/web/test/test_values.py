@@ -0,0 +1,205 @@
+import gzip
+from StringIO import StringIO
+
+from twisted.internet.defer import (
+    CancelledError, Deferred, fail, inlineCallbacks, succeed)
+from twisted.web.http_headers import Headers
+
+from fluiddb.common.types_thrift.ttypes import TNonexistentTag
+from fluiddb.testing.basic import FluidinfoTestCase
+from fluiddb.testing.doubles import FakeRequest, FakeSession
+from fluiddb.testing.resources import ConfigResource
+from fluiddb.web.values import ResponseProducer, ValuesResource
+
+
+class FakeFacade(object):
+    """A fake L{Facade} that streams a canned C{/values} response.
+
+    @param chunks: The C{str} chunks of the response.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def getValuesForQuery(self, session, query, tags=None, write=None):
+        """
+        Write each chunk, waiting for any C{Deferred} returned by C{write}
+        before writing the next one, like L{FacadeTagValueMixin} does.
+        """
+        if write is None:
+            return succeed(''.join(self.chunks))
+        deferred = succeed(None)
+        for chunk in self.chunks:
+            deferred.addCallback(lambda result, chunk=chunk: write(chunk))
+        return deferred.addCallback(lambda result: None)
+
+
+class ResponseProducerTest(FluidinfoTestCase):
+
+    def testWait(self):
+        """
+        L{ResponseProducer.wait} returns a C{Deferred} that has already
+        fired if the producer isn't paused.
+        """
+        results = []
+        ResponseProducer().wait().addCallback(results.append)
+        self.assertEqual([None], results)
+
+    def testWaitWhilePaused(self):
+        """
+        L{ResponseProducer.wait} returns a C{Deferred} that only fires once
+        a paused producer is resumed.
+        """
+        producer = ResponseProducer()
+        producer.pauseProducing()
+        results = []
+        producer.wait().addCallback(results.append)
+        self.assertEqual([], results)
+        producer.resumeProducing()
+        self.assertEqual([None], results)
+
+    def testStopProducing(self):
+        """
+        L{ResponseProducer.stopProducing} fails the C{Deferred}s that are
+        waiting, and the ones returned afterwards, with C{CancelledError}.
+        """
+        producer = ResponseProducer()
+        producer.pauseProducing()
+        deferred = producer.wait()
+        producer.stopProducing()
+        self.assertFailure(deferred, CancelledError)
+        return self.assertFailure(producer.wait(), CancelledError)
+
+
+class ValuesResourceTest(FluidinfoTestCase):
+
+    resources = [('config', ConfigResource())]
+
+    def createRequest(self, acceptEncoding=None):
+        """Create a C{GET} request for C{/values}.
+
+        @param acceptEncoding: Optionally, the C{Accept-Encoding} header.
+        """
+        headers = Headers()
+        if acceptEncoding is not None:
+            headers.setRawHeaders('Accept-Encoding', [acceptEncoding])
+        request = FakeRequest(method='GET', headers=headers,
+                              args={'query': ['has test/tag'],
+                                    'tag': ['test/tag']})
+        # The request is still being answered while values are streamed.
+        request.notifyFinish = Deferred
+        return request
+
+    @inlineCallbacks
+    def testGET(self):
+        """A C{GET} request streams the response uncompressed by default."""
+        chunks = ['{"results": {"id": {', '"a": {}', '}}}']
+        resource = ValuesResource(FakeFacade(chunks), FakeSession())
+        request = self.createRequest()
+        result = yield resource.deferred_render_GET(request)
+        self.assertIdentical(None, result)
+        self.assertEqual(''.join(chunks), request.written.getvalue())
+        self.assertIdentical(None,
+                             request.getResponseHeader('Content-Encoding'))
+        self.assertIdentical(None, request.producer)
+
+    def testGETWaitsWhileTransportIsPaused(self):
+        """
+        A C{GET} request registers a L{ResponseProducer} and doesn't write
+        more of the response while the transport has paused it.
+        """
+        chunks = ['{"results": {"id": {', '"a": {}', '}}}']
+        resource = ValuesResource(FakeFacade(chunks), FakeSession())
+        request = self.createRequest()
+        write = request.write
+
+        def pausingWrite(data):
+            write(data)
+            request.producer.pauseProducing()
+
+        request.write = pausingWrite
+        results = []
+        deferred = resource.deferred_render_GET(request)
+        deferred.addCallback(results.append)
+        self.assertEqual(chunks[0], request.written.getvalue())
+        request.producer.resumeProducing()
+        self.assertEqual(''.join(chunks[:2]), request.written.getvalue())
+        self.assertEqual([], results)
+        request.producer.resumeProducing()
+        self.assertEqual(''.join(chunks), request.written.getvalue())
+        self.assertEqual([], results)
+        request.producer.resumeProducing()
+        self.assertEqual([None], results)
+        self.assertIdentical(None, request.producer)
+
+    def testGETStopsWhenTransportIsStopped(self):
+        """
+        A C{GET} request stops writing the response if the transport stops
+        its L{ResponseProducer}, because the client has gone away.
+        """
+        chunks = ['{"results": {"id": {', '"a": {}', '}}}']
+        resource = ValuesResource(FakeFacade(chunks), FakeSession())
+        request = self.createRequest()
+        write = request.write
+
+        def pausingWrite(data):
+            write(data)
+            request.producer.pauseProducing()
+
+        request.write = pausingWrite
+        deferred = resource.deferred_render_GET(request)
+        request.producer.stopProducing()
+        self.assertEqual(chunks[0], request.written.getvalue())
+        return self.assertFailure(deferred, CancelledError)
+
+    @inlineCallbacks
+    def testGETCompressed(self):
+        """
+        A C{GET} request that accepts C{gzip} streams a compressed response.
+        """
+        chunks = ['{"results": {"id": {', '"a": {}', '}}}']
+        resource = ValuesResource(FakeFacade(chunks), FakeSession())
+        request = self.createRequest('gzip')
+        yield resource.deferred_render_GET(request)
+        self.assertEqual('gzip', request.getResponseHeader('Content-Encoding'))
+        body = StringIO(request.written.getvalue())
+        self.assertEqual(''.join(chunks), gzip.GzipFile(fileobj=body).read())
+
+    @inlineCallbacks
+    def testGETCompressedInThread(self):
+        """
+        Chunks at least as large as the C{compression-thread-size} are
+        compressed in a thread, and are still written in order.
+        """
+        self.config.set('service', 'compression-thread-size', '100')
+        chunks = ['{"results": {"id": {',
+                  ', '.join('"%d": {}' % i for i in range(100)),
+                  '}}}']
+        resource = ValuesResource(FakeFacade(chunks), FakeSession())
+        request = self.createRequest('gzip')
+        yield resource.deferred_render_GET(request)
+        body = StringIO(request.written.getvalue())
+        self.assertEqual(''.join(chunks), gzip.GzipFile(fileobj=body).read())
+
+    def testGETCompressedFailsBeforeWriting(self):
+        """
+        A C{GET} request that fails before any values are written doesn't
+        set the C{Content-Encoding} or success headers, so the error response
+        isn't labelled as compressed.
+        """
+
+        class FailingFacade(object):
+
+            def getValuesForQuery(self, session, query, tags=None,
+                                  write=None):
+                return fail(TNonexistentTag('test/tag'))
+
+        resource = ValuesResource(FailingFacade(), FakeSession())
+        request = self.createRequest('gzip')
+        deferred = resource.deferred_render_GET(request)
+        self.assertFailure(deferred, TNonexistentTag)
+        self.assertIdentical(None,
+                             request.getResponseHeader('Content-Encoding'))
+        self.assertIdentical(None, request.getResponseHeader('Cache-Control'))
+        self.assertIdentical(None, request.code)
+        return deferred
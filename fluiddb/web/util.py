@@ -1,8 +1,14 @@
+from calendar import timegm
+from hashlib import sha256
 import json
 import random
 
+from twisted.web import http
+from twisted.web.http import stringToDatetime
+
 from fluiddb.common import error, util
 from fluiddb.common.defaults import contentTypeForPrimitiveJSON
+from fluiddb.web.compression import getEntityTag
 
 
 def _sendBody(request, body, contentType):
@@ -34,6 +40,227 @@ def getBooleanArg(request, argName, default):
             raise error.MultipleArgumentValues(argName)
 
 
+def dropBody(body):
+    """Drop the body of a response, for use with C{HEAD} requests.
+
+    @param body: The body of the response, a C{str}, C{None} or an open
+        file-like object that will be closed.
+    @return: An empty C{str}.
+    """
+    if hasattr(body, 'close'):
+        body.close()
+    return ''
+
+
+class FileRange(object):
+    """A range of bytes in an open file, to be sent as a response body.
+
+    @param file: The open file-like object.
+    @param offset: The offset of the first byte of the range.
+    @param length: The number of bytes in the range.
+    """
+
+    def __init__(self, file, offset, length):
+        self.file = file
+        self.offset = offset
+        self.length = length
+
+    def close(self):
+        """Close the underlying file."""
+        self.file.close()
+
+
+def isNotModified(request, etag, lastModified=None):
+    """Check whether a conditional C{GET} or C{HEAD} can be answered with a
+    C{304 Not Modified} response.
+
+    C{If-None-Match} takes precedence over C{If-Modified-Since}, as described
+    in RFC 2616 section 14.26.
+
+    @param request: The HTTP request.
+    @param etag: The quoted entity tag of the current representation.
+    @param lastModified: Optionally, the C{datetime}, in UTC, when the
+        resource was last modified.
+    @return: C{True} if the client's copy is still valid, otherwise
+        C{False}.
+    """
+    ifNoneMatch = request.getHeader('if-none-match')
+    if ifNoneMatch is not None:
+        tags = [tag.strip() for tag in ifNoneMatch.split(',')]
+        # Weak comparison is allowed for GET and HEAD requests.
+        tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+        return '*' in tags or etag in tags
+
+    ifModifiedSince = request.getHeader('if-modified-since')
+    if ifModifiedSince is not None and lastModified is not None:
+        try:
+            since = stringToDatetime(ifModifiedSince)
+        except (IndexError, KeyError, ValueError):
+            return False
+        return timegm(lastModified.utctimetuple()) <= since
+    return False
+
+
+def getByteRange(request, etag, size):
+    """Get the range of bytes requested with a C{Range} header.
+
+    Only single ranges are supported.  Multiple ranges, other units and
+    malformed headers are ignored and the whole body is sent, which RFC 2616
+    section 14.35.1 allows.  The C{Range} header is also ignored if an
+    C{If-Range} header doesn't match the current entity tag.
+
+    @param request: The HTTP request.
+    @param etag: The quoted entity tag of the current representation.
+    @param size: The size of the full body in bytes.
+    @raise RangeNotSatisfiable: Raised if the requested range starts past
+        the end of the body.
+    @return: An C{(offset, length)} 2-tuple or C{None} if the whole body
+        should be sent.
+    """
+    header = request.getHeader('range')
+    if header is None:
+        return None
+    ifRange = request.getHeader('if-range')
+    if ifRange is not None and ifRange.strip() != etag:
+        return None
+
+    unit, _, ranges = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in ranges:
+        return None
+    first, separator, last = ranges.strip().partition('-')
+    if not separator:
+        return None
+    try:
+        if first:
+            offset = int(first)
+            if last:
+                last = int(last)
+                if last < offset:
+                    return None
+                last = min(last, size - 1)
+            else:
+                last = size - 1
+        else:
+            # A suffix range, for the last bytes of the body.
+            offset = max(size - int(last), 0)
+            last = size - 1
+    except ValueError:
+        return None
+    if offset >= size or last < offset:
+        raise error.RangeNotSatisfiable()
+    return offset, last - offset + 1
+
+
+def wrapWithCallback(request, body):
+    """Wrap a response body in a call to the JSONP C{callback} function.
+
+    The request is marked as wrapped, so that the body isn't wrapped again
+    once it's rendered.
+
+    @param request: The HTTP request, with a C{callback} argument.
+    @param body: The C{str} body of the response, or C{None}.
+    @raise InternalError: Raised if the C{Content-Type} of the response
+        isn't JSON.
+    @return: The wrapped C{str} body.
+    """
+    callback = request.args.get('callback')[0]
+    contentType = request.responseHeaders.getRawHeaders('Content-Type')
+    if body is None or contentType is None:
+        body = '%s()' % callback
+    elif contentType[0] in ('application/json', contentTypeForPrimitiveJSON):
+        body = '%s(%s)' % (callback, body)
+    else:
+        raise error.InternalError('Content type not properly set.')
+    request.setHeader('Content-Length', str(len(body)))
+    request.setHeader('Content-Type', 'text/javascript')
+    request._fluiddb_jsonp_wrapped = None
+    return body
+
+
+def getPrimitiveValueBody(request, body, contentType, options):
+    """Get the body and entity tag of a response with a primitive tag value.
+
+    A JSONP C{callback}, if one is requested, is applied here instead of
+    after the response is rendered, so that the entity tag is built from
+    the same bytes, C{Content-Type} and size that L{compressResponse}
+    compresses.
+
+    @param request: The HTTP request.
+    @param body: The serialized C{str} value.
+    @param contentType: The C{Content-Type} of the serialized value.
+    @param options: The L{CompressionOptions} to use.
+    @return: A C{(body, etag)} 2-tuple with the C{str} body to send and its
+        quoted entity tag.
+    """
+    request.setHeader('Content-Type', contentType)
+    if (request.args.get('callback') and
+            contentType in ('application/json', contentTypeForPrimitiveJSON)):
+        body = wrapWithCallback(request, body)
+        contentType = 'text/javascript'
+    etag = getEntityTag(request, sha256(body).hexdigest(), contentType,
+                        len(body), options)
+    return body, etag
+
+
+def getTagValueResponse(request, body, contentLength, etag, lastModified,
+                        successCode, acceptRanges=False):
+    """Handle conditional and range requests for a tag value.
+
+    The C{ETag}, C{Last-Modified}, C{Content-Length} and, for ranges,
+    C{Content-Range} headers are set and the response code is chosen.
+
+    @param request: The HTTP request.
+    @param body: The body of the response, a C{str}, C{None} or an open
+        file-like object.
+    @param contentLength: The size of the full body in bytes.
+    @param etag: The quoted entity tag of the body.
+    @param lastModified: The C{datetime}, in UTC, when the value was last
+        modified, or C{None}.
+    @param successCode: The response code for a successful request.
+    @param acceptRanges: Optionally, C{True} if C{Range} requests are
+        supported for the body, which must then be an open file-like
+        object for C{GET} requests.  Default is C{False}.
+    @raise RangeNotSatisfiable: Raised if the requested range starts past
+        the end of the body.
+    @return: The body to send, which is an empty C{str} for a
+        C{304 Not Modified} response and a L{FileRange} for a
+        C{206 Partial Content} one.
+    """
+    request.setHeader('ETag', etag)
+    # setting the Last-Modified header for fluiddb/id makes no sense
+    if lastModified is not None:
+        request.setHeader('Last-modified',
+                          lastModified.strftime('%a, %d %b %Y %H:%M:%S'))
+
+    if isNotModified(request, etag, lastModified):
+        dropBody(body)
+        request.setResponseCode(http.NOT_MODIFIED)
+        return ''
+
+    responseCode = successCode
+    if acceptRanges:
+        request.setHeader('Accept-Ranges', 'bytes')
+    # Range headers must be ignored for methods other than GET.
+    if acceptRanges and request.method == 'GET':
+        size = contentLength
+        try:
+            byteRange = getByteRange(request, etag, size)
+        except error.RangeNotSatisfiable:
+            body.close()
+            request.setHeader('Content-Range', 'bytes */%d' % size)
+            raise
+        if byteRange is not None:
+            offset, contentLength = byteRange
+            request.setHeader('Content-Range', 'bytes %d-%d/%d' % (
+                offset, offset + contentLength - 1, size))
+            body = FileRange(body, offset, contentLength)
+            responseCode = http.PARTIAL_CONTENT
+
+    request.setHeader('Content-length', str(contentLength))
+    request.setResponseCode(responseCode)
+    return body
+
+
 def buildHeader(name):
     return "X-FluidDB-%s" % name
 
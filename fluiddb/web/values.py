@@ -1,8 +1,14 @@
 import types
 
 from twisted.internet import defer
+from twisted.internet.interfaces import IPushProducer
+from twisted.internet.threads import deferToThread
 from twisted.web import http
+from zope.interface import implements
 
+from fluiddb.application import getConfig
+from fluiddb.web.compression import (
+    CompressionOptions, StreamCompressor, getContentEncoding)
 from fluiddb.web.resource import WSFEResource
 from fluiddb.web import payloads
 from fluiddb.common.defaults import httpValueCategoryName
@@ -205,6 +211,54 @@ class ValuesQuerySchema(object):
         return tagsAndValues
 
 
+class ResponseProducer(object):
+    """A push producer for a response that is streamed as it's built.
+
+    The transport pauses the producer when its buffer is full and resumes it
+    once the buffer has been sent, so a response is never buffered faster
+    than the client reads it.
+    """
+
+    implements(IPushProducer)
+
+    def __init__(self):
+        self._paused = False
+        self._stopped = False
+        self._waiting = []
+
+    def pauseProducing(self):
+        """Stop writing until L{resumeProducing} is called."""
+        self._paused = True
+
+    def resumeProducing(self):
+        """Let the response be written again."""
+        self._paused = False
+        waiting, self._waiting = self._waiting, []
+        for deferred in waiting:
+            deferred.callback(None)
+
+    def stopProducing(self):
+        """Stop writing the response, because the client has gone away."""
+        self._stopped = True
+        waiting, self._waiting = self._waiting, []
+        for deferred in waiting:
+            deferred.errback(defer.CancelledError())
+
+    def wait(self):
+        """Wait until the transport can take more of the response.
+
+        @return: A C{Deferred} that fires when the producer isn't paused, or
+            fails with C{CancelledError} if the producer has been stopped.
+        """
+        if self._stopped:
+            return defer.fail(defer.CancelledError())
+        if not self._paused:
+            return defer.succeed(None)
+        deferred = defer.Deferred()
+        self._waiting.append(deferred)
+        return deferred
+
+
 class ValuesResource(WSFEResource):
 
     allowedMethods = ('GET', 'PUT', 'DELETE', 'OPTIONS')
@@ -216,11 +270,19 @@ class ValuesResource(WSFEResource):
         Handle a GET request for /values with a query and a list
         of wanted tags.
 
+        The response is streamed with chunked transfer encoding as values
+        are fetched, unless a JSONP C{callback} is requested, in which case
+        the whole body has to be built before it can be wrapped.  Values
+        stop being fetched while the transport is paused by a
+        L{ResponseProducer}, so a slow client doesn't make the response pile
+        up in memory.
+
         @param request: The incoming C{twisted.web.server.Request} request.
         @return: A C{Deferred} which will fire with the body of the
-            response.  The deferred may errback for a variety of reasons,
-            for example an invalid query, the mention of a non-existent tag
-            or a tag that the caller does not have READ permission for.
+            response, or with C{None} if it has been streamed.  The deferred
+            may errback for a variety of reasons, for example an invalid
+            query, the mention of a non-existent tag or a tag that the caller
+            does not have READ permission for.
         """
         usage = registry.findUsage(httpValueCategoryName, 'GET',
                                    ValuesResource)
@@ -232,12 +294,72 @@ class ValuesResource(WSFEResource):
         # tags, like 'tag=foo&tag=*'. -jkakar
         if tags == ['*']:
             tags = None
-        body = yield self.facadeClient.getValuesForQuery(
-            self.session, query, tags)
-        request.setHeader('Content-length', str(len(body)))
-        request.setHeader('Content-type', responseType)
-        request.setResponseCode(usage.successCode)
-        defer.returnValue(body)
+        if request.args.get('callback'):
+            body = yield self.facadeClient.getValuesForQuery(
+                self.session, query, tags)
+            request.setHeader('Content-length', str(len(body)))
+            request.setHeader('Content-type', responseType)
+            request.setResponseCode(usage.successCode)
+            defer.returnValue(body)
+
+        request.setHeader('Vary', 'Accept-Encoding')
+        encoding = getContentEncoding(request)
+        options = CompressionOptions.fromConfig(getConfig())
+        compressor = None
+        if encoding is not None:
+            compressor = StreamCompressor(encoding, options.level)
+
+        def startResponse():
+            # Headers are sent with the first chunk, so they can't be left
+            # for WSFEResource._finish to set.  They're only set then, so an
+            # error raised before any values are written gets a plain error
+            # response.
+            if request.startedWriting:
+                return
+            request.setHeader('Content-type', responseType)
+            request.setHeader('Cache-Control', 'no-cache')
+            request.setResponseCode(usage.successCode)
+            if encoding is not None:
+                request.setHeader('Content-Encoding', encoding)
+
+        finished = []
+        request.notifyFinish().addBoth(finished.append)
+        producer = ResponseProducer()
+        request.registerProducer(producer, True)
+        # Twisted pauses the producer of a pipelined request that is waiting
+        # for earlier responses and doesn't resume it when its turn comes,
+        # so the response is buffered until then instead.
+        producer.resumeProducing()
+
+        def write(data):
+            # Stop fetching values if the client has gone away.
+            if finished:
+                raise defer.CancelledError()
+            startResponse()
+            if compressor is None:
+                request.write(data)
+            elif len(data) >= options.threadSize:
+                # Large chunks are compressed in a thread, so the reactor
+                # isn't blocked.  The next chunk isn't produced until the
+                # returned Deferred fires, so chunks are written in order.
+                deferred = deferToThread(compressor.compress, data)
+                deferred.addCallback(request.write)
+                return deferred.addCallback(lambda result: producer.wait())
+            else:
+                request.write(compressor.compress(data))
+            # The next batch isn't fetched until the returned Deferred fires,
+            # so no more values are read while the transport has no room.
+            return producer.wait()
+
+        try:
+            yield self.facadeClient.getValuesForQuery(self.session, query,
+                                                      tags, write=write)
+            startResponse()
+            if compressor is not None:
+                request.write(compressor.flush())
+        finally:
+            request.unregisterProducer()
+        defer.returnValue(None)
 
     @defer.inlineCallbacks
     def deferred_render_PUT(self, request):